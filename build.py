@@ -1,5 +1,6 @@
 import os
 import subprocess
+import sys
 
 from pybuilder.utils import assert_can_execute
 from pybuilder.core import use_plugin, init, Author, task
@@ -62,6 +63,7 @@ def set_properties(project):
     project.set_property('filter_resources_glob', ['**/cli.py'])
 
     project.set_property('dir_dist_scripts', 'scripts')
+    project.set_property('dir_source_benchmark_python', 'src/benchmark/python')
 
     project.set_property('distutils_classifiers', [
         'Development Status :: 4 - Beta',
@@ -107,3 +109,15 @@ def pdoc_generate(project, logger):
                    "PATH": os.environ["PATH"]}
 
     subprocess.check_call(command_and_arguments, shell=False, env=environment)
+
+
+@task("benchmark", "Runs the benchmark suite against an in-memory fake vSphere inventory")
+def benchmark(project, logger):
+    logger.info("Running benchmarks")
+    benchmark_directory = project.expand_path("$dir_source_benchmark_python")
+    command_and_arguments = [sys.executable, os.path.join(benchmark_directory, "isphere_benchmark.py")]
+    command_and_arguments.extend(os.environ.get("ISPHERE_BENCHMARK_ARGUMENTS", "").split())
+    environment = {"PYTHONPATH": os.pathsep.join([project.expand_path("$dir_source_main_python"), benchmark_directory]),
+                   "PATH": os.environ["PATH"]}
+
+    subprocess.check_call(command_and_arguments, shell=False, env=environment)
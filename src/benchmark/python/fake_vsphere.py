@@ -0,0 +1,670 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+"""
+An in-process, in-memory fake of a vSphere inventory.
+
+The fake serves real `pyVmomi` managed objects (`vim.VirtualMachine`,
+`vim.view.ContainerView`, `vmodl.query.PropertyCollector`...) through a fake
+stub adapter, so the isphere code paths run unchanged. Every method call and
+every property access is one simulated round trip which can be delayed with a
+configurable latency.
+
+Modelled are:
+- the service content (root folder, view manager, property collector, search index,
+  custom fields manager),
+- datacenters, clusters, ESXi host systems, virtual machines and distributed
+  virtual switches, some of them with triggered alarms,
+- a resource pool and a datastore per cluster and a network per datacenter,
+  used by the virtual machines,
+- container views, also on datacenters, clusters and folders, including subtypes
+  (e.G. clusters in a view on compute resources),
+- inventory path lookups,
+- property collector retrievals (`RetrieveProperties`, `RetrievePropertiesEx` with paging),
+- property collector filters and updates (`CreateFilter`, `WaitForUpdates`, `WaitForUpdatesEx`),
+- tasks that succeed after a configurable duration,
+- guest reboots, during which the VMware tools stop for the task duration,
+- a power on event per virtual machine in the event history,
+- a few performance counters with real time values (`QueryPerf`).
+
+Usage:
+
+    >>> from fake_vsphere import FakeVSphere
+    >>> fake = FakeVSphere(number_of_vms=10000, latency=0.001)
+    >>> vvc = fake.connect_vvc()
+    >>> len(vvc.get_restricted_view_on_vms(["name"]))
+    10000
+"""
+
+from collections import namedtuple
+import datetime
+import threading
+import time
+import uuid
+
+from pyVmomi import vim, vmodl
+
+from isphere.interactive_wrapper import VVC
+
+__all__ = ["FakeVSphere", "FakeData"]
+
+ObjectContent = namedtuple("ObjectContent", ["obj", "propSet"])
+DynamicProperty = namedtuple("DynamicProperty", ["name", "val"])
+RetrieveResult = namedtuple("RetrieveResult", ["token", "objects"])
+UpdateSet = namedtuple("UpdateSet", ["version", "filterSet", "truncated"])
+PropertyFilterUpdate = namedtuple("PropertyFilterUpdate", ["filter", "objectSet"])
+ObjectUpdate = namedtuple("ObjectUpdate", ["kind", "obj", "changeSet"])
+PropertyChange = namedtuple("PropertyChange", ["name", "op", "val"])
+CustomFieldDef = namedtuple("CustomFieldDef", ["key", "name"])
+CustomFieldValue = namedtuple("CustomFieldValue", ["key", "value"])
+
+_PERFORMANCE_COUNTERS = (("cpu", "ready", "summation", "millisecond"),
+                         ("cpu", "usage", "average", "percent"),
+                         ("mem", "usage", "average", "percent"),
+                         ("disk", "maxTotalLatency", "latest", "millisecond"))
+
+
+class FakeData(object):
+
+    """
+    A simple data object, standing in for `pyVmomi` data objects like
+    `vim.vm.ConfigInfo`.
+    """
+
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+    def __repr__(self):
+        return "FakeData({0})".format(", ".join(
+            "{0}={1!r}".format(key, value) for key, value in sorted(self.__dict__.items())))
+
+
+class FakeVSphere(object):
+
+    """
+    An in-memory vSphere inventory. It acts as the stub adapter of all the
+    managed objects it hands out.
+    """
+
+    def __init__(self,
+                 number_of_vms=1000,
+                 number_of_esxis=None,
+                 number_of_dvses=10,
+                 number_of_datacenters=1,
+                 hosts_per_cluster=16,
+                 latency=0.0,
+                 task_duration=0.0):
+        """
+        Create a fake inventory.
+
+        - number_of_vms (type `int`): The number of virtual machines.
+        - number_of_esxis (type `int`): The number of ESXi host systems. Defaults
+          to one host per 30 VMs.
+        - number_of_dvses (type `int`): The number of distributed virtual switches.
+        - number_of_datacenters (type `int`): The number of datacenters the
+          inventory is spread over.
+        - hosts_per_cluster (type `int`): The number of hosts in each cluster.
+        - latency (type `float`): The number of seconds each round trip takes.
+        - task_duration (type `float`): The number of seconds until a task succeeds.
+        """
+        self.latency = latency
+        self.task_duration = task_duration
+        self.round_trips = 0
+
+        self._lock = threading.RLock()
+        self._properties = {}
+        self._ancestors = {}
+        self._objects = {}
+        self._uuid_index = {}
+        self._dns_index = {}
+        self._tasks = {}
+        self._guest_reboots = {}
+        self._views = {}
+        self._resources = []
+        self._collectors = {}
+        self._retrievals = {}
+        self._events = []
+        self._event_collectors = {}
+        self._ids = {}
+
+        self._build_services()
+        self._build_inventory(number_of_vms,
+                              number_of_esxis or max(1, number_of_vms // 30),
+                              number_of_dvses,
+                              number_of_datacenters,
+                              hosts_per_cluster)
+
+    def connect_vvc(self, hostname="fake-vcenter"):
+        """
+        Returns a `isphere.interactive_wrapper.VVC` which is connected to this fake.
+        """
+        vvc = VVC(hostname)
+        vvc.service_instance = self.service_instance
+        vvc.service_instance_content = self.service_instance.RetrieveContent()
+        return vvc
+
+    @property
+    def vms(self):
+        """
+        The virtual machine managed objects.
+        """
+        return list(self._vms)
+
+    @property
+    def esxis(self):
+        """
+        The ESXi host system managed objects.
+        """
+        return list(self._esxis)
+
+    def get_property(self, managed_object, path):
+        """
+        Returns the current value of a property without a simulated round trip.
+        """
+        with self._lock:
+            found, value = self._resolve(managed_object, path)
+            return value if found else None
+
+    def set_property(self, managed_object, name, value):
+        """
+        Changes a (top level) property. Property collector filters watching it
+        will report the change.
+        """
+        with self._lock:
+            self._properties[managed_object._moId][name] = value
+
+    # --- stub adapter interface ---
+
+    def InvokeMethod(self, mo, info, args, *_):
+        self._round_trip()
+        handler = getattr(self, "_handle_" + info.wsdlName, None)
+        if handler:
+            with self._lock:
+                return handler(mo, *args)
+        if info.wsdlName.endswith("_Task"):
+            with self._lock:
+                return self._create_task(mo, info.wsdlName, args)
+        return None
+
+    def InvokeAccessor(self, mo, info):
+        self._round_trip()
+        with self._lock:
+            found, value = self._resolve(mo, info.name)
+            return value if found else None
+
+    # --- inventory ---
+
+    def _round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _next_id(self, prefix):
+        self._ids[prefix] = self._ids.get(prefix, 0) + 1
+        return "{0}-{1}".format(prefix, self._ids[prefix])
+
+    def _add(self, managed_type, prefix, parent=None, **properties):
+        managed_object = managed_type(self._next_id(prefix), self)
+        if parent is not None:
+            properties.setdefault("parent", parent)
+            self._ancestors[managed_object._moId] = self._ancestors.get(parent._moId, set()) | set([parent._moId])
+        else:
+            self._ancestors[managed_object._moId] = set()
+        self._properties[managed_object._moId] = properties
+        self._objects[managed_object._moId] = managed_object
+        return managed_object
+
+    def _build_services(self):
+        self.service_instance = vim.ServiceInstance("ServiceInstance", self)
+        self.root_folder = self._add(vim.Folder, "group-d", name="Datacenters", childEntity=[])
+        self.property_collector = vmodl.query.PropertyCollector("propertyCollector", self)
+        self._collectors[self.property_collector._moId] = self._new_collector_state()
+        self.custom_fields_manager = vim.CustomFieldsManager("CustomFieldsManager", self)
+        self._properties[self.custom_fields_manager._moId] = {
+            "field": [CustomFieldDef(key=key, name=name)
+                      for key, name in enumerate(["owner", "team", "environment"], 1)]}
+        self.content = FakeData(rootFolder=self.root_folder,
+                                viewManager=vim.view.ViewManager("ViewManager", self),
+                                propertyCollector=self.property_collector,
+                                searchIndex=vim.SearchIndex("SearchIndex", self),
+                                customFieldsManager=self.custom_fields_manager,
+                                eventManager=vim.event.EventManager("EventManager", self),
+                                perfManager=vim.PerformanceManager("PerfMgr", self))
+        self._properties["PerfMgr"] = {
+            "perfCounter": [FakeData(key=key, groupInfo=FakeData(key=group), nameInfo=FakeData(key=name),
+                                     rollupType=rollup, unitInfo=FakeData(key=unit))
+                            for key, (group, name, rollup, unit) in enumerate(_PERFORMANCE_COUNTERS, 1)]}
+        self._properties["ServiceInstance"] = {"content": self.content}
+
+    def _build_inventory(self, number_of_vms, number_of_esxis, number_of_dvses, number_of_datacenters, hosts_per_cluster):
+        datacenters = []
+        for datacenter_index in range(number_of_datacenters):
+            datacenter = self._add(vim.Datacenter, "datacenter", self.root_folder,
+                                   name="datacenter-{0:02d}".format(datacenter_index))
+            self._properties[datacenter._moId].update(
+                vmFolder=self._add(vim.Folder, "group-v", datacenter, name="vm", childEntity=[]),
+                hostFolder=self._add(vim.Folder, "group-h", datacenter, name="host", childEntity=[]),
+                datastoreFolder=self._add(vim.Folder, "group-s", datacenter, name="datastore", childEntity=[]),
+                networkFolder=self._add(vim.Folder, "group-n", datacenter, name="network", childEntity=[]))
+            network_folder = self._properties[datacenter._moId]["networkFolder"]
+            network = self._add(vim.Network, "network", network_folder,
+                                name="vm-network-{0:02d}".format(datacenter_index), vm=[])
+            self._properties[network_folder._moId]["childEntity"].append(network)
+            self._resources.append(network)
+            self._properties[self.root_folder._moId]["childEntity"].append(datacenter)
+            datacenters.append(datacenter)
+
+        cpu_alarm, memory_alarm = [self._add(vim.alarm.Alarm, "alarm", None, info=FakeData(name=name))
+                                   for name in ("Virtual machine CPU usage", "Host memory usage")]
+
+        self._esxis = []
+        clusters = {}
+        for esx_index in range(number_of_esxis):
+            datacenter = datacenters[esx_index % number_of_datacenters]
+            host_folder = self._properties[datacenter._moId]["hostFolder"]
+            cluster = clusters.get(datacenter._moId)
+            if cluster is None or len(self._properties[cluster._moId]["host"]) == hosts_per_cluster:
+                cluster_index = self._ids.get("domain-c", 0)
+                cluster = self._add(vim.ClusterComputeResource, "domain-c", host_folder,
+                                    name="cluster-{0:03d}".format(cluster_index), host=[])
+                datastore_folder = self._properties[datacenter._moId]["datastoreFolder"]
+                datastore = self._add(vim.Datastore, "datastore", datastore_folder,
+                                      name="datastore-{0:03d}".format(cluster_index), host=[], vm=[],
+                                      overallStatus="green",
+                                      summary=FakeData(type="VMFS", accessible=True,
+                                                       capacity=4 * 1024 ** 4,
+                                                       freeSpace=(1 + cluster_index % 4) * 512 * 1024 ** 3,
+                                                       uncommitted=(cluster_index % 3) * 1024 ** 4))
+                self._properties[datastore_folder._moId]["childEntity"].append(datastore)
+                self._properties[cluster._moId].update(
+                    resourcePool=self._add(vim.ResourcePool, "resgroup", cluster, name="Resources", vm=[]),
+                    datastore=[datastore])
+                self._resources.extend([datastore, self._properties[cluster._moId]["resourcePool"]])
+                self._properties[host_folder._moId]["childEntity"].append(cluster)
+                clusters[datacenter._moId] = cluster
+            host_name = "esx-{0:05d}".format(esx_index)
+            esx = self._add(vim.HostSystem, "host", cluster,
+                            name="{0}.example.com".format(host_name),
+                            overallStatus="green",
+                            vm=[],
+                            datastore=list(self._properties[cluster._moId]["datastore"]),
+                            hardware=FakeData(systemInfo=FakeData(uuid=str(uuid.uuid4()))),
+                            config=FakeData(network=FakeData(dnsConfig=FakeData(hostName=host_name,
+                                                                                domainName="example.com"))),
+                            runtime=FakeData(inMaintenanceMode=False, connectionState="connected",
+                                             bootTime=datetime.datetime(2015, 1, 1)),
+                            triggeredAlarmState=self._triggered_alarms(memory_alarm, esx_index % 7 == 0))
+            self._properties[cluster._moId]["host"].append(esx)
+            self._properties[self._properties[cluster._moId]["datastore"][0]._moId]["host"].append(esx)
+            self._uuid_index[(self._properties[esx._moId]["hardware"].systemInfo.uuid, False)] = esx
+            self._dns_index[(host_name + ".example.com", False)] = esx
+            self._esxis.append(esx)
+
+        self._vms = []
+        for vm_index in range(number_of_vms):
+            esx = self._esxis[vm_index % number_of_esxis]
+            datacenter_index = (vm_index % number_of_esxis) % number_of_datacenters
+            vm_folder = self._properties[datacenters[datacenter_index]._moId]["vmFolder"]
+            cluster = self._properties[esx._moId]["parent"]
+            resource_pool = self._properties[cluster._moId]["resourcePool"]
+            datastore = self._properties[cluster._moId]["datastore"][0]
+            network = self._properties[self._properties[datacenters[datacenter_index]._moId]["networkFolder"]._moId][
+                "childEntity"][0]
+            vm_uuid = str(uuid.uuid4())
+            vm_name = "vm-{0:06d}".format(vm_index)
+            vm = self._add(vim.VirtualMachine, "vm", vm_folder,
+                           name=vm_name,
+                           overallStatus="green",
+                           config=FakeData(uuid=vm_uuid,
+                                           guestFullName="Any Linux (64-bit)",
+                                           guestId="otherLinux64Guest",
+                                           version="vmx-10",
+                                           hardware=FakeData(numCPU=1 + vm_index % 8,
+                                                             memoryMB=1024 * (1 + vm_index % 16))),
+                           runtime=FakeData(host=esx, powerState="poweredOn"),
+                           guest=FakeData(guestState="running", toolsRunningStatus="guestToolsRunning"),
+                           guestHeartbeatStatus="green",
+                           summary=FakeData(config=FakeData(vmPathName="[{0}] {1}/{1}.vmx".format(
+                               self._properties[datastore._moId]["name"], vm_name))),
+                           customValue=[CustomFieldValue(key=1, value="owner-{0}".format(vm_index % 50))],
+                           triggeredAlarmState=self._triggered_alarms(cpu_alarm, vm_index % 10 == 0),
+                           resourcePool=resource_pool,
+                           network=[network],
+                           datastore=[datastore])
+            self._properties[vm_folder._moId]["childEntity"].append(vm)
+            self._events.append(FakeData(key=vm_index,
+                                         createdTime=datetime.datetime.utcnow() - datetime.timedelta(seconds=number_of_vms - vm_index),
+                                         userName="",
+                                         vm=FakeData(vm=vm, name=vm_name),
+                                         host=FakeData(host=esx, name=self._properties[esx._moId]["name"]),
+                                         fullFormattedMessage="{0} on {1} is powered on".format(
+                                             vm_name, self._properties[esx._moId]["name"])))
+            for used_item in (esx, resource_pool, datastore, network):
+                self._properties[used_item._moId]["vm"].append(vm)
+            self._ancestors[vm._moId] |= self._ancestors[esx._moId]  # the resource pool of the cluster
+            self._uuid_index[(vm_uuid, True)] = vm
+            self._dns_index[(vm_name + ".example.com", True)] = vm
+            self._vms.append(vm)
+
+        self._containers = [managed_object for managed_object in self._objects.values()
+                            if isinstance(managed_object, (vim.Datacenter, vim.ClusterComputeResource, vim.Folder))]
+
+        self._dvses = []
+        for dvs_index in range(number_of_dvses):
+            datacenter = datacenters[dvs_index % number_of_datacenters]
+            network_folder = self._properties[datacenter._moId]["networkFolder"]
+            dvs = self._add(vim.VmwareDistributedVirtualSwitch, "dvs", network_folder,
+                            name="dvs-{0:03d}".format(dvs_index), overallStatus="green")
+            self._properties[network_folder._moId]["childEntity"].append(dvs)
+            self._dvses.append(dvs)
+
+    @staticmethod
+    def _triggered_alarms(alarm, triggered):
+        if not triggered:
+            return []
+        return [FakeData(alarm=alarm, overallStatus="red", acknowledged=False,
+                         time=datetime.datetime(2015, 1, 1))]
+
+    def _resolve(self, managed_object, path):
+        if managed_object._moId in self._tasks:
+            self._progress_task(managed_object._moId)
+        if managed_object._moId in self._guest_reboots and path.startswith("guest"):
+            self._progress_guest_reboot(managed_object._moId)
+        properties = self._properties.get(managed_object._moId, {})
+        parts = path.split(".")
+        if parts[0] not in properties:
+            return False, None
+        value = properties[parts[0]]
+        for part in parts[1:]:
+            if not hasattr(value, part):
+                return False, None
+            value = getattr(value, part)
+        return True, value
+
+    # --- view manager ---
+
+    def _handle_CreateContainerView(self, _, container, types, recursive):
+        type_names = [managed_type._wsdlName for managed_type in types]
+        members = [managed_object
+                   for managed_object in self._vms + self._esxis + self._dvses + self._containers + self._resources
+                   if isinstance(managed_object, tuple(types)) and self._contains(container, managed_object, recursive)]
+        view = self._add(vim.view.ContainerView, "session[fake]view",
+                         view=members, type=type_names, container=container, recursive=recursive)
+        self._views[view._moId] = members
+        return view
+
+    def _contains(self, container, managed_object, recursive):
+        if recursive:
+            return container._moId in self._ancestors[managed_object._moId]
+        return self._properties[managed_object._moId].get("parent") == container
+
+    def _handle_DestroyView(self, view):
+        self._views.pop(view._moId, None)
+        self._properties.pop(view._moId, None)
+
+    # --- service instance and search index ---
+
+    def _handle_RetrieveServiceContent(self, _):
+        return self.content
+
+    def _handle_FindByUuid(self, _, datacenter, uuid, vmSearch, *__):
+        return self._uuid_index.get((uuid, bool(vmSearch)))
+
+    def _handle_FindByDnsName(self, _, datacenter, dnsName, vmSearch):
+        return self._dns_index.get((dnsName, bool(vmSearch)))
+
+    def _handle_FindByInventoryPath(self, _, inventoryPath):
+        current = self.root_folder
+        for name in inventoryPath.strip("/").split("/"):
+            properties = self._properties[current._moId]
+            children = list(properties.get("childEntity", []))
+            children += [properties[folder] for folder in ("vmFolder", "hostFolder", "datastoreFolder", "networkFolder")
+                         if folder in properties]
+            current = next((child for child in children if self._properties[child._moId]["name"] == name), None)
+            if current is None:
+                return None
+        return current
+
+    def _handle_SetField(self, _, entity, key, value):
+        custom_values = [custom_value for custom_value in self._properties[entity._moId].get("customValue", [])
+                         if custom_value.key != key]
+        custom_values.append(CustomFieldValue(key=key, value=value))
+        self._properties[entity._moId]["customValue"] = custom_values
+
+    def _handle_RebootGuest(self, vm):
+        properties = self._properties[vm._moId]
+        properties["guest"] = FakeData(**dict(properties["guest"].__dict__, guestState="notRunning",
+                                              toolsRunningStatus="guestToolsNotRunning"))
+        properties["guestHeartbeatStatus"] = "gray"
+        self._guest_reboots[vm._moId] = {"started_at": time.time(), "observed": False}
+
+    def _progress_guest_reboot(self, vm_id):
+        guest_reboot = self._guest_reboots[vm_id]
+        # the stopped tools are observable at least once, even without a task duration
+        if not guest_reboot["observed"] or time.time() - guest_reboot["started_at"] < self.task_duration:
+            guest_reboot["observed"] = True
+            return
+        del self._guest_reboots[vm_id]
+        properties = self._properties[vm_id]
+        properties["guest"] = FakeData(**dict(properties["guest"].__dict__, guestState="running",
+                                              toolsRunningStatus="guestToolsRunning"))
+        properties["guestHeartbeatStatus"] = "green"
+
+    # --- event history ---
+
+    def _handle_CreateCollectorForEvents(self, _, spec):
+        collector = vim.event.EventHistoryCollector(self._next_id("session[fake]eventcollector"), self)
+        self._event_collectors[collector._moId] = {"events": [event for event in self._events
+                                                              if self._event_matches(event, spec)],
+                                                   "position": 0}
+        return collector
+
+    @staticmethod
+    def _event_matches(event, spec):
+        if spec.time and spec.time.beginTime and event.createdTime < spec.time.beginTime.replace(tzinfo=None):
+            return False
+        if spec.time and spec.time.endTime and event.createdTime > spec.time.endTime.replace(tzinfo=None):
+            return False
+        if spec.entity:
+            return spec.entity.entity in (event.vm.vm, event.host.host)
+        return True
+
+    def _handle_RewindCollector(self, collector):
+        self._event_collectors[collector._moId]["position"] = 0
+
+    def _handle_ReadNextEvents(self, collector, max_count):
+        event_collector = self._event_collectors[collector._moId]
+        position = event_collector["position"]
+        event_collector["position"] = position + max_count
+        return event_collector["events"][position:position + max_count]
+
+    def _handle_DestroyCollector(self, collector):
+        self._event_collectors.pop(collector._moId, None)
+
+    # --- performance manager ---
+
+    def _handle_QueryPerf(self, _, querySpec):
+        entity_metrics = []
+        for query_spec in querySpec:
+            number = int(query_spec.entity._moId.rsplit("-", 1)[-1])
+            samples = query_spec.maxSample or 1
+            latest = int(time.time()) // query_spec.intervalId * query_spec.intervalId
+            sample_infos = [FakeData(timestamp=datetime.datetime.utcfromtimestamp(latest - (samples - 1 - sample) * query_spec.intervalId),
+                                     interval=query_spec.intervalId)
+                            for sample in range(samples)]
+            series = [FakeData(id=FakeData(counterId=metric_id.counterId, instance=""),
+                               value=[(number * 37 * metric_id.counterId + sample * 11) % 1000 for sample in range(samples)])
+                      for metric_id in query_spec.metricId]
+            entity_metrics.append(FakeData(entity=query_spec.entity, sampleInfo=sample_infos, value=series))
+        return entity_metrics
+
+    # --- property collector retrieval ---
+
+    def _collect(self, spec_set):
+        contents = []
+        for filter_spec in spec_set:
+            for managed_object in self._objects_of(filter_spec):
+                property_set = []
+                for path in self._paths_of(filter_spec, managed_object):
+                    found, value = self._resolve(managed_object, path)
+                    if found:
+                        property_set.append(DynamicProperty(name=path, val=value))
+                contents.append(ObjectContent(obj=managed_object, propSet=property_set))
+        return contents
+
+    def _objects_of(self, filter_spec):
+        objects = []
+        for object_spec in filter_spec.objectSet:
+            if not object_spec.skip:
+                objects.append(object_spec.obj)
+            if object_spec.selectSet and object_spec.obj._moId in self._views:
+                objects.extend(self._views[object_spec.obj._moId])
+        return objects
+
+    def _paths_of(self, filter_spec, managed_object):
+        for property_spec in filter_spec.propSet:
+            if not isinstance(managed_object, property_spec.type):
+                continue
+            if property_spec.all:
+                return sorted(self._properties[managed_object._moId].keys())
+            return list(property_spec.pathSet)
+        return []
+
+    def _handle_RetrieveProperties(self, _, spec_set):
+        return self._collect(spec_set)
+
+    def _handle_RetrievePropertiesEx(self, _, spec_set, options):
+        return self._page(self._collect(spec_set), options.maxObjects if options else None)
+
+    def _handle_ContinueRetrievePropertiesEx(self, _, token):
+        contents, max_objects = self._retrievals.pop(token)
+        return self._page(contents, max_objects)
+
+    def _page(self, contents, max_objects):
+        if not max_objects or len(contents) <= max_objects:
+            return RetrieveResult(token=None, objects=contents)
+        token = self._next_id("retrieval")
+        self._retrievals[token] = (contents[max_objects:], max_objects)
+        return RetrieveResult(token=token, objects=contents[:max_objects])
+
+    def _handle_CancelRetrievePropertiesEx(self, _, token):
+        self._retrievals.pop(token, None)
+
+    # --- property collector updates ---
+
+    @staticmethod
+    def _new_collector_state():
+        return {"filters": {}, "version": 0}
+
+    def _handle_CreatePropertyCollector(self, _):
+        collector = vmodl.query.PropertyCollector(self._next_id("session[fake]collector"), self)
+        self._collectors[collector._moId] = self._new_collector_state()
+        return collector
+
+    def _handle_DestroyPropertyCollector(self, collector):
+        self._collectors.pop(collector._moId, None)
+
+    def _handle_CreateFilter(self, collector, spec, partial_updates):
+        property_filter = vmodl.query.PropertyCollector.Filter(self._next_id("session[fake]filter"), self)
+        self._collectors[collector._moId]["filters"][property_filter._moId] = {
+            "filter": property_filter, "spec": spec, "reported": {}}
+        return property_filter
+
+    def _handle_DestroyPropertyFilter(self, property_filter):
+        for collector in self._collectors.values():
+            collector["filters"].pop(property_filter._moId, None)
+
+    def _handle_WaitForUpdates(self, collector, version):
+        return self._wait_for_updates(collector, None)
+
+    def _handle_WaitForUpdatesEx(self, collector, version, options):
+        max_wait_seconds = options.maxWaitSeconds if options else None
+        return self._wait_for_updates(collector, max_wait_seconds)
+
+    def _handle_CheckForUpdates(self, collector, version):
+        return self._pending_updates(collector)
+
+    def _wait_for_updates(self, collector, max_wait_seconds):
+        started_at = time.time()
+        while True:
+            update = self._pending_updates(collector)
+            if update or max_wait_seconds == 0:
+                return update
+            if max_wait_seconds is not None and time.time() - started_at >= max_wait_seconds:
+                return None
+            self._lock.release()
+            try:
+                time.sleep(0.001)
+            finally:
+                self._lock.acquire()
+
+    def _pending_updates(self, collector):
+        state = self._collectors[collector._moId]
+        filter_updates = []
+        for watched in list(state["filters"].values()):
+            object_updates = []
+            for managed_object in self._objects_of(watched["spec"]):
+                reported = watched["reported"].setdefault(managed_object._moId, {})
+                changes = []
+                for path in self._paths_of(watched["spec"], managed_object):
+                    found, value = self._resolve(managed_object, path)
+                    if found and (path not in reported or reported[path] != value):
+                        reported[path] = value
+                        changes.append(PropertyChange(name=path, op="assign", val=value))
+                if changes:
+                    kind = "modify" if len(reported) > len(changes) else "enter"
+                    object_updates.append(ObjectUpdate(kind=kind, obj=managed_object, changeSet=changes))
+            if object_updates:
+                filter_updates.append(PropertyFilterUpdate(filter=watched["filter"], objectSet=object_updates))
+        if not filter_updates:
+            return None
+        state["version"] += 1
+        return UpdateSet(version=str(state["version"]), filterSet=filter_updates, truncated=False)
+
+    # --- tasks ---
+
+    def _create_task(self, entity, method_name, args):
+        task = vim.Task(self._next_id("task"), self)
+        entity_name = self._properties.get(entity._moId, {}).get("name")
+        self._properties[task._moId] = {
+            "info": FakeData(key=task._moId, task=task, state="queued", error=None, result=None,
+                             descriptionId=method_name, entityName=entity_name, entity=entity)}
+        self._tasks[task._moId] = (time.time(), entity, method_name, args)
+        self._progress_task(task._moId)
+        return task
+
+    def _progress_task(self, task_id):
+        created_at, entity, method_name, args = self._tasks[task_id]
+        info = self._properties[task_id]["info"]
+        if info.state in ("success", "error"):
+            return
+        if time.time() - created_at < self.task_duration:
+            if info.state != "running":
+                self._properties[task_id]["info"] = FakeData(**dict(info.__dict__, state="running"))
+            return
+        self._apply_task_effect(entity, method_name, args)
+        self._properties[task_id]["info"] = FakeData(**dict(info.__dict__, state="success"))
+
+    def _apply_task_effect(self, entity, method_name, args):
+        properties = self._properties[entity._moId]
+        if method_name == "RelocateVM_Task" and args and args[0].host:
+            old_host, new_host = properties["runtime"].host, args[0].host
+            self._properties[old_host._moId]["vm"] = [vm for vm in self._properties[old_host._moId]["vm"] if vm != entity]
+            self._properties[new_host._moId]["vm"] = self._properties[new_host._moId]["vm"] + [entity]
+            properties["runtime"] = FakeData(**dict(properties["runtime"].__dict__, host=new_host))
+        if method_name == "PowerOnVM_Task":
+            properties["runtime"] = FakeData(**dict(properties["runtime"].__dict__, powerState="poweredOn"))
+        elif method_name == "PowerOffVM_Task":
+            properties["runtime"] = FakeData(**dict(properties["runtime"].__dict__, powerState="poweredOff"))
+        elif method_name == "EnterMaintenanceMode_Task":
+            properties["runtime"] = FakeData(**dict(properties["runtime"].__dict__, inMaintenanceMode=True))
+        elif method_name == "ExitMaintenanceMode_Task":
+            properties["runtime"] = FakeData(**dict(properties["runtime"].__dict__, inMaintenanceMode=False))
+        elif method_name == "RebootHost_Task":
+            properties["runtime"] = FakeData(**dict(properties["runtime"].__dict__, bootTime=datetime.datetime.now()))
+        elif method_name == "ShutdownHost_Task":
+            properties["runtime"] = FakeData(**dict(properties["runtime"].__dict__, connectionState="notResponding"))
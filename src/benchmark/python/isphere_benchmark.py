@@ -0,0 +1,177 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+"""isphere benchmark
+
+Measures wall time, peak memory and round trips of isphere operations against
+an in-memory fake vSphere inventory (see `fake_vsphere`), or against a SOAP recording of a real session
+(see `isphere.soap`) to include the pyVmomi deserialization cost.
+
+Usage:
+    isphere_benchmark.py [options]
+    isphere_benchmark.py -h | --help
+
+Options:
+    --sizes <sizes>         Comma separated VM counts [default: 1000,10000,100000].
+    --latency <seconds>     Simulated latency per round trip [default: 0].
+    --operations <names>    Comma separated operations to run [default: all].
+    --no-memory             Do not measure peak memory (faster).
+    --replay <recording>    Replay a recorded session instead of using the fake.
+                            Operations with unrecorded requests are skipped.
+    -h --help               Show this screen.
+"""
+
+from __future__ import print_function
+
+from collections import namedtuple
+import os
+import re
+import sys
+import time
+
+from docopt import docopt
+
+from fake_vsphere import FakeVSphere
+from isphere.command import VSphereREPL
+from isphere.interactive_wrapper import VVC
+from isphere.soap import NotRecorded
+
+try:
+    import tracemalloc
+except ImportError:  # python < 3.4
+    tracemalloc = None
+
+try:
+    _timer = time.perf_counter
+except AttributeError:
+    _timer = time.time
+
+Measurement = namedtuple("Measurement", ["operation", "size", "seconds", "peak_bytes", "round_trips"])
+
+OPERATIONS = []
+
+
+def operation(function):
+    """
+    Registers a benchmark operation. The operation is called with a prepared
+    `isphere.command.VSphereREPL` whose cache is connected to the fake.
+    """
+    OPERATIONS.append(function)
+    return function
+
+
+@operation
+def fill(repl):
+    repl.cache.fill()
+
+
+@operation
+def pattern_matching(repl):
+    patterns = [re.compile(pattern) for pattern in ("vm-0.*5$", "^vm-00012", "does-not-match")]
+    for _ in repl.yield_vm_patterns(patterns):
+        pass
+
+
+@operation
+def eval_all_vms(repl):
+    repl.eval("! vm.config.hardware.numCPU > 4 or no_output()",
+              lambda patterns: repl.cache.list_cached_vms(),
+              repl.retrieve_vm,
+              "vm")
+
+
+@operation
+def item_container_conversion(repl):
+    repl.cache.vvc.get_restricted_view_on_vms(["name", "config.uuid", "runtime.powerState", "runtime.host"])
+
+
+def create_repl(connect_vvc):
+    repl = VSphereREPL()
+    repl.cache._connection.vvc = connect_vvc()
+    repl.cache.fill()
+    return repl
+
+
+def measure(benchmark_operation, size, connect_vvc, measure_memory, count_round_trips=lambda: None):
+    repl = create_repl(connect_vvc)
+    size = size or repl.cache.number_of_vms
+    round_trips_before = count_round_trips()
+    started_at = _timer()
+    benchmark_operation(repl)
+    seconds = _timer() - started_at
+    round_trips = None if round_trips_before is None else count_round_trips() - round_trips_before
+
+    peak_bytes = None
+    if measure_memory and tracemalloc:
+        repl = create_repl(connect_vvc)
+        tracemalloc.start()
+        benchmark_operation(repl)
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return Measurement(benchmark_operation.__name__, size, seconds, peak_bytes, round_trips)
+
+
+def measure_fake(benchmark_operation, size, latency, measure_memory):
+    fake = FakeVSphere(number_of_vms=size, latency=latency)
+    return measure(benchmark_operation, size, fake.connect_vvc, measure_memory, lambda: fake.round_trips)
+
+
+def measure_replay(benchmark_operation, recording_path, measure_memory):
+    def connect_vvc():
+        vvc = VVC("replay")
+        vvc.replay(recording_path)
+        return vvc
+    return measure(benchmark_operation, None, connect_vvc, measure_memory)
+
+
+def format_measurement(measurement):
+    peak = "n/a" if measurement.peak_bytes is None else "{0:.1f}".format(measurement.peak_bytes / 1024.0 / 1024.0)
+    round_trips = "n/a" if measurement.round_trips is None else measurement.round_trips
+    return "{0:<28} {1:>8} {2:>10.3f} {3:>10} {4:>12}".format(measurement.operation,
+                                                              measurement.size,
+                                                              measurement.seconds,
+                                                              peak,
+                                                              round_trips)
+
+
+def main(*args):
+    arguments = docopt(__doc__)
+    sizes = [int(size) for size in arguments["--sizes"].split(",")]
+    latency = float(arguments["--latency"])
+    operations = OPERATIONS
+    if arguments["--operations"] != "all":
+        wanted = arguments["--operations"].split(",")
+        operations = [candidate for candidate in OPERATIONS if candidate.__name__ in wanted]
+
+    measure_memory = not arguments["--no-memory"]
+    if arguments["--replay"]:
+        recording_path = arguments["--replay"]
+        runs = [(benchmark_operation, lambda operation=benchmark_operation: measure_replay(operation, recording_path, measure_memory))
+                for benchmark_operation in operations]
+    else:
+        runs = [(benchmark_operation, lambda operation=benchmark_operation, size=size: measure_fake(operation, size, latency, measure_memory))
+                for size in sizes
+                for benchmark_operation in operations]
+
+    print("{0:<28} {1:>8} {2:>10} {3:>10} {4:>12}".format("operation", "VMs", "seconds", "peak MB", "round trips"))
+    with open(os.devnull, "w") as devnull:
+        for benchmark_operation, run in runs:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                measurement = run()
+            except NotRecorded:
+                measurement = None
+            finally:
+                sys.stdout = stdout
+            if measurement is None:
+                print("{0:<28} skipped, not covered by the recording".format(benchmark_operation.__name__))
+            else:
+                print(format_measurement(measurement))
+
+
+if __name__ == "__main__":
+    main()
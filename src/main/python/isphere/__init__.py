@@ -21,6 +21,18 @@ It also features an easy to use **API** for programmatic access.
 - `isphere.connection`: A connection and caching abstraction over
   `isphere.interactive_wrapper`.
 - `isphere.input`: a module for user input capabilities.
+- `isphere.soap`: SOAP traffic recording, replaying and instrumentation.
+- `isphere.metrics`: Per-method SOAP metrics, exported for Prometheus or as JSON.
+- `isphere.watcher`: Property change notifications and task tracking.
+- `isphere.migration`: Parallel, host-throttled vMotions.
+- `isphere.parallel`: Bounded concurrency for blocking vCenter calls.
+- `isphere.maintenance`: Rolling maintenance of many ESXi host systems.
+- `isphere.reboot`: Rolling guest reboots of virtual machines.
+- `isphere.events`: Paged reading of the vCenter event history.
+- `isphere.performance`: Batched queries of performance counters.
+- `isphere.timeseries`: Ring buffers of sampled metrics with rollups.
+- `isphere.prefix_index`: Sorted name index for fast prefix lookups.
+- `isphere.asynchronous`: An asyncio facade over `isphere.connection` (python 3 only).
 
 
 # API capabilities
@@ -51,6 +63,21 @@ See `isphere.interactive_wrapper.VVC` for all the possibilities.
     for vm in vvc.get_restricted_view_on_vms(["name", "runtime.host.name"]):
         print("{vm_name} on {host_system}".format(vm_name=vm.name, host_system=vm.runtime.host.name))
 
+## Hydrated retrieval API
+
+The hydrated retrieval API fetches the given properties of all items in one
+bulk call and returns full items. Reading those properties is served from
+a snapshot, other attributes are fetched from the server as usual.
+See `isphere.interactive_wrapper.CachedItem` for the snapshot semantics.
+
+    from isphere.interactive_wrapper import VVC
+    vvc = VVC(hostname)
+    vvc.connect(username, password)
+
+    for vm in vvc.get_vms_with_properties(["config", "runtime.powerState"]):
+        print("{vm_name}: {power_state}".format(vm_name=vm.name, power_state=vm.runtime.powerState))
+        vm.refresh()  # drop the snapshot, the next read goes to the server again
+
 ## Caching API
 
 The caching API allows to access all available item names with an optional
@@ -0,0 +1,191 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+"""
+Provides an asyncio facade over `isphere.connection.CachingVSphere` (python 3 only).
+
+pyVmomi calls block, so the `isphere.asynchronous.AsyncCachingVSphere` runs them
+on a bounded thread pool and hands out awaitable futures instead. The calls of
+one connection are serialized, calls of different connections run concurrently.
+Tasks are awaited by polling their state in bulk, so waiting does not hold the
+connection between polls.
+
+Usage:
+
+    >>> from isphere.asynchronous import AsyncCachingVSphere
+    >>> vsphere = AsyncCachingVSphere(hostname="vcenter", username="user", password="secret")
+    >>> yield from vsphere.fill()  # or `await vsphere.fill()`
+    >>> vm = yield from vsphere.retrieve_vm("some-vm")
+    >>> yield from vsphere.wait_for_tasks([vm.ResetVM_Task()])
+    >>> vsphere.close()
+"""
+
+import functools
+
+try:
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:  # python 2
+    asyncio = ThreadPoolExecutor = None
+
+from isphere.connection import CachingVSphere
+from isphere.parallel import DEFAULT_MAX_CONCURRENCY
+
+__all__ = ["AsyncCachingVSphere"]
+
+
+class AsyncCachingVSphere(object):
+
+    """
+    Awaitable access to a `isphere.connection.CachingVSphere`. All methods
+    must be called from the thread running the event loop.
+    """
+
+    def __init__(self, hostname=None, username=None, password=None, cache=None, executor=None,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, loop=None):
+        """
+        - hostname (type `str`): The vCenter host name. Must be given unless `cache` is,
+          since prompting would block the event loop.
+        - username (type `str`): The vCenter user name.
+        - password (type `str`): The vCenter password.
+        - cache (type `isphere.connection.CachingVSphere`): The connection to use
+          instead of a new one.
+        - executor (type `concurrent.futures.Executor`): The executor running the
+          blocking calls, e.G. one shared by many connections. A thread pool of
+          `max_concurrency` threads is created (and closed by `close`) if `None`.
+        - max_concurrency (type `int`): The size of the created thread pool.
+        - loop (type `asyncio.AbstractEventLoop`): The event loop, the current one if `None`.
+        """
+        if asyncio is None:
+            raise RuntimeError("AsyncCachingVSphere needs asyncio (python 3.4+).")
+        self.cache = cache or CachingVSphere(hostname, username, password)
+        self._owns_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=max(max_concurrency, 1))
+        self._loop = loop
+        self._last_call_done = None
+
+    @property
+    def loop(self):
+        """
+        The event loop the futures belong to.
+        """
+        return self._loop or asyncio.get_event_loop()
+
+    def run(self, function, *arguments):
+        """
+        Returns a future of the result of a blocking call, which is run on the
+        executor once the previous calls of this connection are done.
+        Cancelling the future before the call started skips the call.
+
+        - function (type `callable`): The blocking function, e.G. `self.cache.fill`.
+        - arguments: The arguments to call the function with.
+        """
+        loop = self.loop
+        result = loop.create_future()
+        done = loop.create_future()
+        previous_call_done, self._last_call_done = self._last_call_done, done
+
+        def finish(executor_future):
+            done.set_result(None)
+            if result.cancelled():
+                return
+            if executor_future.exception() is not None:
+                result.set_exception(executor_future.exception())
+            else:
+                result.set_result(executor_future.result())
+
+        def start(_=None):
+            if result.cancelled():
+                done.set_result(None)
+                return
+            executor_future = loop.run_in_executor(self.executor, functools.partial(function, *arguments))
+            executor_future.add_done_callback(finish)
+
+        if previous_call_done is None or previous_call_done.done():
+            start()
+        else:
+            previous_call_done.add_done_callback(start)
+        return result
+
+    def fill(self, custom_values=False):
+        """
+        Returns a future of filling the item cache (see `isphere.connection.CachingVSphere.fill`).
+
+        - custom_values (type `bool`): Whether to fetch and index the custom attribute values too.
+        """
+        return self.run(self.cache.fill, custom_values)
+
+    def retrieve_vm(self, vm_name):
+        """
+        Returns a future of the virtual machine with the given name. The name must be in the cache.
+
+        - vm_name (type `str`): The virtual machine name from the cache.
+        """
+        return self.run(self.cache.retrieve_vm, vm_name)
+
+    def retrieve_esx(self, esx_name):
+        """
+        Returns a future of the ESXi host system with the given name. The name must be in the cache.
+
+        - esx_name (type `str`): The ESX name from the cache.
+        """
+        return self.run(self.cache.retrieve_esx, esx_name)
+
+    def get_properties(self, managed_objects, properties):
+        """
+        Returns a future of a restricted view on managed objects, retrieved in a single call
+        (see `isphere.interactive_wrapper.VVC.get_restricted_view_on_managed_objects`).
+
+        - managed_objects (type `list`): The managed objects, e.G. the
+          `pyVmomi.vim.VirtualMachine`s from the cache.
+        - properties (type `list`): The desired properties, e.G. `["runtime.powerState"]`.
+        """
+        return self.run(lambda: self.cache.vvc.get_restricted_view_on_managed_objects(managed_objects, properties))
+
+    def wait_for_tasks(self, tasks, poll_seconds=1):
+        """
+        Returns a future that is done once all tasks succeeded. It holds the
+        task results in order, or the error of the first failed task.
+        The states of all tasks are polled with a single call.
+
+        - tasks (type `list`): The `pyVmomi.vim.Task`s.
+        - poll_seconds (type `float`): The time between two polls.
+        """
+        loop = self.loop
+        result = loop.create_future()
+        tasks = list(tasks)
+
+        def poll():
+            if not result.cancelled():
+                self.get_properties(tasks, ["info"]).add_done_callback(check)
+
+        def check(task_states):
+            if result.cancelled():
+                return
+            if task_states.exception() is not None:
+                result.set_exception(task_states.exception())
+                return
+            infos = dict((task_state.moref, task_state.info) for task_state in task_states.result())
+            states = [str(infos[task].state) for task in tasks]
+            if "error" in states:
+                result.set_exception(infos[tasks[states.index("error")]].error)
+            elif all(state == "success" for state in states):
+                result.set_result([infos[task].result for task in tasks])
+            else:
+                loop.call_later(poll_seconds, poll)
+
+        if tasks:
+            poll()
+        else:
+            result.set_result([])
+        return result
+
+    def close(self):
+        """
+        Shuts the executor down if it was created by this facade.
+        """
+        if self._owns_executor:
+            self.executor.shutdown(wait=False)
@@ -15,6 +15,9 @@ Options:
     -u --username <username>    Use specified username.
     --hostname <hostname>       Use specified hostname.
     --password -p <password>    Use specified password.
+    --scope <scope>             Only work on the items below these comma separated
+                                datacenters, clusters or folders, given by name or
+                                inventory path (e.G. dc-1/host/cluster-1).
     -h --help                   Show this screen.
     --version                   Show version.
 """
@@ -29,5 +32,7 @@ def main(*args):
     arguments = docopt(__doc__, version='isphere ${version}')
     sys.argv = []  # prevent cmd2 from looking at argv
 
-    repl = VSphereREPL(arguments['--hostname'], arguments['--username'], arguments['--password'])
+    scope = [name.strip() for name in arguments['--scope'].split(",")] if arguments['--scope'] else None
+
+    repl = VSphereREPL(arguments['--hostname'], arguments['--username'], arguments['--password'], scope)
     repl.cmdloop()
@@ -16,11 +16,12 @@ from isphere.command.core_command import CoreCommand
 from isphere.command.esx_command import EsxCommand
 from isphere.command.virtual_machine_command import VirtualMachineCommand
 from isphere.command.dvs_command import DvsCommand
+from isphere.command.datastore_command import DatastoreCommand
 
 __pdoc__ = {}
 
 
-class VSphereREPL(EsxCommand, VirtualMachineCommand, DvsCommand):
+class VSphereREPL(EsxCommand, VirtualMachineCommand, DvsCommand, DatastoreCommand):
 
     """
     The isphere REPL command class.
@@ -31,7 +32,7 @@ class VSphereREPL(EsxCommand, VirtualMachineCommand, DvsCommand):
     for field in cmd2.Cmd.__dict__.keys():
         __pdoc__['VSphereREPL.%s' % field] = None
 
-    def __init__(self, hostname=None, username=None, password=None):
+    def __init__(self, hostname=None, username=None, password=None, scope=None):
         """
         Create a new REPL that connects to a vmware vCenter.
 
@@ -41,10 +42,14 @@ class VSphereREPL(EsxCommand, VirtualMachineCommand, DvsCommand):
           result in a prompt.
         - password (type `str`) is the vCenter password. Can be `None` and will
           result in a prompt.
+        - scope (type `list`) are the names or inventory paths of the datacenters,
+          clusters or folders to restrict the REPL to. Can be `None` for the
+          whole vCenter.
         """
         self.hostname = hostname
         self.username = username
         self.password = password
+        self.scope = scope
         CoreCommand.__init__(self)
 
     def cmdloop(self, **kwargs):
@@ -11,10 +11,15 @@ A common set of capabilities for each command.
 from __future__ import print_function
 
 from cmd2 import Cmd
+from datetime import datetime, timedelta
 import re
+import time
+
+from pyVmomi import vmodl
 
 from isphere.connection import CachingVSphere
 from isphere.interactive_wrapper import NotFound
+from isphere.timeseries import TimeSeriesStore
 
 
 try:
@@ -22,6 +27,32 @@ try:
 except NameError:
     _input = input
 
+try:
+    _timer = time.perf_counter
+except AttributeError:  # python < 3.3
+    _timer = time.time
+
+
+_DURATION_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}
+_TIME_FORMATS = ("%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%d")
+
+
+def _parse_event_time(text, now):
+    """
+    Parses a point in time given either as a duration before `now` (e.G. `90m`,
+    `2h`, `1d`) or as a UTC timestamp (e.G. `2015-06-01T12:00`).
+    Raises `ValueError` if the text is neither.
+    """
+    duration = re.match(r"^(\d+)([smhd])$", text)
+    if duration:
+        return now - timedelta(**{_DURATION_UNITS[duration.group(2)]: int(duration.group(1))})
+    for time_format in _TIME_FORMATS:
+        try:
+            return datetime.strptime(text, time_format)
+        except ValueError:
+            pass
+    raise ValueError("Invalid time '{0}', try a duration like 2h or a timestamp like 2015-06-01T12:00.".format(text))
+
 
 class NoOutput(Exception):
 
@@ -31,23 +62,149 @@ class NoOutput(Exception):
     pass
 
 
+def _parse_custom_value_selector(pattern):
+    """
+    Returns the (attribute name, value) of a `@name=value` selector or `None`
+    if the pattern is a name pattern.
+    """
+    if not pattern.startswith("@") or "=" not in pattern:
+        return None
+    attribute_name, attribute_value = pattern[1:].split("=", 1)
+    return attribute_name, attribute_value
+
+
 class CoreCommand(Cmd):
 
     """
     The core capabilities of isphere commands, independent of the item type.
     """
 
+    settable = dict(Cmd.settable)
+    settable.update({"max_migrations_per_source": "Concurrent vMotions off an ESXi (0 is unlimited)",
+                     "max_migrations_per_target": "Concurrent vMotions onto an ESXi (0 is unlimited)",
+                     "maintenance_wave_size": "ESXis in rolling maintenance at the same time",
+                     "maintenance_state_file": "State file to resume rolling maintenance from (none if empty)",
+                     "reboot_wave_size": "VMs in a rolling reboot wave",
+                     "reboot_timeout": "Seconds a rolling reboot wave may take to be ready again",
+                     "max_parallel_calls": "Concurrent vCenter calls of bulk commands and fills",
+                     "index_custom_values": "Fetch VM custom attribute values on reload for @name=value selectors",
+                     "index_relations": "Fetch VM and ESXi placement on reload for list_vm_on and list_esx_in",
+                     "watch_poll_seconds": "Maximal seconds watch commands wait for changes at once",
+                     "perf_samples": "Recent 20 second samples perf commands average",
+                     "perf_top": "Items perf commands show, highest first (0 is all)"})
+    max_migrations_per_source = 2
+    max_migrations_per_target = 2
+    maintenance_wave_size = 1
+    maintenance_state_file = ""
+    reboot_wave_size = 1
+    reboot_timeout = 600
+    max_parallel_calls = 16
+    index_custom_values = False
+    index_relations = False
+    watch_poll_seconds = 30
+    perf_samples = 3
+    perf_top = 20
+
     def __init__(self):
-        self.cache = CachingVSphere(self.hostname, self.username, self.password)
+        self.cache = CachingVSphere(self.hostname, self.username, self.password, self.scope)
+        self.timeseries = TimeSeriesStore()
+        self.report_timing = False
+        self._timing_started_at = None
+        self._statistics_before = None
         Cmd.__init__(self)
         self.prompt = self.colorize("isphere > ", "green")
 
+    def do_timing(self, line):
+        """Usage: timing [on|off]
+        Toggle the timing report. When on, the wall time, the number of SOAP calls
+        issued, the time spent in them (network and parsing), the bytes received and
+        the cache hits are printed after each command.
+
+        Sample usage: `timing on`
+        """
+        toggle = line.strip().lower()
+        if toggle in ("on", "off"):
+            self.report_timing = toggle == "on"
+        elif toggle:
+            print(self.colorize("Usage: timing [on|off]", "red"))
+            return
+        print("Timing is {0}.".format("on" if self.report_timing else "off"))
+
+    def do_memory(self, _):
+        """Usage: memory
+        Show the approximate memory held by the cache, per structure.
+        Names shared by several structures are counted for the first one.
+
+        Sample usage: `memory`
+        """
+        report = self.cache.memory_report()
+        name_width = max(len(usage.structure) for usage in report)
+        print("{0:<{1}}  {2:>9}  {3:>10}".format("structure", name_width, "entries", "KiB"))
+        for usage in report:
+            print("{0:<{1}}  {2:>9}  {3:>10.1f}".format(usage.structure, name_width, usage.entries,
+                                                        usage.bytes / 1024.0))
+        print(self.colorize("{0:.1f} MiB held by the cache.".format(
+            sum(usage.bytes for usage in report) / 1024.0 ** 2), "blue"))
+
+    def precmd(self, line):
+        """
+        Called by the `cmd.Cmd` base class before dispatching a command.
+        Starts measuring the command if the timing report is on.
+        """
+        if self.report_timing:
+            self._statistics_before = self.cache.statistics()
+            self._timing_started_at = _timer()
+        return line
+
+    def postcmd(self, stop, line):
+        """
+        Called by the `cmd.Cmd` base class after dispatching a command.
+        Prints the timing report of the command if it was measured.
+        """
+        if self._timing_started_at is not None:
+            wall_seconds = _timer() - self._timing_started_at
+            self._timing_started_at = None
+            print(self.colorize(self.format_timing_report(wall_seconds,
+                                                          self._statistics_before,
+                                                          self.cache.statistics()),
+                                "blue"))
+        return stop
+
+    @staticmethod
+    def format_timing_report(wall_seconds, statistics_before, statistics_after):
+        """
+        Formats the timing report of a command.
+
+        - wall_seconds (type `float`): The wall time of the command.
+        - statistics_before (type `isphere.connection.Statistics`): The statistics
+          before the command.
+        - statistics_after (type `isphere.connection.Statistics`): The statistics
+          after the command.
+        """
+        soap = statistics_after.soap - statistics_before.soap
+        cache_hits = statistics_after.cache_hits - statistics_before.cache_hits
+        cache_misses = statistics_after.cache_misses - statistics_before.cache_misses
+        return ("{wall:.3f}s wall, {calls} SOAP calls ({errors} failed) taking {soap:.3f}s "
+                "({network:.3f}s network, {parsing:.3f}s serialization/parsing), "
+                "{local:.3f}s local, {kib:.1f} KiB received, "
+                "{hits}/{lookups} cache hits").format(wall=wall_seconds,
+                                                      calls=soap.calls,
+                                                      errors=soap.errors,
+                                                      soap=soap.seconds,
+                                                      network=soap.network_seconds,
+                                                      parsing=soap.seconds - soap.network_seconds,
+                                                      local=max(wall_seconds - soap.seconds, 0.0),
+                                                      kib=soap.bytes_received / 1024.0,
+                                                      hits=cache_hits,
+                                                      lookups=cache_hits + cache_misses)
+
     def preloop(self):
         """
         Called by the `cmd.Cmd` base class before entering the REPL loop.
         Displays information about the cached items.
         """
-        self.cache.fill()
+        self.cache.fill(custom_values=self.index_custom_values, max_concurrency=self.max_parallel_calls,
+                        relations=self.index_relations)
         print(
             self.colorize("{0} VMs on {1} ESXis available.".format(self.cache.number_of_vms,
                                                                    self.cache.number_of_esxis),
@@ -56,6 +213,7 @@ class CoreCommand(Cmd):
             self.colorize("{0} Distributed Virtual Switches configured.".format(
                 self.cache.number_of_dvses),
                 "blue"))
+        print(self.colorize("{0} Datastores available.".format(self.cache.number_of_datastores), "blue"))
 
     def do_reload(self, _):
         """Usage: reload
@@ -117,7 +275,269 @@ class CoreCommand(Cmd):
                 print(self.colorize(item_name_header, "red"))
                 print(self.colorize("Eval failed for {0}: {1}".format(item_name, e), "red"))
 
-    def compile_and_yield_generic_patterns(self, patterns, pattern_generator, item_count, risky=True, ask=False):
+    def print_triggered_alarms(self, item_names, name_to_moref_mapping):
+        """
+        Prints the triggered alarms of items, retrieved in bulk.
+
+        - item_names (type `list`): The names of the items.
+        - name_to_moref_mapping (type `dict`): The cache mapping from item names
+          to managed objects, e.G. `self.cache.vm_name_to_moref_mapping`.
+        """
+        if not item_names:
+            return
+        triggered_alarms = self.cache.get_triggered_alarms([name_to_moref_mapping[item_name]
+                                                            for item_name in item_names])
+        for item_name in item_names:
+            print("-" * 70)
+            print("Alarms for {0}".format(item_name))
+            for alarm in triggered_alarms.get(name_to_moref_mapping[item_name], []):
+                print("\talarm: {0}".format(alarm.name))
+                print("\talarm status: {0}{1}".format(alarm.status, " (acknowledged)" if alarm.acknowledged else ""))
+                print("\ttriggered at: {0}".format(alarm.time))
+
+    def watch(self, line, item_name_generator, name_to_moref_mapping, usage):
+        """
+        Run a watch command. Watches properties of the items matching the given
+        patterns with one property collector filter and prints the changes as they
+        are reported, until interrupted with Ctrl+C.
+
+        - line (type `str`): The text line provided by the user. The format should
+          be as follows: <patterns> ! <property1> [<property2>...]
+        - item_name_generator (type `callable`): A function that should generate
+          an iterable that represents the available item names for pattern matching.
+        - name_to_moref_mapping (type `dict`): The cache mapping from item names
+          to managed objects, e.G. `self.cache.vm_name_to_moref_mapping`.
+        - usage (type `str`): The help command to point to on malformed input.
+        """
+        try:
+            patterns, properties = line.split("!", 1)
+            properties = properties.split()
+        except ValueError:
+            properties = []
+        if not properties:
+            print(self.colorize("Looks like your input was malformed. Try `{0}`.".format(usage), "red"))
+            return
+
+        item_names = dict((name_to_moref_mapping[item_name], item_name) for item_name in item_name_generator(patterns))
+        if not item_names:
+            return
+
+        watcher = self.cache.create_property_watcher()
+        try:
+            watcher.watch(item_names.keys(), properties)
+            print(self.colorize("Watching {0} on {1} items, Ctrl+C to stop.".format(", ".join(properties),
+                                                                                    len(item_names)),
+                                "blue"))
+            while True:
+                for update in watcher.wait(self.watch_poll_seconds):
+                    for property_path, value in sorted(update.changes.items()):
+                        print("{0:%H:%M:%S} {1}: {2} = {3}".format(datetime.now(),
+                                                                   item_names.get(update.obj, update.obj),
+                                                                   property_path,
+                                                                   value))
+        except KeyboardInterrupt:
+            pass
+        except vmodl.MethodFault as e:
+            print(self.colorize("Could not watch: {0}".format(e.msg), "red"))
+        finally:
+            watcher.close()
+
+    def print_events(self, line, item_name_generator, name_to_moref_mapping):
+        """
+        Run an events command. Prints the events of the items matching the given
+        patterns as they are read from the vCenter, oldest first.
+
+        - line (type `str`): The text line provided by the user. The format should
+          be as follows: <patterns> [! <since> [<until>]], where the times are
+          durations before now (e.G. `2h`) or UTC timestamps. The default is
+          the last hour.
+        - item_name_generator (type `callable`): A function that should generate
+          an iterable that represents the available item names for pattern matching.
+        - name_to_moref_mapping (type `dict`): The cache mapping from item names
+          to managed objects, e.G. `self.cache.vm_name_to_moref_mapping`.
+        """
+        patterns, _, time_range = line.partition("!")
+        time_range = time_range.split() or ["1h"]
+        now = datetime.utcnow()
+        try:
+            begin_time = _parse_event_time(time_range[0], now)
+            end_time = _parse_event_time(time_range[1], now) if len(time_range) > 1 else None
+        except ValueError as e:
+            print(self.colorize(str(e), "red"))
+            return
+
+        morefs = [name_to_moref_mapping[item_name] for item_name in item_name_generator(patterns)]
+        number_of_events = 0
+        for event in self.cache.read_events(morefs, begin_time, end_time):
+            number_of_events += 1
+            print("{0:%Y-%m-%d %H:%M:%S} {1}{2}".format(event.createdTime,
+                                                        "[{0}] ".format(event.userName) if event.userName else "",
+                                                        event.fullFormattedMessage))
+        if morefs:
+            print(self.colorize("{0} events.".format(number_of_events), "blue"))
+
+    def print_performance(self, line, item_name_generator, name_to_moref_mapping, usage):
+        """
+        Run a perf command. Prints the recent performance counter values of the
+        items matching the given patterns, sorted by the first counter, highest
+        first. All items and counters are queried in a few batched calls.
+
+        - line (type `str`): The text line provided by the user. The format should
+          be as follows: <patterns> ! <counter1> [<counter2>...]
+        - item_name_generator (type `callable`): A function that should generate
+          an iterable that represents the available item names for pattern matching.
+        - name_to_moref_mapping (type `dict`): The cache mapping from item names
+          to managed objects, e.G. `self.cache.vm_name_to_moref_mapping`.
+        - usage (type `str`): The help command to point to on malformed input.
+        """
+        try:
+            patterns, counter_names = line.split("!", 1)
+            counter_names = counter_names.split()
+        except ValueError:
+            counter_names = []
+        if not counter_names:
+            print(self.colorize("Looks like your input was malformed. Try `{0}`.".format(usage), "red"))
+            return
+
+        item_names = dict((name_to_moref_mapping[item_name], item_name) for item_name in item_name_generator(patterns))
+        if not item_names:
+            return
+        try:
+            result = self.cache.query_performance(list(item_names.keys()), counter_names, samples=self.perf_samples)
+        except NotFound as e:
+            print(self.colorize(str(e), "red"))
+            return
+        except vmodl.MethodFault as e:
+            print(self.colorize("Could not query performance: {0}".format(e.msg), "red"))
+            return
+        self.timeseries.record_performance(result, item_names)
+
+        top = result.top(counter_names[0], self.perf_top or None)
+        name_width = max([len("name")] + [len(item_names[entity]) for entity, _ in top])
+        headers = ["{0} ({1})".format(counter.name, counter.unit) for counter in result.counters]
+        print("{0:<{1}}  {2}".format("name", name_width, "  ".join(headers)))
+        entity_indices = dict((entity, index) for index, entity in enumerate(result.entities))
+        for entity, _ in top:
+            values = [result.values[counter.name][entity_indices[entity]] for counter in result.counters]
+            print("{0:<{1}}  {2}".format(item_names[entity], name_width,
+                                         "  ".join("{0:>{1}}".format("{0:.1f}".format(value) if value == value else "-",
+                                                                     len(header))
+                                                   for value, header in zip(values, headers))))
+        print(self.colorize("Showing {0} of {1} items.".format(len(top), len(item_names)), "blue"))
+
+    def print_trends(self, line, item_name_generator, usage):
+        """
+        Run a trend command. Prints the min, average, max and 95th percentile of
+        a counter for the items matching the given patterns, computed from the
+        samples recorded by earlier perf commands (see `self.timeseries`).
+
+        - line (type `str`): The text line provided by the user. The format should
+          be as follows: <patterns> ! <counter> [<window>], where the window is a
+          duration before now (e.G. `30m`). The default is all recorded samples.
+        - item_name_generator (type `callable`): A function that should generate
+          an iterable that represents the available item names for pattern matching.
+        - usage (type `str`): The help command to point to on malformed input.
+        """
+        patterns, _, arguments = line.partition("!")
+        arguments = arguments.split()
+        if len(arguments) not in (1, 2):
+            print(self.colorize("Looks like your input was malformed. Try `{0}`.".format(usage), "red"))
+            return
+        counter_name = arguments[0]
+        window_seconds = None
+        if len(arguments) == 2:
+            now = datetime.utcnow()
+            try:
+                window_seconds = (now - _parse_event_time(arguments[1], now)).total_seconds()
+            except ValueError as e:
+                print(self.colorize(str(e), "red"))
+                return
+
+        now = time.time()
+        rollups = [(item_name, self.timeseries.rollup(item_name, counter_name, window_seconds, now))
+                   for item_name in item_name_generator(patterns)]
+        rollups = sorted([(item_name, rollup) for item_name, rollup in rollups if rollup],
+                         key=lambda item_name_and_rollup: item_name_and_rollup[1].p95, reverse=True)
+        if not rollups:
+            print(self.colorize("No samples of {0}, record some with a perf command first.".format(counter_name),
+                                "red"))
+            return
+        name_width = max([len("name")] + [len(item_name) for item_name, _ in rollups])
+        print("{0:<{1}}  {2:>7}  {3:>10}  {4:>10}  {5:>10}  {6:>10}".format(
+            "name", name_width, "samples", "min", "avg", "max", "p95"))
+        for item_name, rollup in rollups:
+            print("{0:<{1}}  {2:>7}  {3:>10.1f}  {4:>10.1f}  {5:>10.1f}  {6:>10.1f}".format(
+                item_name, name_width, rollup.count, rollup.min, rollup.avg, rollup.max, rollup.p95))
+
+    def do_dump_timeseries(self, path):
+        """Usage: dump_timeseries <file>
+        Write the performance samples recorded by perf commands to a compact
+        binary file for later analysis (see `isphere.timeseries`).
+
+        Sample usage: `dump_timeseries samples.ists`
+        """
+        path = path.strip()
+        if not path:
+            print(self.colorize("Usage: dump_timeseries <file>", "red"))
+            return
+        try:
+            with open(path, "wb") as binary_file:
+                self.timeseries.dump(binary_file)
+        except IOError as e:
+            print(self.colorize("Could not write {0}: {1}".format(path, e), "red"))
+            return
+        print("Wrote {0} series to {1}.".format(len(self.timeseries.series), path))
+
+    def do_load_timeseries(self, path):
+        """Usage: load_timeseries <file>
+        Replace the recorded performance samples with the ones of a file
+        written by `dump_timeseries`.
+
+        Sample usage: `load_timeseries samples.ists`
+        """
+        path = path.strip()
+        if not path:
+            print(self.colorize("Usage: load_timeseries <file>", "red"))
+            return
+        try:
+            with open(path, "rb") as binary_file:
+                self.timeseries = TimeSeriesStore.load(binary_file)
+        except (IOError, ValueError) as e:
+            print(self.colorize("Could not load {0}: {1}".format(path, e), "red"))
+            return
+        print("Loaded {0} series from {1}.".format(len(self.timeseries.series), path))
+
+    def completedefault(self, text, line, begidx, endidx):
+        """
+        Completes the item names of commands ending in an item type, e.G.
+        `info_vm`, with the `complete_<type>_names` method of that type.
+        """
+        item_type = line.split(None, 1)[0].rsplit("_", 1)[-1]
+        completer = getattr(self, "complete_{0}_names".format(item_type), None)
+        return completer(text, line, begidx, endidx) if completer else []
+
+    @staticmethod
+    def complete_item_names(prefix_index, text, line, endidx):
+        """
+        Returns the completions of the item name being typed, looked up in a
+        sorted prefix index. Nothing is completed after the `!`.
+
+        - prefix_index (type `isphere.prefix_index.PrefixIndex`): The item names,
+          e.G. `self.cache.vm_name_index`.
+        - text (type `str`): The part of the word readline completes, which may
+          start after a delimiter inside the word.
+        - line (type `str`): The whole line.
+        - endidx (type `int`): The cursor position in the line.
+        """
+        before_cursor = line[:endidx]
+        if "!" in before_cursor:
+            return []
+        word = "" if not before_cursor or before_cursor[-1].isspace() else before_cursor.split()[-1]
+        offset = len(word) - len(text)
+        return [item_name[offset:] for item_name in prefix_index.complete(word)]
+
+    def compile_and_yield_generic_patterns(self, patterns, pattern_generator, item_count, risky=True, ask=False,
+                                           custom_value_selectors=False):
         """
         Compiles and returns regular expression patterns. Swallows the exception
         and complains if the patterns are invalid.
@@ -132,6 +552,9 @@ class CoreCommand(Cmd):
           are given.
         - ask (type `bool`, default `False`): Whether to prompt for confirmation when the given patterns
           match more than 50 elements.
+        - custom_value_selectors (type `bool`, default `False`): Whether `@name=value` selectors are
+          taken literally instead of being compiled. They are then passed to `pattern_generator` as
+          a list of (attribute name, value) after the compiled patterns.
         """
         if not patterns and risky:
             unformatted_message = "No pattern specified - you're doing this to all {count} items. Proceed? (y/N) "
@@ -148,12 +571,20 @@ class CoreCommand(Cmd):
             if not _input(message).lower() == "y":
                 return []
 
+        selectors = []
+        if custom_value_selectors:
+            parsed_patterns = [(pattern, _parse_custom_value_selector(pattern)) for pattern in actual_patterns]
+            selectors = [selector for _, selector in parsed_patterns if selector is not None]
+            actual_patterns = [pattern for pattern, selector in parsed_patterns if selector is None]
+
         try:
             compiled_patterns = [re.compile(pattern) for pattern in actual_patterns]
         except Exception as e:
             print(self.colorize("Invalid regular expression patterns: {0}".format(e), "red"))
             return []
 
+        if custom_value_selectors:
+            return pattern_generator(compiled_patterns, selectors)
         return pattern_generator(compiled_patterns)
 
     @staticmethod
@@ -0,0 +1,89 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+"""
+Datastore specific REPL commands.
+"""
+
+from __future__ import print_function
+
+from pyVmomi import vmodl
+
+from isphere.command.core_command import CoreCommand
+
+_GIB = 1024.0 ** 3
+
+
+class DatastoreCommand(CoreCommand):
+
+    def do_eval_ds(self, line):
+        """Usage: eval_ds [pattern1 [pattern2]...] ! <statement>
+        Evaluate a statement of python code. You can access the
+        datastore object by using the variable `ds`.
+
+        Calling the function `no_output` will not produce any output (use this
+                                                                      to filter).
+
+        Sample usage:
+        * `eval_ds MY_DATASTORE_NAME ! ds.summary.type`
+        * `eval_ds ! ds.overallStatus if ds.overallStatus != "green" else no_output()`
+          ^ shows overall status of datastores unless they have the "green" status
+        """
+        self.eval(line, self.compile_and_yield_ds_patterns, self.retrieve_ds, "ds")
+
+    def do_list_ds(self, patterns):
+        """Usage: list_ds [pattern1 [pattern2]...]
+        List the datastore names matching the given ORed name patterns.
+
+        Sample usage:
+        * `list_ds`
+        * `list_ds .*-ssd-.*`
+        """
+        for datastore_name in self.compile_and_yield_ds_patterns(patterns, risky=False):
+            print(datastore_name)
+
+    def do_info_ds(self, patterns):
+        """Usage: info_ds [pattern1 [pattern2]...]
+        Show the capacity, free space and uncommitted (thin provisioned) space
+        of datastores matching the given ORed name patterns, highest utilization
+        first. The space of all datastores is retrieved at once.
+
+        Sample usage:
+        * `info_ds`
+        * `info_ds .*-ssd-.*`
+        """
+        datastore_names = list(self.compile_and_yield_ds_patterns(patterns, risky=False))
+        if not datastore_names:
+            return
+        try:
+            usages = self.cache.get_datastore_usage(datastore_names)
+        except vmodl.MethodFault as e:
+            print(self.colorize("Could not retrieve datastore usage: {0}".format(e.msg), "red"))
+            return
+
+        name_width = max(len(usage.name) for usage in usages) if usages else len("name")
+        print("{0:<{1}}  {2:>12}  {3:>12}  {4:>12}  {5:>6}  {6:>11}".format(
+            "name", name_width, "capacity GiB", "free GiB", "uncommitted", "used %", "provisioned"))
+        for usage in usages:
+            print("{0:<{1}}  {2:>12.1f}  {3:>12.1f}  {4:>12.1f}  {5:>6.1f}  {6:>10.1f}%".format(
+                usage.name, name_width, usage.capacity / _GIB, usage.free_space / _GIB, usage.uncommitted / _GIB,
+                100 * usage.utilization, 100 * usage.provisioned))
+        print(self.colorize("Showing {0} of {1} datastores.".format(len(usages), len(datastore_names)), "blue"))
+
+    def complete_ds_names(self, text, line, begidx, endidx):
+        return self.complete_item_names(self.cache.datastore_name_index, text, line, endidx)
+
+    def compile_and_yield_ds_patterns(self, patterns, risky=True):
+        return self.compile_and_yield_generic_patterns(patterns, self.yield_ds_patterns,
+                                                       self.cache.number_of_datastores, risky)
+
+    def yield_ds_patterns(self, compiled_patterns):
+        for datastore_name in self.cache.list_cached_datastores():
+            if any([pattern.match(datastore_name) for pattern in compiled_patterns]):
+                yield(datastore_name)
+
+    def retrieve_ds(self, datastore_name):
+        return self.cache.retrieve_datastore(datastore_name)
@@ -43,6 +43,9 @@ class DvsCommand(CoreCommand):
         for dvs_name in self.compile_and_yield_dvs_patterns(patterns, risky=False):
             print(dvs_name)
 
+    def complete_dvs_names(self, text, line, begidx, endidx):
+        return self.complete_item_names(self.cache.dvs_name_index, text, line, endidx)
+
     def compile_and_yield_dvs_patterns(self, patterns, risky=True):
         return self.compile_and_yield_generic_patterns(patterns, self.yield_dvs_patterns, self.cache.number_of_dvses, risky)
 
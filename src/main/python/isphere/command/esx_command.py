@@ -11,6 +11,8 @@ ESXi host system specific REPL commands.
 from __future__ import print_function
 
 from isphere.command.core_command import CoreCommand
+from isphere.interactive_wrapper import NotFound
+from isphere.maintenance import ACTIONS, RollingMaintenance
 
 
 class EsxCommand(CoreCommand):
@@ -44,6 +46,24 @@ class EsxCommand(CoreCommand):
         for esx_name in self.compile_and_yield_esx_patterns(patterns, risky=False):
             print(esx_name)
 
+    def do_list_esx_in(self, cluster_names):
+        """Usage: list_esx_in cluster1 [cluster2]...
+        List the esx names in the given clusters.
+        The placement is looked up locally. It is fetched on first use unless
+        `index_relations` is set.
+
+        Sample usage:
+        * `list_esx_in cluster-1 cluster-2`
+        """
+        for cluster_name in cluster_names.split():
+            try:
+                esx_names = self.cache.find_esx_names_in(cluster_name)
+            except NotFound as e:
+                print(self.colorize(str(e), "red"))
+                continue
+            for esx_name in esx_names:
+                print(esx_name)
+
     def compile_and_yield_esx_patterns(self, patterns, risky=True):
         return self.compile_and_yield_generic_patterns(patterns,
                                                        self.yield_esx_patterns,
@@ -108,6 +128,116 @@ class EsxCommand(CoreCommand):
         self.cache.wait_for_tasks([shutdown_task])
         return
 
+    def do_rolling_maintenance_esx(self, line):
+        """Usage: rolling_maintenance_esx [pattern1 [pattern2]...] ! enter|reboot|shutdown
+        Put the esxis matching the given ORed name patterns into maintenance,
+        `maintenance_wave_size` esxis at a time (see `set`).
+        The powered on VMs of each esx are moved to the least loaded esxis of its
+        cluster in parallel first.
+        * enter: the esxis stay in maintenance mode.
+        * reboot: the esxis are rebooted and leave the maintenance mode once they
+          are connected again.
+        * shutdown: the esxis are shut down.
+        If `maintenance_state_file` is set, the progress is kept in that file and
+        running the same command again resumes an interrupted maintenance. A state
+        file of another vCenter, action or selection of esxis is refused.
+
+        Sample usage:
+        * `rolling_maintenance_esx devesx[0-9]+ ! reboot`
+        """
+        try:
+            patterns, action = line.split("!", 1)
+            action = action.strip()
+        except ValueError:
+            print("Looks like your input was malformed. Try `help rolling_maintenance_esx`.")
+            return
+
+        if action not in ACTIONS:
+            print("Unknown action '{0}', try one of {1}.".format(action, ", ".join(ACTIONS)))
+            return
+
+        esx_names = list(self.compile_and_yield_esx_patterns(patterns))
+        if not esx_names:
+            return
+
+        hosts = [(esx_name, self.cache.esx_name_to_moref_mapping[esx_name]) for esx_name in esx_names]
+        task_tracker = self.cache.create_task_tracker()
+        try:
+            rolling_maintenance = RollingMaintenance(self.cache.vvc,
+                                                     hosts,
+                                                     task_tracker,
+                                                     action=action,
+                                                     wave_size=self.maintenance_wave_size,
+                                                     state_path=self.maintenance_state_file or None,
+                                                     max_migrations_per_source=self.max_migrations_per_source,
+                                                     max_migrations_per_target=self.max_migrations_per_target)
+            maintenances = rolling_maintenance.run(on_progress=print)
+        except ValueError as e:
+            print(self.colorize(str(e), "red"))
+            return
+        finally:
+            task_tracker.close()
+
+        stages = [maintenance.stage for maintenance in maintenances]
+        print("{0} of {1} esxis done, {2} failed.".format(stages.count("done"), len(stages), stages.count("failed")))
+
+    def do_alarms_esx(self, patterns):
+        """Usage: alarms_esx [pattern1 [pattern2]...]
+        Show alarm information for esxis matching the given ORed name patterns.
+        The alarms of all esxis are retrieved at once.
+
+        Sample usage: `alarms_esx MY_ESX_NAME`
+        """
+        esx_names = list(self.compile_and_yield_esx_patterns(patterns))
+        self.print_triggered_alarms(esx_names, self.cache.esx_name_to_moref_mapping)
+
+    def do_watch_esx(self, line):
+        """Usage: watch_esx [pattern1 [pattern2]...] ! <property1> [<property2>...]
+        Watch properties of esxis matching the given ORed name patterns.
+        The current values are printed first, then each change as it happens,
+        until interrupted with Ctrl+C.
+
+        Sample usage: `watch_esx devesx.* ! runtime.connectionState runtime.inMaintenanceMode`
+        """
+        self.watch(line, self.compile_and_yield_esx_patterns, self.cache.esx_name_to_moref_mapping, "help watch_esx")
+
+    def do_events_esx(self, line):
+        """Usage: events_esx [pattern1 [pattern2]...] [! <since> [<until>]]
+        Show the events of esxis matching the given ORed name patterns, oldest first
+        (within each group of 25 esxis).
+        The times are durations before now (like `30m`, `2h` or `7d`) or UTC
+        timestamps (like `2015-06-01T12:00`). Shows the last hour by default.
+
+        Sample usage: `events_esx devesx.* ! 2015-06-01T12:00 2015-06-01T14:00`
+        """
+        self.print_events(line, self.compile_and_yield_esx_patterns, self.cache.esx_name_to_moref_mapping)
+
+    def do_perf_esx(self, line):
+        """Usage: perf_esx [pattern1 [pattern2]...] ! <counter1> [<counter2>...]
+        Show performance counters of esxis matching the given ORed name patterns,
+        sorted by the first counter, highest first (see `help perf_vm`).
+
+        Sample usage: `perf_esx devesx.* ! cpu.usage.average disk.maxTotalLatency.latest`
+        """
+        self.print_performance(line, self.compile_and_yield_esx_patterns, self.cache.esx_name_to_moref_mapping,
+                               "help perf_esx")
+
+    def do_trend_esx(self, line):
+        """Usage: trend_esx [pattern1 [pattern2]...] ! <counter> [<window>]
+        Show the min, average, max and 95th percentile of a counter for esxis
+        matching the given ORed name patterns, computed from the samples
+        recorded by `perf_esx` (see `help trend_vm`).
+
+        Sample usage: `trend_esx devesx.* ! cpu.usage.average 1h`
+        """
+        self.print_trends(line, self.compile_and_yield_esx_patterns, "help trend_esx")
+
+    def complete_esx_names(self, text, line, begidx, endidx):
+        return self.complete_item_names(self.cache.esx_name_index, text, line, endidx)
+
+    complete_enter_maintenance = complete_esx_names
+    complete_exit_maintenance = complete_esx_names
+
     def yield_esx_patterns(self, compiled_patterns):
         for esx_name in self.cache.list_cached_esxis():
             if any([pattern.match(esx_name) for pattern in compiled_patterns]):
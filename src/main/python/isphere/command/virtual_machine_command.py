@@ -13,6 +13,8 @@ from pyVmomi import vim
 
 from isphere.interactive_wrapper import NotFound
 from isphere.command.core_command import CoreCommand, _input
+from isphere.migration import MigrationPlanner
+from isphere.reboot import RollingReboot
 import time
 
 
@@ -64,6 +66,7 @@ class VirtualMachineCommand(CoreCommand):
     def do_set_custom_attribute_vm(self, patterns):
         """Usage: set_custom_attribute_vm [pattern1 [pattern2]...]
         Set custom attributes by name on VMs matching the given ORed name patterns.
+        Up to `max_parallel_calls` VMs are updated at the same time (see `set`).
 
         Sample usage: `set_custom_attribute_vm` foo.* ^other-name$
         """
@@ -79,19 +82,25 @@ class VirtualMachineCommand(CoreCommand):
         target_value = _input("Target value for {name}? ".format(
             name=target_name))
 
-        for vm_name in self.compile_and_yield_vm_patterns(patterns):
-            print("Setting attribute for {vm_name}".format(vm_name=vm_name))
-            try:
-                self.cache.set_custom_attribute(
-                    self.cache.retrieve_vm(vm_name).raw_vm,
-                    target_name,
-                    target_value)
-            except Exception as e:
+        try:
+            self.cache.find_custom_attribute_key(target_name)
+        except NotFound as e:
+            print(self.colorize(str(e), "red"))
+            return
+
+        vm_names = dict((self.cache.vm_name_to_moref_mapping[vm_name], vm_name)
+                        for vm_name in self.compile_and_yield_vm_patterns(patterns))
+        results = self.cache.set_custom_attributes(vm_names.keys(), target_name, target_value,
+                                                   max_concurrency=self.max_parallel_calls)
+        for vm, problem in results:
+            if problem:
                 print(self.colorize(
-                    "Got a problem: {problem}".format(problem=e),
+                    "Got a problem with {vm_name}: {problem}".format(vm_name=vm_names[vm], problem=problem),
                     "red"))
                 print(self.colorize("Not continuing.", "red"))
+                results.close()
                 break
+            print("Set attribute for {vm_name}".format(vm_name=vm_names[vm]))
 
     def do_eval_vm(self, line):
         """Usage: eval_vm [pattern1 [pattern2]...] ! <statement>
@@ -118,6 +127,34 @@ class VirtualMachineCommand(CoreCommand):
             print("Asking {0} to reboot".format(vm_name))
             self.retrieve_vm(vm_name).RebootGuest()
 
+    def do_rolling_reboot_vm(self, patterns):
+        """Usage: rolling_reboot_vm [pattern1 [pattern2]...]
+        Soft reboot vms matching the given ORed name patterns in waves of
+        `reboot_wave_size` vms (see `set`).
+        The next wave starts once the VMware tools of all vms of the wave run
+        again and their heartbeat is green. Stops when a wave is not ready
+        within `reboot_timeout` seconds.
+
+        Sample usage: `rolling_reboot_vm appserver[0-9]+`
+        """
+        vm_names = list(self.compile_and_yield_vm_patterns(patterns))
+        if not vm_names:
+            return
+
+        vms = [(vm_name, self.cache.vm_name_to_moref_mapping[vm_name]) for vm_name in vm_names]
+        watcher = self.cache.create_property_watcher()
+        try:
+            rolling_reboot = RollingReboot(watcher,
+                                           vms,
+                                           wave_size=self.reboot_wave_size,
+                                           timeout_seconds=self.reboot_timeout)
+            reboots = rolling_reboot.run(on_progress=print)
+        finally:
+            watcher.close()
+
+        states = [reboot.state for reboot in reboots]
+        print("{0} of {1} vms ready, {2} failed.".format(states.count("ready"), len(states), states.count("failed")))
+
     def do_shutdown_vm(self, patterns, ask=True):
         """Usage: shutdown_vm [pattern1 [pattern2]...]
         shutdown vms matching the given ORed name patterns.
@@ -155,6 +192,10 @@ class VirtualMachineCommand(CoreCommand):
     def do_migrate_vm(self, line):
         """Usage: migrate_vm [pattern1 [pattern2]...] ! TARGET_ESX_NAME
         Migrate one or several VMs to another ESX host by name.
+        The ESX host can be given by name, FQDN or short host name.
+        The vMotions run in parallel, limited per source and target host by the
+        `max_migrations_per_source` and `max_migrations_per_target` settings
+        (see `set`).
 
         Sample usage: `migrate MYVNNAME ! ESX_FQDN`
         """
@@ -171,46 +212,136 @@ class VirtualMachineCommand(CoreCommand):
             return
 
         try:
-            # TODO use esx from cache, allows for better error messages (eg no fqdn)
-            esx_host = self.cache.find_by_dns_name(esx_name)
+            esx_host = self.cache.find_esx_host(esx_name)
         except NotFound:
-            print("Target esx host '{0}' not found, maybe try with FQDN?".format(esx_name))
+            suggestions = self.cache.suggest_esx_names(esx_name)
+            if suggestions:
+                print("Target esx host '{0}' not found, did you mean {1}?".format(esx_name, " or ".join(suggestions)))
+            else:
+                print("Target esx host '{0}' not found.".format(esx_name))
             return
 
-        for vm_name in self.compile_and_yield_vm_patterns(patterns):
-            relocate_spec = vim.vm.RelocateSpec(host=esx_host)
-            print("Relocating {0} to {1}".format(vm_name, esx_name))
-            try:
-                self.retrieve_vm(vm_name).Relocate(relocate_spec)
-            except Exception as e:
-                print("Relocation failed: {0}".format(e))
+        vm_names = list(self.compile_and_yield_vm_patterns(patterns))
+        if not vm_names:
+            return
+
+        current_esx_hosts = self.cache.get_current_esx_hosts(vm_names)
+        task_tracker = self.cache.create_task_tracker()
+        try:
+            planner = MigrationPlanner(task_tracker,
+                                       max_per_source_host=self.max_migrations_per_source,
+                                       max_per_target_host=self.max_migrations_per_target)
+            for vm_name in vm_names:
+                planner.add(vm_name,
+                            self.cache.vm_name_to_moref_mapping[vm_name],
+                            current_esx_hosts.get(vm_name),
+                            esx_host)
+            print("Relocating {0} VMs to {1}".format(len(vm_names), esx_name))
+            moves = planner.run(on_progress=print)
+        finally:
+            task_tracker.close()
+
+        for move in moves:
+            if move.state == "error":
+                print("Relocation of {0} failed: {1}".format(move.vm_name, getattr(move.error, "msg", None) or move.error))
 
     def do_alarms_vm(self, patterns):
         """Usage: alarms_vm [pattern1 [pattern2]...]
         Show alarm information for vms matching the given ORed name patterns.
+        The alarms of all vms are retrieved at once.
 
         Sample usage: `alarms MY_VM_NAME`
         """
-        for vm_name in self.compile_and_yield_vm_patterns(patterns):
-            print("-" * 70)
-            print("Alarms for {0}".format(vm_name))
-            alarms = self.retrieve_vm(vm_name).triggeredAlarmState
-            for alarm in alarms:
-                print("\talarm_moref: {0}".format(alarm.key.split('.')[0]))
-                print("\talarm status: {0}".format(alarm.overallStatus))
+        vm_names = list(self.compile_and_yield_vm_patterns(patterns))
+        self.print_triggered_alarms(vm_names, self.cache.vm_name_to_moref_mapping)
+
+    def do_watch_vm(self, line):
+        """Usage: watch_vm [pattern1 [pattern2]...] ! <property1> [<property2>...]
+        Watch properties of vms matching the given ORed name patterns.
+        The current values are printed first, then each change as it happens,
+        until interrupted with Ctrl+C. All vms are watched with a single
+        property collector filter, which is cheap on the vCenter.
+
+        Sample usage: `watch_vm dev.* ! runtime.powerState guest.toolsRunningStatus`
+        """
+        self.watch(line, self.compile_and_yield_vm_patterns, self.cache.vm_name_to_moref_mapping, "help watch_vm")
+
+    def do_events_vm(self, line):
+        """Usage: events_vm [pattern1 [pattern2]...] [! <since> [<until>]]
+        Show the events of vms matching the given ORed name patterns, oldest first
+        (within each group of 25 vms).
+        The times are durations before now (like `30m`, `2h` or `7d`) or UTC
+        timestamps (like `2015-06-01T12:00`). Shows the last hour by default.
+        The events are read from the vCenter in pages while they are printed.
+
+        Sample usage:
+        * `events_vm dev.*`
+        * `events_vm dev.* ! 2d 1d`
+        """
+        self.print_events(line, self.compile_and_yield_vm_patterns, self.cache.vm_name_to_moref_mapping)
+
+    def do_perf_vm(self, line):
+        """Usage: perf_vm [pattern1 [pattern2]...] ! <counter1> [<counter2>...]
+        Show performance counters of vms matching the given ORed name patterns,
+        sorted by the first counter, highest first. The values are averaged over
+        the last `perf_samples` real time samples and only the top `perf_top`
+        vms are shown.
+        Counters are named `<group>.<name>.<rollup>`. The vms are queried in
+        batches, so even thousands of vms cost only a few calls.
+
+        Sample usage: `perf_vm dev.* ! cpu.ready.summation cpu.usage.average`
+        """
+        self.print_performance(line, self.compile_and_yield_vm_patterns, self.cache.vm_name_to_moref_mapping,
+                               "help perf_vm")
+
+    def do_trend_vm(self, line):
+        """Usage: trend_vm [pattern1 [pattern2]...] ! <counter> [<window>]
+        Show the min, average, max and 95th percentile of a counter for vms
+        matching the given ORed name patterns, highest p95 first.
+        The values are computed locally from the samples recorded by `perf_vm`,
+        optionally only over the last window (like `30m` or `2h`).
+
+        Sample usage: `trend_vm dev.* ! cpu.ready.summation 30m`
+        """
+        self.print_trends(line, self.compile_and_yield_vm_patterns, "help trend_vm")
+
+    def complete_vm_names(self, text, line, begidx, endidx):
+        return self.complete_item_names(self.cache.vm_name_index, text, line, endidx)
 
     def do_list_vm(self, patterns):
         """Usage: list [pattern1 [pattern2]...]
         List the vm names matching the given ORed name patterns.
+        Patterns like `@owner=payments` select vms by custom attribute value.
 
         Sample usage:
         * `list dev.* ...ybc01`
+        * `list @owner=payments`
         * `list`
         * `list .*`
         """
         for vm_name in self.compile_and_yield_vm_patterns(patterns, risky=False):
             print(vm_name)
 
+    def do_list_vm_on(self, names):
+        """Usage: list_vm_on name1 [name2]...
+        List the vm names placed on the given esxis, clusters, datastores,
+        networks or resource pools.
+        The placement is looked up locally. It is fetched on first use unless
+        `index_relations` is set.
+
+        Sample usage:
+        * `list_vm_on devesx99.rz.is`
+        * `list_vm_on cluster-1 datastore-1`
+        """
+        for name in names.split():
+            try:
+                vm_names = self.cache.find_vm_names_on(name)
+            except NotFound as e:
+                print(self.colorize(str(e), "red"))
+                continue
+            for vm_name in vm_names:
+                print(vm_name)
+
     def do_info_vm(self, patterns):
         """Usage: info_vm [pattern1 [pattern2]...]
         Show quick info about vms matching the given ORed name patterns.
@@ -223,7 +354,7 @@ class VirtualMachineCommand(CoreCommand):
             vm = self.retrieve_vm(vm_name)
             print("-" * 70)
             print("Name: {0}".format(vm.name))
-            print("ESXi Host: {0}".format(vm.get_esx_host().name))
+            print("ESXi Host: {0}".format(self.cache.get_esx_name_of_vm(vm_name)))
             print("Path to VM: {0}".format(vm.summary.config.vmPathName))
             print("BIOS UUID: {0}".format(vm.config.uuid))
             print("CPUs: {0}".format(vm.config.hardware.numCPU))
@@ -255,11 +386,19 @@ class VirtualMachineCommand(CoreCommand):
                                                        self.yield_vm_patterns,
                                                        self.cache.number_of_vms,
                                                        risky,
-                                                       ask)
+                                                       ask,
+                                                       custom_value_selectors=True)
+
+    def yield_vm_patterns(self, compiled_patterns, custom_value_selectors=()):
+        selected_vm_names = set()
+        for selector in custom_value_selectors:
+            try:
+                selected_vm_names.update(self.cache.find_vm_names_by_custom_value(*selector))
+            except NotFound as e:
+                print(self.colorize(str(e), "red"))
 
-    def yield_vm_patterns(self, compiled_patterns):
         for vm_name in self.cache.list_cached_vms():
-            if any([pattern.match(vm_name) for pattern in compiled_patterns]):
+            if vm_name in selected_vm_names or any([pattern.match(vm_name) for pattern in compiled_patterns]):
                 yield(vm_name)
 
     def retrieve_vm(self, vm_name):
@@ -30,10 +30,23 @@ Usage:
 
 """
 
+from collections import namedtuple
+import difflib
 from functools import wraps
 
-from isphere.interactive_wrapper import VVC
+from pyVmomi import vim
+
+from isphere.interactive_wrapper import DVS, Datastore, NotFound, VVC
+from isphere.events import DEFAULT_PAGE_SIZE, read_events
 from isphere.input import killable_input
+from isphere.inventory import ESX_RELATION_PROPERTIES, RELATED_TYPES, VM_RELATION_PROPERTIES, InventoryGraph
+from isphere.memory import approximate_size
+from isphere.name_store import UuidStore, intern_name
+from isphere.parallel import DEFAULT_MAX_CONCURRENCY, map_bounded
+from isphere.performance import DEFAULT_BATCH_SIZE, PerformanceCounters, query_performance
+from isphere.prefix_index import PrefixIndex
+from isphere.soap import SoapStatistics
+from isphere.watcher import PropertyWatcher, TaskTracker
 import thirdparty.tasks as thirdparty_tasks
 
 try:
@@ -44,7 +57,39 @@ except ImportError:
 except AttributeError:
     pass
 
-__all__ = ["memoized", "CachingVSphere", "AutoEstablishingConnection"]
+__all__ = ["memoized", "Statistics", "TriggeredAlarm", "DatastoreUsage", "DATASTORE_USAGE_PROPERTIES", "MemoryUsage",
+           "CachingVSphere", "AutoEstablishingConnection"]
+
+Statistics = namedtuple("Statistics", ["soap", "cache_hits", "cache_misses"])
+"""
+A snapshot of the work done by a `isphere.connection.CachingVSphere`.
+`soap` holds the `isphere.soap.SoapTotals` of the vCenter connection.
+"""
+
+TriggeredAlarm = namedtuple("TriggeredAlarm", ["name", "status", "time", "acknowledged"])
+"""
+An alarm that is triggered on an item. `status` is the overall status of the
+alarm, e.G. `red`.
+"""
+
+DatastoreUsage = namedtuple("DatastoreUsage", ["name", "capacity", "free_space", "uncommitted", "utilization",
+                                               "provisioned"])
+"""
+The space of a datastore in bytes. `utilization` is the used fraction of the
+capacity, `provisioned` the fraction that is used or promised to thin
+provisioned disks (more than 1 if overcommitted).
+"""
+
+DATASTORE_USAGE_PROPERTIES = ["summary.capacity", "summary.freeSpace", "summary.uncommitted"]
+"""
+The datastore properties a `isphere.connection.DatastoreUsage` is computed from.
+"""
+
+MemoryUsage = namedtuple("MemoryUsage", ["structure", "entries", "bytes"])
+"""
+The approximate memory held by one structure of a `isphere.connection.CachingVSphere`
+(see `isphere.memory.approximate_size`).
+"""
 
 
 def memoized(function):
@@ -52,19 +97,38 @@ def memoized(function):
     Memoizes a function.
     Calls will be cached based on the args/kwargs. The cache is public
     (`func.cached_calls`) so it can be cleared or used from the outside.
+    Cache hits and misses are counted in `func.cache_hits` and `func.cache_misses`.
     """
-    cached_calls = function.cached_calls = {}
+    function.cached_calls = {}
+    function.cache_hits = function.cache_misses = 0
 
     @wraps(function)
     def function_with_memoized_calls(*args, **kwargs):
+        cached_calls = function_with_memoized_calls.cached_calls
         cache_id_for_this_call = str(args) + str(kwargs)
         if cache_id_for_this_call not in cached_calls:
+            function_with_memoized_calls.cache_misses += 1
             call_result = function(*args, **kwargs)
             cached_calls[cache_id_for_this_call] = call_result
+        else:
+            function_with_memoized_calls.cache_hits += 1
         return cached_calls[cache_id_for_this_call]
     return function_with_memoized_calls
 
 
+def _unique_items(items):
+    """
+    Returns the items, each managed object only once.
+    """
+    seen_morefs = set()
+    unique_items = []
+    for item in items:
+        if item.moref not in seen_morefs:
+            seen_morefs.add(item.moref)
+            unique_items.append(item)
+    return unique_items
+
+
 class CachingVSphere(object):
 
     """
@@ -72,7 +136,7 @@ class CachingVSphere(object):
     a caching layer on top.
     """
 
-    def __init__(self, hostname=None, username=None, password=None):
+    def __init__(self, hostname=None, username=None, password=None, scope=None):
         """
         Create a new caching vSphere connection.
 
@@ -82,11 +146,26 @@ class CachingVSphere(object):
           result in a prompt.
         - password (type `str`) is the vCenter password. Can be `None` and will
           result in a prompt.
-        """
-        self._connection = AutoEstablishingConnection(hostname, username, password)
-        self.vm_name_to_uuid_mapping = {}
-        self.esx_name_to_uuid_mapping = {}
-        self.dvs_mapping = {}
+        - scope (type `list`) are the names or inventory paths of the datacenters,
+          clusters or folders to restrict the cache to (see
+          `isphere.interactive_wrapper.VVC.set_scope`). Can be `None` for the
+          whole vCenter.
+        """
+        self._connection = AutoEstablishingConnection(hostname, username, password, scope)
+        self.vm_name_to_uuid_mapping = UuidStore()
+        self.vm_name_to_moref_mapping = {}
+        self.vm_custom_value_index = None
+        self.esx_name_to_uuid_mapping = UuidStore()
+        self.esx_name_to_moref_mapping = {}
+        self.esx_dns_index = {}
+        self.dvs_name_to_moref_mapping = {}
+        self.datastore_name_to_moref_mapping = {}
+        self.vm_name_index = PrefixIndex()
+        self.esx_name_index = PrefixIndex()
+        self.dvs_name_index = PrefixIndex()
+        self.datastore_name_index = PrefixIndex()
+        self.inventory_graph = None
+        self.alarm_names = {}
 
     @property
     def vvc(self):
@@ -114,47 +193,504 @@ class CachingVSphere(object):
         """
         return self.vvc.get_custom_attributes_mapping()
 
+    @memoized
+    def get_custom_attribute_keys(self):
+        """
+        Returns a dictionary with the mapping from custom attribute names to
+        custom attribute keys, the inverse of `get_custom_attributes_mapping`.
+        """
+        return dict((name, key) for key, name in self.get_custom_attributes_mapping().items())
+
+    def find_custom_attribute_key(self, attribute_name):
+        """
+        Returns the key of a custom attribute.
+        Raises `isphere.interactive_wrapper.NotFound` if there is no custom
+        attribute with this name.
+
+        - attribute_name (type `str`): The custom attribute name.
+        """
+        attribute_keys = self.get_custom_attribute_keys()
+        if attribute_name not in attribute_keys:
+            raise NotFound("No custom attribute '{name}' found. Available names: {available_names}".format(
+                name=attribute_name, available_names=sorted(attribute_keys)))
+        return attribute_keys[attribute_name]
+
+    @memoized
+    def get_performance_counters(self):
+        """
+        Returns the `isphere.performance.PerformanceCounters` table of the vCenter,
+        which resolves counter names to counter IDs.
+        """
+        return PerformanceCounters(self.vvc.get_service("perfManager").perfCounter)
+
+    def query_performance(self, managed_objects, counter_names, samples=1, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Returns the recent performance counter values of the given managed objects
+        as a `isphere.performance.PerformanceResult`, queried in batches of
+        `batch_size` objects per call (see `isphere.performance.query_performance`).
+        Raises `isphere.interactive_wrapper.NotFound` for unknown counter names.
+
+        - managed_objects (type `list`): The managed objects, e.G. the
+          `pyVmomi.vim.VirtualMachine`s from the cache.
+        - counter_names (type `list`): The counter names, e.G. `["cpu.ready.summation"]`.
+        - samples (type `int`): The number of most recent samples to average.
+        - batch_size (type `int`): The number of objects per call.
+        """
+        return query_performance(self.vvc.get_service("perfManager"), self.get_performance_counters(),
+                                 managed_objects, counter_names, samples=samples, batch_size=batch_size)
+
+    def statistics(self):
+        """
+        Returns a `isphere.connection.Statistics` snapshot of the SOAP traffic
+        and the memoization cache hits so far. Does not establish the connection.
+        """
+        memoized_methods = [CachingVSphere.find_by_dns_name,
+                            CachingVSphere.get_custom_attributes_mapping,
+                            CachingVSphere.get_custom_attribute_keys,
+                            CachingVSphere.get_performance_counters,
+                            CachingVSphere.retrieve_vm,
+                            CachingVSphere.retrieve_esx,
+                            CachingVSphere.retrieve_dvs,
+                            CachingVSphere.retrieve_datastore]
+        memoized_methods = [getattr(method, "__func__", method) for method in memoized_methods]
+        vvc = self._connection.vvc
+        soap_statistics = vvc.soap_statistics if vvc else SoapStatistics()
+        return Statistics(soap_statistics.snapshot(),
+                          sum(method.cache_hits for method in memoized_methods),
+                          sum(method.cache_misses for method in memoized_methods))
+
+    def memory_report(self):
+        """
+        Returns the approximate memory held by the cache as a list of
+        `isphere.connection.MemoryUsage`s, one per structure. Objects shared by
+        several structures (e.G. the names) are counted for the first one.
+        Does not establish the connection.
+        """
+        retrieved_items = {}
+        for method in (CachingVSphere.retrieve_vm, CachingVSphere.retrieve_esx, CachingVSphere.retrieve_dvs,
+                       CachingVSphere.retrieve_datastore):
+            retrieved_items.update(getattr(method, "__func__", method).cached_calls)
+        name_indexes = [self.vm_name_index, self.esx_name_index, self.dvs_name_index, self.datastore_name_index]
+        structures = [("VM names and UUIDs", self.vm_name_to_uuid_mapping),
+                      ("VM managed objects", self.vm_name_to_moref_mapping),
+                      ("ESXi names and UUIDs", self.esx_name_to_uuid_mapping),
+                      ("ESXi managed objects", self.esx_name_to_moref_mapping),
+                      ("ESXi DNS index", self.esx_dns_index),
+                      ("DVS managed objects", self.dvs_name_to_moref_mapping),
+                      ("Datastore managed objects", self.datastore_name_to_moref_mapping),
+                      ("Custom value index", self.vm_custom_value_index or {}),
+                      ("Inventory graph", self.inventory_graph or ()),
+                      ("Retrieved items", retrieved_items),
+                      ("Alarm names", self.alarm_names)]
+        seen = set()
+        report = [MemoryUsage(name, len(structure), approximate_size(structure, seen))
+                  for name, structure in structures]
+        report.append(MemoryUsage("Name completion indexes", sum(len(index) for index in name_indexes),
+                                  approximate_size(name_indexes, seen)))
+        return report
+
     def set_custom_attribute(self, item, attribute_name, attribute_value):
-        self.vvc.set_custom_attribute(item, attribute_name, attribute_value)
+        """
+        Sets the value of a custom attribute on an item.
+
+        - item (type `pyVmomi.vim.ManagedEntity`): The item, e.G. a `pyVmomi.vim.VirtualMachine`.
+        - attribute_name (type `str`): The custom attribute name.
+        - attribute_value (type `str`): The value to set.
+        """
+        self.vvc.set_custom_attribute_by_key(item, self.find_custom_attribute_key(attribute_name), attribute_value)
+        self.vm_custom_value_index = None
+
+    def set_custom_attributes(self, items, attribute_name, attribute_value, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        """
+        Sets the value of a custom attribute on many items, with up to
+        `max_concurrency` calls at the same time.
+        Yields an `(item, error)` tuple for each item as it is done, `error` is
+        the raised exception or `None`. No further calls are started once the
+        iteration is stopped. The custom value index is rebuilt on next use.
+        Raises `isphere.interactive_wrapper.NotFound` if there is no custom
+        attribute with this name.
 
-    def fill(self):
+        - items (type `iterable`): The items, e.G. `pyVmomi.vim.VirtualMachine`s.
+        - attribute_name (type `str`): The custom attribute name.
+        - attribute_value (type `str`): The value to set.
+        - max_concurrency (type `int`): The maximal number of concurrent calls.
+        """
+        attribute_key = self.find_custom_attribute_key(attribute_name)
+        vvc = self.vvc
+        self.vm_custom_value_index = None
+
+        def set_custom_attribute(item):
+            vvc.set_custom_attribute_by_key(item, attribute_key, attribute_value)
+        results = map_bounded(set_custom_attribute, items, max_concurrency)
+        try:
+            for item, _, error in results:
+                yield item, error
+        finally:
+            results.close()
+
+    def fill(self, custom_values=False, max_concurrency=DEFAULT_MAX_CONCURRENCY, relations=False):
         """
         Fill the item cache. Makes listing item names available and retrieving
-        items available.
+        items available. The name prefix indexes (`vm_name_index`, `esx_name_index`,
+        `dvs_name_index` and `datastore_name_index`) are updated with the names that changed.
+        The items of each datacenter (or scope container, see
+        `isphere.interactive_wrapper.VVC.get_partitions`) are retrieved through
+        their own views, up to `max_concurrency` datacenters at the same time,
+        and merged, keeping items found in several partitions once. The cache
+        is left as it was if a retrieval fails.
+
+        - custom_values (type `bool`): Whether to fetch the custom attribute values
+          of the virtual machines in the same call and index them
+          (see `find_vm_names_by_custom_value`).
+        - max_concurrency (type `int`): The maximal number of datacenters retrieved
+          at the same time.
+        - relations (type `bool`): Whether to fetch the hosts, resource pools,
+          datastores and networks of the virtual machines and the clusters of
+          the hosts in the same calls, and build the `inventory_graph`
+          (see `get_inventory_graph`).
         """
         self.find_by_dns_name.__func__.cached_calls = {}
         self.get_custom_attributes_mapping.__func__.cached_calls = {}
+        self.get_custom_attribute_keys.__func__.cached_calls = {}
+        self.get_performance_counters.__func__.cached_calls = {}
         self.retrieve_vm.__func__.cached_calls = {}
+        self.retrieve_dvs.__func__.cached_calls = {}
+        self.retrieve_datastore.__func__.cached_calls = {}
+        self.alarm_names = {}
+
+        vvc = self.vvc
+        vm_properties = ["name", "config.uuid"]
+        vm_properties += ["customValue"] if custom_values else []
+        vm_properties += VM_RELATION_PROPERTIES if relations else []
+        esx_properties = ["name",
+                          "hardware.systemInfo.uuid",
+                          "config.network.dnsConfig.hostName",
+                          "config.network.dnsConfig.domainName"]
+        esx_properties += ESX_RELATION_PROPERTIES if relations else []
+
+        def fill_partition(container):
+            return (vvc.get_restricted_view_on_vms(vm_properties, [container]),
+                    vvc.get_restricted_view_on_host_systems(esx_properties, [container]),
+                    vvc.get_restricted_view_on_dvses(["name"], [container]),
+                    vvc.get_restricted_view_on_datastores(["name"], [container]),
+                    vvc.get_restricted_view_on_items(["name"], RELATED_TYPES, [container]) if relations else [])
+
+        vms, esxis, dvses, datastores, related_items = [], [], [], [], []
+        results = map_bounded(fill_partition, vvc.get_partitions(), max_concurrency)
+        try:
+            for _, partition_items, error in results:
+                if error:
+                    raise error
+                vms.extend(partition_items[0])
+                esxis.extend(partition_items[1])
+                dvses.extend(partition_items[2])
+                datastores.extend(partition_items[3])
+                related_items.extend(partition_items[4])
+        finally:
+            results.close()
+        vms, esxis, dvses, datastores, related_items = [_unique_items(items)
+                                                        for items in (vms, esxis, dvses, datastores, related_items)]
+
+        self.vm_name_to_moref_mapping = {}
+        self.vm_custom_value_index = None
+        for vm in vms:
+            vm.name = intern_name(vm.name)
+            self.vm_name_to_moref_mapping[vm.name] = vm.moref
+        self.vm_name_to_uuid_mapping = UuidStore((vm.name, vm.config.uuid) for vm in vms)
+        if custom_values:
+            self.vm_custom_value_index = self._build_custom_value_index(vms, self.get_custom_attributes_mapping())
+
+        self.esx_name_to_moref_mapping = {}
+        esx_dns_names = {}
+        for esx in esxis:
+            esx.name = intern_name(esx.name)
+            self.esx_name_to_moref_mapping[esx.name] = esx.moref
+            dns_config = getattr(getattr(getattr(esx, "config", None), "network", None), "dnsConfig", None)
+            esx_dns_names[esx.name] = (getattr(dns_config, "hostName", None), getattr(dns_config, "domainName", None))
+        self.esx_name_to_uuid_mapping = UuidStore((esx.name, esx.hardware.systemInfo.uuid) for esx in esxis)
+        self.esx_dns_index = self._build_esx_dns_index(esx_dns_names)
+
+        self.dvs_name_to_moref_mapping = dict((intern_name(dvs.name), dvs.moref) for dvs in dvses)
+        self.datastore_name_to_moref_mapping = dict((intern_name(datastore.name), datastore.moref)
+                                                    for datastore in datastores)
+
+        self.inventory_graph = self._build_inventory_graph(vms, esxis, related_items) if relations else None
+
+        self.vm_name_index.update(self.vm_name_to_moref_mapping)
+        self.esx_name_index.update(self.esx_name_to_moref_mapping)
+        self.dvs_name_index.update(self.dvs_name_to_moref_mapping)
+        self.datastore_name_index.update(self.datastore_name_to_moref_mapping)
+
+    @staticmethod
+    def _build_custom_value_index(vms, custom_attributes_mapping):
+        index = {}
+        for vm in vms:
+            for custom_value in getattr(vm, "customValue", None) or []:
+                attribute_name = custom_attributes_mapping.get(custom_value.key)
+                if attribute_name is None:
+                    continue
+                values = index.setdefault(attribute_name, {})
+                values.setdefault(custom_value.value, set()).add(vm.name)
+        return index
+
+    def find_vm_names_by_custom_value(self, attribute_name, attribute_value):
+        """
+        Returns the names of the virtual machines with the given custom attribute value.
+        Uses the index built by `fill(custom_values=True)`, or builds it with one
+        bulk call on first use.
+        Raises `isphere.interactive_wrapper.NotFound` if there is no custom
+        attribute with this name.
+
+        - attribute_name (type `str`): The custom attribute name, e.G. `owner`.
+        - attribute_value (type `str`): The exact value to look for.
+        """
+        self.find_custom_attribute_key(attribute_name)
+        if self.vm_custom_value_index is None:
+            vms = self.vvc.get_restricted_view_on_vms(["name", "customValue"])
+            self.vm_custom_value_index = self._build_custom_value_index(vms, self.get_custom_attributes_mapping())
+        return set(self.vm_custom_value_index.get(attribute_name, {}).get(attribute_value, ()))
+
+    def _build_inventory_graph(self, vms, esxis, related_items):
+        graph = InventoryGraph()
+        for item in related_items:
+            graph.add(item.moref, intern_name(item.name))
+        for esx in esxis:
+            graph.add(esx.moref, esx.name, [getattr(esx, "parent", None)])
+        for vm in vms:
+            parents = [getattr(getattr(vm, "runtime", None), "host", None), getattr(vm, "resourcePool", None)]
+            parents.extend(getattr(vm, "datastore", None) or [])
+            parents.extend(getattr(vm, "network", None) or [])
+            graph.add(vm.moref, vm.name, parents)
+        unnamed_items = graph.unnamed_items()
+        if unnamed_items:  # the containers of a scope are not in their own views
+            for item in self.vvc.get_restricted_view_on_managed_objects(unnamed_items, ["name"]):
+                graph.add(item.moref, item.name)
+        return graph
+
+    def get_inventory_graph(self):
+        """
+        Returns the `isphere.inventory.InventoryGraph` of the cached virtual
+        machines and hosts and the items they use. Uses the graph built by
+        `fill(relations=True)`, or builds it with three bulk calls on first use.
+        """
+        if self.inventory_graph is None:
+            vvc = self.vvc
+            self.inventory_graph = self._build_inventory_graph(
+                vvc.get_restricted_view_on_vms(["name"] + VM_RELATION_PROPERTIES),
+                vvc.get_restricted_view_on_host_systems(["name"] + ESX_RELATION_PROPERTIES),
+                vvc.get_restricted_view_on_items(["name"], RELATED_TYPES))
+        return self.inventory_graph
+
+    def find_vm_names_on(self, name):
+        """
+        Returns the sorted names of the virtual machines placed on an item,
+        looked up in the inventory graph (see `get_inventory_graph`).
+        The item is an ESXi (known by any name `resolve_esx_name` accepts), a
+        cluster, a datastore, a network or a resource pool.
+        Raises `isphere.interactive_wrapper.NotFound` if no or several items
+        have this name.
+
+        - name (type `str`): The item name.
+        """
+        graph = self.get_inventory_graph()
+        if name.strip().lower() in self.esx_dns_index:
+            item = self.esx_name_to_moref_mapping[self.resolve_esx_name(name)]
+        else:
+            item = graph.find(name, RELATED_TYPES + [vim.HostSystem])
+        if isinstance(item, vim.ComputeResource):
+            return sorted(vm_name for esx in graph.children(item, vim.HostSystem)
+                          for vm_name in graph.child_names(esx, vim.VirtualMachine))
+        return graph.child_names(item, vim.VirtualMachine)
+
+    def find_esx_names_in(self, cluster_name):
+        """
+        Returns the sorted names of the ESXis in a cluster, looked up in the
+        inventory graph (see `get_inventory_graph`).
+        Raises `isphere.interactive_wrapper.NotFound` if no or several clusters
+        have this name.
+
+        - cluster_name (type `str`): The cluster name.
+        """
+        graph = self.get_inventory_graph()
+        return graph.child_names(graph.find(cluster_name, [vim.ComputeResource]), vim.HostSystem)
+
+    def get_esx_name_of_vm(self, vm_name):
+        """
+        Returns the name of the ESXi a virtual machine runs on, `None` if it
+        runs on none. The host is always retrieved with one call, since the
+        inventory graph does not follow migrations. The name of a host that is
+        not cached (e.G. outside of the scope) is retrieved with one more call.
+        The virtual machine name must be in the cache.
+
+        - vm_name (type `str`): The virtual machine name from the cache.
+        """
+        esx = self.get_current_esx_hosts([vm_name]).get(vm_name)
+        if esx is None:
+            return None
+        if self.inventory_graph is not None and esx in self.inventory_graph.names:
+            return self.inventory_graph.names[esx]
+        for esx_name, esx_moref in self.esx_name_to_moref_mapping.items():
+            if esx_moref == esx:
+                return esx_name
+        for item in self.vvc.get_restricted_view_on_managed_objects([esx], ["name"]):
+            return item.name
+        return None
+
+    @staticmethod
+    def _build_esx_dns_index(esx_dns_names):
+        index, ambiguous_keys = {}, set()
+        for esx_name, (host_name, domain_name) in esx_dns_names.items():
+            aliases = set([esx_name.split(".", 1)[0]])
+            if host_name:
+                aliases.add(host_name)
+                if domain_name:
+                    aliases.add("{0}.{1}".format(host_name, domain_name))
+            for alias in aliases:
+                alias = alias.lower()
+                if index.get(alias, esx_name) != esx_name:
+                    ambiguous_keys.add(alias)
+                index[alias] = esx_name
+        for key in ambiguous_keys:
+            del index[key]
+        for esx_name in esx_dns_names:  # cached names always resolve, even if they are another ESXi's alias
+            index[esx_name.lower()] = esx_name
+        return index
+
+    def resolve_esx_name(self, name):
+        """
+        Returns the cached name of the ESXi host system known by `name`.
+        Besides the cached name, the DNS host name, the FQDN and the short name
+        (first label) of an ESXi are accepted, case insensitively. A cached name
+        always resolves to its ESXi, other names that fit several ESXis are not
+        resolved.
+        This requires `fill()` to have been called since it operates on the cache.
+        Raises `isphere.interactive_wrapper.NotFound` if the name is unknown.
+
+        - name (type `str`): The name of the desired ESXi.
+        """
+        try:
+            return self.esx_dns_index[name.strip().lower()]
+        except KeyError:
+            raise NotFound("ESXi host {0} not found".format(name))
+
+    def suggest_esx_names(self, name, limit=3):
+        """
+        Returns up to `limit` cached ESXi names that are similar to `name`.
+
+        - name (type `str`): The (misspelled) name of the desired ESXi.
+        - limit (type `int`): The maximal number of suggestions.
+        """
+        suggestions = []
+        for key in difflib.get_close_matches(name.strip().lower(), self.esx_dns_index.keys(), n=limit * 3):
+            esx_name = self.esx_dns_index[key]
+            if esx_name not in suggestions:
+                suggestions.append(esx_name)
+        return suggestions[:limit]
+
+    def find_esx_host(self, name):
+        """
+        Returns the raw `pyVmomi.vim.HostSystem` of the ESXi known by `name`
+        (see `resolve_esx_name`) without asking the server.
+        Raises `isphere.interactive_wrapper.NotFound` if the name is unknown.
+
+        - name (type `str`): The name of the desired ESXi.
+        """
+        return self.esx_name_to_moref_mapping[self.resolve_esx_name(name)]
+
+    def get_current_esx_hosts(self, vm_names):
+        """
+        Returns a dictionary that maps virtual machine names to the raw
+        `pyVmomi.vim.HostSystem` they are currently running on, retrieved in a
+        single call. The names must be in the cache.
+
+        - vm_names (type `list`): The virtual machine names from the cache.
+        """
+        vm_names_by_moref = dict((self.vm_name_to_moref_mapping[vm_name], vm_name) for vm_name in vm_names)
+        return dict((vm_names_by_moref[vm.moref], getattr(getattr(vm, "runtime", None), "host", None))
+                    for vm in self.vvc.get_restricted_view_on_managed_objects(vm_names_by_moref.keys(), ["runtime.host"]))
+
+    def get_triggered_alarms(self, managed_objects):
+        """
+        Returns a dictionary that maps the given managed objects to the list of
+        `isphere.connection.TriggeredAlarm`s triggered on them.
+        The triggered alarms of all objects are retrieved in a single call.
+        Alarm names are cached in `alarm_names`, so only alarms that were not
+        seen before cost one more call.
+
+        - managed_objects (type `list`): The managed objects, e.G. the
+          `pyVmomi.vim.VirtualMachine`s and `pyVmomi.vim.HostSystem`s from the cache.
+        """
+        items = self.vvc.get_restricted_view_on_managed_objects(managed_objects, ["triggeredAlarmState"])
+        alarm_states = dict((item.moref, getattr(item, "triggeredAlarmState", None) or []) for item in items)
+        unknown_alarms = set(alarm_state.alarm for states in alarm_states.values() for alarm_state in states
+                             if alarm_state.alarm not in self.alarm_names)
+        for alarm in self.vvc.get_restricted_view_on_managed_objects(unknown_alarms, ["info.name"]):
+            self.alarm_names[alarm.moref] = alarm.info.name
+
+        return dict((managed_object, [TriggeredAlarm(self.alarm_names.get(alarm_state.alarm, str(alarm_state.alarm)),
+                                                     str(alarm_state.overallStatus),
+                                                     alarm_state.time,
+                                                     alarm_state.acknowledged)
+                                      for alarm_state in states])
+                    for managed_object, states in alarm_states.items())
 
-        for vm in self.vvc.get_restricted_view_on_vms(["name", "config.uuid"]):
-            self.vm_name_to_uuid_mapping[vm.name] = vm.config.uuid
+    def read_events(self, managed_objects, begin_time=None, end_time=None, page_size=DEFAULT_PAGE_SIZE):
+        """
+        Yields the events of the given managed objects in a time range, oldest
+        first, read in pages through event history collectors
+        (see `isphere.events.read_events`). Many managed objects are read through
+        the collectors of the scope.
+
+        - managed_objects (type `list`): The managed objects, e.G. the
+          `pyVmomi.vim.VirtualMachine`s from the cache.
+        - begin_time (type `datetime.datetime`): The time to start at, unbounded if `None`.
+        - end_time (type `datetime.datetime`): The time to end at, unbounded if `None`.
+        - page_size (type `int`): The number of events to read per call.
+        """
+        return read_events(self.vvc.get_service("eventManager"), managed_objects, begin_time, end_time, page_size,
+                           containers=self.vvc.scope)
 
-        for esx in self.vvc.get_restricted_view_on_host_systems(["name", "hardware.systemInfo.uuid"]):
-            self.esx_name_to_uuid_mapping[esx.name] = esx.hardware.systemInfo.uuid
+    def create_task_tracker(self):
+        """
+        Returns a new `isphere.watcher.TaskTracker` on a private property collector.
+        It must be closed once done.
+        """
+        return TaskTracker(self.create_property_watcher())
 
-        for dvs in self.vvc.get_all_dvs():
-            self.dvs_mapping[dvs.name] = dvs
+    def create_property_watcher(self):
+        """
+        Returns a new `isphere.watcher.PropertyWatcher` on a private property collector.
+        It must be closed once done.
+        """
+        return PropertyWatcher(self.vvc.create_property_collector())
 
     def list_cached_vms(self):
         """
         List the names of the virtual machines.
         This requires `fill()` to have been called since it operates on the cache.
         """
-        return self.vm_name_to_uuid_mapping.keys()
+        return self.vm_name_to_moref_mapping.keys()
 
     def list_cached_esxis(self):
         """
         List the names of the ESXi host systems.
         This requires `fill()` to have been called since it operates on the cache.
         """
-        return self.esx_name_to_uuid_mapping.keys()
+        return self.esx_name_to_moref_mapping.keys()
 
     def list_cached_dvses(self):
         """
         List the names of the distributed virtual switches.
         This requires `fill()` to have been called since it operates on the cache.
         """
-        return self.dvs_mapping.keys()
+        return self.dvs_name_to_moref_mapping.keys()
+
+    def list_cached_datastores(self):
+        """
+        List the names of the datastores.
+        This requires `fill()` to have been called since it operates on the cache.
+        """
+        return self.datastore_name_to_moref_mapping.keys()
 
     @memoized
     def retrieve_vm(self, vm_name):
@@ -163,7 +699,7 @@ class CachingVSphere(object):
 
         - vm_name (type `str`): The virtual machine name from the cache.
         """
-        return self.vvc.get_vm_by_uuid(self.vm_name_to_uuid_mapping[vm_name])
+        return self.vvc.get_vm_by_uuid(self.vm_name_to_uuid_mapping[vm_name], name=vm_name)
 
     @memoized
     def retrieve_esx(self, esx_name):
@@ -172,36 +708,83 @@ class CachingVSphere(object):
 
         - esx_name (type `str`): The ESX name from the cache.
         """
-        return self.vvc.get_host_system_by_uuid(self.esx_name_to_uuid_mapping[esx_name])
+        return self.vvc.get_host_system_by_uuid(self.esx_name_to_uuid_mapping[esx_name], name=esx_name)
 
+    @memoized
     def retrieve_dvs(self, dvs_name):
         """
         Retrieve a DVS by its name. The name must be in the cache.
+        The wrapper is built from the cached managed object reference without
+        asking the server.
 
         - dvs_name (type `str`): The DVS name from the cache.
         """
-        return self.dvs_mapping[dvs_name]
+        return DVS(self.dvs_name_to_moref_mapping[dvs_name], name=dvs_name, ttl=self.vvc.property_ttl)
+
+    @memoized
+    def retrieve_datastore(self, datastore_name):
+        """
+        Retrieve a datastore by its name. The name must be in the cache.
+        The wrapper is built from the cached managed object reference without
+        asking the server.
+
+        - datastore_name (type `str`): The datastore name from the cache.
+        """
+        return Datastore(self.datastore_name_to_moref_mapping[datastore_name], name=datastore_name,
+                         ttl=self.vvc.property_ttl)
+
+    def get_datastore_usage(self, datastore_names):
+        """
+        Returns the `isphere.connection.DatastoreUsage` of the given datastores,
+        retrieved in a single call, highest utilization first.
+        Datastores without a capacity (e.G. inaccessible ones) are left out.
+        The names must be in the cache.
+
+        - datastore_names (type `list`): The datastore names from the cache.
+        """
+        names_by_moref = dict((self.datastore_name_to_moref_mapping[datastore_name], datastore_name)
+                              for datastore_name in datastore_names)
+        usages = []
+        for datastore in self.vvc.get_restricted_view_on_managed_objects(names_by_moref.keys(),
+                                                                         DATASTORE_USAGE_PROPERTIES):
+            summary = getattr(datastore, "summary", None)
+            capacity = getattr(summary, "capacity", None)
+            if not capacity:
+                continue
+            free_space = getattr(summary, "freeSpace", None) or 0
+            uncommitted = getattr(summary, "uncommitted", None) or 0
+            usages.append(DatastoreUsage(names_by_moref[datastore.moref], capacity, free_space, uncommitted,
+                                         float(capacity - free_space) / capacity,
+                                         float(capacity - free_space + uncommitted) / capacity))
+        return sorted(usages, key=lambda usage: usage.utilization, reverse=True)
 
     @property
     def number_of_vms(self):
         """
         The number of virtual machines available in the cache.
         """
-        return len(self.vm_name_to_uuid_mapping)
+        return len(self.vm_name_to_moref_mapping)
 
     @property
     def number_of_esxis(self):
         """
         The number of ESXi available in the cache.
         """
-        return len(self.esx_name_to_uuid_mapping)
+        return len(self.esx_name_to_moref_mapping)
 
     @property
     def number_of_dvses(self):
         """
         The number of DVS available in the cache.
         """
-        return len(self.dvs_mapping)
+        return len(self.dvs_name_to_moref_mapping)
+
+    @property
+    def number_of_datastores(self):
+        """
+        The number of datastores available in the cache.
+        """
+        return len(self.datastore_name_to_moref_mapping)
 
     def wait_for_tasks(self, tasks):
         """
@@ -218,7 +801,7 @@ class AutoEstablishingConnection(object):
     A vCenter connection that establishes when used.
     """
 
-    def __init__(self, hostname, username, password):
+    def __init__(self, hostname, username, password, scope=None):
         """
         Create a new connection.
 
@@ -228,11 +811,14 @@ class AutoEstablishingConnection(object):
           result in a prompt.
         - password (type `str`) is the vCenter password. Can be `None` and will
           result in a prompt.
+        - scope (type `list`) are the datacenters, clusters or folders the
+          connection is restricted to once established. Can be `None`.
         """
         self.vvc = None
         self.username = username
         self.hostname = hostname
         self.password = password
+        self.scope = scope
 
     def ensure_established(self):
         """
@@ -244,7 +830,9 @@ class AutoEstablishingConnection(object):
     def _connect(self):
         self.hostname = self.hostname or killable_input("Remote vsphere hostname: ")
         self.username = self.username or killable_input("User name for {0}: ".format(self.hostname))
-        self.vvc = VVC(self.hostname)
-        self.vvc.connect(self.username, self.password)
+        vvc = VVC(self.hostname)
+        vvc.connect(self.username, self.password)
+        vvc.set_scope(self.scope)
+        self.vvc = vvc
 
         return self.vvc
@@ -0,0 +1,164 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+"""
+Provides paged reading of the vCenter event history.
+
+`isphere.events.read_events` creates one `EventHistoryCollector` for a time
+range and reads it page by page with `ReadNextEvents`, so even hundreds of
+thousands of events are streamed in bounded memory.
+An event filter can only name one entity, so events of several entities are
+read through one collector per entity and merged by creation time. With more
+entities than collectors may be open at once, the events of the containers
+holding them are read instead and filtered by their involved entities.
+
+Usage:
+
+    >>> from isphere.events import read_events
+    >>> for event in read_events(vvc.get_service("eventManager"), [vm], begin_time=yesterday):
+    ...     print(event.fullFormattedMessage)
+"""
+
+from heapq import heappop, heappush
+
+from pyVmomi import vim
+
+__all__ = ["DEFAULT_PAGE_SIZE", "DEFAULT_MAX_COLLECTORS", "read_events", "involved_entities"]
+
+DEFAULT_PAGE_SIZE = 1000
+"""
+The number of events read per call, which is also the maximum a vCenter allows.
+"""
+
+DEFAULT_MAX_COLLECTORS = 25
+"""
+The number of event history collectors open at the same time, below the
+default limit of 32 collectors per vCenter session.
+"""
+
+_ENTITY_ARGUMENTS = (("vm", "vm"),
+                     ("host", "host"),
+                     ("ds", "datastore"),
+                     ("net", "network"),
+                     ("dvs", "dvs"),
+                     ("computeResource", "computeResource"),
+                     ("datacenter", "datacenter"))
+
+
+def involved_entities(event):
+    """
+    Returns the managed entities an event is about (its virtual machine, host,
+    datastore...).
+
+    - event (type `pyVmomi.vim.event.Event`): The event.
+    """
+    entities = []
+    for argument_name, entity_name in _ENTITY_ARGUMENTS:
+        entity = getattr(getattr(event, argument_name, None), entity_name, None)
+        if entity is not None:
+            entities.append(entity)
+    return entities
+
+
+def _filter_spec(entity, begin_time, end_time, recursion="self"):
+    by_time = vim.event.EventFilterSpec.ByTime(beginTime=begin_time, endTime=end_time)
+    if entity is None:
+        return vim.event.EventFilterSpec(time=by_time)
+    return vim.event.EventFilterSpec(time=by_time,
+                                     entity=vim.event.EventFilterSpec.ByEntity(entity=entity, recursion=recursion))
+
+
+def _read_collector(event_manager, filter_spec, page_size, collectors):
+    """
+    Yields the events of a new event history collector page by page, oldest
+    first. The collector is added to `collectors` to be destroyed by the caller.
+    """
+    collector = event_manager.CreateCollectorForEvents(filter_spec)
+    collectors.append(collector)
+    collector.RewindCollector()
+    while True:
+        events = collector.ReadNextEvents(page_size)
+        if not events:
+            return
+        for event in events:
+            yield event
+
+
+def _merge_by_creation_time(event_iterators):
+    """
+    Yields the events of several iterators that are sorted by creation time,
+    sorted by creation time. Events read from several iterators (e.G. an event
+    about a virtual machine and its host) are yielded once.
+    """
+    heap = []
+    for index, events in enumerate(event_iterators):
+        for event in events:
+            heappush(heap, (event.createdTime, index, event, events))
+            break
+    last_time, keys_at_last_time = None, set()
+    while heap:
+        created_time, index, event, events = heappop(heap)
+        if created_time != last_time:
+            last_time, keys_at_last_time = created_time, set()
+        if event.key not in keys_at_last_time:
+            keys_at_last_time.add(event.key)
+            yield event
+        for next_event in events:
+            heappush(heap, (next_event.createdTime, index, next_event, events))
+            break
+
+
+def _read_merged(event_manager, filter_specs, page_size):
+    """
+    Yields the events of one collector per filter spec, oldest first, and
+    destroys the collectors once the iteration is over or stopped.
+    """
+    collectors = []
+    try:
+        event_iterators = [_read_collector(event_manager, filter_spec, page_size, collectors)
+                           for filter_spec in filter_specs]
+        for event in _merge_by_creation_time(event_iterators):
+            yield event
+    finally:
+        for collector in collectors:
+            collector.DestroyCollector()
+
+
+def read_events(event_manager, entities, begin_time=None, end_time=None, page_size=DEFAULT_PAGE_SIZE,
+                max_collectors=DEFAULT_MAX_COLLECTORS, containers=None):
+    """
+    Yields the events of the given entities, oldest first.
+    The vCenter filters the events with one event history collector per entity,
+    whose pages are merged. One page of events per collector is held in memory
+    at a time. The collectors are destroyed once the iteration is over or stopped.
+    With more than `max_collectors` entities, the events of the `containers` (or
+    of the whole vCenter) are read instead, merged the same way, and only the
+    events involving one of the entities (see `involved_entities`) are yielded.
+
+    - event_manager (type `pyVmomi.vim.event.EventManager`): The event manager of the vCenter.
+    - entities (type `list`): The managed entities, e.G. `pyVmomi.vim.VirtualMachine`s.
+    - begin_time (type `datetime.datetime`): The time to start at, unbounded if `None`.
+    - end_time (type `datetime.datetime`): The time to end at, unbounded if `None`.
+    - page_size (type `int`): The number of events to read per call.
+    - max_collectors (type `int`): The maximal number of collectors open at the same time.
+    - containers (type `list`): The datacenters, clusters or folders holding all
+      entities (e.G. the scope of the cache), the whole vCenter if `None`.
+    """
+    entities = list(set(entities))
+    if len(entities) <= max_collectors:
+        filter_specs = [_filter_spec(entity, begin_time, end_time) for entity in entities]
+        for event in _read_merged(event_manager, filter_specs, page_size):
+            yield event
+        return
+
+    containers = list(containers or [])
+    if not containers or len(containers) > max_collectors:
+        containers = [None]
+    filter_specs = [_filter_spec(container, begin_time, end_time, recursion="all") for container in containers]
+    wanted_entities = set(entities)
+    for event in _read_merged(event_manager, filter_specs, page_size):
+        if any(entity in wanted_entities for entity in involved_entities(event)):
+            yield event
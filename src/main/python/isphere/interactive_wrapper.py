@@ -13,11 +13,28 @@ to get all VMs.
 
 import atexit
 from getpass import getpass
+import time
 
 from pyVim import connect
 from pyVmomi import vim, vmodl
 
-__all__ = ["NotFound", "VVC", "ESX", "VM", "DVS"]
+from isphere.soap import SoapRecorder, ReplayStubAdapter, SoapStatistics, SoapObservers, instrument_stub
+
+__all__ = ["NotFound", "VVC", "CachedItem", "ESX", "VM", "DVS", "Datastore", "DEFAULT_PROPERTY_TTL",
+           "DEFAULT_RETRIEVE_PAGE_SIZE"]
+
+DEFAULT_PROPERTY_TTL = 0
+"""
+The default snapshot TTL of the item wrappers: properties that are read are
+not kept (see `isphere.interactive_wrapper.CachedItem` for the TTL values).
+"""
+
+DEFAULT_RETRIEVE_PAGE_SIZE = 1000
+"""
+The default number of items retrieved per call when paging through a view.
+"""
+
+_SCOPE_CONTAINER_TYPES = [vim.Datacenter, vim.ClusterComputeResource, vim.Folder]
 
 
 class NotFound(Exception):
@@ -34,6 +51,12 @@ class VVC(object):
     A vCenter host.
     """
 
+    property_ttl = DEFAULT_PROPERTY_TTL
+    """
+    The snapshot TTL of the items returned by this vCenter host, see
+    `isphere.interactive_wrapper.CachedItem` for the TTL values.
+    """
+
     def __init__(self, hostname):
         """
         Creates a VVC instance.
@@ -43,14 +66,19 @@ class VVC(object):
         self.hostname = hostname
         self.service_instance = None
         self.service_instance_content = None
+        self.soap_statistics = SoapStatistics()
+        self.soap_observers = SoapObservers([self.soap_statistics])
+        self.scope = None
 
-    def connect(self, username, password=None):
+    def connect(self, username, password=None, recording_path=None):
         """
         Connects to the vCenter host encapsulated by this VVC instance.
 
         - `username` (str) is the username to use for authentication.
         - `password` (str) is the password to use for authentication.
           If the password is not specified, a getpass prompt will be used.
+        - `recording_path` (str) is a file to record the SOAP traffic of this
+          session to (see `isphere.soap.SoapRecorder`). Nothing is recorded by default.
         """
         if not password:
             password = getpass("Password for {0}@{1}: ".format(username, self.hostname))
@@ -58,8 +86,24 @@ class VVC(object):
                                                      user=username,
                                                      pwd=password,
                                                      port=443)
-        self.service_instance_content = self.service_instance.RetrieveContent()
+        if recording_path:
+            recorder = SoapRecorder.record(self.service_instance._stub, recording_path)
+            atexit.register(recorder.close)
+        instrument_stub(self.service_instance._stub, self.soap_observers)
         atexit.register(connect.Disconnect, self.service_instance)
+        self.service_instance_content = self.service_instance.RetrieveContent()
+
+    def replay(self, recording_path):
+        """
+        Replays a session recorded with `connect(..., recording_path=...)` instead
+        of connecting to the vCenter host. Only requests that were recorded can
+        be answered.
+
+        - `recording_path` (str) is the recording to replay.
+        """
+        self.service_instance = vim.ServiceInstance("ServiceInstance", ReplayStubAdapter(recording_path))
+        instrument_stub(self.service_instance._stub, self.soap_observers)
+        self.service_instance_content = self.service_instance.RetrieveContent()
 
     def get_first_level_of_vm_folders(self):
         children = self.service_instance_content.rootFolder.childEntity
@@ -67,6 +111,83 @@ class VVC(object):
             if hasattr(child, "vmFolder"):
                 yield child.vmFolder
 
+    def find_scope_containers(self, names):
+        """
+        Returns the datacenters, clusters or folders with the given names,
+        looked up within the current scope.
+        Raises `NotFound` if a name matches none or several of them.
+
+        - `names` (str[]) are the container names or inventory paths, e.G.
+          `dc-1`, `dc-1/host/cluster-1` or `dc-1/vm/some-folder`. Names are looked
+          up in a single call, inventory paths with one call each.
+        """
+        search_index = self.get_service("searchIndex")
+        containers_by_name = {}
+        if any("/" not in name for name in names):
+            for container in self.get_restricted_view_on_items(["name"], _SCOPE_CONTAINER_TYPES):
+                containers_by_name.setdefault(container.name, []).append(container.moref)
+
+        containers = []
+        for name in names:
+            if "/" in name:
+                found_containers = [container for container in [search_index.FindByInventoryPath(inventoryPath=name)]
+                                    if isinstance(container, tuple(_SCOPE_CONTAINER_TYPES))]
+            else:
+                found_containers = containers_by_name.get(name, [])
+            if len(found_containers) != 1:
+                raise NotFound("{0} datacenters, clusters or folders named {1} found, try an inventory path like "
+                               "datacenter/host/cluster".format(len(found_containers) or "No", name))
+            containers.append(found_containers[0])
+        return containers
+
+    def set_scope(self, names):
+        """
+        Restricts the views (see `view_for`) and everything using them, like
+        `get_restricted_view_on_vms`, to the subtrees of the given datacenters,
+        clusters or folders. Raises `NotFound` for unknown names.
+        Containers below another given container (e.G. a cluster and its
+        datacenter) are dropped, so their items are not retrieved twice.
+
+        - `names` (str[]) are the container names or inventory paths (see
+          `find_scope_containers`). No names mean the whole vCenter.
+        """
+        self.scope = None
+        self.scope = self.find_outermost_containers(self.find_scope_containers(names)) if names else None
+
+    def find_outermost_containers(self, containers):
+        """
+        Returns the given containers without the ones that are below another
+        one of them, in order. The parents are retrieved with one call if
+        there are several containers.
+
+        - `containers` (list) are the datacenters, clusters or folders.
+        """
+        containers = [container for index, container in enumerate(containers) if container not in containers[:index]]
+        if len(containers) < 2:
+            return containers
+        parents = dict((item.moref, getattr(item, "parent", None))
+                       for item in self.get_restricted_view_on_items(["parent"], _SCOPE_CONTAINER_TYPES))
+
+        def is_nested(container):
+            parent = parents.get(container)
+            while parent is not None:
+                if parent in containers:
+                    return True
+                parent = parents.get(parent)
+            return False
+        return [container for container in containers if not is_nested(container)]
+
+    def get_partitions(self):
+        """
+        Returns the containers the items can be retrieved from independently,
+        e.G. to retrieve them concurrently with one view per container: the
+        containers of the scope (see `set_scope`), or the datacenters (and
+        datacenter folders) below the root folder if there is no scope.
+        """
+        if self.scope:
+            return list(self.scope)
+        return list(self.service_instance_content.rootFolder.childEntity)
+
     def get_service(self, service_name):
         if hasattr(self.service_instance_content, service_name):
             return getattr(self.service_instance_content, service_name)
@@ -95,6 +216,13 @@ class VVC(object):
 
         self.get_service("customFieldsManager").SetField(entity=item, key=attribute_key, value=attribute_value)
 
+    def set_custom_attribute_by_key(self, item, attribute_key, attribute_value):
+        """
+        Sets the value of a custom attribute given by its key, which saves looking
+        up the custom attribute definitions (see `get_custom_attributes_mapping`).
+        """
+        self.get_service("customFieldsManager").SetField(entity=item, key=attribute_key, value=attribute_value)
+
     def find_by_dns_name(self, dns_name, search_for_vms=False):
         """
         Returns an item by searching for its DNS name.
@@ -104,7 +232,7 @@ class VVC(object):
         - `search_for_vms` (boolean) (default False) indicates if VMs should
           be included in the search.
         """
-        search_index = self.service_instance.RetrieveContent().searchIndex
+        search_index = self.get_service("searchIndex")
         item = search_index.FindByDnsName(dnsName=dns_name, vmSearch=search_for_vms)
         if not item:
             raise NotFound(
@@ -114,36 +242,41 @@ class VVC(object):
 
         return item
 
-    def get_vm_by_uuid(self, uuid):
+    def get_vm_by_uuid(self, uuid, name=None):
         """
         Returns a VM by searching for its UUID.
         An exception will be raised if the VM cannot be found.
 
         - `uuid` (str) is the UUID of the desired VM.
+        - `name` (str) is the name of the VM, if already known. Passing it
+          saves a round trip to the server.
         """
         vm = self.get_service("searchIndex").FindByUuid(uuid=uuid, vmSearch=True)
         if not vm:
             raise NotFound("VM with uuid {0} not found".format(uuid))
-        return VM(vm)
+        return VM(vm, name=name, ttl=self.property_ttl)
 
-    def get_host_system_by_uuid(self, uuid):
+    def get_host_system_by_uuid(self, uuid, name=None):
         """
         Returns an item by searching for its UUID.
         An exception will be raised if the VM cannot be found.
 
         - `uuid` (str) is the UUID of the desired VM.
+        - `name` (str) is the name of the host system, if already known.
+          Passing it saves a round trip to the server.
         """
         esx = self.get_service("searchIndex").FindByUuid(uuid=uuid, vmSearch=False)
         if not esx:
             raise NotFound("Host system with uuid {0} not found".format(uuid))
-        return ESX(esx)
+        return ESX(esx, name=name, ttl=self.property_ttl)
 
     def get_all_vms(self):
         """
         Returns a generator for all virtual machines on this vCenter.
+        The virtual machines are retrieved in pages together with their names,
+        see `iterate_items_with_properties`.
         """
-        for vm in self.get_all_by_type([vim.VirtualMachine]):
-            yield VM(vm)
+        return self.iterate_items_with_properties(["name"], [vim.VirtualMachine], VM)
 
     def get_all_by_type(self, types):
         """
@@ -152,32 +285,66 @@ class VVC(object):
         - `types` (type[]) is a list of desired types. The types should be
           attributes of the `pyVmomi.vim` module, for example `pyVmomi.vim.VirtualMachine`
         """
-        view = self.view_for(types)
-        all_items = view.view
-        view.Destroy()
+        all_items, seen_items = [], set()
+        for view in self.views_for(types):
+            for item in view.view:
+                if item not in seen_items:
+                    seen_items.add(item)
+                    all_items.append(item)
+            view.Destroy()
         return all_items
 
     def get_all_esx(self):
         """
         Returns a generator for all ESXi host systems on this vCenter.
+        The host systems are retrieved in pages together with their names.
         """
-        for esx in self.get_all_by_type([vim.HostSystem]):
-            yield ESX(esx)
+        return self.iterate_items_with_properties(["name"], [vim.HostSystem], ESX)
 
-    def get_all_dvs(self):
+    def get_all_dvs(self, containers=None):
         """
         Returns a generator for all distributed virtual switches on this vCenter.
+        The switches are retrieved in pages together with their names.
+
+        - `containers` are the containers to look into (see `views_for`).
         """
-        for dvs in self.get_all_by_type([vim.VmwareDistributedVirtualSwitch]):
-            yield DVS(dvs)
+        return self.iterate_items_with_properties(["name"], [vim.VmwareDistributedVirtualSwitch], DVS,
+                                                  containers=containers)
 
-    def view_for(self, types):
+    def get_all_datastores(self, containers=None):
+        """
+        Returns a generator for all datastores on this vCenter.
+        The datastores are retrieved in pages together with their names.
+
+        - `containers` are the containers to look into (see `views_for`).
+        """
+        return self.iterate_items_with_properties(["name"], [vim.Datastore], Datastore, containers=containers)
+
+    def view_for(self, types, container=None):
+        """
+        Returns a recursive container view on the items of the given types.
+
+        - `types` (type[]) is a list of desired types.
+        - `container` is the container to look into, the root folder if `None`.
+        """
         return self.get_service("viewManager").CreateContainerView(
-            self.service_instance_content.rootFolder,
+            container or self.service_instance_content.rootFolder,
             types,
             True)
 
-    def get_restricted_view_on_vms(self, properties):
+    def views_for(self, types, containers=None):
+        """
+        Returns one container view (see `view_for`) per container of the scope,
+        or a single one on the root folder if there is no scope (see `set_scope`).
+        The views must be destroyed once done.
+
+        - `types` (type[]) is a list of desired types.
+        - `containers` are the containers to look into instead of the scope,
+          e.G. one of `get_partitions`.
+        """
+        return [self.view_for(types, container) for container in containers or self.scope or [None]]
+
+    def get_restricted_view_on_vms(self, properties, containers=None):
         """
         Returns a list of all virtual machines.
         The VMs will only have the specified properties but retrieval will be
@@ -187,10 +354,11 @@ class VVC(object):
         - `properties` (str[]) is a list of desired properties.
           For example using `properties=["name", "runtime.host"]` will return
           objects that have only the attributes `name` and `runtime.host`.
+        - `containers` are the containers to look into (see `views_for`).
         """
-        return self.get_restricted_view_on_items(properties, [vim.VirtualMachine])
+        return self.get_restricted_view_on_items(properties, [vim.VirtualMachine], containers)
 
-    def get_restricted_view_on_host_systems(self, properties):
+    def get_restricted_view_on_host_systems(self, properties, containers=None):
         """
         Returns a list of all ESXi host systems.
         The ESXis will only have the specified properties but retrieval will be
@@ -200,10 +368,31 @@ class VVC(object):
         - `properties` (str[]) is a list of desired properties.
           For example using `properties=["name", "hardware.memorySize"]` will return
           objects that have only the attributes `name` and `hardware.memorySize`.
+        - `containers` are the containers to look into (see `views_for`).
+        """
+        return self.get_restricted_view_on_items(properties, [vim.HostSystem], containers)
+
+    def get_restricted_view_on_dvses(self, properties, containers=None):
+        """
+        Returns a list of all distributed virtual switches, restricted to the
+        specified properties (see `get_restricted_view_on_items`).
+
+        - `properties` (str[]) is a list of desired properties, e.G. `["name"]`.
+        - `containers` are the containers to look into (see `views_for`).
         """
-        return self.get_restricted_view_on_items(properties, [vim.HostSystem])
+        return self.get_restricted_view_on_items(properties, [vim.VmwareDistributedVirtualSwitch], containers)
 
-    def get_restricted_view_on_items(self, properties, types):
+    def get_restricted_view_on_datastores(self, properties, containers=None):
+        """
+        Returns a list of all datastores, restricted to the specified properties
+        (see `get_restricted_view_on_items`).
+
+        - `properties` (str[]) is a list of desired properties, e.G. `["name"]`.
+        - `containers` are the containers to look into (see `views_for`).
+        """
+        return self.get_restricted_view_on_items(properties, [vim.Datastore], containers)
+
+    def get_restricted_view_on_items(self, properties, types, containers=None):
         """
         Returns a restricted view on a specific item type collection.
         The items are restricted in the sense that only properties which were
@@ -213,25 +402,157 @@ class VVC(object):
         as attributes.
         Note that recursing properties (e.G. summary.config) will be stored under
         their full name (item.summary.config).
+        The managed object reference of each item is available as `item.moref`.
 
         - `properties` (str[]) is a list of properties that should be fetched.
           Recursing properties can be separated by dots, e.G. "summary.config".
         - `types` (type[]) is a list of types to restrict the items that are given
           back. The types must be attributes of the `pyVmomi.vim` module.
+        - `containers` are the containers to look into (see `views_for`).
+        """
+        unrestricted_views = self.views_for(types, containers)
+        try:
+            collector_spec = build_property_collector_specs(unrestricted_views, properties)
+            retrieved_contents = self.get_service("propertyCollector").RetrieveContents(collector_spec)
+        finally:
+            for unrestricted_view in unrestricted_views:
+                unrestricted_view.Destroy()
+        return build_item_containers(retrieved_contents, properties)
+
+    def get_restricted_view_on_managed_objects(self, managed_objects, properties):
+        """
+        Returns a restricted view (see `get_restricted_view_on_items`) on the
+        given managed objects, retrieved in a single call.
+
+        - `managed_objects` (list) are the managed objects, e.G. `vim.VirtualMachine`
+          references kept from an earlier restricted view.
+        - `properties` (str[]) is a list of desired properties.
+        """
+        managed_objects = list(managed_objects)
+        if not managed_objects:
+            return []
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec()
+        filter_spec.objectSet = [vmodl.query.PropertyCollector.ObjectSpec(obj=managed_object, skip=False)
+                                 for managed_object in managed_objects]
+        filter_spec.propSet = [vmodl.query.PropertyCollector.PropertySpec(type=managed_type, pathSet=properties)
+                               for managed_type in set(type(managed_object) for managed_object in managed_objects)]
+
+        retrieved_contents = self.get_service("propertyCollector").RetrieveContents([filter_spec])
+        return build_item_containers(retrieved_contents, properties)
+
+    def create_property_collector(self):
+        """
+        Returns a new property collector for this session.
+        Filters and updates of a private collector do not interfere with other
+        users of the session, see `isphere.watcher.PropertyWatcher`.
         """
-        unrestricted_view = self.view_for(types)
-        collector_spec = build_property_collector_specs(unrestricted_view, properties)
+        return self.get_service("propertyCollector").CreatePropertyCollector()
 
-        retrieved_contents = self.get_service("propertyCollector").RetrieveContents(collector_spec)
+    def get_vms_with_properties(self, properties):
+        """
+        Returns a list of all virtual machines, hydrated with the given properties.
+        The properties are fetched in one bulk call and served from the VM
+        snapshots afterwards (see `isphere.interactive_wrapper.CachedItem`).
+        Other properties are still fetched from the server when accessed.
+
+        - `properties` (str[]) is a list of properties that should be fetched
+          upfront, for example `["config", "runtime.powerState"]`.
+        """
+        return self.get_items_with_properties(properties, [vim.VirtualMachine], VM)
+
+    def get_host_systems_with_properties(self, properties):
+        """
+        Returns a list of all ESXi host systems, hydrated with the given properties.
+        See `isphere.interactive_wrapper.VVC.get_vms_with_properties`.
+
+        - `properties` (str[]) is a list of properties that should be fetched upfront.
+        """
+        return self.get_items_with_properties(properties, [vim.HostSystem], ESX)
+
+    def get_dvs_with_properties(self, properties):
+        """
+        Returns a list of all distributed virtual switches, hydrated with the given properties.
+        See `isphere.interactive_wrapper.VVC.get_vms_with_properties`.
+
+        - `properties` (str[]) is a list of properties that should be fetched upfront.
+        """
+        return self.get_items_with_properties(properties, [vim.VmwareDistributedVirtualSwitch], DVS)
+
+    def get_datastores_with_properties(self, properties):
+        """
+        Returns a list of all datastores, hydrated with the given properties.
+        See `isphere.interactive_wrapper.VVC.get_vms_with_properties`.
+
+        - `properties` (str[]) is a list of properties that should be fetched upfront.
+        """
+        return self.get_items_with_properties(properties, [vim.Datastore], Datastore)
+
+    def get_items_with_properties(self, properties, types, item_type):
+        """
+        Returns a list of wrapped items which are hydrated with the given properties.
+        The name of each item is always fetched so that wrapping the items does
+        not require additional round trips.
+
+        - `properties` (str[]) is a list of properties that should be fetched upfront.
+          Recursing properties can be separated by dots, e.G. "summary.config".
+        - `types` (type[]) is a list of types to restrict the items that are given
+          back. The types must be attributes of the `pyVmomi.vim` module.
+        - `item_type` (type) is the wrapper type, e.G. `isphere.interactive_wrapper.VM`.
+        """
+        properties = ["name"] + [item_property for item_property in properties if item_property != "name"]
+        unrestricted_views = self.views_for(types)
+        try:
+            collector_spec = build_property_collector_specs(unrestricted_views, properties)
+            retrieved_contents = self.get_service("propertyCollector").RetrieveContents(collector_spec)
+        finally:
+            for unrestricted_view in unrestricted_views:
+                unrestricted_view.Destroy()
         items = []
-        for item in retrieved_contents:
-            item_instance = ItemContainer()
-            for item_property in item.propSet:
-                if item_property.name in properties:
-                    item_instance.set_path_value(item_property.name, item_property.val)
-            items.append(item_instance)
+        for item in _unique_contents(retrieved_contents):
+            item_properties = dict((item_property.name, item_property.val) for item_property in item.propSet)
+            items.append(item_type(item.obj, properties=item_properties, ttl=self.property_ttl))
         return items
 
+    def iterate_items_with_properties(self, properties, types, item_type, page_size=DEFAULT_RETRIEVE_PAGE_SIZE,
+                                      containers=None):
+        """
+        Returns a generator of wrapped items which are hydrated with the given
+        properties (and their name, see `get_items_with_properties`).
+        The items are retrieved page by page with `RetrievePropertiesEx`, so the
+        first items are available after one call and at most one page is held
+        in memory. Stopping the iteration early cancels the retrieval.
+
+        - `properties` (str[]) is a list of properties that should be fetched upfront.
+        - `types` (type[]) is a list of types to restrict the items that are given
+          back. The types must be attributes of the `pyVmomi.vim` module.
+        - `item_type` (type) is the wrapper type, e.G. `isphere.interactive_wrapper.VM`.
+        - `page_size` (int) is the maximal number of items retrieved per call.
+        - `containers` are the containers to look into (see `views_for`).
+        """
+        properties = ["name"] + [item_property for item_property in properties if item_property != "name"]
+        property_collector = self.get_service("propertyCollector")
+        unrestricted_views = self.views_for(types, containers)
+        token = None
+        try:
+            collector_spec = build_property_collector_specs(unrestricted_views, properties)
+            result = property_collector.RetrievePropertiesEx(
+                collector_spec, vmodl.query.PropertyCollector.RetrieveOptions(maxObjects=page_size))
+            seen_items = set() if len(unrestricted_views) > 1 else None
+            while result:
+                token = result.token
+                for item in _unique_contents(result.objects, seen_items):
+                    item_properties = dict((item_property.name, item_property.val) for item_property in item.propSet)
+                    yield item_type(item.obj, properties=item_properties, ttl=self.property_ttl)
+                if not token:
+                    break
+                next_token, token = token, None
+                result = property_collector.ContinueRetrievePropertiesEx(next_token)
+        finally:
+            if token:
+                property_collector.CancelRetrievePropertiesEx(token)
+            for unrestricted_view in unrestricted_views:
+                unrestricted_view.Destroy()
+
 
 class ItemContainer(object):
 
@@ -257,15 +578,190 @@ class ItemContainer(object):
             part_container._inner_set_path_value(part_names, value, part_container)
 
 
-class ESX(object):
+class CachedItem(object):
+
+    """
+    A wrapper around a raw pyVmomi managed object.
+    Attribute access is forwarded to the raw object, but properties that were
+    retrieved in bulk (see `hydrate`) are served from a snapshot, also when
+    accessed attribute by attribute (e.G. `item.runtime.powerState` after
+    hydrating "runtime.powerState"). A property of which only nested properties
+    were retrieved (`item.runtime` in the example) is fetched from the server
+    once it is used as a whole, e.G. printed or compared.
+    Methods of the raw object are never cached.
+
+    The `ttl` decides how long the snapshot values stay fresh, in seconds:
+
+    - `0` (the default): properties that are read are always fetched from the
+      server, only the properties retrieved in bulk are kept (until `refresh`).
+    - a positive number: properties that are read are kept in the snapshot too,
+      so that repeated reads do not cause additional round trips. All snapshot
+      values (also the ones retrieved in bulk) are fetched again once they are
+      older than `ttl`.
+    - `None`: all snapshot values are kept until `refresh`.
+    """
+
+    def __init__(self, raw_item, name=None, properties=None, ttl=DEFAULT_PROPERTY_TTL):
+        """
+        Wraps a raw item.
+
+        - `raw_item` is the pyVmomi managed object.
+        - `name` (str) is the item name if it is already known. When it is not
+          given (and not part of `properties`), it will be fetched from the server.
+        - `properties` (dict) maps property paths (e.G. "config.uuid") to values
+          that were retrieved in bulk. They are served from the snapshot.
+        - `ttl` (number) is the number of seconds a snapshot value stays fresh,
+          see above for `0` and `None`.
+        """
+        self._raw_item = raw_item
+        self._snapshot = {}
+        self.ttl = ttl
+        if properties:
+            self.hydrate(properties)
+        if name is None:
+            name = self.get_property("name")
+        self.name = name
+
+    def __getattr__(self, attribute):
+        if "_snapshot" not in self.__dict__:
+            raise AttributeError(attribute)
+        if attribute.startswith("_"):
+            return getattr(self._raw_item, attribute)
+        return self.get_property(attribute)
+
+    def __dir__(self):
+        return dir(self._raw_item)
+
+    def get_property(self, path):
+        """
+        Returns the value of a property, from the snapshot if it is still fresh.
+
+        - `path` (str) is the property path. Recursing properties can be separated
+          by dots, e.G. "summary.config".
+        """
+        if path in self._snapshot:
+            value, retrieved_at = self._snapshot[path]
+            if not self._is_expired(retrieved_at):
+                return value
+        if self._has_fresh_properties_below(path):
+            return _PropertyPath(self, path)
+        return self._fetch(path)
+
+    def _fetch(self, path):
+        value = self._raw_item
+        for part in path.split("."):
+            value = getattr(value, part)
+        if not callable(value) and self.ttl != 0:
+            self._snapshot[path] = (value, time.time())
+        return value
+
+    def _is_hydrated(self, path):
+        if path in self._snapshot and not self._is_expired(self._snapshot[path][1]):
+            return True
+        return self._has_fresh_properties_below(path)
+
+    def hydrate(self, properties):
+        """
+        Stores property values in the snapshot, e.G. after a bulk retrieval.
+
+        - `properties` (dict) maps property paths to their values.
+        """
+        retrieved_at = time.time()
+        for path, value in properties.items():
+            self._snapshot[path] = (value, retrieved_at)
+
+    def refresh(self, *paths):
+        """
+        Drops properties from the snapshot, so that they are fetched from the
+        server again on their next access.
+
+        - `paths` (str) are the property paths to drop. All properties
+          are dropped if no path is given.
+        """
+        if not paths:
+            self._snapshot.clear()
+        for path in paths:
+            self._snapshot.pop(path, None)
+
+    def _has_fresh_properties_below(self, path):
+        prefix = path + "."
+        return any(snapshot_path.startswith(prefix) and not self._is_expired(retrieved_at)
+                   for snapshot_path, (_, retrieved_at) in self._snapshot.items())
+
+    def _is_expired(self, retrieved_at):
+        return bool(self.ttl) and time.time() - retrieved_at >= self.ttl
+
+
+_NOT_FETCHED = object()
+
+
+class _PropertyPath(object):
+
+    """
+    A property of a `isphere.interactive_wrapper.CachedItem` that is not in the
+    snapshot itself, but some of its nested properties are (e.G. `runtime` after
+    hydrating "runtime.powerState"). Attribute access to the nested properties
+    in the snapshot continues the path, everything else uses the real property,
+    which is fetched from the server on first use.
+    """
+
+    def __init__(self, item, path):
+        self._item = item
+        self._path = path
+        self._value = _NOT_FETCHED
+
+    def _real_value(self):
+        if self._value is _NOT_FETCHED:
+            self._value = self._item._fetch(self._path)
+        return self._value
+
+    def __getattr__(self, attribute):
+        if attribute.startswith("__"):
+            raise AttributeError(attribute)
+        nested_path = "{0}.{1}".format(self._path, attribute)
+        if not attribute.startswith("_") and self._item._is_hydrated(nested_path):
+            return self._item.get_property(nested_path)
+        return getattr(self._real_value(), attribute)
+
+    def __dir__(self):
+        return dir(self._real_value())
+
+    def __repr__(self):
+        return repr(self._real_value())
+
+    def __str__(self):
+        return str(self._real_value())
+
+    def __eq__(self, other):
+        return self._real_value() == other
+
+    def __ne__(self, other):
+        return self._real_value() != other
+
+    def __hash__(self):
+        return hash(self._real_value())
+
+    def __iter__(self):
+        return iter(self._real_value())
+
+    def __len__(self):
+        return len(self._real_value())
+
+    def __bool__(self):
+        return bool(self._real_value())
+
+    __nonzero__ = __bool__
+
+
+class ESX(CachedItem):
 
     """
     An ESX instance.
     """
 
-    def __init__(self, raw_esx):
+    def __init__(self, raw_esx, name=None, properties=None, ttl=DEFAULT_PROPERTY_TTL):
         self.raw_esx = raw_esx
-        self.name = raw_esx.name
+        CachedItem.__init__(self, raw_esx, name, properties, ttl)
 
     def __eq__(self, other):
         return self.name == other.name
@@ -273,17 +769,11 @@ class ESX(object):
     def __hash__(self):
         return int("".join((str(ord(c)) for c in self.name)))
 
-    def __getattr__(self, attribute):
-        return getattr(self.raw_esx, attribute)
-
-    def __dir__(self):
-        return dir(self.raw_esx)
-
     def get_number_of_cores(self):
         """
         Returns the number of CPU cores (type long) on this ESX.
         """
-        resources_on_esx = self.raw_esx.licensableResource.resource
+        resources_on_esx = self.get_property("licensableResource").resource
         for resource in resources_on_esx:
             if resource.key == "numCpuCores":
                 return resource.value
@@ -291,21 +781,15 @@ class ESX(object):
         raise RuntimeError(message.format(self.name, resources_on_esx))
 
 
-class VM(object):
+class VM(CachedItem):
 
     """
     A virtual machine.
     """
 
-    def __init__(self, raw_vm):
+    def __init__(self, raw_vm, name=None, properties=None, ttl=DEFAULT_PROPERTY_TTL):
         self.raw_vm = raw_vm
-        self.name = raw_vm.name
-
-    def __getattr__(self, attribute):
-        return getattr(self.raw_vm, attribute)
-
-    def __dir__(self):
-        return dir(self.raw_vm)
+        CachedItem.__init__(self, raw_vm, name, properties, ttl)
 
     def get_first_network_interface_matching(self, predicate):
         """
@@ -315,33 +799,41 @@ class VM(object):
         - `predicate` (callable) is a function that takes a network and returns
           True (return this network) or False (skip this network).
         """
-        for network in self.raw_vm.network:
+        for network in self.get_property("network"):
             if predicate(network):
                 return network
         return None
 
     def get_esx_host(self):
-        return ESX(self.raw_vm.runtime.host)
+        return ESX(self.get_property("runtime.host"), ttl=self.ttl)
 
 
-class DVS(object):
+class DVS(CachedItem):
 
     """
     A DistributedVirtualSwitch
     """
 
-    def __init__(self, raw_dvs):
+    def __init__(self, raw_dvs, name=None, properties=None, ttl=DEFAULT_PROPERTY_TTL):
         self.raw_dvs = raw_dvs
-        self.name = raw_dvs.name
+        CachedItem.__init__(self, raw_dvs, name, properties, ttl)
 
     def __eq__(self, other):
         return self.name == other.name
 
-    def __dir__(self):
-        return dir(self.raw_dvs)
 
-    def __getattr__(self, attribute):
-        return getattr(self.raw_dvs, attribute)
+class Datastore(CachedItem):
+
+    """
+    A datastore.
+    """
+
+    def __init__(self, raw_datastore, name=None, properties=None, ttl=DEFAULT_PROPERTY_TTL):
+        self.raw_datastore = raw_datastore
+        CachedItem.__init__(self, raw_datastore, name, properties, ttl)
+
+    def __eq__(self, other):
+        return self.name == other.name
 
 
 def get_all_vms_in_folder(folder):
@@ -355,23 +847,56 @@ def get_all_vms_in_folder(folder):
             yield VM(vm_or_folder)  # it's a VM
 
 
-def build_property_collector_specs(view, item_properties):
-    obj_spec = vmodl.query.PropertyCollector.ObjectSpec()
-    obj_spec.obj = view
-    obj_spec.skip = True
+def _unique_contents(retrieved_contents, seen_items=None):
+    """
+    Yields the retrieved object contents, but each object only once. Objects
+    are retrieved twice when the views of a scope overlap, e.G. a cluster and
+    its datacenter.
+    """
+    seen_items = set() if seen_items is None else seen_items
+    for item in retrieved_contents:
+        if item.obj not in seen_items:
+            seen_items.add(item.obj)
+            yield item
+
+
+def build_item_containers(retrieved_contents, properties):
+    items = []
+    for item in _unique_contents(retrieved_contents):
+        item_instance = ItemContainer()
+        item_instance.moref = item.obj
+        for item_property in item.propSet:
+            if item_property.name in properties:
+                item_instance.set_path_value(item_property.name, item_property.val)
+        items.append(item_instance)
+    return items
+
+
+def build_property_collector_specs(views, item_properties):
+    views = views if isinstance(views, list) else [views]
 
     traversal_spec = vmodl.query.PropertyCollector.TraversalSpec()
     traversal_spec.name = 'traverseEntities'
     traversal_spec.path = 'view'
     traversal_spec.skip = False
-    traversal_spec.type = view.__class__
-    obj_spec.selectSet = [traversal_spec]
-
-    property_spec = vmodl.query.PropertyCollector.PropertySpec()
-    property_spec.type = getattr(vim, view.type[0])
-    property_spec.pathSet = item_properties
+    traversal_spec.type = views[0].__class__
+
+    obj_specs = []
+    for view in views:
+        obj_spec = vmodl.query.PropertyCollector.ObjectSpec()
+        obj_spec.obj = view
+        obj_spec.skip = True
+        obj_spec.selectSet = [traversal_spec]
+        obj_specs.append(obj_spec)
+
+    property_specs = []
+    for type_name in views[0].type:
+        property_spec = vmodl.query.PropertyCollector.PropertySpec()
+        property_spec.type = getattr(vim, type_name)
+        property_spec.pathSet = item_properties
+        property_specs.append(property_spec)
 
     filter_spec = vmodl.query.PropertyCollector.FilterSpec()
-    filter_spec.objectSet = [obj_spec]
-    filter_spec.propSet = [property_spec]
+    filter_spec.objectSet = obj_specs
+    filter_spec.propSet = property_specs
     return [filter_spec]
@@ -0,0 +1,137 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+"""
+Provides an in-memory graph of the relations between inventory items, e.G.
+the host a virtual machine runs on or the hosts of a cluster.
+
+The `isphere.inventory.InventoryGraph` is built from managed object references
+that are retrieved in bulk together with the item names
+(see `isphere.connection.CachingVSphere.fill`), so relations are looked up
+without asking the vCenter again.
+
+Usage:
+
+    >>> from isphere.inventory import InventoryGraph
+    >>> graph = InventoryGraph()
+    >>> graph.add(cluster, "cluster-1")
+    >>> graph.add(esx, "esx-1", [cluster])
+    >>> graph.add(vm, "vm-1", [esx, datastore])
+    >>> graph.child_names(graph.find("cluster-1"), vim.HostSystem)
+    ['esx-1']
+"""
+
+from pyVmomi import vim
+
+from isphere.interactive_wrapper import NotFound
+
+__all__ = ["VM_RELATION_PROPERTIES", "ESX_RELATION_PROPERTIES", "RELATED_TYPES", "InventoryGraph"]
+
+VM_RELATION_PROPERTIES = ["runtime.host", "resourcePool", "datastore", "network"]
+"""
+The virtual machine properties referencing the items a virtual machine uses.
+"""
+
+ESX_RELATION_PROPERTIES = ["parent"]
+"""
+The ESXi host system properties referencing the cluster (or standalone
+compute resource) a host belongs to.
+"""
+
+RELATED_TYPES = [vim.ComputeResource, vim.ResourcePool, vim.Datastore, vim.Network]
+"""
+The types of the referenced items, whose names are retrieved to look them up by name.
+Clusters are compute resources, distributed port groups are networks.
+"""
+
+
+class InventoryGraph(object):
+
+    """
+    Items (managed objects) with their names, and which items they belong to
+    or use (their parents), e.G. a virtual machine has its host, resource pool,
+    datastores and networks as parents.
+    """
+
+    def __init__(self):
+        self.names = {}
+        self._items_by_name = {}
+        self._parents = {}
+        self._children = {}
+
+    def add(self, item, name, parents=()):
+        """
+        Adds an item, or more parents of an item that was added before.
+
+        - item (type `pyVmomi.vim.ManagedEntity`): The item, e.G. a `pyVmomi.vim.VirtualMachine`.
+        - name (type `str`): The item name.
+        - parents (type `iterable`): The items this item belongs to or uses, `None`s are skipped.
+        """
+        if item not in self.names:
+            self.names[item] = name
+            self._items_by_name.setdefault(name, []).append(item)
+        for parent in parents:
+            if parent is not None:
+                self._parents.setdefault(item, set()).add(parent)
+                self._children.setdefault(parent, set()).add(item)
+
+    def find(self, name, item_types=None):
+        """
+        Returns the item with the given name.
+        Raises `isphere.interactive_wrapper.NotFound` if no or several items
+        of the given types have this name.
+
+        - name (type `str`): The item name.
+        - item_types (type `list`): The accepted types, all if `None`.
+        """
+        items = [item for item in self._items_by_name.get(name, [])
+                 if item_types is None or isinstance(item, tuple(item_types))]
+        if len(items) != 1:
+            raise NotFound("{0} items named {1} found".format(len(items) or "No", name))
+        return items[0]
+
+    def parents(self, item, item_type=None):
+        """
+        Returns the items an item belongs to or uses.
+
+        - item (type `pyVmomi.vim.ManagedEntity`): The item.
+        - item_type (type `type`): Only parents of this type if given, e.G. `pyVmomi.vim.HostSystem`.
+        """
+        return [parent for parent in self._parents.get(item, ())
+                if item_type is None or isinstance(parent, item_type)]
+
+    def children(self, item, item_type=None):
+        """
+        Returns the items that belong to or use an item, e.G. the virtual
+        machines on a host or datastore.
+
+        - item (type `pyVmomi.vim.ManagedEntity`): The item.
+        - item_type (type `type`): Only children of this type if given, e.G. `pyVmomi.vim.VirtualMachine`.
+        """
+        return [child for child in self._children.get(item, ())
+                if item_type is None or isinstance(child, item_type)]
+
+    def parent_names(self, item, item_type=None):
+        """
+        Returns the sorted names of the parents of an item (see `parents`).
+        """
+        return sorted(self.names[parent] for parent in self.parents(item, item_type) if parent in self.names)
+
+    def child_names(self, item, item_type=None):
+        """
+        Returns the sorted names of the children of an item (see `children`).
+        """
+        return sorted(self.names[child] for child in self.children(item, item_type) if child in self.names)
+
+    def unnamed_items(self):
+        """
+        Returns the parents that were not added with a name, e.G. the cluster
+        that contains all retrieved hosts.
+        """
+        return [item for item in self._children if item not in self.names]
+
+    def __len__(self):
+        return len(self.names)
@@ -0,0 +1,374 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+"""
+Provides rolling maintenance of many ESXi host systems.
+
+The `isphere.maintenance.RollingMaintenance` works on `wave_size` hosts at a
+time and starts the next host as soon as one is finished. For each host, the
+powered on VMs are evacuated in parallel to the least loaded hosts of the same
+cluster (see `isphere.migration.MigrationPlanner`), then the host enters the
+maintenance mode and, depending on the action:
+
+- `enter`: stays in maintenance mode.
+- `reboot`: reboots, and exits the maintenance mode once it is connected again
+  with a new boot time (or, if a boot time is unknown, after it was seen
+  disconnected).
+- `shutdown`: shuts down.
+
+All tasks are followed through one `isphere.watcher.TaskTracker`.
+The stage of each host is written to a JSON state file, so an interrupted
+maintenance can be resumed by running it again with the same state file. A
+state file is only resumed by a maintenance of the same vCenter, action and
+hosts.
+
+Usage:
+
+    >>> from isphere.maintenance import RollingMaintenance
+    >>> maintenance = RollingMaintenance(vvc, [("esx-1.domain", esx_1)], tracker,
+    ...                                  action="reboot", wave_size=2, state_path="maintenance.json")
+    >>> maintenance.run(on_progress=print)
+"""
+
+import json
+import os
+
+from pyVmomi.Iso8601 import ISO8601Format, ParseISO8601
+
+from isphere.migration import MigrationPlanner
+
+__all__ = ["ACTIONS", "HostMaintenance", "RollingMaintenance"]
+
+ACTIONS = ("enter", "reboot", "shutdown")
+"""
+The supported rolling maintenance actions.
+"""
+
+HOST_PROPERTIES = ["parent", "vm", "runtime.inMaintenanceMode", "runtime.connectionState", "runtime.bootTime"]
+
+_IDLE_STAGES = ("pending", "done", "failed")
+
+
+def _path_value(item, path, default=None):
+    for part in path.split("."):
+        item = getattr(item, part, None)
+        if item is None:
+            return default
+    return item
+
+
+def _format_time(time):
+    return ISO8601Format(time) if time is not None else None
+
+
+def _error_message(error):
+    return getattr(error, "msg", None) or str(error)
+
+
+class HostMaintenance(object):
+
+    """
+    The maintenance of one ESXi host system.
+    The `stage` is one of `pending`, `evacuating`, `entering`, `rebooting`,
+    `reconnecting`, `exiting`, `shutting_down`, `done` and `failed`.
+    """
+
+    def __init__(self, name, host):
+        """
+        - name (type `str`): The ESXi name.
+        - host (type `pyVmomi.vim.HostSystem`): The ESXi to maintain.
+        """
+        self.name = name
+        self.host = host
+        self.stage = "pending"
+        self.error = None
+        self.boot_time = None
+        self.disconnected = False
+        self.moves = []
+
+    @property
+    def active(self):
+        """
+        Whether this host is being worked on.
+        """
+        return self.stage not in _IDLE_STAGES
+
+    def __str__(self):
+        if self.stage == "failed":
+            return "{0}: failed ({1})".format(self.name, self.error)
+        if self.stage == "evacuating":
+            return "{0}: evacuating {1} VMs".format(self.name, len(self.moves))
+        return "{0}: {1}".format(self.name, self.stage.replace("_", " "))
+
+    def has_rebooted(self, connection_state, boot_time):
+        """
+        Whether the host has rebooted since the reboot was submitted: it is
+        connected with a new boot time or, if the boot time before or now is
+        unknown, it is connected after it was seen disconnected.
+
+        - connection_state (type `str`): The current `runtime.connectionState`.
+        - boot_time (type `datetime.datetime`): The current `runtime.bootTime`, may be `None`.
+        """
+        if connection_state != "connected":
+            return False
+        if self.boot_time is not None and boot_time is not None:
+            return boot_time != self.boot_time
+        return self.disconnected
+
+
+class RollingMaintenance(object):
+
+    """
+    Runs a maintenance action on many ESXi host systems, `wave_size` at a time.
+    """
+
+    def __init__(self, vvc, hosts, task_tracker, action="reboot", wave_size=1, state_path=None,
+                 max_migrations_per_source=2, max_migrations_per_target=2, poll_seconds=5):
+        """
+        - vvc (type `isphere.interactive_wrapper.VVC`): The vCenter connection.
+        - hosts (type `list`): The (name, `pyVmomi.vim.HostSystem`) pairs of the
+          ESXis to maintain, in order.
+        - task_tracker (type `isphere.watcher.TaskTracker`): The tracker to follow
+          all tasks with.
+        - action (type `str`): One of `isphere.maintenance.ACTIONS`.
+        - wave_size (type `int`): The number of hosts to work on at the same time.
+        - state_path (type `str`): The JSON file to keep the state in. An existing
+          state file of the same vCenter, action and hosts is resumed, other state
+          files are refused. Not resumable if `None`.
+        - max_migrations_per_source (type `int`): The maximal number of concurrent
+          vMotions off a host, see `isphere.migration.MigrationPlanner`.
+        - max_migrations_per_target (type `int`): The maximal number of concurrent
+          vMotions onto a host.
+        - poll_seconds (type `int`): The maximal time to wait for task updates
+          before checking rebooting hosts again.
+        """
+        if action not in ACTIONS:
+            raise ValueError("Unknown maintenance action {0}, try one of {1}".format(action, ", ".join(ACTIONS)))
+        self.vvc = vvc
+        self.maintenances = [HostMaintenance(name, host) for name, host in hosts]
+        self.task_tracker = task_tracker
+        self.action = action
+        self.wave_size = max(wave_size, 1)
+        self.state_path = state_path
+        self.poll_seconds = poll_seconds
+        self.planner = MigrationPlanner(task_tracker, max_migrations_per_source, max_migrations_per_target)
+        self._on_progress = None
+        self._tasks = {}
+
+    def run(self, on_progress=None):
+        """
+        Runs the maintenance and returns when all hosts are done or when a host
+        failed and the hosts in progress are done.
+        Returns the list of `isphere.maintenance.HostMaintenance`.
+
+        - on_progress (type `callable`): Called with the `isphere.maintenance.HostMaintenance`
+          whenever a host moves to another stage.
+        """
+        self._on_progress = on_progress
+        self._load_state()
+        for maintenance in self.maintenances:
+            if maintenance.active:  # interrupted while in progress, continue where it stopped
+                self._start(maintenance)
+        while True:
+            self._start_next_hosts()
+            if not any(maintenance.active for maintenance in self.maintenances):
+                break
+            self.planner.start_eligible_moves()
+            for finished_task in self.task_tracker.poll(self.poll_seconds):
+                if self.planner.handle_finished_task(finished_task):
+                    continue
+                maintenance = self._tasks.pop(finished_task.task._moId, None)
+                if maintenance:
+                    self._on_task_finished(maintenance, finished_task)
+            self._check_evacuations()
+            self._check_reconnections()
+
+        if self.state_path and all(maintenance.stage == "done" for maintenance in self.maintenances):
+            os.remove(self.state_path)
+        return self.maintenances
+
+    def _start_next_hosts(self):
+        for maintenance in self.maintenances:
+            if any(other.stage == "failed" for other in self.maintenances):
+                return
+            if len([other for other in self.maintenances if other.active]) >= self.wave_size:
+                return
+            if maintenance.stage != "done" and not maintenance.active:
+                self._start(maintenance)
+
+    def _start(self, maintenance):
+        host_snapshots = dict((host.moref, host) for host in self.vvc.get_restricted_view_on_host_systems(HOST_PROPERTIES))
+        host_snapshot = host_snapshots.get(maintenance.host)
+        if host_snapshot is None:
+            self._fail(maintenance, "host not found")
+        elif maintenance.stage in ("rebooting", "reconnecting"):
+            self._advance(maintenance, "reconnecting")
+        elif maintenance.stage == "exiting":
+            self._exit(maintenance, _path_value(host_snapshot, "runtime.inMaintenanceMode"))
+        elif maintenance.stage == "shutting_down" and _path_value(host_snapshot, "runtime.connectionState") != "connected":
+            self._advance(maintenance, "done")
+        elif maintenance.stage in ("entering", "shutting_down") or _path_value(host_snapshot, "runtime.inMaintenanceMode"):
+            self._enter(maintenance, _path_value(host_snapshot, "runtime.inMaintenanceMode"))
+        else:
+            self._evacuate(maintenance, host_snapshot, host_snapshots)
+
+    def _evacuate(self, maintenance, host_snapshot, host_snapshots):
+        vms = self.vvc.get_restricted_view_on_managed_objects(_path_value(host_snapshot, "vm", []),
+                                                              ["name", "runtime.powerState"])
+        vms = [vm for vm in vms if _path_value(vm, "runtime.powerState") == "poweredOn"]
+        if not vms:
+            self._enter(maintenance, False)
+            return
+
+        targets = self._evacuation_targets(host_snapshot, host_snapshots)
+        if not targets:
+            self._fail(maintenance, "no host left to evacuate {0} VMs to".format(len(vms)))
+            return
+        load = dict((target.moref, len(_path_value(target, "vm", []))) for target in targets)
+        maintenance.moves = []
+        for vm in vms:
+            target = min(targets, key=lambda candidate: load[candidate.moref])
+            load[target.moref] += 1
+            maintenance.moves.append(self.planner.add(vm.name, vm.moref, maintenance.host, target.moref))
+        self._advance(maintenance, "evacuating")
+
+    def _evacuation_targets(self, host_snapshot, host_snapshots):
+        stages = dict((maintenance.host, maintenance.stage) for maintenance in self.maintenances)
+        candidates = [candidate for candidate in host_snapshots.values()
+                      if candidate.moref != host_snapshot.moref and self._can_take_vms(candidate, host_snapshot, stages)]
+        # hosts that still have to be maintained only take VMs when nothing else is left
+        preferred = [candidate for candidate in candidates if stages.get(candidate.moref) != "pending"]
+        return preferred or candidates
+
+    @staticmethod
+    def _can_take_vms(candidate, host_snapshot, stages):
+        if _path_value(candidate, "parent") != _path_value(host_snapshot, "parent"):
+            return False
+        if _path_value(candidate, "runtime.connectionState") != "connected":
+            return False
+        if _path_value(candidate, "runtime.inMaintenanceMode"):
+            return False
+        return stages.get(candidate.moref, "done") in ("pending", "done")
+
+    def _check_evacuations(self):
+        for maintenance in self.maintenances:
+            if maintenance.stage != "evacuating":
+                continue
+            if any(move.state in ("pending", "running") for move in maintenance.moves):
+                continue
+            failed_moves = [move for move in maintenance.moves if move.state == "error"]
+            if failed_moves:
+                self._fail(maintenance, "could not evacuate {0}: {1}".format(failed_moves[0].vm_name,
+                                                                             _error_message(failed_moves[0].error)))
+            else:
+                self._enter(maintenance, False)
+
+    def _enter(self, maintenance, in_maintenance_mode):
+        if in_maintenance_mode:
+            self._after_enter(maintenance)
+        else:
+            self._submit(maintenance, "entering", lambda: maintenance.host.EnterMaintenanceMode(0))
+
+    def _after_enter(self, maintenance):
+        if self.action == "enter":
+            self._advance(maintenance, "done")
+        elif self.action == "shutdown":
+            self._submit(maintenance, "shutting_down", lambda: maintenance.host.Shutdown(False))
+        else:
+            host_snapshot = self.vvc.get_restricted_view_on_managed_objects([maintenance.host], ["runtime.bootTime"])
+            maintenance.boot_time = _path_value(host_snapshot[0], "runtime.bootTime") if host_snapshot else None
+            maintenance.disconnected = False
+            self._submit(maintenance, "rebooting", lambda: maintenance.host.Reboot(False))
+
+    def _check_reconnections(self):
+        reconnecting = dict((maintenance.host, maintenance) for maintenance in self.maintenances
+                            if maintenance.stage == "reconnecting")
+        if not reconnecting:
+            return
+        properties = ["runtime.connectionState", "runtime.bootTime"]
+        for host_snapshot in self.vvc.get_restricted_view_on_managed_objects(list(reconnecting.keys()), properties):
+            maintenance = reconnecting[host_snapshot.moref]
+            connection_state = _path_value(host_snapshot, "runtime.connectionState")
+            if connection_state != "connected" and not maintenance.disconnected:
+                maintenance.disconnected = True
+                self._save_state()
+            if maintenance.has_rebooted(connection_state, _path_value(host_snapshot, "runtime.bootTime")):
+                self._exit(maintenance, True)
+
+    def _exit(self, maintenance, in_maintenance_mode):
+        if in_maintenance_mode:
+            self._submit(maintenance, "exiting", lambda: maintenance.host.ExitMaintenanceMode(0))
+        else:
+            self._advance(maintenance, "done")
+
+    def _submit(self, maintenance, stage, create_task):
+        try:
+            task = create_task()
+            self.task_tracker.track(task)
+        except Exception as e:
+            self._fail(maintenance, _error_message(e))
+            return
+        self._tasks[task._moId] = maintenance
+        self._advance(maintenance, stage)
+
+    def _on_task_finished(self, maintenance, finished_task):
+        if finished_task.state == "error":
+            self._fail(maintenance, _error_message(finished_task.error))
+        elif maintenance.stage == "entering":
+            self._after_enter(maintenance)
+        elif maintenance.stage == "rebooting":
+            self._advance(maintenance, "reconnecting")
+        else:
+            self._advance(maintenance, "done")
+
+    def _fail(self, maintenance, error):
+        maintenance.error = error
+        self._advance(maintenance, "failed")
+
+    def _advance(self, maintenance, stage):
+        maintenance.stage = stage
+        if stage != "failed":
+            maintenance.error = None
+        self._save_state()
+        if self._on_progress:
+            self._on_progress(maintenance)
+
+    def _load_state(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        with open(self.state_path) as state_file:
+            state = json.load(state_file)
+        if state["action"] != self.action:
+            raise ValueError("State file {0} belongs to a rolling '{1}', not '{2}'.".format(
+                self.state_path, state["action"], self.action))
+        if state.get("vcenter") != self.vvc.hostname:
+            raise ValueError("State file {0} belongs to the vCenter {1}, not {2}.".format(
+                self.state_path, state.get("vcenter"), self.vvc.hostname))
+        if set(state["hosts"]) != set(maintenance.name for maintenance in self.maintenances):
+            raise ValueError("State file {0} belongs to a maintenance of other esxis: {1}.".format(
+                self.state_path, ", ".join(sorted(state["hosts"]))))
+        for maintenance in self.maintenances:
+            host_state = state["hosts"].get(maintenance.name)
+            if host_state:
+                maintenance.stage = "pending" if host_state["stage"] == "failed" else host_state["stage"]
+                boot_time = host_state.get("boot_time")
+                maintenance.boot_time = ParseISO8601(boot_time) if boot_time else None
+                maintenance.disconnected = host_state.get("disconnected", False)
+
+    def _save_state(self):
+        if not self.state_path:
+            return
+        state = {"action": self.action,
+                 "vcenter": self.vvc.hostname,
+                 "hosts": dict((maintenance.name, {"stage": maintenance.stage,
+                                                   "boot_time": _format_time(maintenance.boot_time),
+                                                   "disconnected": maintenance.disconnected,
+                                                   "error": maintenance.error})
+                               for maintenance in self.maintenances)}
+        temporary_path = "{0}.tmp".format(self.state_path)
+        with open(temporary_path, "w") as state_file:
+            json.dump(state, state_file, indent=2, sort_keys=True)
+        os.rename(temporary_path, self.state_path)
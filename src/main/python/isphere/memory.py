@@ -0,0 +1,52 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+"""
+Provides an estimate of the memory held by the cache structures, to keep an
+eye on long running sessions.
+
+Usage:
+
+    >>> from isphere.memory import approximate_size
+    >>> seen = set()
+    >>> approximate_size({"vm-1": "uuid-1"}, seen)
+    292
+"""
+
+import sys
+
+__all__ = ["approximate_size"]
+
+_CONTAINER_TYPES = (dict, list, tuple, set, frozenset)
+
+
+def approximate_size(item, seen):
+    """
+    Returns the approximate number of bytes held by an item, including the
+    contents of `dict`s, `list`s, `tuple`s and `set`s and the attributes of
+    isphere objects. Other objects (e.G. managed object references) are
+    counted without what they reference.
+    Objects in `seen` are not counted again, so objects shared by several
+    items (e.G. interned names) are only counted for the first one.
+
+    - item: The item to measure.
+    - seen (type `set`): The ids of the objects counted so far, updated.
+    """
+    size, pending = 0, [item]
+    while pending:
+        current = pending.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+        if isinstance(current, dict):
+            pending.extend(current.keys())
+            pending.extend(current.values())
+        elif isinstance(current, _CONTAINER_TYPES):
+            pending.extend(current)
+        elif type(current).__module__.startswith("isphere.") and hasattr(current, "__dict__"):
+            pending.append(current.__dict__)
+    return size
@@ -0,0 +1,233 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+"""
+Provides per-method metrics of the SOAP calls made to a vCenter.
+
+The `isphere.metrics.SoapMetrics` records a latency histogram, an error
+counter and a received bytes counter per SOAP method (e.G. `RetrieveProperties`,
+`FindByUuid`, `PowerOnVM_Task`).
+The `isphere.metrics.MetricsExporter` writes them to a file in the
+Prometheus text format (for the node exporter textfile collector) or as JSON,
+at exit and optionally at intervals.
+
+Usage:
+
+    >>> from isphere.interactive_wrapper import VVC
+    >>> from isphere.metrics import SoapMetrics, MetricsExporter
+    >>> vvc = VVC("vcenter.domain")
+    >>> metrics = SoapMetrics(labels={"vcenter": vvc.hostname})
+    >>> vvc.soap_observers.append(metrics)
+    >>> MetricsExporter(metrics, "/var/lib/node_exporter/isphere.prom", interval=60).start()
+    >>> vvc.connect("username", "password")
+"""
+
+import atexit
+import json
+import os
+import threading
+
+__all__ = ["DEFAULT_BUCKETS", "SoapMetrics", "MetricsExporter"]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+"""
+The default upper bounds (in seconds) of the latency histogram buckets.
+"""
+
+_DURATION = "isphere_soap_request_duration_seconds"
+_ERRORS = "isphere_soap_errors_total"
+_RECEIVED_BYTES = "isphere_soap_received_bytes_total"
+
+
+def _error_name(error):
+    name = getattr(error, "_wsdlName", None)  # vmodl faults, e.G. InvalidState
+    return name or type(error).__name__
+
+
+def _escape(label_value):
+    return str(label_value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    return "{" + ",".join('{0}="{1}"'.format(name, _escape(value)) for name, value in labels) + "}"
+
+
+def _format_bound(bound):
+    return "{0:g}".format(bound)
+
+
+class _MethodMetrics(object):
+
+    def __init__(self, number_of_buckets):
+        self.bucket_counts = [0] * (number_of_buckets + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.bytes_received = 0
+        self.errors = {}
+
+
+class SoapMetrics(object):
+
+    """
+    An observer for `isphere.soap.instrument_stub` that records per-method
+    latency histograms, error counters and received bytes.
+    Register it in `isphere.interactive_wrapper.VVC.soap_observers`.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, labels=None):
+        """
+        - buckets (type `tuple`): The sorted upper bounds of the histogram buckets in seconds.
+        - labels (type `dict`): Constant labels to add to every exported sample,
+          e.G. `{"vcenter": "vcenter.domain"}`.
+        """
+        self.buckets = tuple(buckets)
+        self.labels = sorted((labels or {}).items())
+        self._lock = threading.Lock()
+        self._methods = {}
+
+    def on_call(self, call):
+        """
+        Records a `isphere.soap.SoapCall`.
+        """
+        bucket_index = len(self.buckets)
+        for index, bound in enumerate(self.buckets):
+            if call.seconds <= bound:
+                bucket_index = index
+                break
+
+        with self._lock:
+            method_metrics = self._methods.get(call.method)
+            if method_metrics is None:
+                method_metrics = self._methods[call.method] = _MethodMetrics(len(self.buckets))
+            method_metrics.bucket_counts[bucket_index] += 1
+            method_metrics.count += 1
+            method_metrics.sum += call.seconds
+            method_metrics.bytes_received += call.bytes_received
+            if call.error is not None:
+                error_name = _error_name(call.error)
+                method_metrics.errors[error_name] = method_metrics.errors.get(error_name, 0) + 1
+
+    def snapshot(self):
+        """
+        Returns the recorded metrics as a dictionary, keyed by method name.
+        Bucket counts are cumulative, like in Prometheus.
+        """
+        with self._lock:
+            methods = {}
+            for method, method_metrics in self._methods.items():
+                cumulative_count, buckets = 0, []
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), method_metrics.bucket_counts):
+                    cumulative_count += bucket_count
+                    buckets.append(["+Inf" if bound == float("inf") else bound, cumulative_count])
+                methods[method] = {"count": method_metrics.count,
+                                   "sum_seconds": method_metrics.sum,
+                                   "buckets": buckets,
+                                   "bytes_received": method_metrics.bytes_received,
+                                   "errors": dict(method_metrics.errors)}
+            return methods
+
+    def to_json(self):
+        """
+        Returns the recorded metrics as a JSON document.
+        """
+        return json.dumps({"labels": dict(self.labels), "methods": self.snapshot()}, indent=2, sort_keys=True)
+
+    def to_prometheus_text(self):
+        """
+        Returns the recorded metrics in the Prometheus text exposition format.
+        """
+        methods = sorted(self.snapshot().items())
+        lines = ["# HELP {0} Duration of vCenter SOAP calls, including (de)serialization.".format(_DURATION),
+                 "# TYPE {0} histogram".format(_DURATION)]
+        for method, method_metrics in methods:
+            labels = self.labels + [("method", method)]
+            for bound, cumulative_count in method_metrics["buckets"]:
+                bound = bound if bound == "+Inf" else _format_bound(bound)
+                lines.append("{0}_bucket{1} {2}".format(_DURATION, _format_labels(labels + [("le", bound)]), cumulative_count))
+            lines.append("{0}_sum{1} {2!r}".format(_DURATION, _format_labels(labels), method_metrics["sum_seconds"]))
+            lines.append("{0}_count{1} {2}".format(_DURATION, _format_labels(labels), method_metrics["count"]))
+
+        lines.extend(["# HELP {0} Failed vCenter SOAP calls.".format(_ERRORS),
+                      "# TYPE {0} counter".format(_ERRORS)])
+        for method, method_metrics in methods:
+            for error_name, count in sorted(method_metrics["errors"].items()):
+                labels = self.labels + [("method", method), ("error", error_name)]
+                lines.append("{0}{1} {2}".format(_ERRORS, _format_labels(labels), count))
+
+        lines.extend(["# HELP {0} Bytes received from vCenter SOAP calls.".format(_RECEIVED_BYTES),
+                      "# TYPE {0} counter".format(_RECEIVED_BYTES)])
+        for method, method_metrics in methods:
+            labels = self.labels + [("method", method)]
+            lines.append("{0}{1} {2}".format(_RECEIVED_BYTES, _format_labels(labels), method_metrics["bytes_received"]))
+        return "\n".join(lines) + "\n"
+
+
+class MetricsExporter(object):
+
+    """
+    Writes `isphere.metrics.SoapMetrics` to a file at exit and optionally at intervals.
+    Files are replaced atomically, so collectors never read partial files.
+    """
+
+    def __init__(self, metrics, path, interval=None, output_format=None):
+        """
+        - metrics (type `isphere.metrics.SoapMetrics`): The metrics to export.
+        - path (type `str`): The file to write to.
+        - interval (type `float`): The number of seconds between writes.
+          Only write at exit if `None`.
+        - output_format (type `str`): Either `prometheus` or `json`. Defaults to
+          `json` for paths ending in `.json` and `prometheus` otherwise.
+        """
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.output_format = output_format or ("json" if path.endswith(".json") else "prometheus")
+        if self.output_format not in ("prometheus", "json"):
+            raise ValueError("Unknown metrics format {0}".format(self.output_format))
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Starts exporting. Metrics are written at exit and, if an interval was given,
+        periodically from a daemon thread.
+        """
+        atexit.register(self.stop)
+        if self.interval:
+            self._thread = threading.Thread(target=self._write_periodically, name="isphere-metrics-exporter")
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops the periodic writes and writes the metrics one last time.
+        """
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+        self.write()
+
+    def write(self):
+        """
+        Writes the metrics now.
+        """
+        if self.output_format == "json":
+            content = self.metrics.to_json()
+        else:
+            content = self.metrics.to_prometheus_text()
+        temporary_path = "{0}.{1}.tmp".format(self.path, os.getpid())
+        with open(temporary_path, "w") as metrics_file:
+            metrics_file.write(content)
+        os.rename(temporary_path, self.path)
+
+    def _write_periodically(self):
+        while not self._stopped.is_set():
+            self._stopped.wait(self.interval)
+            if not self._stopped.is_set():
+                self.write()
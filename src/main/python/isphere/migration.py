@@ -0,0 +1,233 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+"""
+Provides parallel, host-throttled vMotions.
+
+The `isphere.migration.MigrationPlanner` submits `RelocateVM_Task`s without
+blocking, keeps at most a given number of vMotions running per source and per
+target ESXi and follows all tasks through one `isphere.watcher.TaskTracker`.
+
+Usage:
+
+    >>> from isphere.migration import MigrationPlanner
+    >>> planner = MigrationPlanner(tracker, max_per_source_host=2, max_per_target_host=2)
+    >>> planner.add("some-vm", vm, source_host, target_host)
+    >>> moves = planner.run(on_progress=print)
+"""
+
+import time
+
+from pyVmomi import vim
+
+__all__ = ["Move", "MigrationProgress", "MigrationPlanner"]
+
+try:
+    _timer = time.perf_counter
+except AttributeError:  # python < 3.3
+    _timer = time.time
+
+
+class Move(object):
+
+    """
+    The migration of a virtual machine to another ESXi host system.
+    The `state` is one of `pending`, `running`, `success`, `error` and `skipped`.
+    """
+
+    def __init__(self, vm_name, vm, source_host, target_host):
+        """
+        - vm_name (type `str`): The virtual machine name.
+        - vm (type `pyVmomi.vim.VirtualMachine`): The virtual machine to migrate.
+        - source_host (type `pyVmomi.vim.HostSystem`): The current host of the
+          virtual machine, `None` if unknown.
+        - target_host (type `pyVmomi.vim.HostSystem`): The host to migrate to.
+        """
+        self.vm_name = vm_name
+        self.vm = vm
+        self.source_host = source_host
+        self.target_host = target_host
+        self.state = "pending"
+        self.task = None
+        self.error = None
+        self.seconds = None
+        self._started_at = None
+
+    def __repr__(self):
+        return "Move({0}, {1})".format(self.vm_name, self.state)
+
+
+class MigrationProgress(object):
+
+    """
+    A snapshot of the progress of a `isphere.migration.MigrationPlanner`.
+    """
+
+    def __init__(self, moves, elapsed_seconds):
+        states = [move.state for move in moves]
+        self.pending = states.count("pending")
+        self.running = states.count("running")
+        self.succeeded = states.count("success")
+        self.failed = states.count("error")
+        self.skipped = states.count("skipped")
+        self.total = len(moves)
+        self.elapsed_seconds = elapsed_seconds
+
+    @property
+    def finished(self):
+        return self.succeeded + self.failed + self.skipped
+
+    @property
+    def per_minute(self):
+        """
+        The throughput in succeeded vMotions per minute.
+        """
+        if not self.elapsed_seconds:
+            return 0.0
+        return self.succeeded * 60.0 / self.elapsed_seconds
+
+    def __str__(self):
+        template = ("{0.finished}/{0.total} done ({0.succeeded} succeeded, {0.failed} failed, {0.skipped} skipped), "
+                    "{0.running} running, {0.pending} pending, {0.per_minute:.1f} vMotions/min")
+        return template.format(self)
+
+
+class MigrationPlanner(object):
+
+    """
+    Runs vMotions in parallel, throttled per source and per target host.
+    """
+
+    def __init__(self, task_tracker, max_per_source_host=2, max_per_target_host=2, poll_seconds=5):
+        """
+        - task_tracker (type `isphere.watcher.TaskTracker`): The tracker to follow
+          the relocation tasks with.
+        - max_per_source_host (type `int`): The maximal number of concurrent vMotions
+          off a host. 0 or `None` means unlimited.
+        - max_per_target_host (type `int`): The maximal number of concurrent vMotions
+          onto a host. 0 or `None` means unlimited.
+        - poll_seconds (type `int`): The maximal time to wait for task updates
+          before reporting progress again.
+        """
+        self.task_tracker = task_tracker
+        self.max_per_source_host = max_per_source_host
+        self.max_per_target_host = max_per_target_host
+        self.poll_seconds = poll_seconds
+        self.moves = []
+        self._running_per_source = {}
+        self._running_per_target = {}
+        self._running_tasks = {}
+
+    def add(self, vm_name, vm, source_host, target_host):
+        """
+        Plans the migration of a virtual machine. VMs that are already on the
+        target host will be skipped.
+        Returns the `isphere.migration.Move`.
+
+        - vm_name (type `str`): The virtual machine name.
+        - vm (type `pyVmomi.vim.VirtualMachine`): The virtual machine to migrate.
+        - source_host (type `pyVmomi.vim.HostSystem`): The current host of the
+          virtual machine, `None` if unknown.
+        - target_host (type `pyVmomi.vim.HostSystem`): The host to migrate to.
+        """
+        move = Move(vm_name, vm, source_host, target_host)
+        if source_host is not None and _key(source_host) == _key(target_host):
+            move.state = "skipped"
+        self.moves.append(move)
+        return move
+
+    def run(self, on_progress=None):
+        """
+        Runs all planned migrations and returns when they are finished.
+        Returns the list of `isphere.migration.Move`s.
+
+        - on_progress (type `callable`): Called with a `isphere.migration.MigrationProgress`
+          whenever migrations were started or finished.
+        """
+        started_at = _timer()
+        changed = self.start_eligible_moves()
+        while self._running_tasks:
+            if changed and on_progress:
+                on_progress(MigrationProgress(self.moves, _timer() - started_at))
+            changed = False
+            for finished_task in self.task_tracker.poll(self.poll_seconds):
+                changed = self.handle_finished_task(finished_task) is not None or changed
+            if changed:
+                self.start_eligible_moves()
+
+        if on_progress:
+            on_progress(MigrationProgress(self.moves, _timer() - started_at))
+        return self.moves
+
+    def start_eligible_moves(self):
+        """
+        Starts the pending migrations that are within the host limits.
+        Returns whether any migration was started.
+        Only needed when driving the planner without `run`, e.G. when the task
+        tracker is shared with other work.
+        """
+        started_any = False
+        for move in self.moves:
+            if move.state != "pending" or not self._is_eligible(move):
+                continue
+            self._start(move)
+            started_any = True
+        return started_any
+
+    def handle_finished_task(self, finished_task):
+        """
+        Updates the migration a finished task belongs to. Returns the
+        `isphere.migration.Move` or `None` if the task is not a migration of this planner.
+        Only needed when driving the planner without `run`.
+
+        - finished_task (type `isphere.watcher.FinishedTask`): A task reported
+          by the task tracker.
+        """
+        move = self._running_tasks.pop(finished_task.task._moId, None)
+        if move:
+            self._finish(move, finished_task.state, finished_task.error)
+        return move
+
+    def _is_eligible(self, move):
+        if not _below_limit(self._running_per_source, move.source_host, self.max_per_source_host):
+            return False
+        return _below_limit(self._running_per_target, move.target_host, self.max_per_target_host)
+
+    def _start(self, move):
+        move._started_at = _timer()
+        try:
+            move.task = move.vm.Relocate(vim.vm.RelocateSpec(host=move.target_host))
+            self.task_tracker.track(move.task)
+        except Exception as e:
+            move.state = "error"
+            move.error = e
+            return
+        move.state = "running"
+        self._running_tasks[move.task._moId] = move
+        _increment(self._running_per_source, move.source_host, 1)
+        _increment(self._running_per_target, move.target_host, 1)
+
+    def _finish(self, move, state, error):
+        move.state = state
+        move.error = error
+        move.seconds = _timer() - move._started_at
+        _increment(self._running_per_source, move.source_host, -1)
+        _increment(self._running_per_target, move.target_host, -1)
+
+
+def _key(host):
+    return getattr(host, "_moId", host)
+
+
+def _below_limit(running_per_host, host, limit):
+    if not limit or host is None:
+        return True
+    return running_per_host.get(_key(host), 0) < limit
+
+
+def _increment(running_per_host, host, amount):
+    if host is not None:
+        running_per_host[_key(host)] = running_per_host.get(_key(host), 0) + amount
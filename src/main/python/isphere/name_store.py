@@ -0,0 +1,154 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+"""
+Provides a compact mapping from item names to UUIDs for inventories with
+hundreds of thousands of items, where a `dict` of strings takes several
+hundred bytes per item.
+
+Usage:
+
+    >>> from isphere.name_store import UuidStore
+    >>> store = UuidStore([("vm-1", "4231a8b2-7f3c-4e6d-9a1b-2c3d4e5f6a7b")])
+    >>> store["vm-1"]
+    '4231a8b2-7f3c-4e6d-9a1b-2c3d4e5f6a7b'
+    >>> store.keys()
+    ['vm-1']
+"""
+
+from array import array
+import uuid
+
+try:
+    _intern = intern  # python 2
+except NameError:
+    from sys import intern as _intern
+
+__all__ = ["intern_name", "UuidStore"]
+
+_NO_UUID = bytes(bytearray(16))
+
+
+def intern_name(name):
+    """
+    Returns the interned name, so equal names retrieved at different times
+    share one string. Names that cannot be interned (e.G. `unicode` in
+    python 2) are returned as they are.
+
+    - name (type `str`): The name.
+    """
+    try:
+        return _intern(name)
+    except TypeError:
+        return name
+
+
+def _encode(name):
+    return name if isinstance(name, bytes) else name.encode("utf-8")
+
+
+def _decode(encoded_name):
+    return encoded_name if isinstance(encoded_name, str) else encoded_name.decode("utf-8")
+
+
+def _pack_uuid(value):
+    """
+    Returns the 16 bytes of a UUID, `None` if the UUID would not read back
+    exactly as given (e.G. upper case, malformed or `None`).
+    """
+    try:
+        packed = uuid.UUID(value).bytes
+    except (AttributeError, TypeError, ValueError):
+        return None
+    return packed if str(uuid.UUID(bytes=packed)) == value else None
+
+
+class UuidStore(object):
+
+    """
+    An immutable mapping from item names to UUIDs.
+    The names are stored UTF-8 encoded and sorted in one buffer with an array
+    of their offsets, and are found by bisection. Each UUID takes 16 bytes in
+    a second buffer, the few UUIDs that do not read back exactly in the
+    canonical form are kept aside as they are.
+    """
+
+    def __init__(self, items=()):
+        """
+        - items (type `iterable`): The `(name, uuid)` pairs, the last pair wins
+          for duplicate names.
+        """
+        uuids_by_name = dict((_encode(name), value) for name, value in items)
+        self._names = bytearray()
+        self._offsets = array("I", [0])
+        self._uuids = bytearray()
+        self._irregular_uuids = {}
+        for position, encoded_name in enumerate(sorted(uuids_by_name)):
+            self._names += encoded_name
+            self._offsets.append(len(self._names))
+            packed = _pack_uuid(uuids_by_name[encoded_name])
+            if packed is None:
+                self._irregular_uuids[position] = uuids_by_name[encoded_name]
+            self._uuids += packed or _NO_UUID
+
+    def _encoded_name_at(self, position):
+        return bytes(self._names[self._offsets[position]:self._offsets[position + 1]])
+
+    def _uuid_at(self, position):
+        if position in self._irregular_uuids:
+            return self._irregular_uuids[position]
+        return str(uuid.UUID(bytes=bytes(self._uuids[16 * position:16 * position + 16])))
+
+    def _find(self, name):
+        encoded_name = _encode(name)
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self._encoded_name_at(middle) < encoded_name:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self) and self._encoded_name_at(low) == encoded_name:
+            return low
+        return None
+
+    def __getitem__(self, name):
+        position = self._find(name)
+        if position is None:
+            raise KeyError(name)
+        return self._uuid_at(position)
+
+    def get(self, name, default=None):
+        """
+        Returns the UUID of the given name, `default` if the name is unknown.
+
+        - name (type `str`): The item name.
+        - default: The value for unknown names.
+        """
+        position = self._find(name)
+        return default if position is None else self._uuid_at(position)
+
+    def __contains__(self, name):
+        return self._find(name) is not None
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield intern_name(_decode(self._encoded_name_at(position)))
+
+    def keys(self):
+        """
+        Returns the sorted names.
+        """
+        return list(self)
+
+    def items(self):
+        """
+        Returns the `(name, uuid)` pairs sorted by name.
+        """
+        return [(name, self._uuid_at(position)) for position, name in enumerate(self)]
@@ -0,0 +1,89 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+"""
+Provides bounded concurrency for blocking vCenter calls.
+
+Most vCenter calls spend their time waiting for the network, so running a few
+of them at the same time speeds up bulk operations a lot. The vCenter should
+not be flooded however, hence the concurrency limit.
+
+Usage:
+
+    >>> from isphere.parallel import map_bounded
+    >>> for vm, result, error in map_bounded(lambda vm: vm.RebootGuest(), vms, max_concurrency=16):
+    ...     if error:
+    ...         break
+"""
+
+import threading
+
+try:
+    import queue
+except ImportError:  # python 2
+    import Queue as queue
+
+__all__ = ["DEFAULT_MAX_CONCURRENCY", "map_bounded"]
+
+DEFAULT_MAX_CONCURRENCY = 16
+"""
+The default maximal number of concurrent calls.
+"""
+
+_FINISHED = object()
+
+
+def map_bounded(function, arguments, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """
+    Calls a function for each argument in worker threads, at most
+    `max_concurrency` at the same time.
+    Yields an `(argument, result, error)` tuple for each call as it finishes,
+    `error` is the raised exception or `None`.
+    No further calls are started once the consumer stops iterating, calls in
+    progress are waited for.
+
+    - function (type `callable`): The function to call with each argument.
+    - arguments (type `iterable`): The arguments.
+    - max_concurrency (type `int`): The maximal number of concurrent calls.
+    """
+    arguments = iter(arguments)
+    arguments_lock = threading.Lock()
+    stopped = threading.Event()
+    results = queue.Queue()
+
+    def work():
+        try:
+            while not stopped.is_set():
+                with arguments_lock:
+                    try:
+                        argument = next(arguments)
+                    except StopIteration:
+                        return
+                try:
+                    results.put((argument, function(argument), None))
+                except Exception as e:
+                    results.put((argument, None, e))
+        finally:
+            results.put(_FINISHED)
+
+    workers = [threading.Thread(target=work, name="isphere-parallel-{0}".format(index))
+               for index in range(max(max_concurrency, 1))]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+
+    try:
+        running_workers = len(workers)
+        while running_workers:
+            result = results.get()
+            if result is _FINISHED:
+                running_workers -= 1
+            else:
+                yield result
+    finally:
+        stopped.set()
+        for worker in workers:
+            worker.join()
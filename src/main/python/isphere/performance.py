@@ -0,0 +1,189 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+"""
+Provides batched access to the vCenter performance counters.
+
+The `isphere.performance.PerformanceCounters` table resolves counter names like
+`cpu.ready.summation` to counter IDs. It is built from one read of the
+`perfManager` counter list.
+`isphere.performance.query_performance` asks for many entities and counters
+with few `QueryPerf` calls and aligns the results into one array per counter,
+see `isphere.performance.PerformanceResult`.
+
+Usage:
+
+    >>> from isphere.performance import PerformanceCounters, query_performance
+    >>> perf_manager = vvc.get_service("perfManager")
+    >>> counters = PerformanceCounters(perf_manager.perfCounter)
+    >>> result = query_performance(perf_manager, counters, vms, ["cpu.ready.summation"])
+    >>> result.top("cpu.ready.summation", 10)
+"""
+
+from array import array
+import calendar
+import difflib
+
+from pyVmomi import vim
+
+from isphere.interactive_wrapper import NotFound
+from isphere.parallel import map_bounded
+
+__all__ = ["REALTIME_INTERVAL", "DEFAULT_BATCH_SIZE", "PerformanceCounter", "PerformanceCounters",
+           "PerformanceResult", "query_performance"]
+
+REALTIME_INTERVAL = 20
+"""
+The sampling interval of the real time statistics in seconds.
+"""
+
+DEFAULT_BATCH_SIZE = 64
+"""
+The default number of query specs (entities) per `QueryPerf` call.
+"""
+
+_NO_VALUE = float("nan")
+
+
+def _epoch_seconds(timestamp):
+    return calendar.timegm(timestamp.utctimetuple()) + timestamp.microsecond / 1e6
+
+
+class PerformanceCounter(object):
+
+    """
+    A performance counter, named `<group>.<name>.<rollup>`, e.G. `cpu.ready.summation`.
+    """
+
+    def __init__(self, key, name, unit):
+        """
+        - key (type `int`): The counter ID.
+        - name (type `str`): The counter name.
+        - unit (type `str`): The unit, e.G. `millisecond` or `percent`.
+        """
+        self.key = key
+        self.name = name
+        self.unit = unit
+
+    def scale(self, raw_value):
+        """
+        Returns a raw counter value in its unit. Percentages are reported in
+        hundredths of a percent by the vCenter.
+        """
+        return raw_value / 100.0 if self.unit == "percent" else float(raw_value)
+
+    def __repr__(self):
+        return "PerformanceCounter({0}, {1})".format(self.key, self.name)
+
+
+class PerformanceCounters(object):
+
+    """
+    The table of the performance counters of a vCenter.
+    """
+
+    def __init__(self, perf_counters):
+        """
+        - perf_counters (type `list`): The `pyVmomi.vim.PerformanceManager.CounterInfo`s,
+          i.E. the `perfCounter` property of the performance manager.
+        """
+        self.counters_by_name = {}
+        for perf_counter in perf_counters:
+            name = "{0}.{1}.{2}".format(perf_counter.groupInfo.key, perf_counter.nameInfo.key, perf_counter.rollupType)
+            self.counters_by_name[name] = PerformanceCounter(perf_counter.key, name, str(perf_counter.unitInfo.key))
+
+    def resolve(self, name):
+        """
+        Returns the `isphere.performance.PerformanceCounter` with the given name.
+        Raises `isphere.interactive_wrapper.NotFound` if there is none.
+
+        - name (type `str`): The counter name, e.G. `cpu.ready.summation`.
+        """
+        if name not in self.counters_by_name:
+            suggestions = difflib.get_close_matches(name, self.counters_by_name.keys(), 3)
+            raise NotFound("No performance counter '{0}' found.{1}".format(
+                name, " Did you mean {0}?".format(" or ".join(suggestions)) if suggestions else ""))
+        return self.counters_by_name[name]
+
+
+class PerformanceResult(object):
+
+    """
+    Performance values aligned into one array per counter. The value of
+    `entities[i]` for a counter is at index `i` of `values[counter_name]`,
+    `nan` if the entity did not report it. The samples the value was averaged
+    from are at index `i` of `samples[counter_name]`, as (timestamp in seconds
+    since the epoch, value) pairs, oldest first.
+    """
+
+    def __init__(self, entities, counters):
+        """
+        - entities (type `list`): The queried entities.
+        - counters (type `list`): The queried `isphere.performance.PerformanceCounter`s.
+        """
+        self.entities = list(entities)
+        self.counters = list(counters)
+        self.values = dict((counter.name, array("d", [_NO_VALUE] * len(self.entities))) for counter in self.counters)
+        self.samples = dict((counter.name, [[] for _ in self.entities]) for counter in self.counters)
+
+    def top(self, counter_name, limit=10):
+        """
+        Returns the (entity, value) pairs with the highest values of a counter,
+        highest first. Entities without a value are left out.
+
+        - counter_name (type `str`): The counter name.
+        - limit (type `int`): The maximal number of pairs, all if `None`.
+        """
+        values = self.values[counter_name]
+        indices = [index for index in range(len(self.entities)) if values[index] == values[index]]  # not nan
+        indices.sort(key=lambda index: values[index], reverse=True)
+        return [(self.entities[index], values[index]) for index in indices[:limit]]
+
+
+def query_performance(perf_manager, counters, entities, counter_names, samples=1,
+                      interval=REALTIME_INTERVAL, batch_size=DEFAULT_BATCH_SIZE, max_concurrency=4):
+    """
+    Queries the recent values of performance counters for many entities.
+    The query specs are sent in batches of `batch_size` per `QueryPerf` call,
+    up to `max_concurrency` calls at the same time.
+    Returns a `isphere.performance.PerformanceResult` holding the average of the
+    last `samples` values of each entity and counter (the aggregate instance).
+    Raises `isphere.interactive_wrapper.NotFound` for unknown counter names.
+
+    - perf_manager (type `pyVmomi.vim.PerformanceManager`): The performance manager.
+    - counters (type `isphere.performance.PerformanceCounters`): The counter table.
+    - entities (type `list`): The managed entities, e.G. `pyVmomi.vim.VirtualMachine`s.
+    - counter_names (type `list`): The counter names, e.G. `["cpu.ready.summation"]`.
+    - samples (type `int`): The number of most recent samples to average.
+    - interval (type `int`): The sampling interval in seconds.
+    - batch_size (type `int`): The number of entities per `QueryPerf` call.
+    - max_concurrency (type `int`): The maximal number of concurrent `QueryPerf` calls.
+    """
+    resolved_counters = [counters.resolve(counter_name) for counter_name in counter_names]
+    result = PerformanceResult(entities, resolved_counters)
+    counters_by_key = dict((counter.key, counter) for counter in resolved_counters)
+    entity_indices = dict((entity, index) for index, entity in enumerate(result.entities))
+
+    metric_ids = [vim.PerformanceManager.MetricId(counterId=counter.key, instance="") for counter in resolved_counters]
+    query_specs = [vim.PerformanceManager.QuerySpec(entity=entity, metricId=metric_ids, intervalId=interval,
+                                                    maxSample=samples)
+                   for entity in result.entities]
+    batches = [query_specs[start:start + batch_size] for start in range(0, len(query_specs), batch_size)]
+
+    for _, entity_metrics, error in map_bounded(perf_manager.QueryPerf, batches, max_concurrency):
+        if error:
+            raise error
+        for entity_metric in entity_metrics or []:
+            index = entity_indices.get(entity_metric.entity)
+            timestamps = [_epoch_seconds(sample_info.timestamp) for sample_info in entity_metric.sampleInfo or []]
+            for series in entity_metric.value:
+                counter = counters_by_key.get(series.id.counterId)
+                if index is None or counter is None or series.id.instance or not series.value:
+                    continue
+                values = [counter.scale(value) for value in series.value]
+                result.values[counter.name][index] = sum(values) / len(values)
+                result.samples[counter.name][index] = list(zip(timestamps, values))
+    return result
@@ -0,0 +1,70 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+"""
+Provides a sorted index of item names to find all names with a given prefix
+by bisection, e.G. for tab completion over tens of thousands of names.
+
+Usage:
+
+    >>> from isphere.prefix_index import PrefixIndex
+    >>> index = PrefixIndex()
+    >>> index.update(["dev-vm-1", "dev-vm-2", "prod-vm-1"])
+    >>> index.complete("dev-")
+    ['dev-vm-1', 'dev-vm-2']
+"""
+
+from bisect import bisect_left, insort
+
+__all__ = ["PrefixIndex"]
+
+
+class PrefixIndex(object):
+
+    """
+    A sorted list of names. Updates only insert and remove the changed names
+    unless most of them changed.
+    """
+
+    def __init__(self, names=()):
+        """
+        - names (type `iterable`): The initial names.
+        """
+        self.names = sorted(set(names))
+
+    def update(self, names):
+        """
+        Replaces the indexed names.
+
+        - names (type `iterable`): The current names.
+        """
+        names, indexed_names = set(names), set(self.names)  # not kept, it would take more memory than the list
+        removed_names = indexed_names - names
+        added_names = names - indexed_names
+        if len(removed_names) + len(added_names) > len(self.names) // 4:
+            self.names = sorted(names)
+        else:
+            for name in removed_names:
+                del self.names[bisect_left(self.names, name)]
+            for name in added_names:
+                insort(self.names, name)
+
+    def complete(self, prefix, limit=None):
+        """
+        Returns the names starting with the given prefix, sorted.
+
+        - prefix (type `str`): The prefix.
+        - limit (type `int`): The maximal number of names, all if `None`.
+        """
+        names = []
+        for index in range(bisect_left(self.names, prefix), len(self.names)):
+            if not self.names[index].startswith(prefix) or len(names) == limit:
+                break
+            names.append(self.names[index])
+        return names
+
+    def __len__(self):
+        return len(self.names)
@@ -0,0 +1,205 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+"""
+Provides rolling guest reboots of virtual machines.
+
+The `isphere.reboot.RollingReboot` reboots the guests of `wave_size` virtual
+machines, waits until all of them are ready again and continues with the next
+wave. A guest is ready once the VMware tools run and its heartbeat is green
+after it went down or booted again.
+The readiness of a whole wave is followed through one filter of a
+`isphere.watcher.PropertyWatcher` instead of polling each virtual machine.
+
+Usage:
+
+    >>> from isphere.reboot import RollingReboot
+    >>> rolling_reboot = RollingReboot(watcher, [("some-vm", vm)], wave_size=2, timeout_seconds=600)
+    >>> reboots = rolling_reboot.run(on_progress=print)
+"""
+
+import time
+
+__all__ = ["READINESS_PROPERTIES", "GuestReboot", "RollingReboot"]
+
+try:
+    _timer = time.perf_counter
+except AttributeError:  # python < 3.3
+    _timer = time.time
+
+READINESS_PROPERTIES = ["guest.toolsRunningStatus", "guestHeartbeatStatus", "runtime.bootTime",
+                        "summary.quickStats.uptimeSeconds"]
+"""
+The virtual machine properties that tell whether a guest is ready, and
+whether it booted again.
+"""
+
+
+def _known_and_less(value, other_value):
+    return value is not None and other_value is not None and value < other_value
+
+
+class GuestReboot(object):
+
+    """
+    The guest reboot of one virtual machine.
+    The `state` is one of `pending`, `rebooting`, `ready` and `failed`.
+    """
+
+    def __init__(self, name, vm):
+        """
+        - name (type `str`): The virtual machine name.
+        - vm (type `pyVmomi.vim.VirtualMachine`): The virtual machine to reboot.
+        """
+        self.name = name
+        self.vm = vm
+        self.state = "pending"
+        self.error = None
+        self.seconds = None
+        self.started_at = None
+        self.went_down = False
+        self.tools_running_status = None
+        self.heartbeat_status = None
+        self.boot_time = None
+        self.uptime_seconds = None
+        self._boot_time_before = None
+        self._uptime_seconds_before = None
+
+    @property
+    def guest_ready(self):
+        """
+        Whether the VMware tools run and the heartbeat is green.
+        """
+        return self.tools_running_status == "guestToolsRunning" and self.heartbeat_status == "green"
+
+    @property
+    def restarted(self):
+        """
+        Whether the guest went down, or booted again (a newer boot time or a
+        lower uptime than before the reboot). Changes between two polls are
+        merged, so a fast reboot is not necessarily seen down.
+        """
+        booted_again = _known_and_less(self._boot_time_before, self.boot_time)
+        uptime_reset = _known_and_less(self.uptime_seconds, self._uptime_seconds_before)
+        return self.went_down or booted_again or uptime_reset
+
+    def start(self, started_at):
+        """
+        Marks the guest as rebooting since `started_at`, remembering its boot
+        time and uptime from before.
+
+        - started_at (type `float`): The timer value the reboot started at.
+        """
+        self.started_at = started_at
+        self._boot_time_before = self.boot_time
+        self._uptime_seconds_before = self.uptime_seconds
+
+    def __str__(self):
+        if self.state == "failed":
+            return "{0}: failed ({1})".format(self.name, self.error)
+        if self.state == "ready":
+            return "{0}: ready after {1:.0f}s".format(self.name, self.seconds)
+        return "{0}: {1}".format(self.name, self.state)
+
+
+class RollingReboot(object):
+
+    """
+    Reboots the guests of many virtual machines in waves of `wave_size`.
+    """
+
+    def __init__(self, watcher, vms, wave_size=1, timeout_seconds=600, poll_seconds=5):
+        """
+        - watcher (type `isphere.watcher.PropertyWatcher`): The watcher to follow
+          the readiness of the guests with.
+        - vms (type `list`): The (name, `pyVmomi.vim.VirtualMachine`) pairs of the
+          virtual machines to reboot, in order.
+        - wave_size (type `int`): The number of virtual machines to reboot at the same time.
+        - timeout_seconds (type `int`): The maximal time a wave may take to be ready again.
+        - poll_seconds (type `int`): The maximal time to wait for property updates
+          before checking the timeout again.
+        """
+        self.watcher = watcher
+        self.reboots = [GuestReboot(name, vm) for name, vm in vms]
+        self.wave_size = max(wave_size, 1)
+        self.timeout_seconds = timeout_seconds
+        self.poll_seconds = poll_seconds
+        self._on_progress = None
+
+    def run(self, on_progress=None):
+        """
+        Reboots all virtual machines wave by wave and returns when all of them
+        are ready again or when a wave failed.
+        Returns the list of `isphere.reboot.GuestReboot`.
+
+        - on_progress (type `callable`): Called with the `isphere.reboot.GuestReboot`
+          whenever a virtual machine changes its state.
+        """
+        self._on_progress = on_progress
+        for wave_start in range(0, len(self.reboots), self.wave_size):
+            wave = self.reboots[wave_start:wave_start + self.wave_size]
+            self._reboot_wave(wave)
+            if any(reboot.state == "failed" for reboot in wave):
+                break
+        return self.reboots
+
+    def _reboot_wave(self, wave):
+        property_filter = self.watcher.watch([reboot.vm for reboot in wave], READINESS_PROPERTIES)
+        try:
+            reboots_by_vm = dict((reboot.vm, reboot) for reboot in wave)
+            self._apply_updates(reboots_by_vm, self.watcher.wait(0))  # the status before rebooting
+
+            started_at = _timer()
+            for reboot in wave:
+                try:
+                    reboot.vm.RebootGuest()
+                except Exception as e:
+                    self._fail(reboot, getattr(e, "msg", None) or str(e))
+                    continue
+                reboot.start(started_at)
+                self._change_state(reboot, "rebooting")
+
+            while any(reboot.state == "rebooting" for reboot in wave):
+                remaining_seconds = self.timeout_seconds - (_timer() - started_at)
+                if remaining_seconds <= 0:
+                    for reboot in wave:
+                        if reboot.state == "rebooting":
+                            self._fail(reboot, "not ready after {0} seconds".format(self.timeout_seconds))
+                    break
+                max_wait_seconds = max(1, int(min(self.poll_seconds, remaining_seconds)))
+                self._apply_updates(reboots_by_vm, self.watcher.wait(max_wait_seconds))
+        finally:
+            self.watcher.unwatch(property_filter)
+
+    def _apply_updates(self, reboots_by_vm, updates):
+        for update in updates:
+            reboot = reboots_by_vm.get(update.obj)
+            if reboot is None:
+                continue
+            if "guest.toolsRunningStatus" in update.changes:
+                reboot.tools_running_status = update.changes["guest.toolsRunningStatus"]
+            if "guestHeartbeatStatus" in update.changes:
+                reboot.heartbeat_status = str(update.changes["guestHeartbeatStatus"])
+            if "runtime.bootTime" in update.changes:
+                reboot.boot_time = update.changes["runtime.bootTime"]
+            if "summary.quickStats.uptimeSeconds" in update.changes:
+                reboot.uptime_seconds = update.changes["summary.quickStats.uptimeSeconds"]
+            if reboot.state != "rebooting":
+                continue
+            if not reboot.guest_ready:
+                reboot.went_down = True
+            elif reboot.restarted:
+                reboot.seconds = _timer() - reboot.started_at
+                self._change_state(reboot, "ready")
+
+    def _fail(self, reboot, error):
+        reboot.error = error
+        self._change_state(reboot, "failed")
+
+    def _change_state(self, reboot, state):
+        reboot.state = state
+        if self._on_progress:
+            self._on_progress(reboot)
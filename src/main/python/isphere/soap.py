@@ -0,0 +1,466 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+"""
+Provides hooks into the SOAP traffic of a `pyVmomi` stub adapter.
+
+The `isphere.soap.SoapRecorder` captures the SOAP requests and responses of
+a session to disk. The `isphere.soap.ReplayStubAdapter` serves recorded
+responses locally, so the actual `pyVmomi` deserialization path can be
+exercised (and benchmarked) without a vCenter.
+
+Usage:
+
+    >>> from isphere.interactive_wrapper import VVC
+    >>> vvc = VVC("vcenter.domain")
+    >>> vvc.connect("username", "password", recording_path="session.jsonl.gz")
+    >>> vms = vvc.get_restricted_view_on_vms(["name"])
+    >>> # later, offline:
+    >>> replayed_vvc = VVC("vcenter.domain")
+    >>> replayed_vvc.replay("session.jsonl.gz")
+    >>> vms = replayed_vvc.get_restricted_view_on_vms(["name"])
+
+Note that the login happens before recording starts, so credentials are never
+written to the recording.
+
+`isphere.soap.instrument_stub` reports every SOAP call (method, duration, time
+spent on the network and bytes received) to an observer such as
+`isphere.soap.SoapStatistics`. Each `isphere.interactive_wrapper.VVC` keeps
+its statistics in `vvc.soap_statistics` and reports to all observers in
+`vvc.soap_observers` (see also `isphere.metrics`).
+"""
+
+import base64
+from collections import deque, namedtuple
+import gzip
+import hashlib
+from io import BytesIO
+import json
+import threading
+import time
+
+from pyVmomi.SoapAdapter import SoapStubAdapter
+
+__all__ = ["NotRecorded", "CapturedResponse", "hook_connections", "SoapRecorder", "ReplayStubAdapter",
+           "SoapCall", "SoapTotals", "SoapStatistics", "SoapObservers", "instrument_stub"]
+
+_UNRECORDED_HEADERS = ("set-cookie",)
+
+try:
+    _timer = time.perf_counter
+except AttributeError:  # python < 3.3
+    _timer = time.time
+
+
+class NotRecorded(Exception):
+
+    """
+    To be raised when a replayed request is not part of the recording.
+    """
+    pass
+
+
+class CapturedResponse(object):
+
+    """
+    A fully read HTTP response. Behaves like the `httplib` responses that
+    `pyVmomi` consumes.
+    """
+
+    def __init__(self, status, reason, headers, body, network_seconds=0.0):
+        """
+        - status (type `int`): The HTTP status code.
+        - reason (type `str`): The HTTP reason phrase.
+        - headers (type `list`): A list of (name, value) pairs.
+        - body (type `bytes`): The response body, as sent over the wire.
+        - network_seconds (type `float`): The time spent sending the request
+          and reading the response.
+        """
+        self.status = status
+        self.reason = reason
+        self.headers = list(headers)
+        self.body = body
+        self.network_seconds = network_seconds
+        self._stream = BytesIO(body)
+
+    @property
+    def bytes_received(self):
+        """
+        The size of the response body.
+        """
+        return len(self.body)
+
+    def getheader(self, name, default=None):
+        for header_name, header_value in self.headers:
+            if header_name.lower() == name.lower():
+                return header_value
+        return default
+
+    def getheaders(self):
+        return self.headers
+
+    def read(self, amount=None):
+        if amount is None or amount < 0:
+            return self._stream.read()
+        return self._stream.read(amount)
+
+    def close(self):
+        pass
+
+
+class _MeteredResponse(object):
+
+    """
+    Passes an HTTP response through while it is read and counts the bytes
+    and the time spent reading. `on_consumed` is called with the response
+    once its body was read to the end or it was closed.
+    """
+
+    def __init__(self, response, network_seconds, on_consumed):
+        self._response = response
+        self._on_consumed = on_consumed
+        self.network_seconds = network_seconds
+        self.bytes_received = 0
+
+    def read(self, amount=None):
+        read_all = amount is None or amount < 0
+        started_at = _timer()
+        data = self._response.read() if read_all else self._response.read(amount)
+        self.network_seconds += _timer() - started_at
+        self.bytes_received += len(data)
+        if read_all or not data:
+            self._consumed()
+        return data
+
+    def close(self):
+        self._consumed()
+        self._response.close()
+
+    def _consumed(self):
+        on_consumed, self._on_consumed = self._on_consumed, None
+        if on_consumed:
+            on_consumed(self)
+
+    def __getattr__(self, attribute):
+        return getattr(self._response, attribute)
+
+
+class _HookedConnection(object):
+
+    def __init__(self, connection, on_exchange, buffer_body):
+        self._connection = connection
+        self._on_exchange = on_exchange
+        self._buffer_body = buffer_body
+        self._request_body = None
+        self._requested_at = None
+
+    def request(self, method, url, body=None, *args, **kwargs):
+        self._request_body = body
+        self._requested_at = _timer()
+        return self._connection.request(method, url, body, *args, **kwargs)
+
+    def getresponse(self):
+        response = self._connection.getresponse()
+        if not self._buffer_body:
+            request_body = self._request_body
+            return _MeteredResponse(response,
+                                    _timer() - self._requested_at,
+                                    lambda metered_response: self._on_exchange(request_body, metered_response))
+        body = response.read()
+        captured_response = CapturedResponse(response.status,
+                                             response.reason,
+                                             response.getheaders(),
+                                             body,
+                                             _timer() - self._requested_at)
+        self._on_exchange(self._request_body, captured_response)
+        return captured_response
+
+    def __getattr__(self, attribute):
+        return getattr(self._connection, attribute)
+
+
+def hook_connections(stub, on_exchange, buffer_body=True):
+    """
+    Hooks into the HTTP connections of a `pyVmomi` SOAP stub adapter.
+    After each SOAP exchange, `on_exchange` is called with the request body
+    (type `bytes`) and the response, which has the `network_seconds` and
+    `bytes_received` of the exchange.
+    With `buffer_body`, the response body is read at once and the response is
+    a `isphere.soap.CapturedResponse`. Otherwise the body is passed through
+    to `pyVmomi` while it is read, and `on_exchange` is called once it was
+    read to the end.
+    Hooks can be stacked. Stubs without HTTP connections (e.G. fakes) are left alone.
+
+    - stub (type `pyVmomi.SoapAdapter.SoapStubAdapter`): The stub to hook into,
+      usually `service_instance._stub`.
+    - on_exchange (type `callable`): The exchange callback.
+    - buffer_body (type `bool`): Whether `on_exchange` needs the response body.
+    """
+    if not hasattr(stub, "GetConnection"):
+        return
+    get_connection, return_connection = stub.GetConnection, stub.ReturnConnection
+
+    def get_hooked_connection():
+        return _HookedConnection(get_connection(), on_exchange, buffer_body)
+
+    def return_hooked_connection(connection):
+        return_connection(connection._connection if isinstance(connection, _HookedConnection) else connection)
+
+    stub.GetConnection = get_hooked_connection
+    stub.ReturnConnection = return_hooked_connection
+
+
+def _request_key(request_body):
+    if not isinstance(request_body, bytes):
+        request_body = request_body.encode("utf-8")
+    return hashlib.sha1(request_body).hexdigest()
+
+
+def _encode(data):
+    if not isinstance(data, bytes):
+        data = data.encode("utf-8")
+    return base64.b64encode(data).decode("ascii")
+
+
+class SoapRecorder(object):
+
+    """
+    Records SOAP exchanges to a gzipped file with one JSON document per line.
+    The first line holds the API version of the session.
+    """
+
+    def __init__(self, path, version):
+        """
+        - path (type `str`): The file to record to. It will be overwritten.
+        - version (type `str`): The API version of the recorded stub,
+          e.G. `vim.version.version9`.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = gzip.open(path, "wb")
+        self._write({"version": version})
+
+    @classmethod
+    def record(cls, stub, path):
+        """
+        Starts recording the SOAP traffic of a stub.
+        Returns the `isphere.soap.SoapRecorder`, which must be closed once done.
+
+        - stub (type `pyVmomi.SoapAdapter.SoapStubAdapter`): The stub to record.
+        - path (type `str`): The file to record to.
+        """
+        recorder = cls(path, stub.version)
+        hook_connections(stub, recorder.record_exchange)
+        return recorder
+
+    def record_exchange(self, request_body, response):
+        """
+        Records one SOAP exchange.
+
+        - request_body (type `bytes`): The SOAP request.
+        - response (type `isphere.soap.CapturedResponse`): The SOAP response.
+        """
+        headers = [[name, value] for name, value in response.getheaders() if name.lower() not in _UNRECORDED_HEADERS]
+        self._write({"request": _request_key(request_body),
+                     "request_body": _encode(request_body),
+                     "status": response.status,
+                     "reason": response.reason,
+                     "headers": headers,
+                     "response": _encode(response.body)})
+
+    def close(self):
+        """
+        Flushes and closes the recording.
+        """
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def _write(self, document):
+        line = (json.dumps(document) + "\n").encode("utf-8")
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line)
+
+
+class ReplayStubAdapter(SoapStubAdapter):
+
+    """
+    A SOAP stub adapter that serves the responses of a recording made with
+    `isphere.soap.SoapRecorder` instead of talking to a server.
+
+    Requests are matched by their content. Identical requests get the recorded
+    responses in recording order, the last one is repeated when they run out.
+    """
+
+    def __init__(self, recording_path):
+        """
+        - recording_path (type `str`): The recording to replay.
+        """
+        self.recording_path = recording_path
+        self._responses = {}
+        self._responses_lock = threading.Lock()
+        with gzip.open(recording_path, "rb") as recording:
+            version = json.loads(recording.readline().decode("utf-8"))["version"]
+            for line in recording:
+                exchange = json.loads(line.decode("utf-8"))
+                self._responses.setdefault(exchange["request"], deque()).append(exchange)
+        SoapStubAdapter.__init__(self, host="replay", version=version)
+
+    def GetConnection(self):
+        return _ReplayConnection(self)
+
+    def ReturnConnection(self, connection):
+        pass
+
+    def DropConnections(self):
+        pass
+
+    def next_response(self, request_body):
+        """
+        Returns the recorded `isphere.soap.CapturedResponse` for a request.
+        Raises `isphere.soap.NotRecorded` for unrecorded requests.
+
+        - request_body (type `bytes`): The SOAP request.
+        """
+        with self._responses_lock:
+            recorded_exchanges = self._responses.get(_request_key(request_body))
+            if not recorded_exchanges:
+                raise NotRecorded("Request was not recorded in {0}".format(self.recording_path))
+            exchange = recorded_exchanges.popleft() if len(recorded_exchanges) > 1 else recorded_exchanges[0]
+        return CapturedResponse(exchange["status"],
+                                exchange["reason"],
+                                [tuple(header) for header in exchange["headers"]],
+                                base64.b64decode(exchange["response"]))
+
+
+class _ReplayConnection(object):
+
+    sock = None
+
+    def __init__(self, stub):
+        self._stub = stub
+        self._request_body = None
+
+    def request(self, method, url, body=None, *args, **kwargs):
+        self._request_body = body
+
+    def getresponse(self):
+        return self._stub.next_response(self._request_body)
+
+    def close(self):
+        pass
+
+
+SoapCall = namedtuple("SoapCall", ["method", "seconds", "network_seconds", "bytes_received", "error"])
+"""
+A single SOAP call as reported by `isphere.soap.instrument_stub`.
+The `method` is the WSDL name of the method (`Fetch` for property accessors),
+`seconds` includes serialization and parsing, `error` is the raised exception or `None`.
+"""
+
+
+class SoapTotals(namedtuple("SoapTotals", ["calls", "errors", "seconds", "network_seconds", "bytes_received"])):
+
+    """
+    Accumulated SOAP traffic. Subtracting two totals yields the traffic in between.
+    """
+
+    def __sub__(self, other):
+        return SoapTotals(*[mine - theirs for mine, theirs in zip(self, other)])
+
+
+class SoapStatistics(object):
+
+    """
+    An observer for `isphere.soap.instrument_stub` that accumulates SOAP calls.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = SoapTotals(0, 0, 0.0, 0.0, 0)
+
+    def on_call(self, call):
+        """
+        Accumulates a `isphere.soap.SoapCall`.
+        """
+        with self._lock:
+            self._totals = SoapTotals(self._totals.calls + 1,
+                                      self._totals.errors + (call.error is not None),
+                                      self._totals.seconds + call.seconds,
+                                      self._totals.network_seconds + call.network_seconds,
+                                      self._totals.bytes_received + call.bytes_received)
+
+    def snapshot(self):
+        """
+        Returns the `isphere.soap.SoapTotals` accumulated so far.
+        """
+        with self._lock:
+            return self._totals
+
+
+class SoapObservers(list):
+
+    """
+    A list of observers for `isphere.soap.instrument_stub` that passes each
+    call on to all of them. Observers can be added while calls are made.
+    """
+
+    def on_call(self, call):
+        for observer in list(self):
+            observer.on_call(call)
+
+
+def instrument_stub(stub, observer):
+    """
+    Reports each SOAP call made through a stub adapter to an observer.
+    The observer must provide an `on_call` method that takes a `isphere.soap.SoapCall`.
+    Network time and bytes are only known for stubs with HTTP connections (see
+    `isphere.soap.hook_connections`), they are 0 otherwise.
+
+    - stub (type `pyVmomi.SoapAdapter.SoapStubAdapter`): The stub to instrument,
+      usually `service_instance._stub`.
+    - observer: The observer to report calls to.
+    """
+    current = threading.local()
+    invoke_method, invoke_accessor = stub.InvokeMethod, stub.InvokeAccessor
+
+    def on_exchange(request_body, response):
+        measured = getattr(current, "measured", None)
+        if measured is not None:
+            measured["network_seconds"] += response.network_seconds
+            measured["bytes_received"] += response.bytes_received
+
+    def invoke(method_name, invocation, *args):
+        if getattr(current, "measured", None) is not None:
+            # accessors of SOAP stubs are implemented with InvokeMethod
+            return invocation(*args)
+        current.measured = {"network_seconds": 0.0, "bytes_received": 0}
+        error = None
+        started_at = _timer()
+        try:
+            return invocation(*args)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            seconds = _timer() - started_at
+            measured, current.measured = current.measured, None
+            observer.on_call(SoapCall(method_name,
+                                      seconds,
+                                      measured["network_seconds"],
+                                      measured["bytes_received"],
+                                      error))
+
+    def instrumented_invoke_method(mo, info, args, *more_args):
+        return invoke(info.wsdlName, invoke_method, mo, info, args, *more_args)
+
+    def instrumented_invoke_accessor(mo, info):
+        return invoke("Fetch", invoke_accessor, mo, info)
+
+    stub.InvokeMethod = instrumented_invoke_method
+    stub.InvokeAccessor = instrumented_invoke_accessor
+    hook_connections(stub, on_exchange, buffer_body=False)
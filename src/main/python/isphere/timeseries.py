@@ -0,0 +1,236 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+"""
+Provides an in-memory store for sampled metrics, so trends can be queried
+locally instead of asking the vCenter again.
+
+Each (entity, counter) series is a `isphere.timeseries.RingBuffer` of
+`capacity` samples held in two `array.array`s, so a sample costs 16 bytes.
+The `isphere.timeseries.TimeSeriesStore` keeps the total within a fixed memory
+budget by evicting the least recently updated series.
+A store can be dumped to a compact binary file and loaded again.
+
+Usage:
+
+    >>> from isphere.timeseries import TimeSeriesStore
+    >>> store = TimeSeriesStore(memory_budget=16 * 1024 * 1024, capacity=360)
+    >>> store.record("some-vm", "cpu.ready.summation", time.time(), 1500.0)
+    >>> store.rollup("some-vm", "cpu.ready.summation", window_seconds=600)
+    Rollup(count=1, min=1500.0, avg=1500.0, max=1500.0, p95=1500.0)
+    >>> with open("samples.ists", "wb") as samples_file:
+    ...     store.dump(samples_file)
+"""
+
+from array import array
+from collections import namedtuple
+import math
+import struct
+
+__all__ = ["DEFAULT_MEMORY_BUDGET", "DEFAULT_CAPACITY", "BYTES_PER_SAMPLE", "Rollup", "RingBuffer",
+           "TimeSeriesStore"]
+
+DEFAULT_MEMORY_BUDGET = 16 * 1024 * 1024
+"""
+The default number of bytes the samples of a store may take.
+"""
+
+DEFAULT_CAPACITY = 360
+"""
+The default number of samples per series, two hours of 20 second samples.
+"""
+
+BYTES_PER_SAMPLE = 16
+"""
+The size of one sample, a timestamp and a value (both doubles).
+"""
+
+_MAGIC = b"ISTS"
+_VERSION = 1
+_HEADER = struct.Struct("<4sBI")
+_SERIES_HEADER = struct.Struct("<HHI")
+
+Rollup = namedtuple("Rollup", ["count", "min", "avg", "max", "p95"])
+
+
+class RingBuffer(object):
+
+    """
+    The most recent `capacity` samples of a series, oldest samples are
+    overwritten first.
+    """
+
+    def __init__(self, capacity):
+        """
+        - capacity (type `int`): The maximal number of samples.
+        """
+        self.capacity = capacity
+        self.timestamps = array("d", [0.0] * capacity)
+        self.values = array("d", [0.0] * capacity)
+        self.count = 0
+        self._next = 0
+
+    def append(self, timestamp, value):
+        """
+        Adds a sample.
+
+        - timestamp (type `float`): The time of the sample in seconds since the epoch.
+        - value (type `float`): The sampled value.
+        """
+        self.timestamps[self._next] = timestamp
+        self.values[self._next] = value
+        self._next = (self._next + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    @property
+    def last_timestamp(self):
+        """
+        The time of the latest sample, `None` if there is none.
+        """
+        return self.timestamps[self._next - 1] if self.count else None
+
+    def samples(self, since=None):
+        """
+        Returns the (timestamp, value) pairs, oldest first.
+
+        - since (type `float`): Only samples at or after this time if given.
+        """
+        start = (self._next - self.count) % self.capacity
+        indices = [(start + offset) % self.capacity for offset in range(self.count)]
+        return [(self.timestamps[index], self.values[index]) for index in indices
+                if since is None or self.timestamps[index] >= since]
+
+
+class TimeSeriesStore(object):
+
+    """
+    Ring buffers per (entity, counter) series within a fixed memory budget.
+    """
+
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET, capacity=DEFAULT_CAPACITY):
+        """
+        - memory_budget (type `int`): The number of bytes the samples may take.
+        - capacity (type `int`): The number of samples per series.
+        """
+        self.capacity = max(capacity, 1)
+        self.max_series = max(memory_budget // (self.capacity * BYTES_PER_SAMPLE), 1)
+        self.series = {}
+
+    def record(self, entity_name, counter_name, timestamp, value):
+        """
+        Adds a sample to a series. When a new series would exceed the memory
+        budget, the least recently updated series is evicted.
+
+        - entity_name (type `str`): The entity name, e.G. a virtual machine name.
+        - counter_name (type `str`): The counter name, e.G. `cpu.ready.summation`.
+        - timestamp (type `float`): The time of the sample in seconds since the epoch.
+        - value (type `float`): The sampled value.
+        """
+        key = (entity_name, counter_name)
+        ring_buffer = self.series.get(key)
+        if ring_buffer is None:
+            if len(self.series) >= self.max_series:
+                del self.series[min(self.series, key=lambda series_key: self.series[series_key].last_timestamp)]
+            ring_buffer = self.series[key] = RingBuffer(self.capacity)
+        ring_buffer.append(timestamp, value)
+
+    def record_performance(self, result, names_by_entity):
+        """
+        Adds the samples of a `isphere.performance.PerformanceResult` with
+        their own timestamps. Samples that are not newer than the latest
+        sample of their series (e.G. recorded by an earlier query of the same
+        interval) are skipped.
+
+        - result (type `isphere.performance.PerformanceResult`): The queried values.
+        - names_by_entity (type `dict`): The mapping from the queried entities to their names.
+        """
+        for counter in result.counters:
+            for entity, samples in zip(result.entities, result.samples[counter.name]):
+                ring_buffer = self.series.get((names_by_entity[entity], counter.name))
+                last_timestamp = ring_buffer.last_timestamp if ring_buffer else None
+                for timestamp, value in samples:
+                    if last_timestamp is None or timestamp > last_timestamp:
+                        self.record(names_by_entity[entity], counter.name, timestamp, value)
+                        last_timestamp = timestamp
+
+    def rollup(self, entity_name, counter_name, window_seconds=None, now=None):
+        """
+        Returns the `isphere.timeseries.Rollup` (min, average, max and 95th
+        percentile) of a series, `None` if there are no samples in the window.
+
+        - entity_name (type `str`): The entity name.
+        - counter_name (type `str`): The counter name.
+        - window_seconds (type `float`): Only the samples of the last `window_seconds`
+          before `now` if given, all samples otherwise.
+        - now (type `float`): The end of the window, defaults to the latest sample.
+        """
+        ring_buffer = self.series.get((entity_name, counter_name))
+        if ring_buffer is None or not ring_buffer.count:
+            return None
+        since = None
+        if window_seconds is not None:
+            since = (ring_buffer.last_timestamp if now is None else now) - window_seconds
+        values = sorted(value for _, value in ring_buffer.samples(since))
+        if not values:
+            return None
+        p95_rank = max(int(math.ceil(0.95 * len(values))), 1)
+        return Rollup(len(values), values[0], sum(values) / len(values), values[-1], values[p95_rank - 1])
+
+    def memory_usage(self):
+        """
+        Returns the number of bytes the samples of the series take.
+        """
+        return len(self.series) * self.capacity * BYTES_PER_SAMPLE
+
+    def dump(self, binary_file):
+        """
+        Writes all series to a binary file: a header, then per series the
+        UTF-8 entity and counter names, the number of samples and the
+        little endian timestamps and values, oldest first.
+
+        - binary_file (type `file`): A file opened for writing bytes.
+        """
+        binary_file.write(_HEADER.pack(_MAGIC, _VERSION, self.capacity))
+        for (entity_name, counter_name), ring_buffer in sorted(self.series.items()):
+            samples = ring_buffer.samples()
+            entity_name, counter_name = entity_name.encode("utf-8"), counter_name.encode("utf-8")
+            binary_file.write(_SERIES_HEADER.pack(len(entity_name), len(counter_name), len(samples)))
+            binary_file.write(entity_name + counter_name)
+            binary_file.write(struct.pack("<{0}d".format(len(samples)), *[timestamp for timestamp, _ in samples]))
+            binary_file.write(struct.pack("<{0}d".format(len(samples)), *[value for _, value in samples]))
+
+    @staticmethod
+    def load(binary_file, memory_budget=DEFAULT_MEMORY_BUDGET):
+        """
+        Returns a new `isphere.timeseries.TimeSeriesStore` with the series of a
+        file written by `dump`. Raises `ValueError` if the file is no dump.
+
+        - binary_file (type `file`): A file opened for reading bytes.
+        - memory_budget (type `int`): The memory budget of the new store.
+        """
+        magic, version, capacity = _HEADER.unpack(_read_exactly(binary_file, _HEADER.size))
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("Not a time series dump (version {0}).".format(_VERSION))
+        store = TimeSeriesStore(memory_budget, capacity)
+        while True:
+            series_header = binary_file.read(_SERIES_HEADER.size)
+            if not series_header:
+                return store
+            series_header += _read_exactly(binary_file, _SERIES_HEADER.size - len(series_header))
+            entity_name_length, counter_name_length, count = _SERIES_HEADER.unpack(series_header)
+            entity_name = _read_exactly(binary_file, entity_name_length).decode("utf-8")
+            counter_name = _read_exactly(binary_file, counter_name_length).decode("utf-8")
+            timestamps = struct.unpack("<{0}d".format(count), _read_exactly(binary_file, 8 * count))
+            values = struct.unpack("<{0}d".format(count), _read_exactly(binary_file, 8 * count))
+            for timestamp, value in zip(timestamps, values):
+                store.record(entity_name, counter_name, timestamp, value)
+
+
+def _read_exactly(binary_file, size):
+    data = binary_file.read(size)
+    if len(data) != size:
+        raise ValueError("Truncated time series dump.")
+    return data
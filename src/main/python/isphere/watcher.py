@@ -0,0 +1,187 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+"""
+Provides property change notifications through a vSphere PropertyCollector.
+
+The `isphere.watcher.PropertyWatcher` uses a private property collector, so
+watching does not interfere with other users of the session's collector.
+One `WaitForUpdatesEx` call reports the changes of all watched objects, which
+is far cheaper than polling each object.
+The `isphere.watcher.TaskTracker` builds on it to follow many tasks at once.
+
+Usage:
+
+    >>> from isphere.watcher import PropertyWatcher, TaskTracker
+    >>> tracker = TaskTracker(PropertyWatcher(vvc.create_property_collector()))
+    >>> tracker.track(vm.PowerOn())
+    >>> while tracker.pending:
+    ...     for finished_task in tracker.poll(max_wait_seconds=10):
+    ...         print(finished_task.state)
+    >>> tracker.close()
+"""
+
+from collections import namedtuple
+
+from pyVmomi import vmodl
+
+__all__ = ["PropertyUpdate", "FinishedTask", "PropertyWatcher", "TaskTracker"]
+
+PropertyUpdate = namedtuple("PropertyUpdate", ["obj", "kind", "changes"])
+"""
+The changes of one watched object. `kind` is one of `enter`, `modify` and
+`leave`, `changes` maps property paths to their new values (`None` when removed).
+"""
+
+FinishedTask = namedtuple("FinishedTask", ["task", "state", "error", "result"])
+"""
+A task that reached the `success` or `error` state. `error` is the fault of
+failed tasks and `result` the result of successful tasks.
+"""
+
+_TASK_PROPERTIES = ["info.state", "info.error", "info.result"]
+_FINISHED_TASK_STATES = ("success", "error")
+
+
+class PropertyWatcher(object):
+
+    """
+    Watches properties of managed objects through a private property collector.
+    """
+
+    def __init__(self, property_collector):
+        """
+        - property_collector (type `pyVmomi.vmodl.query.PropertyCollector`):
+          The collector to use. It is destroyed by `close()`, so it should not
+          be shared (see `isphere.interactive_wrapper.VVC.create_property_collector`).
+        """
+        self.property_collector = property_collector
+        self.version = ""
+
+    def watch(self, managed_objects, properties):
+        """
+        Starts watching properties of managed objects. The next update reports
+        their current values (as `enter` updates).
+        Returns the filter, which can be passed to `unwatch`.
+
+        - managed_objects (type `list`): The managed objects to watch.
+        - properties (type `str[]`): The property paths to watch, e.G.
+          `["runtime.powerState"]`.
+        """
+        managed_objects = list(managed_objects)
+        object_specs = [vmodl.query.PropertyCollector.ObjectSpec(obj=managed_object, skip=False)
+                        for managed_object in managed_objects]
+        property_specs = [vmodl.query.PropertyCollector.PropertySpec(type=managed_type, pathSet=list(properties))
+                          for managed_type in _unique_types(managed_objects)]
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(objectSet=object_specs, propSet=property_specs)
+        return self.property_collector.CreateFilter(filter_spec, True)
+
+    @staticmethod
+    def unwatch(property_filter):
+        """
+        Stops watching the objects of a filter returned by `watch`.
+        """
+        property_filter.Destroy()
+
+    def wait(self, max_wait_seconds=None):
+        """
+        Waits for changes of the watched properties and returns them as a list of
+        `isphere.watcher.PropertyUpdate`. Returns an empty list if nothing changed
+        within `max_wait_seconds`.
+
+        - max_wait_seconds (type `int`): The maximal time to wait. Waits until
+          something changes if `None`, does not wait at all if 0.
+        """
+        wait_options = vmodl.query.PropertyCollector.WaitOptions()
+        if max_wait_seconds is not None:
+            wait_options.maxWaitSeconds = max_wait_seconds
+
+        updates = []
+        while True:
+            update_set = self.property_collector.WaitForUpdatesEx(self.version, wait_options)
+            if not update_set:
+                return updates
+            self.version = update_set.version
+            for filter_update in update_set.filterSet:
+                for object_update in filter_update.objectSet:
+                    changes = dict((change.name, None if change.op == "remove" else change.val)
+                                   for change in object_update.changeSet)
+                    updates.append(PropertyUpdate(object_update.obj, str(object_update.kind), changes))
+            if not update_set.truncated:
+                return updates
+            wait_options.maxWaitSeconds = 0
+
+    def close(self):
+        """
+        Stops watching anything and destroys the property collector.
+        """
+        self.property_collector.Destroy()
+
+
+class TaskTracker(object):
+
+    """
+    Follows many tasks at once with a `isphere.watcher.PropertyWatcher`.
+    """
+
+    def __init__(self, watcher):
+        """
+        - watcher (type `isphere.watcher.PropertyWatcher`): The watcher to use.
+        """
+        self.watcher = watcher
+        self._filters = {}
+
+    @property
+    def pending(self):
+        """
+        The number of tracked tasks that did not finish yet.
+        """
+        return len(self._filters)
+
+    def track(self, task):
+        """
+        Starts tracking a task.
+
+        - task (type `pyVmomi.vim.Task`): The task to track.
+        """
+        self._filters[task._moId] = self.watcher.watch([task], _TASK_PROPERTIES)
+
+    def poll(self, max_wait_seconds=None):
+        """
+        Waits until tracked tasks finish and returns them as a list of
+        `isphere.watcher.FinishedTask`. Finished tasks are no longer tracked.
+        Returns an empty list if no task finished within `max_wait_seconds`.
+
+        - max_wait_seconds (type `int`): The maximal time to wait. Waits until
+          something changes if `None`.
+        """
+        finished_tasks = []
+        for update in self.watcher.wait(max_wait_seconds):
+            task_id = update.obj._moId
+            state = update.changes.get("info.state")
+            if task_id not in self._filters or str(state) not in _FINISHED_TASK_STATES:
+                continue
+            self.watcher.unwatch(self._filters.pop(task_id))
+            finished_tasks.append(FinishedTask(update.obj,
+                                               str(state),
+                                               update.changes.get("info.error"),
+                                               update.changes.get("info.result")))
+        return finished_tasks
+
+    def close(self):
+        """
+        Stops tracking all tasks and releases the watcher.
+        """
+        self._filters = {}
+        self.watcher.close()
+
+
+def _unique_types(managed_objects):
+    managed_types = []
+    for managed_object in managed_objects:
+        if type(managed_object) not in managed_types:
+            managed_types.append(type(managed_object))
+    return managed_types
@@ -0,0 +1,108 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+import threading
+from unittest import TestCase, skipIf
+
+from mock import Mock
+
+from isphere.asynchronous import AsyncCachingVSphere, asyncio
+
+
+def task_state(task, state, result=None, error=None):
+    return Mock(moref=task, info=Mock(state=state, result=result, error=error))
+
+
+@skipIf(asyncio is None, "asyncio needs python 3.4+")
+class AsyncCachingVSphereTests(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.cache = Mock()
+        self.vsphere = AsyncCachingVSphere(cache=self.cache, max_concurrency=4, loop=self.loop)
+
+    def tearDown(self):
+        self.vsphere.close()
+        self.loop.close()
+
+    def test_should_fill_and_retrieve_vms_on_executor(self):
+        self.cache.retrieve_vm.side_effect = lambda vm_name: threading.current_thread().name
+
+        self.loop.run_until_complete(self.vsphere.fill(custom_values=True))
+        thread_name = self.loop.run_until_complete(self.vsphere.retrieve_vm("any-vm"))
+
+        self.cache.fill.assert_called_with(True)
+        self.assertNotEqual(thread_name, threading.current_thread().name)
+
+    def test_should_raise_errors_of_blocking_calls(self):
+        self.cache.retrieve_esx.side_effect = KeyError("any-esx")
+
+        self.assertRaises(KeyError, lambda: self.loop.run_until_complete(self.vsphere.retrieve_esx("any-esx")))
+
+    def test_should_fetch_properties_in_bulk(self):
+        properties = self.loop.run_until_complete(self.vsphere.get_properties(["vm-1", "vm-2"], ["runtime.powerState"]))
+
+        self.assertEqual(properties, self.cache.vvc.get_restricted_view_on_managed_objects.return_value)
+        self.cache.vvc.get_restricted_view_on_managed_objects.assert_called_with(["vm-1", "vm-2"],
+                                                                                 ["runtime.powerState"])
+
+    def test_should_serialize_calls_of_one_connection(self):
+        first_call_may_finish = threading.Event()
+        calls = []
+
+        def first_call():
+            calls.append("first started")
+            first_call_may_finish.wait(5)
+            calls.append("first finished")
+
+        first = self.vsphere.run(first_call)
+        second = self.vsphere.run(lambda: calls.append("second"))
+        self.loop.call_later(0.05, first_call_may_finish.set)
+
+        self.loop.run_until_complete(asyncio.gather(first, second))
+
+        self.assertEqual(calls, ["first started", "first finished", "second"])
+
+    def test_should_run_calls_of_different_connections_concurrently(self):
+        other_vsphere = AsyncCachingVSphere(cache=Mock(), executor=self.vsphere.executor, loop=self.loop)
+        barrier = threading.Barrier(2, timeout=5)
+
+        self.loop.run_until_complete(asyncio.gather(self.vsphere.run(barrier.wait), other_vsphere.run(barrier.wait)))
+
+    def test_should_skip_calls_cancelled_before_they_started(self):
+        first_call_may_finish = threading.Event()
+        skipped_call = Mock()
+
+        first = self.vsphere.run(first_call_may_finish.wait, 5)
+        second = self.vsphere.run(skipped_call)
+        third = self.vsphere.run(lambda: "third")
+        second.cancel()
+        first_call_may_finish.set()
+
+        self.assertEqual(self.loop.run_until_complete(third), "third")
+        self.assertTrue(first.done())
+        self.assertFalse(skipped_call.called)
+
+    def test_should_wait_for_tasks_by_polling_their_states_in_bulk(self):
+        get_properties = self.cache.vvc.get_restricted_view_on_managed_objects
+        get_properties.side_effect = [[task_state("task-1", "running"), task_state("task-2", "success", "result-2")],
+                                      [task_state("task-2", "success", "result-2"), task_state("task-1", "success", "result-1")]]
+
+        results = self.loop.run_until_complete(self.vsphere.wait_for_tasks(["task-1", "task-2"], poll_seconds=0.01))
+
+        self.assertEqual(results, ["result-1", "result-2"])
+        self.assertEqual(get_properties.call_count, 2)
+        get_properties.assert_called_with(["task-1", "task-2"], ["info"])
+
+    def test_should_raise_error_of_failed_task(self):
+        error = RuntimeError("any-task-error")
+        self.cache.vvc.get_restricted_view_on_managed_objects.return_value = [task_state("task-1", "error", error=error)]
+
+        self.assertRaises(RuntimeError, lambda: self.loop.run_until_complete(self.vsphere.wait_for_tasks(["task-1"])))
+
+    def test_should_not_wait_without_tasks(self):
+        self.assertEqual(self.loop.run_until_complete(self.vsphere.wait_for_tasks([])), [])
+        self.assertFalse(self.cache.vvc.get_restricted_view_on_managed_objects.called)
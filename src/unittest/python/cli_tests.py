@@ -18,10 +18,23 @@ class CliLoopTest(TestCase):
     def test_should_create_REPL_and_start_it(self, repl_loop, arguments):
         arguments.return_value = {"--username": "any-user-name",
                                   "--password": "any-password",
-                                  "--hostname": "any-hostname"}
+                                  "--hostname": "any-hostname",
+                                  "--scope": None}
         main()
 
         repl_loop.assert_called_with('any-hostname',
                                      'any-user-name',
-                                     'any-password')
+                                     'any-password',
+                                     None)
         repl_loop.return_value.cmdloop.assert_called_with()
+
+    @patch("isphere.cli.docopt")
+    @patch("isphere.cli.VSphereREPL")
+    def test_should_create_REPL_restricted_to_scope(self, repl_loop, arguments):
+        arguments.return_value = {"--username": None,
+                                  "--password": None,
+                                  "--hostname": None,
+                                  "--scope": "dc-1, dc-2/host/cluster-1"}
+        main()
+
+        repl_loop.assert_called_with(None, None, None, ["dc-1", "dc-2/host/cluster-1"])
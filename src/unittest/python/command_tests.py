@@ -4,13 +4,23 @@
 #  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
 #
 
+from datetime import datetime, timedelta
+import os
 import re
+import shutil
+import tempfile
+import time
 from unittest import TestCase
 
 from mock import patch, call, Mock
+from pyVmomi import vmodl
 
 from isphere.command import VSphereREPL
+from isphere.command.core_command import _parse_event_time
+from isphere.connection import DatastoreUsage, MemoryUsage, Statistics, TriggeredAlarm
 from isphere.interactive_wrapper import NotFound
+from isphere.soap import SoapTotals
+from isphere.watcher import PropertyUpdate
 
 
 class PatternTests(TestCase):
@@ -97,6 +107,63 @@ class PatternTests(TestCase):
 
         self.assertEqual(actual_matches, ["vm-2", "other-vm", "my-vm-name"])
 
+    @patch("isphere.command.core_command.CachingVSphere.find_vm_names_by_custom_value")
+    @patch("isphere.command.core_command.CachingVSphere.list_cached_vms")
+    def test_should_yield_vms_selected_by_custom_value_ored_with_patterns(self, list_cached_vms, find_vm_names):
+        list_cached_vms.return_value = ["vm-1", "vm-2", "other-vm", "my-vm-name"]
+        find_vm_names.return_value = set(["vm-2", "my-vm-name"])
+
+        actual_matches = list(self.repl.compile_and_yield_vm_patterns("@owner=team-a=b other.*"))
+
+        self.assertEqual(actual_matches, ["vm-2", "other-vm", "my-vm-name"])
+        find_vm_names.assert_called_with("owner", "team-a=b")
+
+    @patch("isphere.command.core_command.CachingVSphere.find_vm_names_by_custom_value")
+    @patch("isphere.command.core_command.CachingVSphere.list_cached_vms")
+    def test_should_take_custom_value_selectors_literally(self, list_cached_vms, find_vm_names):
+        list_cached_vms.return_value = ["vm-1", "vm-2"]
+        find_vm_names.side_effect = lambda name, value: set(["vm-1"]) if value == "team(a" else set(["vm-2"])
+
+        actual_matches = list(self.repl.compile_and_yield_vm_patterns("@owner=team(a @ticket=[123]"))
+
+        self.assertEqual(actual_matches, ["vm-1", "vm-2"])
+        find_vm_names.assert_any_call("owner", "team(a")
+        find_vm_names.assert_any_call("ticket", "[123]")
+
+    @patch("isphere.command.virtual_machine_command.print", create=True)
+    @patch("isphere.command.core_command.CachingVSphere.find_vm_names_by_custom_value")
+    @patch("isphere.command.core_command.CachingVSphere.list_cached_vms")
+    def test_should_complain_about_unknown_custom_attribute_in_selector(self, list_cached_vms, find_vm_names, mock_print):
+        self.repl.colorize = lambda text, color: text
+        list_cached_vms.return_value = ["vm-1"]
+        find_vm_names.side_effect = NotFound("No custom attribute 'owner' found.")
+
+        actual_matches = list(self.repl.compile_and_yield_vm_patterns("@owner=any"))
+
+        self.assertEqual(actual_matches, [])
+        mock_print.assert_called_with("No custom attribute 'owner' found.")
+
+
+class EventTimeTests(TestCase):
+
+    def test_should_parse_durations_before_now(self):
+        now = datetime(2015, 6, 2, 12, 0, 0)
+
+        self.assertEqual(_parse_event_time("90s", now), datetime(2015, 6, 2, 11, 58, 30))
+        self.assertEqual(_parse_event_time("30m", now), datetime(2015, 6, 2, 11, 30, 0))
+        self.assertEqual(_parse_event_time("2h", now), datetime(2015, 6, 2, 10, 0, 0))
+        self.assertEqual(_parse_event_time("1d", now), datetime(2015, 6, 1, 12, 0, 0))
+
+    def test_should_parse_timestamps(self):
+        now = datetime(2015, 6, 2, 12, 0, 0)
+
+        self.assertEqual(_parse_event_time("2015-06-01T08:15:30", now), datetime(2015, 6, 1, 8, 15, 30))
+        self.assertEqual(_parse_event_time("2015-06-01T08:15", now), datetime(2015, 6, 1, 8, 15))
+        self.assertEqual(_parse_event_time("2015-06-01", now), datetime(2015, 6, 1))
+
+    def test_should_raise_on_invalid_times(self):
+        self.assertRaises(ValueError, _parse_event_time, "2x", datetime(2015, 6, 2))
+
 
 class VSphereREPLTests(TestCase):
 
@@ -125,6 +192,53 @@ class VSphereREPLTests(TestCase):
         self.esx_print_patcher.stop()
         self.core_print_patcher.stop()
 
+    def test_should_toggle_timing(self):
+        self.repl.do_timing("on")
+        self.assertTrue(self.repl.report_timing)
+
+        self.repl.do_timing("off")
+        self.assertFalse(self.repl.report_timing)
+
+    def test_should_not_toggle_timing_on_invalid_input(self):
+        self.repl.do_timing("maybe")
+
+        self.assertFalse(self.repl.report_timing)
+        self.core_mock_print.assert_called_with("Usage: timing [on|off]")
+
+    @patch("isphere.command.core_command.CachingVSphere.memory_report")
+    def test_should_show_memory_report(self, memory_report):
+        memory_report.return_value = [MemoryUsage("VM names and UUIDs", 100, 3072),
+                                      MemoryUsage("Alarm names", 0, 1024 ** 2)]
+
+        self.repl.do_memory("")
+
+        self.assertEqual(self.core_mock_print.call_args_list, [
+            call("structure             entries         KiB"),
+            call("VM names and UUIDs        100         3.0"),
+            call("Alarm names                 0      1024.0"),
+            call("1.0 MiB held by the cache.")])
+
+    @patch("isphere.command.core_command.CachingVSphere.statistics")
+    def test_should_report_timing_after_command_when_timing_is_on(self, statistics):
+        statistics.side_effect = [Statistics(SoapTotals(1, 0, 0.5, 0.25, 1024), 0, 1),
+                                  Statistics(SoapTotals(4, 1, 2.0, 1.0, 3072), 2, 2)]
+        self.repl.do_timing("on")
+
+        self.repl.postcmd(False, self.repl.precmd("any-command"))
+
+        report = self.core_mock_print.call_args[0][0]
+        self.assertIn("3 SOAP calls (1 failed) taking 1.500s", report)
+        self.assertIn("0.750s network, 0.750s serialization/parsing", report)
+        self.assertIn("2.0 KiB received", report)
+        self.assertIn("2/3 cache hits", report)
+
+    @patch("isphere.command.core_command.CachingVSphere.statistics")
+    def test_should_not_report_timing_when_timing_is_off(self, statistics):
+        self.repl.postcmd(False, self.repl.precmd("any-command"))
+
+        self.assertFalse(statistics.called)
+        self.assertFalse(self.core_mock_print.called)
+
     @patch("isphere.command.core_command.CachingVSphere.retrieve_vm")
     def test_should_retrieve_vm_from_cache(self, cache_retrieve):
         self.assertEqual(self.repl.retrieve_vm("any-vm-name"), cache_retrieve.return_value)
@@ -243,9 +357,10 @@ class VSphereREPLTests(TestCase):
                              call("Eval failed for any-host-1: unsupported operand type(s) for +: 'int' and 'str'")
                          ])
 
+    @patch("isphere.command.core_command.CachingVSphere.get_esx_name_of_vm")
     @patch("isphere.command.core_command.CachingVSphere.get_custom_attributes_mapping")
     @patch("isphere.command.core_command.CachingVSphere.retrieve_vm")
-    def test_should_print_info_for_matching_vms(self, cache_retrieve, custom_attributes_mapping):
+    def test_should_print_info_for_matching_vms(self, cache_retrieve, custom_attributes_mapping, get_esx_name_of_vm):
         self.vm_names.return_value = ["any-host-1"]
         custom_attributes_mapping.return_value = {"key-1": "name-for-key-1",
                                                   "key-2": "name-for-key-2"}
@@ -263,7 +378,7 @@ class VSphereREPLTests(TestCase):
         mock_vm.guest.guestState = "any-guest-state"
         mock_vm.summary.config.vmPathName = "/any/path/to/the/vm"
         mock_vm.name = "any-name"
-        mock_vm.get_esx_host.return_value.name = "any-esx-name"
+        get_esx_name_of_vm.return_value = "any-esx-name"
         cache_retrieve.return_value = mock_vm
 
         self.repl.do_info_vm("any-host-1")
@@ -286,6 +401,25 @@ class VSphereREPLTests(TestCase):
                              call()
                          ])
 
+    @patch("isphere.command.core_command.CachingVSphere.find_vm_names_on")
+    def test_should_list_vms_on_items_and_complain_about_unknown_items(self, find_vm_names_on):
+        find_vm_names_on.side_effect = [["vm-1", "vm-2"], NotFound("No items named cluster-9 found")]
+
+        self.repl.do_list_vm_on("esx-1 cluster-9")
+
+        self.assertEqual(find_vm_names_on.call_args_list, [call("esx-1"), call("cluster-9")])
+        self.assertEqual(self.vm_mock_print.call_args_list, [call("vm-1"), call("vm-2"),
+                                                             call("No items named cluster-9 found")])
+
+    @patch("isphere.command.core_command.CachingVSphere.find_esx_names_in")
+    def test_should_list_esxis_in_clusters(self, find_esx_names_in):
+        find_esx_names_in.return_value = ["esx-1", "esx-2"]
+
+        self.repl.do_list_esx_in("cluster-1")
+
+        find_esx_names_in.assert_called_with("cluster-1")
+        self.assertEqual(self.esx_mock_print.call_args_list, [call("esx-1"), call("esx-2")])
+
     @patch("isphere.command.core_command.CachingVSphere.wait_for_tasks")
     @patch("isphere.command.core_command.CachingVSphere.retrieve_vm")
     def test_should_reset_vms(self, cache_retrieve, _):
@@ -372,7 +506,7 @@ class VSphereREPLTests(TestCase):
                          ])
 
     @patch("isphere.command.virtual_machine_command.vim")
-    @patch("isphere.command.core_command.CachingVSphere.find_by_dns_name")
+    @patch("isphere.command.core_command.CachingVSphere.find_esx_host")
     @patch("isphere.command.core_command.CachingVSphere.retrieve_vm")
     def test_should_not_migrate_when_syntax_is_invalid(self, cache_retrieve, _, __):
         self.vm_names.return_value = ["any-host-1"]
@@ -385,7 +519,7 @@ class VSphereREPLTests(TestCase):
         self.vm_mock_print.assert_called_with('Looks like your input was malformed. Try `help migrate_vm`.')
 
     @patch("isphere.command.virtual_machine_command.vim")
-    @patch("isphere.command.core_command.CachingVSphere.find_by_dns_name")
+    @patch("isphere.command.core_command.CachingVSphere.find_esx_host")
     @patch("isphere.command.core_command.CachingVSphere.retrieve_vm")
     def test_should_not_migrate_when_target_esx_is_missing(self, cache_retrieve, _, __):
         self.vm_names.return_value = ["any-host-1"]
@@ -397,37 +531,460 @@ class VSphereREPLTests(TestCase):
         self.assertFalse(mock_vm.Relocate.called)
         self.vm_mock_print.assert_called_with('No target esx name given. Try `help migrate_vm`.')
 
-    @patch("isphere.command.virtual_machine_command.vim")
-    @patch("isphere.command.core_command.CachingVSphere.find_by_dns_name")
-    @patch("isphere.command.core_command.CachingVSphere.retrieve_vm")
-    def test_should_trim_whitespace_from_esx_name_when_surrounded_with_whitespace(self, cache_retrieve, find_by_dns_name, _):
-        self.vm_names.return_value = ["any-host-1"]
-        mock_vm = Mock()
-        cache_retrieve.return_value = mock_vm
+    @patch("isphere.command.core_command.CachingVSphere.find_esx_host")
+    def test_should_trim_whitespace_from_esx_name_when_surrounded_with_whitespace(self, find_esx_host):
+        self.vm_names.return_value = []
 
         self.repl.do_migrate_vm("any.*!     any-esxi.domain        ")
 
-        find_by_dns_name.assert_called_with("any-esxi.domain")
+        find_esx_host.assert_called_with("any-esxi.domain")
 
-    @patch("isphere.command.virtual_machine_command.vim")
-    @patch("isphere.command.core_command.CachingVSphere.find_by_dns_name")
+    @patch("isphere.command.core_command.CachingVSphere.suggest_esx_names")
+    @patch("isphere.command.core_command.CachingVSphere.find_esx_host")
     @patch("isphere.command.core_command.CachingVSphere.retrieve_vm")
-    def test_should_migrate_matching_vms(self, cache_retrieve, find_by_dns_name, vim):
+    def test_should_suggest_esx_names_when_target_esx_is_unknown(self, cache_retrieve, find_esx_host, suggest_esx_names):
+        self.vm_names.return_value = ["any-host-1"]
+        find_esx_host.side_effect = NotFound()
+        suggest_esx_names.return_value = ["esx-1.domain", "esx-11.domain"]
+
+        self.repl.do_migrate_vm("any.*!esx-l")
+
+        self.assertFalse(cache_retrieve.called)
+        self.vm_mock_print.assert_called_with("Target esx host 'esx-l' not found, did you mean esx-1.domain or esx-11.domain?")
+
+    @patch("isphere.command.virtual_machine_command.MigrationPlanner")
+    @patch("isphere.command.core_command.CachingVSphere.create_task_tracker")
+    @patch("isphere.command.core_command.CachingVSphere.get_current_esx_hosts")
+    @patch("isphere.command.core_command.CachingVSphere.find_esx_host")
+    def test_should_migrate_matching_vms(self, find_esx_host, get_current_esx_hosts, create_task_tracker, planner):
         self.vm_names.return_value = ["any-host-1", "any-host-2"]
+        self.repl.cache.vm_name_to_moref_mapping = {"any-host-1": "vm-1-moref", "any-host-2": "vm-2-moref"}
+        get_current_esx_hosts.return_value = {"any-host-1": "esx-1-moref", "any-host-2": "esx-2-moref"}
         mock_esx = Mock()
-        find_by_dns_name.return_value = mock_esx
-        mock_vm1, mock_vm2 = Mock(), Mock()
-        cache_retrieve.side_effect = [mock_vm1, mock_vm2]
-        spec_1, spec_2 = Mock(), Mock()
-        vim.vm.RelocateSpec.side_effect = [spec_1, spec_2]
+        find_esx_host.return_value = mock_esx
+        planner.return_value.run.return_value = []
+        self.repl.max_migrations_per_source = 3
+        self.repl.max_migrations_per_target = 4
+
+        self.repl.do_migrate_vm("any.*!any-esxi.domain")
+
+        find_esx_host.assert_called_with("any-esxi.domain")
+        planner.assert_called_with(create_task_tracker.return_value, max_per_source_host=3, max_per_target_host=4)
+        self.assertEqual(planner.return_value.add.call_args_list,
+                         [call("any-host-1", "vm-1-moref", "esx-1-moref", mock_esx),
+                          call("any-host-2", "vm-2-moref", "esx-2-moref", mock_esx)])
+        create_task_tracker.return_value.close.assert_called_with()
+
+    @patch("isphere.command.virtual_machine_command.MigrationPlanner")
+    @patch("isphere.command.core_command.CachingVSphere.create_task_tracker")
+    @patch("isphere.command.core_command.CachingVSphere.get_current_esx_hosts")
+    @patch("isphere.command.core_command.CachingVSphere.find_esx_host")
+    def test_should_report_failed_migrations(self, _, __, ___, planner):
+        self.vm_names.return_value = ["any-host-1"]
+        self.repl.cache.vm_name_to_moref_mapping = {"any-host-1": "vm-1-moref"}
+        failed_move = Mock(vm_name="any-host-1", state="error")
+        failed_move.error.msg = "any-fault-message"
+        planner.return_value.run.return_value = [failed_move]
 
         self.repl.do_migrate_vm("any.*!any-esxi.domain")
 
-        find_by_dns_name.assert_called_with("any-esxi.domain")
-        self.assertEqual(vim.vm.RelocateSpec.call_args_list,
-                         [call(host=mock_esx), call(host=mock_esx)])
-        mock_vm1.Relocate.assert_called_with(spec_1)
-        mock_vm2.Relocate.assert_called_with(spec_2)
+        self.vm_mock_print.assert_called_with("Relocation of any-host-1 failed: any-fault-message")
+
+    @patch("isphere.command.virtual_machine_command._input")
+    @patch("isphere.command.core_command.CachingVSphere.set_custom_attributes")
+    @patch("isphere.command.core_command.CachingVSphere.find_custom_attribute_key")
+    @patch("isphere.command.core_command.CachingVSphere.get_custom_attributes_mapping")
+    def test_should_set_custom_attribute_on_matching_vms(self, mapping, _, set_custom_attributes, _input):
+        mapping.return_value = {1: "any-attribute"}
+        _input.side_effect = ["any-attribute", "any-value"]
+        self.vm_names.return_value = ["any-host-1", "any-host-2"]
+        self.repl.cache.vm_name_to_moref_mapping = {"any-host-1": "vm-1-moref", "any-host-2": "vm-2-moref"}
+        self.repl.max_parallel_calls = 8
+        set_custom_attributes.return_value = iter([("vm-2-moref", None), ("vm-1-moref", None)])
+
+        self.repl.do_set_custom_attribute_vm("any-host")
+
+        vms, attribute_name, attribute_value = set_custom_attributes.call_args[0]
+        self.assertEqual(sorted(vms), ["vm-1-moref", "vm-2-moref"])
+        self.assertEqual((attribute_name, attribute_value), ("any-attribute", "any-value"))
+        self.assertEqual(set_custom_attributes.call_args[1], {"max_concurrency": 8})
+        self.assertEqual(self.vm_mock_print.call_args_list[-2:],
+                         [call("Set attribute for any-host-2"), call("Set attribute for any-host-1")])
+
+    @patch("isphere.command.virtual_machine_command._input")
+    @patch("isphere.command.core_command.CachingVSphere.set_custom_attributes")
+    @patch("isphere.command.core_command.CachingVSphere.find_custom_attribute_key")
+    @patch("isphere.command.core_command.CachingVSphere.get_custom_attributes_mapping")
+    def test_should_not_set_unknown_custom_attribute(self, mapping, find_custom_attribute_key, set_custom_attributes, _input):
+        mapping.return_value = {1: "any-attribute"}
+        _input.side_effect = ["unknown-attribute", "any-value"]
+        find_custom_attribute_key.side_effect = NotFound("No custom attribute 'unknown-attribute' found.")
+
+        self.repl.do_set_custom_attribute_vm("any-host")
+
+        self.vm_mock_print.assert_called_with("No custom attribute 'unknown-attribute' found.")
+        self.assertFalse(set_custom_attributes.called)
+
+    @patch("isphere.command.virtual_machine_command._input")
+    @patch("isphere.command.core_command.CachingVSphere.set_custom_attributes")
+    @patch("isphere.command.core_command.CachingVSphere.find_custom_attribute_key")
+    @patch("isphere.command.core_command.CachingVSphere.get_custom_attributes_mapping")
+    def test_should_stop_setting_custom_attribute_on_first_problem(self, mapping, _, set_custom_attributes, _input):
+        mapping.return_value = {1: "any-attribute"}
+        _input.side_effect = ["any-attribute", "any-value"]
+        self.vm_names.return_value = ["any-host-1", "any-host-2"]
+        self.repl.cache.vm_name_to_moref_mapping = {"any-host-1": "vm-1-moref", "any-host-2": "vm-2-moref"}
+        results = Mock()
+        results.__iter__ = Mock(return_value=iter([("vm-1-moref", Exception("any-problem")), ("vm-2-moref", None)]))
+        set_custom_attributes.return_value = results
+
+        self.repl.do_set_custom_attribute_vm("any-host")
+
+        self.assertEqual(self.vm_mock_print.call_args_list[-2:],
+                         [call("Got a problem with any-host-1: any-problem"), call("Not continuing.")])
+        results.close.assert_called_with()
+
+    @patch("isphere.command.virtual_machine_command.RollingReboot")
+    @patch("isphere.command.core_command.CachingVSphere.create_property_watcher")
+    def test_should_reboot_matching_vms_in_waves(self, create_property_watcher, rolling_reboot):
+        self.vm_names.return_value = ["any-host-1", "any-host-2"]
+        self.repl.cache.vm_name_to_moref_mapping = {"any-host-1": "vm-1-moref", "any-host-2": "vm-2-moref"}
+        self.repl.reboot_wave_size = 2
+        self.repl.reboot_timeout = 300
+        rolling_reboot.return_value.run.return_value = [Mock(state="ready"), Mock(state="failed")]
+
+        self.repl.do_rolling_reboot_vm("any-host")
+
+        rolling_reboot.assert_called_with(create_property_watcher.return_value,
+                                          [("any-host-1", "vm-1-moref"), ("any-host-2", "vm-2-moref")],
+                                          wave_size=2,
+                                          timeout_seconds=300)
+        create_property_watcher.return_value.close.assert_called_with()
+        self.vm_mock_print.assert_called_with("1 of 2 vms ready, 1 failed.")
+
+    @patch("isphere.command.virtual_machine_command.RollingReboot")
+    def test_should_not_reboot_in_waves_without_matching_vms(self, rolling_reboot):
+        self.vm_names.return_value = []
+
+        self.repl.do_rolling_reboot_vm("any-host")
+
+        self.assertFalse(rolling_reboot.called)
+
+    @patch("isphere.command.core_command.CachingVSphere.get_triggered_alarms")
+    def test_should_print_alarms_of_matching_vms_retrieved_at_once(self, get_triggered_alarms):
+        self.vm_names.return_value = ["any-host-1", "any-host-2"]
+        self.repl.cache.vm_name_to_moref_mapping = {"any-host-1": "vm-1-moref", "any-host-2": "vm-2-moref"}
+        get_triggered_alarms.return_value = {"vm-1-moref": [TriggeredAlarm("any-alarm", "red", "any-time", True)],
+                                             "vm-2-moref": []}
+
+        self.repl.do_alarms_vm("any-host")
+
+        get_triggered_alarms.assert_called_once_with(["vm-1-moref", "vm-2-moref"])
+        self.assertEqual(self.core_mock_print.call_args_list,
+                         [call("-" * 70),
+                          call("Alarms for any-host-1"),
+                          call("\talarm: any-alarm"),
+                          call("\talarm status: red (acknowledged)"),
+                          call("\ttriggered at: any-time"),
+                          call("-" * 70),
+                          call("Alarms for any-host-2")])
+
+    @patch("isphere.command.core_command.CachingVSphere.get_triggered_alarms")
+    def test_should_print_alarms_of_matching_esxis(self, get_triggered_alarms):
+        self.esx_names.return_value = ["any-esx-1"]
+        self.repl.cache.esx_name_to_moref_mapping = {"any-esx-1": "esx-1-moref"}
+        get_triggered_alarms.return_value = {"esx-1-moref": [TriggeredAlarm("any-alarm", "yellow", "any-time", False)]}
+
+        self.repl.do_alarms_esx("any-esx")
+
+        get_triggered_alarms.assert_called_once_with(["esx-1-moref"])
+        self.core_mock_print.assert_any_call("\talarm status: yellow")
+
+    @patch("isphere.command.core_command.CachingVSphere.get_triggered_alarms")
+    def test_should_not_retrieve_alarms_without_matching_vms(self, get_triggered_alarms):
+        self.vm_names.return_value = []
+
+        self.repl.do_alarms_vm("any-host")
+
+        self.assertFalse(get_triggered_alarms.called)
+
+    def test_should_not_watch_without_properties(self):
+        self.repl.do_watch_vm("any-host !  ")
+
+        self.core_mock_print.assert_called_with("Looks like your input was malformed. Try `help watch_vm`.")
+
+    @patch("isphere.command.core_command.CachingVSphere.create_property_watcher")
+    def test_should_watch_matching_vms_with_one_filter_and_print_changes(self, create_property_watcher):
+        self.vm_names.return_value = ["any-host-1", "any-host-2"]
+        self.repl.cache.vm_name_to_moref_mapping = {"any-host-1": "vm-1-moref", "any-host-2": "vm-2-moref"}
+        watcher = create_property_watcher.return_value
+        watcher.wait.side_effect = [[PropertyUpdate("vm-1-moref", "enter", {"runtime.powerState": "poweredOn",
+                                                                            "guestHeartbeatStatus": "green"})],
+                                    [],
+                                    [PropertyUpdate("vm-2-moref", "modify", {"runtime.powerState": "poweredOff"})],
+                                    KeyboardInterrupt()]
+        self.repl.watch_poll_seconds = 10
+
+        self.repl.do_watch_vm("any-host ! runtime.powerState guestHeartbeatStatus")
+
+        watched_vms, properties = watcher.watch.call_args[0]
+        self.assertEqual(sorted(watched_vms), ["vm-1-moref", "vm-2-moref"])
+        self.assertEqual(properties, ["runtime.powerState", "guestHeartbeatStatus"])
+        watcher.wait.assert_called_with(10)
+        printed_lines = [print_call[0][0] for print_call in self.core_mock_print.call_args_list[1:]]
+        self.assertEqual([printed_line.split(" ", 1)[1] for printed_line in printed_lines],
+                         ["any-host-1: guestHeartbeatStatus = green",
+                          "any-host-1: runtime.powerState = poweredOn",
+                          "any-host-2: runtime.powerState = poweredOff"])
+        watcher.close.assert_called_with()
+
+    @patch("isphere.command.core_command.CachingVSphere.create_property_watcher")
+    def test_should_report_invalid_watched_properties(self, create_property_watcher):
+        self.esx_names.return_value = ["any-esx-1"]
+        self.repl.cache.esx_name_to_moref_mapping = {"any-esx-1": "esx-1-moref"}
+        watcher = create_property_watcher.return_value
+        watcher.watch.side_effect = vmodl.query.InvalidProperty(msg="invalid property", name="foo")
+
+        self.repl.do_watch_esx("any-esx ! foo")
+
+        self.core_mock_print.assert_called_with("Could not watch: invalid property")
+        watcher.close.assert_called_with()
+
+    @patch("isphere.command.core_command.CachingVSphere.read_events")
+    def test_should_print_events_of_matching_vms_of_last_hour_by_default(self, read_events):
+        self.vm_names.return_value = ["any-host-1", "any-host-2"]
+        self.repl.cache.vm_name_to_moref_mapping = {"any-host-1": "vm-1-moref", "any-host-2": "vm-2-moref"}
+        read_events.return_value = iter([Mock(createdTime=datetime(2015, 6, 1, 12, 0, 0), userName="any-user",
+                                              fullFormattedMessage="any-host-1 is powered on"),
+                                         Mock(createdTime=datetime(2015, 6, 1, 12, 5, 0), userName="",
+                                              fullFormattedMessage="any-host-2 is powered off")])
+
+        self.repl.do_events_vm("any-host")
+
+        morefs, begin_time, end_time = read_events.call_args[0]
+        self.assertEqual(morefs, ["vm-1-moref", "vm-2-moref"])
+        self.assertTrue(timedelta(minutes=59) < datetime.utcnow() - begin_time < timedelta(minutes=61))
+        self.assertEqual(end_time, None)
+        self.assertEqual(self.core_mock_print.call_args_list,
+                         [call("2015-06-01 12:00:00 [any-user] any-host-1 is powered on"),
+                          call("2015-06-01 12:05:00 any-host-2 is powered off"),
+                          call("2 events.")])
+
+    @patch("isphere.command.core_command.CachingVSphere.read_events")
+    def test_should_print_events_of_matching_esxis_in_time_range(self, read_events):
+        self.esx_names.return_value = ["any-esx-1"]
+        self.repl.cache.esx_name_to_moref_mapping = {"any-esx-1": "esx-1-moref"}
+        read_events.return_value = iter([])
+
+        self.repl.do_events_esx("any-esx ! 2015-06-01T12:00 2015-06-02")
+
+        read_events.assert_called_with(["esx-1-moref"], datetime(2015, 6, 1, 12, 0), datetime(2015, 6, 2))
+
+    @patch("isphere.command.core_command.CachingVSphere.read_events")
+    def test_should_not_read_events_with_invalid_time(self, read_events):
+        self.repl.do_events_vm("any-host ! yesterday")
+
+        self.core_mock_print.assert_called_with(
+            "Invalid time 'yesterday', try a duration like 2h or a timestamp like 2015-06-01T12:00.")
+        self.assertFalse(read_events.called)
+
+    def test_should_not_run_rolling_maintenance_without_action(self):
+        self.repl.do_rolling_maintenance_esx("any-host")
+
+        self.esx_mock_print.assert_called_with("Looks like your input was malformed. Try `help rolling_maintenance_esx`.")
+
+    def test_should_not_run_rolling_maintenance_with_unknown_action(self):
+        self.repl.do_rolling_maintenance_esx("any-host ! patch")
+
+        self.esx_mock_print.assert_called_with("Unknown action 'patch', try one of enter, reboot, shutdown.")
+
+    @patch("isphere.command.esx_command.RollingMaintenance")
+    @patch("isphere.command.core_command.CachingVSphere.create_task_tracker")
+    def test_should_run_rolling_maintenance_on_matching_esxis(self, create_task_tracker, rolling_maintenance):
+        self.esx_names.return_value = ["any-host-1", "any-host-2"]
+        self.repl.cache.esx_name_to_moref_mapping = {"any-host-1": "esx-1-moref", "any-host-2": "esx-2-moref"}
+        self.repl.cache._connection = Mock()
+        self.repl.maintenance_wave_size = 2
+        rolling_maintenance.return_value.run.return_value = [Mock(stage="done"), Mock(stage="failed")]
+
+        self.repl.do_rolling_maintenance_esx("any-host ! reboot")
+
+        rolling_maintenance.assert_called_with(self.repl.cache._connection.ensure_established.return_value,
+                                               [("any-host-1", "esx-1-moref"), ("any-host-2", "esx-2-moref")],
+                                               create_task_tracker.return_value,
+                                               action="reboot",
+                                               wave_size=2,
+                                               state_path=None,
+                                               max_migrations_per_source=2,
+                                               max_migrations_per_target=2)
+        create_task_tracker.return_value.close.assert_called_with()
+        self.esx_mock_print.assert_called_with("1 of 2 esxis done, 1 failed.")
+
+    @patch("isphere.command.esx_command.RollingMaintenance")
+    @patch("isphere.command.core_command.CachingVSphere.create_task_tracker")
+    def test_should_report_unresumable_rolling_maintenance(self, create_task_tracker, rolling_maintenance):
+        self.esx_names.return_value = ["any-host-1"]
+        self.repl.cache.esx_name_to_moref_mapping = {"any-host-1": "esx-1-moref"}
+        self.repl.cache._connection = Mock()
+        rolling_maintenance.return_value.run.side_effect = ValueError("any-state-error")
+
+        self.repl.do_rolling_maintenance_esx("any-host ! enter")
+
+        self.esx_mock_print.assert_called_with("any-state-error")
+        create_task_tracker.return_value.close.assert_called_with()
+
+    def test_should_not_query_performance_without_counters(self):
+        self.repl.do_perf_vm("any-host")
+
+        self.core_mock_print.assert_called_with("Looks like your input was malformed. Try `help perf_vm`.")
+
+    @patch("isphere.command.core_command.CachingVSphere.query_performance")
+    def test_should_print_top_matching_vms_by_first_counter(self, query_performance):
+        self.vm_names.return_value = ["any-host-1", "any-host-2", "any-host-3"]
+        self.repl.cache.vm_name_to_moref_mapping = {"any-host-1": "vm-1-moref", "any-host-2": "vm-2-moref",
+                                                    "any-host-3": "vm-3-moref"}
+        self.repl.perf_samples = 3
+        self.repl.perf_top = 1
+        result = query_performance.return_value
+        result.counters = [Mock(unit="millisecond"), Mock(unit="percent")]
+        result.counters[0].name, result.counters[1].name = "cpu.ready.summation", "cpu.usage.average"
+        result.entities = ["vm-2-moref"]
+        result.values = {"cpu.ready.summation": [1500.0], "cpu.usage.average": [float("nan")]}
+        result.samples = {"cpu.ready.summation": [[(20.0, 1000.0), (40.0, 2000.0)]], "cpu.usage.average": [[]]}
+        result.top.return_value = [("vm-2-moref", 1500.0)]
+
+        self.repl.do_perf_vm("any-host ! cpu.ready.summation cpu.usage.average")
+
+        queried_vms, counter_names = query_performance.call_args[0]
+        self.assertEqual(sorted(queried_vms), ["vm-1-moref", "vm-2-moref", "vm-3-moref"])
+        self.assertEqual(counter_names, ["cpu.ready.summation", "cpu.usage.average"])
+        self.assertEqual(query_performance.call_args[1], {"samples": 3})
+        result.top.assert_called_with("cpu.ready.summation", 1)
+        self.assertEqual(self.repl.timeseries.rollup("any-host-2", "cpu.ready.summation").count, 2)
+        printed_lines = [print_call[0][0] for print_call in self.core_mock_print.call_args_list]
+        self.assertEqual([printed_line.split() for printed_line in printed_lines],
+                         [["name", "cpu.ready.summation", "(millisecond)", "cpu.usage.average", "(percent)"],
+                          ["any-host-2", "1500.0", "-"],
+                          ["Showing", "1", "of", "3", "items."]])
+
+    @patch("isphere.command.core_command.CachingVSphere.query_performance")
+    def test_should_report_unknown_performance_counters(self, query_performance):
+        self.esx_names.return_value = ["any-esx-1"]
+        self.repl.cache.esx_name_to_moref_mapping = {"any-esx-1": "esx-1-moref"}
+        query_performance.side_effect = NotFound("No performance counter 'foo' found.")
+
+        self.repl.do_perf_esx("any-esx ! foo")
+
+        self.core_mock_print.assert_called_with("No performance counter 'foo' found.")
+
+    def test_should_print_trends_of_recorded_samples_highest_p95_first(self):
+        self.vm_names.return_value = ["any-host-1", "any-host-2", "any-host-3"]
+        now = time.time()
+        for value in range(10):
+            self.repl.timeseries.record("any-host-1", "cpu.ready.summation", now - 600 + value, float(value))
+            self.repl.timeseries.record("any-host-2", "cpu.ready.summation", now - value, 100.0 + value)
+
+        self.repl.do_trend_vm("any-host ! cpu.ready.summation")
+        self.repl.do_trend_vm("any-host ! cpu.ready.summation 5m")
+
+        printed_lines = [print_call[0][0].split() for print_call in self.core_mock_print.call_args_list]
+        self.assertEqual(printed_lines,
+                         [["name", "samples", "min", "avg", "max", "p95"],
+                          ["any-host-2", "10", "100.0", "104.5", "109.0", "109.0"],
+                          ["any-host-1", "10", "0.0", "4.5", "9.0", "9.0"],
+                          ["name", "samples", "min", "avg", "max", "p95"],
+                          ["any-host-2", "10", "100.0", "104.5", "109.0", "109.0"]])
+
+    def test_should_not_print_trends_without_samples(self):
+        self.esx_names.return_value = ["any-esx-1"]
+
+        self.repl.do_trend_esx("any-esx ! cpu.usage.average")
+
+        self.core_mock_print.assert_called_with("No samples of cpu.usage.average, record some with a perf command first.")
+
+    def test_should_not_print_trends_without_counter(self):
+        self.repl.do_trend_vm("any-host")
+
+        self.core_mock_print.assert_called_with("Looks like your input was malformed. Try `help trend_vm`.")
+
+    def test_should_dump_and_load_recorded_samples(self):
+        self.repl.timeseries.record("any-host-1", "cpu.ready.summation", 1.0, 150.0)
+        dump_directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(dump_directory, "samples.ists")
+            self.repl.do_dump_timeseries(path)
+            self.repl.timeseries.record("any-host-2", "cpu.ready.summation", 1.0, 150.0)
+
+            self.repl.do_load_timeseries(path)
+        finally:
+            shutil.rmtree(dump_directory)
+
+        self.assertEqual(list(self.repl.timeseries.series), [("any-host-1", "cpu.ready.summation")])
+        self.core_mock_print.assert_called_with("Loaded 1 series from {0}.".format(path))
+
+    def test_should_report_unwritable_sample_files(self):
+        self.repl.do_dump_timeseries("/any/missing/directory/samples.ists")
+
+        self.assertTrue(self.core_mock_print.call_args[0][0].startswith("Could not write /any/missing/directory/samples.ists: "))
+
+    def test_should_report_unloadable_sample_files(self):
+        self.repl.do_load_timeseries("/any/missing/file")
+
+        self.assertTrue(self.core_mock_print.call_args[0][0].startswith("Could not load /any/missing/file: "))
+
+    def test_should_complete_vm_names_of_vm_commands(self):
+        self.repl.cache.vm_name_index.update(["dev-vm-1", "dev-vm-2", "prod-vm-1"])
+
+        self.assertEqual(self.repl.completedefault("", "info_vm ", 8, 8), ["dev-vm-1", "dev-vm-2", "prod-vm-1"])
+        self.assertEqual(self.repl.completedefault("dev", "reset_vm prod-vm-1 dev", 19, 22), ["dev-vm-1", "dev-vm-2"])
+
+    def test_should_complete_only_the_text_after_readline_delimiters(self):
+        self.repl.cache.vm_name_index.update(["dev-vm-1", "dev-vm-2", "prod-vm-1"])
+
+        self.assertEqual(self.repl.completedefault("vm", "info_vm dev-vm", 12, 14), ["vm-1", "vm-2"])
+
+    def test_should_not_complete_names_after_exclamation_mark(self):
+        self.repl.cache.vm_name_index.update(["dev-vm-1"])
+
+        self.assertEqual(self.repl.completedefault("d", "eval_vm dev-vm-1 ! d", 19, 20), [])
+
+    def test_should_complete_esx_and_dvs_names(self):
+        self.repl.cache.esx_name_index.update(["esx-1.domain", "esx-2.domain"])
+        self.repl.cache.dvs_name_index.update(["dvs-1"])
+
+        self.assertEqual(self.repl.completedefault("esx-2", "info_esx esx-2", 9, 14), ["esx-2.domain"])
+        self.assertEqual(self.repl.complete_enter_maintenance("esx", "enter_maintenance esx", 18, 21),
+                         ["esx-1.domain", "esx-2.domain"])
+        self.assertEqual(self.repl.completedefault("d", "list_dvs d", 9, 10), ["dvs-1"])
+
+    def test_should_complete_datastore_names(self):
+        self.repl.cache.datastore_name_index.update(["ds-ssd-1", "ds-ssd-2", "ds-hdd-1"])
+
+        self.assertEqual(self.repl.completedefault("ds-s", "info_ds ds-s", 8, 12), ["ds-ssd-1", "ds-ssd-2"])
+
+    @patch("isphere.command.datastore_command.print", create=True)
+    @patch("isphere.command.core_command.CachingVSphere.get_datastore_usage")
+    @patch("isphere.command.core_command.CachingVSphere.list_cached_datastores")
+    def test_should_print_datastore_usage_highest_utilization_first(self, list_cached_datastores,
+                                                                    get_datastore_usage, mock_print):
+        list_cached_datastores.return_value = ["ds-1", "ds-2", "other-ds"]
+        get_datastore_usage.return_value = [
+            DatastoreUsage("ds-2", 4 * 1024 ** 4, 1024 ** 4, 2 * 1024 ** 4, 0.75, 1.25),
+            DatastoreUsage("ds-1", 1024 ** 4, 1024 ** 4, 0, 0.0, 0.0)]
+
+        self.repl.do_info_ds("ds-.*")
+
+        get_datastore_usage.assert_called_with(["ds-1", "ds-2"])
+        self.assertEqual(mock_print.call_args_list, [
+            call("name  capacity GiB      free GiB   uncommitted  used %  provisioned"),
+            call("ds-2        4096.0        1024.0        2048.0    75.0       125.0%"),
+            call("ds-1        1024.0        1024.0           0.0     0.0         0.0%"),
+            call("Showing 2 of 2 datastores.")])
+
+    def test_should_not_complete_names_of_other_commands(self):
+        self.repl.cache.vm_name_index.update(["dev-vm-1"])
+
+        self.assertEqual(self.repl.completedefault("d", "timing d", 7, 8), [])
 
     def test_wait_for_task_to_complete_raises_exception_on_unknown_task_state(self):
         task_mock = Mock()
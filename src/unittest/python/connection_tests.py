@@ -6,10 +6,15 @@
 
 from unittest import TestCase
 from mock import patch, call, Mock
+from pyVmomi import vim
 
 from isphere.connection import (AutoEstablishingConnection,
                                 CachingVSphere,
+                                DatastoreUsage,
+                                TriggeredAlarm,
                                 memoized)
+from isphere.interactive_wrapper import ItemContainer, NotFound
+from isphere.name_store import UuidStore
 
 
 class CachingVSphereTests(TestCase):
@@ -18,6 +23,13 @@ class CachingVSphereTests(TestCase):
         self.cache = CachingVSphere(None, None, None)
         self.cache._connection = Mock()
         self.vvc = self.cache._connection.ensure_established.return_value
+        self.vvc.get_partitions.return_value = ["any-datacenter"]
+        self.vvc.get_restricted_view_on_dvses.return_value = []
+        self.vvc.get_restricted_view_on_datastores.return_value = []
+        for memoized_method in (CachingVSphere.get_custom_attributes_mapping, CachingVSphere.get_custom_attribute_keys,
+                                CachingVSphere.get_performance_counters, CachingVSphere.retrieve_dvs,
+                                CachingVSphere.retrieve_datastore):
+            getattr(memoized_method, "__func__", memoized_method).cached_calls = {}
 
     def test_should_fill_cache_with_vms_dvs_and_esxis_returned_by_vvc(self):
         vm_1, vm_2 = Mock(), Mock()
@@ -28,20 +40,395 @@ class CachingVSphereTests(TestCase):
         esx_1, esx_2 = Mock(), Mock()
         esx_1.name = "esx-1"
         esx_1.hardware.systemInfo.uuid = "esx-1-uuid"
+        esx_1.config.network.dnsConfig.hostName = "esx-1"
+        esx_1.config.network.dnsConfig.domainName = "domain"
         esx_2.name = "esx-2"
         esx_2.hardware.systemInfo.uuid = "esx-2-uuid"
+        esx_2.config.network.dnsConfig.hostName = "esx-2"
+        esx_2.config.network.dnsConfig.domainName = "domain"
         dvs_1, dvs_2 = Mock(), Mock()
         dvs_1.name = "dvs-1"
         dvs_2.name = "dvs-2"
         self.vvc.get_restricted_view_on_vms.return_value = [vm_1, vm_2]
         self.vvc.get_restricted_view_on_host_systems.return_value = [esx_1, esx_2]
-        self.vvc.get_all_dvs.return_value = [dvs_1, dvs_2]
+        self.vvc.get_restricted_view_on_dvses.return_value = [dvs_1, dvs_2]
 
         self.cache.fill()
 
-        self.assertEqual(self.cache.vm_name_to_uuid_mapping, {"vm-1": "vm-1-uuid", "vm-2": "vm-2-uuid"})
-        self.assertEqual(self.cache.esx_name_to_uuid_mapping, {"esx-1": "esx-1-uuid", "esx-2": "esx-2-uuid"})
-        self.assertEqual(self.cache.dvs_mapping, {'dvs-1': dvs_1, 'dvs-2': dvs_2})
+        self.assertEqual(self.cache.vm_name_to_uuid_mapping.items(), [("vm-1", "vm-1-uuid"), ("vm-2", "vm-2-uuid")])
+        self.assertEqual(self.cache.vm_name_to_moref_mapping, {"vm-1": vm_1.moref, "vm-2": vm_2.moref})
+        self.assertEqual(self.cache.esx_name_to_uuid_mapping.items(), [("esx-1", "esx-1-uuid"), ("esx-2", "esx-2-uuid")])
+        self.assertEqual(self.cache.esx_name_to_moref_mapping, {"esx-1": esx_1.moref, "esx-2": esx_2.moref})
+        self.assertEqual(self.cache.resolve_esx_name("esx-2.domain"), "esx-2")
+        self.vvc.get_restricted_view_on_dvses.assert_called_once_with(["name"], ["any-datacenter"])
+        self.assertEqual(self.cache.dvs_name_to_moref_mapping, {"dvs-1": dvs_1.moref, "dvs-2": dvs_2.moref})
+        self.assertEqual(self.cache.vm_name_index.names, ["vm-1", "vm-2"])
+        self.assertEqual(self.cache.esx_name_index.names, ["esx-1", "esx-2"])
+        self.assertEqual(self.cache.dvs_name_index.names, ["dvs-1", "dvs-2"])
+
+    def test_should_fill_each_datacenter_through_its_own_views_and_merge_them(self):
+        items = {}
+        for datacenter in ("dc-1", "dc-2"):
+            vm, esx, dvs = Mock(), Mock(), Mock()
+            vm.name, esx.name, dvs.name = "{0}-vm".format(datacenter), "{0}-esx".format(datacenter), "{0}-dvs".format(datacenter)
+            items[datacenter] = vm, esx, dvs
+        self.vvc.get_partitions.return_value = ["dc-1", "dc-2"]
+        self.vvc.get_restricted_view_on_vms.side_effect = lambda properties, containers: [items[containers[0]][0]]
+        self.vvc.get_restricted_view_on_host_systems.side_effect = lambda properties, containers: [items[containers[0]][1]]
+        self.vvc.get_restricted_view_on_dvses.side_effect = lambda properties, containers: [items[containers[0]][2]]
+
+        self.cache.fill(max_concurrency=2)
+
+        self.assertEqual(sorted(self.cache.vm_name_to_moref_mapping), ["dc-1-vm", "dc-2-vm"])
+        self.assertEqual(sorted(self.cache.esx_name_to_moref_mapping), ["dc-1-esx", "dc-2-esx"])
+        self.assertEqual(sorted(self.cache.dvs_name_to_moref_mapping), ["dc-1-dvs", "dc-2-dvs"])
+        self.assertEqual(self.cache.vm_name_index.names, ["dc-1-vm", "dc-2-vm"])
+
+    def test_should_keep_items_of_overlapping_partitions_once(self):
+        vm, esx = vim.VirtualMachine("vm-1"), vim.HostSystem("host-1")
+        self.vvc.get_partitions.return_value = ["dc-1/vm/folder-1", "dc-1/host/cluster-1"]
+        self.vvc.get_restricted_view_on_vms.return_value = [
+            self.item_container(moref=vm, name="vm-1", config__uuid="vm-1-uuid", runtime__host=esx,
+                                resourcePool=None, datastore=[], network=[])]
+        self.vvc.get_restricted_view_on_host_systems.return_value = [
+            self.item_container(moref=esx, name="esx-1", hardware__systemInfo__uuid="esx-1-uuid", parent=None)]
+        self.vvc.get_restricted_view_on_items.return_value = []
+
+        self.cache.fill(relations=True)
+
+        self.assertEqual(self.cache.vm_name_to_moref_mapping, {"vm-1": vm})
+        self.assertEqual(self.cache.esx_name_to_moref_mapping, {"esx-1": esx})
+        self.assertEqual(self.cache.inventory_graph.children(esx, vim.VirtualMachine), [vm])
+
+    def test_should_keep_cache_when_filling_a_datacenter_fails(self):
+        self.cache.vm_name_to_moref_mapping = {"vm-1": "vm-1-moref"}
+        self.vvc.get_partitions.return_value = ["dc-1", "dc-2"]
+        self.vvc.get_restricted_view_on_vms.side_effect = RuntimeError("dc-2 is down")
+
+        self.assertRaises(RuntimeError, self.cache.fill)
+
+        self.assertEqual(self.cache.vm_name_to_moref_mapping, {"vm-1": "vm-1-moref"})
+
+    def test_should_fill_cache_with_datastores(self):
+        datastore = Mock()
+        datastore.name = "ds-1"
+        self.vvc.get_restricted_view_on_vms.return_value = []
+        self.vvc.get_restricted_view_on_host_systems.return_value = []
+        self.vvc.get_restricted_view_on_datastores.return_value = [datastore]
+
+        self.cache.fill()
+
+        self.vvc.get_restricted_view_on_datastores.assert_called_with(["name"], ["any-datacenter"])
+        self.assertEqual(list(self.cache.list_cached_datastores()), ["ds-1"])
+        self.assertEqual(self.cache.retrieve_datastore("ds-1").raw_datastore, datastore.moref)
+        self.assertEqual(self.cache.number_of_datastores, 1)
+        self.assertEqual(self.cache.datastore_name_index.names, ["ds-1"])
+
+    def test_should_get_usage_of_datastores_with_one_call_highest_utilization_first(self):
+        tebibyte = 1024 ** 4
+        self.cache.datastore_name_to_moref_mapping = dict((name, "{0}-moref".format(name))
+                                                          for name in ("ds-1", "ds-2", "ds-3"))
+        self.vvc.get_restricted_view_on_managed_objects.return_value = [
+            self.item_container(moref="ds-1-moref", summary__capacity=4 * tebibyte, summary__freeSpace=3 * tebibyte,
+                                summary__uncommitted=0),
+            self.item_container(moref="ds-2-moref", summary__capacity=4 * tebibyte, summary__freeSpace=tebibyte,
+                                summary__uncommitted=2 * tebibyte),
+            self.item_container(moref="ds-3-moref", summary__capacity=0)]
+
+        usages = self.cache.get_datastore_usage(["ds-1", "ds-2", "ds-3"])
+
+        self.assertEqual(usages, [DatastoreUsage("ds-2", 4 * tebibyte, tebibyte, 2 * tebibyte, 0.75, 1.25),
+                                  DatastoreUsage("ds-1", 4 * tebibyte, 3 * tebibyte, 0, 0.25, 0.25)])
+        self.assertEqual(sorted(self.vvc.get_restricted_view_on_managed_objects.call_args[0][0]),
+                         ["ds-1-moref", "ds-2-moref", "ds-3-moref"])
+        self.assertEqual(self.vvc.get_restricted_view_on_managed_objects.call_args[0][1],
+                         ["summary.capacity", "summary.freeSpace", "summary.uncommitted"])
+
+    def test_should_build_dvs_wrapper_on_first_retrieval_without_asking_the_server(self):
+        self.cache.dvs_name_to_moref_mapping = {"dvs-1": "dvs-1-moref"}
+
+        dvs = self.cache.retrieve_dvs("dvs-1")
+
+        self.assertEqual(dvs.raw_dvs, "dvs-1-moref")
+        self.assertEqual(dvs.name, "dvs-1")
+        self.assertTrue(self.cache.retrieve_dvs("dvs-1") is dvs)
+        self.assertEqual(self.vvc.method_calls, [])
+
+    def test_should_replace_uuids_of_removed_items_on_fill(self):
+        self.cache.vm_name_to_uuid_mapping = UuidStore([("removed-vm", "any-uuid")])
+        self.vvc.get_restricted_view_on_vms.return_value = [
+            self.item_container(name="vm-1", config__uuid="vm-1-uuid", moref="vm-1-moref")]
+        self.vvc.get_restricted_view_on_host_systems.return_value = []
+
+        self.cache.fill()
+
+        self.assertEqual(list(self.cache.list_cached_vms()), ["vm-1"])
+        self.assertEqual(self.cache.number_of_vms, 1)
+
+    def test_should_list_cached_names_without_decoding_uuid_stores(self):
+        self.cache.vm_name_to_moref_mapping = {"vm-1": "vm-1-moref"}
+        self.cache.esx_name_to_moref_mapping = {"esx-1": "esx-1-moref"}
+        self.cache.vm_name_to_uuid_mapping = self.cache.esx_name_to_uuid_mapping = Mock(spec=UuidStore)
+
+        self.assertEqual(list(self.cache.list_cached_vms()), ["vm-1"])
+        self.assertEqual(list(self.cache.list_cached_esxis()), ["esx-1"])
+        self.assertEqual(self.cache.number_of_vms + self.cache.number_of_esxis, 2)
+        self.assertEqual(self.cache.vm_name_to_uuid_mapping.method_calls, [])
+
+    def test_should_report_memory_of_cache_structures_counting_shared_names_once(self):
+        self.vvc.get_restricted_view_on_vms.return_value = [
+            self.item_container(name="vm-{0}".format(number), config__uuid="any-uuid", moref="vm-{0}-moref".format(number))
+            for number in range(100)]
+        self.vvc.get_restricted_view_on_host_systems.return_value = []
+        self.cache.fill()
+        calls = len(self.vvc.method_calls)
+
+        report = dict((usage.structure, usage) for usage in self.cache.memory_report())
+
+        self.assertEqual(report["VM names and UUIDs"].entries, 100)
+        self.assertEqual(report["VM managed objects"].entries, 100)
+        self.assertEqual(report["Name completion indexes"].entries, 100)
+        self.assertTrue(report["Name completion indexes"].bytes < report["VM managed objects"].bytes)
+        self.assertEqual(report["Inventory graph"].entries, 0)
+        self.assertEqual(len(self.vvc.method_calls), calls)
+
+    @staticmethod
+    def item_container(**properties):
+        item = ItemContainer()
+        for path, value in properties.items():
+            item.set_path_value(path.replace("__", "."), value)
+        return item
+
+    def mock_placed_items(self):
+        cluster, datastore, esx, vm = (vim.ClusterComputeResource("domain-c1"), vim.Datastore("datastore-1"),
+                                       vim.HostSystem("host-1"), vim.VirtualMachine("vm-1"))
+        self.vvc.get_restricted_view_on_vms.return_value = [
+            self.item_container(moref=vm, name="vm-1", config__uuid="vm-1-uuid", runtime__host=esx,
+                                resourcePool=None, datastore=[datastore], network=[])]
+        self.vvc.get_restricted_view_on_host_systems.return_value = [
+            self.item_container(moref=esx, name="esx-1", hardware__systemInfo__uuid="esx-1-uuid", parent=cluster)]
+        self.vvc.get_restricted_view_on_items.return_value = [self.item_container(moref=cluster, name="cluster-1"),
+                                                              self.item_container(moref=datastore, name="datastore-1")]
+
+    def test_should_build_inventory_graph_when_filling_with_relations(self):
+        self.mock_placed_items()
+
+        self.cache.fill(relations=True)
+
+        self.assertEqual(self.vvc.get_restricted_view_on_vms.call_args[0][0],
+                         ["name", "config.uuid", "runtime.host", "resourcePool", "datastore", "network"])
+        self.assertEqual(self.vvc.get_restricted_view_on_host_systems.call_args[0][0][-1], "parent")
+        self.assertEqual(self.cache.find_vm_names_on("cluster-1"), ["vm-1"])
+        self.assertEqual(self.cache.find_vm_names_on("datastore-1"), ["vm-1"])
+        self.assertEqual(self.cache.find_vm_names_on("esx-1"), ["vm-1"])
+        self.assertEqual(self.cache.find_esx_names_in("cluster-1"), ["esx-1"])
+        self.assertEqual(self.vvc.get_restricted_view_on_vms.call_count, 1)
+        self.assertFalse(self.vvc.get_restricted_view_on_managed_objects.called)
+
+    def test_should_retrieve_current_esx_of_vm_despite_inventory_graph(self):
+        self.mock_placed_items()
+        self.cache.fill(relations=True)
+        migrated_to = vim.HostSystem("host-2")
+        self.cache.esx_name_to_moref_mapping["esx-2"] = migrated_to
+        self.vvc.get_restricted_view_on_managed_objects.return_value = [
+            self.item_container(moref=vim.VirtualMachine("vm-1"), runtime__host=migrated_to)]
+
+        self.assertEqual(self.cache.get_esx_name_of_vm("vm-1"), "esx-2")
+
+    def test_should_build_inventory_graph_on_first_use(self):
+        self.mock_placed_items()
+        self.cache.fill()
+        self.assertEqual(self.cache.inventory_graph, None)
+
+        self.assertEqual(self.cache.find_esx_names_in("cluster-1"), ["esx-1"])
+        self.assertEqual(self.cache.find_vm_names_on("cluster-1"), ["vm-1"])
+
+        self.assertEqual(self.vvc.get_restricted_view_on_vms.call_count, 2)
+        self.assertRaises(NotFound, self.cache.find_esx_names_in, "datastore-1")
+
+    def test_should_retrieve_esx_of_vm_without_inventory_graph(self):
+        self.mock_placed_items()
+        self.cache.fill()
+        self.vvc.get_restricted_view_on_managed_objects.return_value = [
+            self.item_container(moref=vim.VirtualMachine("vm-1"), runtime__host=vim.HostSystem("host-1"))]
+
+        self.assertEqual(self.cache.get_esx_name_of_vm("vm-1"), "esx-1")
+        self.assertEqual(self.cache.inventory_graph, None)
+
+    def test_should_retrieve_name_of_esx_of_vm_that_is_not_cached(self):
+        vm, esx = vim.VirtualMachine("vm-1"), vim.HostSystem("host-outside-scope")
+        self.cache.vm_name_to_moref_mapping = {"vm-1": vm}
+        self.vvc.get_restricted_view_on_managed_objects.side_effect = [
+            [self.item_container(moref=vm, runtime__host=esx)],
+            [self.item_container(moref=esx, name="esx-outside-scope")]]
+
+        self.assertEqual(self.cache.get_esx_name_of_vm("vm-1"), "esx-outside-scope")
+        self.vvc.get_restricted_view_on_managed_objects.assert_called_with([esx], ["name"])
+
+    def test_should_not_retrieve_esx_name_of_vm_that_runs_on_none(self):
+        vm = vim.VirtualMachine("vm-1")
+        self.cache.vm_name_to_moref_mapping = {"vm-1": vm}
+        self.vvc.get_restricted_view_on_managed_objects.return_value = [
+            self.item_container(moref=vm, runtime__host=None)]
+
+        self.assertEqual(self.cache.get_esx_name_of_vm("vm-1"), None)
+        self.assertEqual(self.vvc.get_restricted_view_on_managed_objects.call_count, 1)
+
+    def mock_vm_with_custom_values(self, name, custom_values):
+        vm = Mock()
+        vm.name = name
+        vm.customValue = [Mock(key=key, value=value) for key, value in custom_values]
+        return vm
+
+    def test_should_index_custom_values_when_filling_with_custom_values(self):
+        self.vvc.get_custom_attributes_mapping.return_value = {1: "owner", 2: "team"}
+        self.vvc.get_restricted_view_on_vms.return_value = [
+            self.mock_vm_with_custom_values("vm-1", [(1, "payments"), (2, "checkout")]),
+            self.mock_vm_with_custom_values("vm-2", [(1, "payments"), (3, "unknown-key")]),
+            self.mock_vm_with_custom_values("vm-3", [(1, "search")])]
+        self.vvc.get_restricted_view_on_host_systems.return_value = []
+
+        self.cache.fill(custom_values=True)
+
+        self.vvc.get_restricted_view_on_vms.assert_called_once_with(["name", "config.uuid", "customValue"],
+                                                                    ["any-datacenter"])
+        self.assertEqual(self.cache.find_vm_names_by_custom_value("owner", "payments"), set(["vm-1", "vm-2"]))
+        self.assertEqual(self.cache.find_vm_names_by_custom_value("team", "checkout"), set(["vm-1"]))
+        self.assertEqual(self.cache.find_vm_names_by_custom_value("team", "other"), set())
+        self.assertEqual(self.vvc.get_restricted_view_on_vms.call_count, 1)
+
+    def test_should_not_fetch_custom_values_when_filling_by_default(self):
+        self.vvc.get_restricted_view_on_vms.return_value = []
+        self.vvc.get_restricted_view_on_host_systems.return_value = []
+
+        self.cache.fill()
+
+        self.vvc.get_restricted_view_on_vms.assert_called_once_with(["name", "config.uuid"], ["any-datacenter"])
+        self.assertEqual(self.cache.vm_custom_value_index, None)
+
+    def test_should_build_custom_value_index_on_first_use(self):
+        self.vvc.get_custom_attributes_mapping.return_value = {1: "owner"}
+        self.vvc.get_restricted_view_on_vms.return_value = [self.mock_vm_with_custom_values("vm-1", [(1, "payments")])]
+
+        self.assertEqual(self.cache.find_vm_names_by_custom_value("owner", "payments"), set(["vm-1"]))
+        self.assertEqual(self.cache.find_vm_names_by_custom_value("owner", "search"), set())
+
+        self.vvc.get_restricted_view_on_vms.assert_called_once_with(["name", "customValue"])
+
+    def test_should_raise_when_selecting_by_unknown_custom_attribute(self):
+        self.vvc.get_custom_attributes_mapping.return_value = {1: "owner"}
+
+        self.assertRaises(NotFound, self.cache.find_vm_names_by_custom_value, "team", "any-value")
+
+    def test_should_rebuild_custom_value_index_after_setting_custom_attribute(self):
+        self.vvc.get_custom_attributes_mapping.return_value = {1: "owner"}
+        self.cache.vm_custom_value_index = {"owner": {"payments": set(["vm-1"])}}
+
+        self.cache.set_custom_attribute("any-vim-item", "owner", "search")
+
+        self.assertEqual(self.cache.vm_custom_value_index, None)
+
+    def test_should_get_triggered_alarms_in_bulk_and_cache_alarm_names(self):
+        cpu_alarm, memory_alarm = Mock(), Mock()
+        vm_item, esx_item = Mock(moref="vm-moref"), Mock(moref="esx-moref")
+        vm_item.triggeredAlarmState = [Mock(alarm=cpu_alarm, overallStatus="red", time="any-time", acknowledged=False)]
+        esx_item.triggeredAlarmState = [Mock(alarm=memory_alarm, overallStatus="yellow", time="any-time", acknowledged=True)]
+        cpu_alarm_item, memory_alarm_item = Mock(moref=cpu_alarm), Mock(moref=memory_alarm)
+        cpu_alarm_item.info.name = "cpu usage"
+        memory_alarm_item.info.name = "memory usage"
+        self.vvc.get_restricted_view_on_managed_objects.side_effect = [[vm_item, esx_item],
+                                                                       [cpu_alarm_item, memory_alarm_item],
+                                                                       [vm_item],
+                                                                       []]
+
+        triggered_alarms = self.cache.get_triggered_alarms(["vm-moref", "esx-moref"])
+        self.cache.get_triggered_alarms(["vm-moref"])
+
+        self.assertEqual(triggered_alarms, {"vm-moref": [TriggeredAlarm("cpu usage", "red", "any-time", False)],
+                                            "esx-moref": [TriggeredAlarm("memory usage", "yellow", "any-time", True)]})
+        calls = self.vvc.get_restricted_view_on_managed_objects.call_args_list
+        self.assertEqual(calls[0], call(["vm-moref", "esx-moref"], ["triggeredAlarmState"]))
+        self.assertEqual(calls[1], call(set([cpu_alarm, memory_alarm]), ["info.name"]))
+        self.assertEqual(calls[3], call(set(), ["info.name"]))
+
+    @patch("isphere.connection.read_events")
+    def test_should_read_events_from_event_manager(self, read_events):
+        events = self.cache.read_events(["vm-moref"], "any-begin", "any-end")
+
+        self.assertEqual(events, read_events.return_value)
+        self.vvc.get_service.assert_called_with("eventManager")
+        read_events.assert_called_with(self.vvc.get_service.return_value, ["vm-moref"], "any-begin", "any-end", 1000,
+                                       containers=self.vvc.scope)
+
+    @patch("isphere.connection.query_performance")
+    @patch("isphere.connection.PerformanceCounters")
+    def test_should_query_performance_with_cached_counter_table(self, performance_counters, query_performance):
+        result = self.cache.query_performance(["vm-moref"], ["cpu.ready.summation"], samples=3)
+        self.cache.query_performance(["esx-moref"], ["cpu.usage.average"])
+
+        self.assertEqual(result, query_performance.return_value)
+        performance_counters.assert_called_once_with(self.vvc.get_service.return_value.perfCounter)
+        self.vvc.get_service.assert_called_with("perfManager")
+        self.assertEqual(query_performance.call_args_list[0],
+                         call(self.vvc.get_service.return_value, performance_counters.return_value,
+                              ["vm-moref"], ["cpu.ready.summation"], samples=3, batch_size=64))
+
+    def fill_esx_dns_index(self, esx_dns_names):
+        self.cache.esx_dns_index = self.cache._build_esx_dns_index(esx_dns_names)
+
+    def test_should_resolve_esx_by_name_fqdn_and_short_name(self):
+        self.fill_esx_dns_index({"esx-1.domain": ("esx-1", "domain"),
+                                 "esx-2": ("esx-2", "other.domain")})
+
+        self.assertEqual(self.cache.resolve_esx_name("esx-1.domain"), "esx-1.domain")
+        self.assertEqual(self.cache.resolve_esx_name("ESX-1"), "esx-1.domain")
+        self.assertEqual(self.cache.resolve_esx_name("esx-2.other.domain"), "esx-2")
+        self.assertEqual(self.cache.resolve_esx_name(" esx-2 "), "esx-2")
+
+    def test_should_not_resolve_ambiguous_short_names(self):
+        self.fill_esx_dns_index({"esx-1.domain": ("esx-1", "domain"),
+                                 "esx-1.other.domain": ("esx-1", "other.domain")})
+
+        self.assertRaises(NotFound, self.cache.resolve_esx_name, "esx-1")
+        self.assertEqual(self.cache.resolve_esx_name("esx-1.other.domain"), "esx-1.other.domain")
+
+    def test_should_resolve_cached_name_that_is_short_name_of_other_esx(self):
+        self.fill_esx_dns_index({"esx-1": ("esx-1", "domain"),
+                                 "esx-1.other-domain": ("esx-1", "other-domain")})
+
+        self.assertEqual(self.cache.resolve_esx_name("esx-1"), "esx-1")
+        self.assertEqual(self.cache.resolve_esx_name("ESX-1.other-domain"), "esx-1.other-domain")
+        self.assertEqual(self.cache.resolve_esx_name("esx-1.domain"), "esx-1")
+
+    def test_should_resolve_esx_without_dns_config(self):
+        self.fill_esx_dns_index({"esx-1.domain": (None, None)})
+
+        self.assertEqual(self.cache.resolve_esx_name("esx-1"), "esx-1.domain")
+
+    def test_should_suggest_similar_esx_names(self):
+        self.fill_esx_dns_index({"esx-1.domain": ("esx-1", "domain"),
+                                 "db-1.domain": ("db-1", "domain")})
+
+        self.assertEqual(self.cache.suggest_esx_names("esx-l.domain")[0], "esx-1.domain")
+        self.assertEqual(self.cache.suggest_esx_names("something-else"), [])
+
+    def test_should_find_esx_host_without_asking_the_server(self):
+        self.fill_esx_dns_index({"esx-1.domain": ("esx-1", "domain")})
+        self.cache.esx_name_to_moref_mapping = {"esx-1.domain": "any-moref"}
+
+        self.assertEqual(self.cache.find_esx_host("esx-1"), "any-moref")
+        self.assertFalse(self.vvc.find_by_dns_name.called)
+
+    def test_should_get_current_esx_hosts_in_one_call(self):
+        self.cache.vm_name_to_moref_mapping = {"vm-1": "vm-1-moref", "vm-2": "vm-2-moref"}
+        vm_1 = Mock(moref="vm-1-moref")
+        vm_1.runtime.host = "esx-1-moref"
+        self.vvc.get_restricted_view_on_managed_objects.return_value = [vm_1]
+
+        current_esx_hosts = self.cache.get_current_esx_hosts(["vm-1"])
+
+        self.assertEqual(current_esx_hosts, {"vm-1": "esx-1-moref"})
+        self.assertEqual(list(self.vvc.get_restricted_view_on_managed_objects.call_args[0][0]), ["vm-1-moref"])
 
     def test_should_passthrough_find_by_dns_name_calls(self):
         mock_item = Mock()
@@ -59,7 +446,16 @@ class CachingVSphereTests(TestCase):
 
         actual_vm = self.cache.retrieve_vm("any-vm-name")
         self.assertEqual(mock_vm, actual_vm)
-        self.vvc.get_vm_by_uuid.assert_called_with("any-uuid")
+        self.vvc.get_vm_by_uuid.assert_called_with("any-uuid", name="any-vm-name")
+
+    def test_should_retrieve_esx_by_uuid(self):
+        mock_esx = Mock()
+        self.vvc.get_host_system_by_uuid.return_value = mock_esx
+        self.cache.esx_name_to_uuid_mapping = {"any-esx-name": "any-uuid"}
+
+        actual_esx = self.cache.retrieve_esx("any-esx-name")
+        self.assertEqual(mock_esx, actual_esx)
+        self.vvc.get_host_system_by_uuid.assert_called_with("any-uuid", name="any-esx-name")
 
     def test_should_passthrough_find_by_dns_name_calls_when_searching_for_vms(self):
         mock_item = Mock()
@@ -70,10 +466,63 @@ class CachingVSphereTests(TestCase):
         self.assertEqual(actual_item, mock_item)
         self.vvc.find_by_dns_name.assert_called_with("any.dns.name", True)
 
-    def test_should_passthrough_set_custom_attribute(self):
+    def test_should_set_custom_attribute_by_cached_key(self):
+        self.vvc.get_custom_attributes_mapping.return_value = {1: "other-name", 2: "any-name"}
+
         self.cache.set_custom_attribute("any-vim-item", "any-name", "any-value")
+        self.cache.set_custom_attribute("other-vim-item", "any-name", "other-value")
+
+        self.assertEqual(self.vvc.set_custom_attribute_by_key.call_args_list,
+                         [call("any-vim-item", 2, "any-value"), call("other-vim-item", 2, "other-value")])
+        self.assertEqual(self.vvc.get_custom_attributes_mapping.call_count, 1)
+
+    def test_should_index_custom_attribute_keys_by_name(self):
+        self.vvc.get_custom_attributes_mapping.return_value = {1: "other-name", 2: "any-name"}
+
+        self.assertEqual(self.cache.get_custom_attribute_keys(), {"other-name": 1, "any-name": 2})
+        self.assertEqual(self.cache.find_custom_attribute_key("any-name"), 2)
+
+    def test_should_raise_when_custom_attribute_name_is_unknown(self):
+        self.vvc.get_custom_attributes_mapping.return_value = {1: "other-name"}
+
+        self.assertRaises(NotFound, self.cache.find_custom_attribute_key, "any-name")
+
+    def test_should_set_custom_attributes_on_many_items(self):
+        self.vvc.get_custom_attributes_mapping.return_value = {2: "any-name"}
+        error = Exception("any-problem")
+        self.vvc.set_custom_attribute_by_key.side_effect = lambda item, key, value: item == "item-2" and self.fail_with(error)
+
+        results = sorted(self.cache.set_custom_attributes(["item-1", "item-2", "item-3"], "any-name", "any-value",
+                                                          max_concurrency=2))
 
-        self.cache.vvc.set_custom_attribute.assert_called_with('any-vim-item', 'any-name', 'any-value')
+        self.assertEqual(results, [("item-1", None), ("item-2", error), ("item-3", None)])
+        self.assertEqual(sorted(self.vvc.set_custom_attribute_by_key.call_args_list),
+                         [call("item-1", 2, "any-value"), call("item-2", 2, "any-value"), call("item-3", 2, "any-value")])
+
+    @staticmethod
+    def fail_with(error):
+        raise error
+
+    def test_should_report_no_soap_traffic_when_not_connected(self):
+        self.cache._connection.vvc = None
+
+        statistics = self.cache.statistics()
+
+        self.assertEqual(statistics.soap.calls, 0)
+        self.assertFalse(self.cache._connection.ensure_established.called)
+
+    def test_should_report_soap_traffic_and_cache_hits(self):
+        self.cache._connection.vvc = self.vvc
+        self.cache.vm_name_to_uuid_mapping = {"any-vm-name": "any-uuid"}
+        statistics_before = self.cache.statistics()
+
+        self.cache.retrieve_vm("any-vm-name")
+        self.cache.retrieve_vm("any-vm-name")
+        statistics_after = self.cache.statistics()
+
+        self.assertEqual(statistics_after.soap, self.vvc.soap_statistics.snapshot.return_value)
+        self.assertEqual(statistics_after.cache_hits - statistics_before.cache_hits, 1)
+        self.assertEqual(statistics_after.cache_misses - statistics_before.cache_misses, 1)
 
 
 class ConnectionTests(TestCase):
@@ -101,6 +550,16 @@ class ConnectionTests(TestCase):
         vvc.assert_called_with("any-hostname.domain")
         vvc.return_value.connect.assert_called_with("any-user-name", None)
 
+    @patch("isphere.connection.killable_input")
+    @patch("isphere.connection.VVC")
+    def test_should_restrict_connection_to_scope(self, vvc, _):
+        connection = AutoEstablishingConnection("any-hostname", "any-user-name", "any-password", ["dc-1"])
+
+        connection._connect()
+
+        vvc.return_value.set_scope.assert_called_with(["dc-1"])
+        self.assertEqual(connection.vvc, vvc.return_value)
+
     @patch("isphere.connection.AutoEstablishingConnection._connect")
     def test_should_use_existing_connection(self, connect):
         connection = AutoEstablishingConnection(None, None, None)
@@ -200,6 +659,21 @@ class MemoizingTests(TestCase):
                          [call('arg1', any_kwarg='any-kwarg'),
                           call('arg1', any_kwarg='any-kwarg-other-value')])
 
+    def test_should_count_cache_hits_and_misses(self):
+        self.memoized_mock_function("arg1")
+        self.memoized_mock_function("arg1")
+        self.memoized_mock_function("arg2")
+
+        self.assertEqual(self.memoized_mock_function.cache_hits, 1)
+        self.assertEqual(self.memoized_mock_function.cache_misses, 2)
+
+    def test_should_recompute_value_when_cache_was_replaced(self):
+        self.memoized_mock_function("arg1")
+        self.memoized_mock_function.cached_calls = {}
+        self.memoized_mock_function("arg1")
+
+        self.assertEqual(self.mock_function.call_args_list, [call("arg1"), call("arg1")])
+
     def test_should_preserve_name_when_decorating_function(self):
         self.assertEqual(self.memoized_mock_function.__name__, "any-name")
 
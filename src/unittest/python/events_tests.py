@@ -0,0 +1,123 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+from datetime import datetime
+from unittest import TestCase
+
+from mock import Mock, call
+from pyVmomi import vim
+
+from isphere.events import involved_entities, read_events
+
+
+def mock_event(vm=None, host=None, created_time=None, key=None):
+    event = Mock(spec=["vm", "host", "fullFormattedMessage", "createdTime", "key"])
+    event.vm = Mock(vm=vm) if vm else None
+    event.host = Mock(host=host) if host else None
+    event.createdTime = created_time or datetime(2015, 1, 1)
+    event.key = key
+    return event
+
+
+VM_1 = vim.VirtualMachine("vm-1")
+VM_2 = vim.VirtualMachine("vm-2")
+HOST_1 = vim.HostSystem("host-1")
+
+
+class ReadEventsTests(TestCase):
+
+    def setUp(self):
+        self.event_manager = Mock()
+        self.collector = self.event_manager.CreateCollectorForEvents.return_value
+
+    def test_should_read_events_of_one_entity_in_pages(self):
+        events = [mock_event(vm=VM_1, key=key) for key in range(5)]
+        self.collector.ReadNextEvents.side_effect = [events[:2], events[2:4], events[4:], []]
+        begin_time, end_time = datetime(2015, 1, 1), datetime(2015, 1, 2)
+
+        actual_events = list(read_events(self.event_manager, [VM_1], begin_time, end_time, page_size=2))
+
+        self.assertEqual(actual_events, events)
+        filter_spec = self.event_manager.CreateCollectorForEvents.call_args[0][0]
+        self.assertEqual(filter_spec.time.beginTime, begin_time)
+        self.assertEqual(filter_spec.time.endTime, end_time)
+        self.assertEqual(filter_spec.entity.recursion, "self")
+        self.collector.RewindCollector.assert_called_with()
+        self.assertEqual(self.collector.ReadNextEvents.call_args_list, [call(2)] * 4)
+        self.collector.DestroyCollector.assert_called_with()
+
+    def mock_collectors(self, events_by_entity):
+        collectors = {}
+        for entity, events in events_by_entity.items():
+            collectors[entity] = Mock()
+            collectors[entity].ReadNextEvents.side_effect = [events, []]
+        self.event_manager.CreateCollectorForEvents.side_effect = lambda filter_spec: collectors[filter_spec.entity.entity]
+        return collectors
+
+    def test_should_filter_events_of_several_entities_on_the_server_and_merge_them_oldest_first(self):
+        vm_1_events = [mock_event(vm=VM_1, created_time=datetime(2015, 1, day), key=day) for day in (1, 3)]
+        host_1_events = [mock_event(host=HOST_1, created_time=datetime(2015, 1, 2), key=2),
+                         vm_1_events[1]]
+        collectors = self.mock_collectors({VM_1: vm_1_events, HOST_1: host_1_events})
+
+        actual_events = list(read_events(self.event_manager, [VM_1, HOST_1]))
+
+        self.assertEqual(actual_events, [vm_1_events[0], host_1_events[0], vm_1_events[1]])
+        filter_specs = [call_args[0][0] for call_args in self.event_manager.CreateCollectorForEvents.call_args_list]
+        self.assertEqual(set(filter_spec.entity.entity for filter_spec in filter_specs), set([HOST_1, VM_1]))
+        self.assertEqual([filter_spec.entity.recursion for filter_spec in filter_specs], ["self", "self"])
+        for collector in collectors.values():
+            collector.DestroyCollector.assert_called_with()
+
+    def test_should_read_containers_and_filter_on_client_with_more_entities_than_collectors(self):
+        datacenter = vim.Datacenter("datacenter-1")
+        events = [mock_event(vm=VM_2, created_time=datetime(2015, 1, 1), key=1),
+                  mock_event(vm=vim.VirtualMachine("vm-3"), created_time=datetime(2015, 1, 2), key=2),
+                  mock_event(vm=VM_1, host=HOST_1, created_time=datetime(2015, 1, 3), key=3),
+                  mock_event(vm=VM_2, created_time=datetime(2015, 1, 4), key=4)]
+        collectors = self.mock_collectors({datacenter: events})
+
+        actual_events = list(read_events(self.event_manager, [VM_1, VM_2], max_collectors=1, containers=[datacenter]))
+
+        self.assertEqual(actual_events, [events[0], events[2], events[3]])
+        filter_spec = self.event_manager.CreateCollectorForEvents.call_args[0][0]
+        self.assertEqual(filter_spec.entity.recursion, "all")
+        self.assertEqual(self.event_manager.CreateCollectorForEvents.call_count, 1)
+        collectors[datacenter].DestroyCollector.assert_called_with()
+
+    def test_should_read_whole_vcenter_with_more_entities_than_collectors_without_containers(self):
+        self.collector.ReadNextEvents.side_effect = [[mock_event(vm=VM_1, key=1), mock_event(host=HOST_1, key=2)], []]
+
+        actual_events = list(read_events(self.event_manager, [VM_1, VM_2], max_collectors=1))
+
+        self.assertEqual(len(actual_events), 1)
+        filter_spec = self.event_manager.CreateCollectorForEvents.call_args[0][0]
+        self.assertEqual(filter_spec.entity, None)
+
+    def test_should_read_only_one_page_at_a_time(self):
+        self.collector.ReadNextEvents.side_effect = [[mock_event(vm=VM_1)], [mock_event(vm=VM_1)], []]
+
+        events = read_events(self.event_manager, [VM_1])
+        next(events)
+
+        self.assertEqual(self.collector.ReadNextEvents.call_count, 1)
+
+    def test_should_destroy_collector_when_reading_is_stopped(self):
+        self.collector.ReadNextEvents.return_value = [mock_event(vm=VM_1)]
+
+        events = read_events(self.event_manager, [VM_1])
+        next(events)
+        events.close()
+
+        self.collector.DestroyCollector.assert_called_with()
+
+    def test_should_not_create_collector_without_entities(self):
+        self.assertEqual(list(read_events(self.event_manager, [])), [])
+
+        self.assertFalse(self.event_manager.CreateCollectorForEvents.called)
+
+    def test_should_list_involved_entities(self):
+        self.assertEqual(involved_entities(mock_event(vm=VM_1, host="host-1")), [VM_1, "host-1"])
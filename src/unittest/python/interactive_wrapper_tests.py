@@ -5,16 +5,20 @@
 #
 
 from unittest import TestCase
-from mock import Mock, patch
+from mock import Mock, call, patch
+from pyVmomi import vim
 
 from isphere.interactive_wrapper import (
     VM,
     VVC,
     ESX,
     DVS,
+    Datastore,
+    CachedItem,
     get_all_vms_in_folder,
     NotFound,
-    ItemContainer
+    ItemContainer,
+    build_property_collector_specs
 )
 
 
@@ -56,6 +60,138 @@ class VMTests(TestCase):
         self.assertEqual(actual, foo_mock_1)
 
 
+class CachedItemTests(TestCase):
+
+    def setUp(self):
+        self.raw_item = Mock()
+        self.raw_item.name = "any-name"
+        self.raw_item.config = "any-config"
+
+    @patch("isphere.interactive_wrapper.time")
+    def test_should_serve_property_from_snapshot_when_fresh(self, time):
+        time.time.return_value = 100
+        item = CachedItem(self.raw_item, ttl=5)
+        self.assertEqual(item.config, "any-config")
+
+        self.raw_item.config = "any-changed-config"
+        time.time.return_value = 104
+
+        self.assertEqual(item.config, "any-config")
+
+    @patch("isphere.interactive_wrapper.time")
+    def test_should_fetch_property_again_when_snapshot_expired(self, time):
+        time.time.return_value = 100
+        item = CachedItem(self.raw_item, ttl=5)
+        self.assertEqual(item.config, "any-config")
+
+        self.raw_item.config = "any-changed-config"
+        time.time.return_value = 105
+
+        self.assertEqual(item.config, "any-changed-config")
+
+    def test_should_never_expire_snapshot_without_ttl(self):
+        item = CachedItem(self.raw_item, ttl=None)
+        self.assertEqual(item.config, "any-config")
+
+        self.raw_item.config = "any-changed-config"
+
+        self.assertEqual(item.config, "any-config")
+
+    def test_should_fetch_property_again_after_refresh(self):
+        item = CachedItem(self.raw_item, ttl=None)
+        self.assertEqual(item.config, "any-config")
+
+        self.raw_item.config = "any-changed-config"
+        item.refresh()
+
+        self.assertEqual(item.config, "any-changed-config")
+
+    def test_should_only_drop_given_properties_on_refresh(self):
+        self.raw_item.runtime = "any-runtime"
+        item = CachedItem(self.raw_item, ttl=None)
+        self.assertEqual(item.config, "any-config")
+        self.assertEqual(item.runtime, "any-runtime")
+
+        self.raw_item.config = "any-changed-config"
+        self.raw_item.runtime = "any-changed-runtime"
+        item.refresh("config")
+
+        self.assertEqual(item.config, "any-changed-config")
+        self.assertEqual(item.runtime, "any-runtime")
+
+    def test_should_not_cache_when_ttl_is_zero(self):
+        item = CachedItem(self.raw_item, ttl=0)
+        self.assertEqual(item.config, "any-config")
+
+        self.raw_item.config = "any-changed-config"
+
+        self.assertEqual(item.config, "any-changed-config")
+
+    def test_should_serve_hydrated_properties_without_fetching(self):
+        raw_item = object()
+        item = CachedItem(raw_item, properties={"name": "hydrated-name",
+                                                "config.uuid": "hydrated-uuid"})
+
+        self.assertEqual(item.name, "hydrated-name")
+        self.assertEqual(item.get_property("config.uuid"), "hydrated-uuid")
+
+    def test_should_serve_hydrated_nested_properties_by_attribute_access(self):
+        raw_item = object()
+        item = CachedItem(raw_item, name="any-name", properties={"runtime.powerState": "poweredOn",
+                                                                 "summary.config.vmPathName": "/any/path"})
+
+        self.assertEqual(item.runtime.powerState, "poweredOn")
+        self.assertEqual(item.summary.config.vmPathName, "/any/path")
+
+    def test_should_fetch_nested_properties_that_were_not_hydrated(self):
+        self.raw_item.runtime.host = "any-host"
+        item = CachedItem(self.raw_item, properties={"runtime.powerState": "poweredOn"})
+
+        self.assertEqual(item.runtime.host, "any-host")
+        self.assertEqual(item.runtime.powerState, "poweredOn")
+
+    def test_should_fetch_partly_hydrated_property_when_used_as_a_whole(self):
+        self.raw_item.runtime = Mock(host="any-host", powerState="poweredOff")
+        item = CachedItem(self.raw_item, properties={"runtime.host": "hydrated-host"})
+
+        runtime = item.runtime
+
+        self.assertEqual(runtime.host, "hydrated-host")
+        self.assertEqual(repr(runtime), repr(self.raw_item.runtime))
+        self.assertEqual(str(runtime), str(self.raw_item.runtime))
+        self.assertEqual(runtime, self.raw_item.runtime)
+        self.assertEqual(runtime.powerState, "poweredOff")
+
+    def test_should_keep_hydrated_but_not_read_properties_by_default(self):
+        item = CachedItem(self.raw_item, properties={"runtime.powerState": "poweredOn"})
+        self.assertEqual(item.config, "any-config")
+
+        self.raw_item.config = "any-changed-config"
+        self.raw_item.runtime.powerState = "poweredOff"
+
+        self.assertEqual(item.config, "any-changed-config")
+        self.assertEqual(item.runtime.powerState, "poweredOn")
+        item.refresh()
+        self.assertEqual(item.runtime.powerState, "poweredOff")
+
+    def test_should_not_fetch_name_when_given(self):
+        raw_item = object()
+        item = CachedItem(raw_item, name="any-given-name")
+
+        self.assertEqual(item.name, "any-given-name")
+
+    def test_should_fetch_name_when_not_given(self):
+        item = CachedItem(self.raw_item)
+
+        self.assertEqual(item.name, "any-name")
+
+    def test_should_resolve_nested_property_paths(self):
+        self.raw_item.summary.config.vmPathName = "/any/path"
+        item = CachedItem(self.raw_item)
+
+        self.assertEqual(item.get_property("summary.config.vmPathName"), "/any/path")
+
+
 class ESXTests(TestCase):
 
     def setUp(self):
@@ -148,7 +284,8 @@ class VVCTests(TestCase):
 
     def setUp(self):
         self.vvc_mock = Mock(VVC, service_instance=Mock())
-        self.mock_search = self.vvc_mock.service_instance.RetrieveContent.return_value.searchIndex.FindByDnsName
+        self.vvc_mock.views_for.side_effect = lambda types, containers=None: [self.vvc_mock.view_for(types)]
+        self.mock_search = self.vvc_mock.get_service.return_value.FindByDnsName
 
     def test_should_return_item_when_found_by_searching(self):
         mock_item = Mock()
@@ -157,6 +294,8 @@ class VVCTests(TestCase):
         actual_item = VVC.find_by_dns_name(self.vvc_mock, "any.dns.name")
 
         self.assertEqual(actual_item, mock_item)
+        self.vvc_mock.get_service.assert_called_with("searchIndex")
+        self.assertFalse(self.vvc_mock.service_instance.RetrieveContent.called)
 
     def test_should_raise_not_found_when_searching_fails(self):
         self.mock_search.return_value = None
@@ -210,6 +349,14 @@ class VVCTests(TestCase):
         self.assertEqual(mock_vm, actual_vm.raw_vm)
         mock_find_by_uuid.assert_called_with(vmSearch=True, uuid='any-uuid')
 
+    def test_should_use_given_name_when_getting_vm_by_uuid(self):
+        mock_vm = Mock()
+        self.vvc_mock.get_service.return_value.FindByUuid.return_value = mock_vm
+
+        actual_vm = VVC.get_vm_by_uuid(self.vvc_mock, "any-uuid", name="any-name")
+
+        self.assertEqual("any-name", actual_vm.name)
+
     def test_should_get_host_system_by_uuid(self):
         mock_esx = Mock()
         mock_find_by_uuid = self.vvc_mock.get_service.return_value.FindByUuid
@@ -231,7 +378,7 @@ class VVCTests(TestCase):
         VVC.get_restricted_view_on_items(self.vvc_mock, ["property_1", "property_2"], "any-type")
 
         self.vvc_mock.view_for.assert_called_with("any-type")
-        build_property_collector_specs.assert_called_with(self.vvc_mock.view_for.return_value, ["property_1", "property_2"])
+        build_property_collector_specs.assert_called_with([self.vvc_mock.view_for.return_value], ["property_1", "property_2"])
 
     @patch("isphere.interactive_wrapper.build_property_collector_specs")
     def test_should_retrieve_contents_with_collector_specs(self, build_property_collector_specs):
@@ -259,6 +406,25 @@ class VVCTests(TestCase):
         self.assertEqual("1", actual_item.property_1)
         self.assertEqual("2", actual_item.property_2)
 
+    def test_should_retrieve_restricted_view_on_managed_objects_in_one_call(self):
+        vm_1, vm_2 = vim.VirtualMachine("vm-1"), vim.VirtualMachine("vm-2")
+        host = Mock()
+        host.name = "runtime.host"
+        host.val = "any-host"
+        self.vvc_mock.get_service.return_value.RetrieveContents.return_value = [Mock(obj=vm_1, propSet=[host])]
+
+        actual_items = VVC.get_restricted_view_on_managed_objects(self.vvc_mock, [vm_1, vm_2], ["runtime.host"])
+
+        self.assertEqual(actual_items[0].moref, vm_1)
+        self.assertEqual(actual_items[0].runtime.host, "any-host")
+        filter_spec = self.vvc_mock.get_service.return_value.RetrieveContents.call_args[0][0][0]
+        self.assertEqual([object_spec.obj for object_spec in filter_spec.objectSet], [vm_1, vm_2])
+        self.assertEqual(filter_spec.propSet[0].pathSet, ["runtime.host"])
+
+    def test_should_not_retrieve_restricted_view_on_no_managed_objects(self):
+        self.assertEqual(VVC.get_restricted_view_on_managed_objects(self.vvc_mock, [], ["runtime.host"]), [])
+        self.assertFalse(self.vvc_mock.get_service.called)
+
     @patch("isphere.interactive_wrapper.build_property_collector_specs")
     def test_should_return_restricted_view_on_several_items(self, _):
         property_1 = Mock()
@@ -305,6 +471,25 @@ class VVCTests(TestCase):
         actual_item = actual_items[0]
         self.assertEqual("any-value", actual_item.parent.child)
 
+    @patch("isphere.interactive_wrapper.build_property_collector_specs")
+    def test_should_return_items_hydrated_with_properties(self, build_property_collector_specs):
+        name_property = Mock(val="any-name")
+        name_property.name = "name"
+        config_property = Mock(val="any-config")
+        config_property.name = "config"
+        raw_vm = object()
+        self.vvc_mock.get_service.return_value.RetrieveContents.return_value = [
+            Mock(obj=raw_vm, propSet=[name_property, config_property])]
+        self.vvc_mock.property_ttl = None
+
+        actual_items = VVC.get_items_with_properties(self.vvc_mock, ["config"], "any-type", VM)
+
+        build_property_collector_specs.assert_called_with([self.vvc_mock.view_for.return_value], ["name", "config"])
+        self.assertEqual(1, len(actual_items))
+        self.assertEqual(raw_vm, actual_items[0].raw_vm)
+        self.assertEqual("any-name", actual_items[0].name)
+        self.assertEqual("any-config", actual_items[0].config)
+
     def test_should_set_custom_attribute(self):
         self.vvc_mock.get_custom_attributes_mapping.return_value = {1: "foo-attribute",
                                                                     2: "any-attribute-name"}
@@ -314,6 +499,14 @@ class VVCTests(TestCase):
         custom_fields_manager = self.vvc_mock.get_service.return_value
         custom_fields_manager.SetField.assert_called_with(key=2, value='any-target-value', entity='any-vim-object')
 
+    def test_should_set_custom_attribute_by_key(self):
+        VVC.set_custom_attribute_by_key(self.vvc_mock, "any-vim-object", 2, "any-target-value")
+
+        self.vvc_mock.get_service.assert_called_with("customFieldsManager")
+        custom_fields_manager = self.vvc_mock.get_service.return_value
+        custom_fields_manager.SetField.assert_called_with(key=2, value='any-target-value', entity='any-vim-object')
+        self.assertFalse(self.vvc_mock.get_custom_attributes_mapping.called)
+
     def test_should_raise_when_setting_custom_attribute_to_inexisting_name(self):
         self.vvc_mock.get_custom_attributes_mapping.return_value = {1: "foo-attribute",
                                                                     2: "bar-attribute"}
@@ -322,6 +515,179 @@ class VVCTests(TestCase):
             NotFound,
             VVC.set_custom_attribute, self.vvc_mock, "any-vim-object", "name-not-in-mapping-values", "any-target-value")
 
+    def mock_retrieve_result(self, names, token=None):
+        self.vvc_mock.property_ttl = 5
+        objects = []
+        for name in names:
+            name_property = Mock(val=name)
+            name_property.name = "name"
+            objects.append(Mock(obj="{0}-moref".format(name), propSet=[name_property]))
+        return Mock(token=token, objects=objects)
+
+    @patch("isphere.interactive_wrapper.build_property_collector_specs")
+    def test_should_iterate_items_page_by_page(self, build_property_collector_specs):
+        property_collector = self.vvc_mock.get_service.return_value
+        property_collector.RetrievePropertiesEx.return_value = self.mock_retrieve_result(["vm-1", "vm-2"], "token-1")
+        property_collector.ContinueRetrievePropertiesEx.return_value = self.mock_retrieve_result(["vm-3"])
+
+        items = VVC.iterate_items_with_properties(self.vvc_mock, ["config.uuid"], "any-type", VM, page_size=2)
+        first_item = next(items)
+
+        self.assertFalse(property_collector.ContinueRetrievePropertiesEx.called)
+        self.assertEqual([first_item.name] + [item.name for item in items], ["vm-1", "vm-2", "vm-3"])
+        self.assertEqual(first_item.raw_vm, "vm-1-moref")
+        build_property_collector_specs.assert_called_with([self.vvc_mock.view_for.return_value], ["name", "config.uuid"])
+        self.assertEqual(property_collector.RetrievePropertiesEx.call_args[0][1].maxObjects, 2)
+        property_collector.ContinueRetrievePropertiesEx.assert_called_with("token-1")
+        self.assertFalse(property_collector.CancelRetrievePropertiesEx.called)
+        self.vvc_mock.view_for.return_value.Destroy.assert_called_with()
+
+    @patch("isphere.interactive_wrapper.build_property_collector_specs")
+    def test_should_cancel_retrieval_when_iteration_stops_early(self, _):
+        property_collector = self.vvc_mock.get_service.return_value
+        property_collector.RetrievePropertiesEx.return_value = self.mock_retrieve_result(["esx-1", "esx-2"], "token-1")
+
+        items = VVC.iterate_items_with_properties(self.vvc_mock, [], "any-type", ESX)
+        next(items)
+        items.close()
+
+        property_collector.CancelRetrievePropertiesEx.assert_called_with("token-1")
+        self.vvc_mock.view_for.return_value.Destroy.assert_called_with()
+
+    @patch("isphere.interactive_wrapper.build_property_collector_specs")
+    def test_should_iterate_no_items_of_empty_view(self, _):
+        self.vvc_mock.get_service.return_value.RetrievePropertiesEx.return_value = None
+
+        self.assertEqual(list(VVC.iterate_items_with_properties(self.vvc_mock, [], "any-type", DVS)), [])
+
+    def test_should_get_all_items_with_their_names_in_pages(self):
+        self.assertEqual(VVC.get_all_vms(self.vvc_mock), self.vvc_mock.iterate_items_with_properties.return_value)
+        self.vvc_mock.iterate_items_with_properties.assert_called_with(["name"], [vim.VirtualMachine], VM)
+
+        VVC.get_all_esx(self.vvc_mock)
+        self.vvc_mock.iterate_items_with_properties.assert_called_with(["name"], [vim.HostSystem], ESX)
+
+        VVC.get_all_dvs(self.vvc_mock, ["any-datacenter"])
+        self.vvc_mock.iterate_items_with_properties.assert_called_with(["name"], [vim.VmwareDistributedVirtualSwitch], DVS,
+                                                                       containers=["any-datacenter"])
+
+        VVC.get_all_datastores(self.vvc_mock)
+        self.vvc_mock.iterate_items_with_properties.assert_called_with(["name"], [vim.Datastore], Datastore,
+                                                                       containers=None)
+
+    def mock_scope_containers(self, names):
+        containers = []
+        for name in names:
+            container = Mock(moref="{0}-moref".format(name))
+            container.name = name
+            containers.append(container)
+        self.vvc_mock.get_restricted_view_on_items.return_value = containers
+
+    def test_should_find_scope_containers_by_name_with_one_call(self):
+        self.mock_scope_containers(["dc-1", "dc-2", "cluster-1"])
+
+        containers = VVC.find_scope_containers(self.vvc_mock, ["cluster-1", "dc-1"])
+
+        self.assertEqual(containers, ["cluster-1-moref", "dc-1-moref"])
+        self.vvc_mock.get_restricted_view_on_items.assert_called_once_with(
+            ["name"], [vim.Datacenter, vim.ClusterComputeResource, vim.Folder])
+
+    def test_should_find_scope_containers_by_inventory_path(self):
+        cluster = vim.ClusterComputeResource("domain-c7")
+        find_by_inventory_path = self.vvc_mock.get_service.return_value.FindByInventoryPath
+        find_by_inventory_path.return_value = cluster
+
+        containers = VVC.find_scope_containers(self.vvc_mock, ["dc-1/host/cluster-1"])
+
+        self.assertEqual(containers, [cluster])
+        find_by_inventory_path.assert_called_with(inventoryPath="dc-1/host/cluster-1")
+        self.assertFalse(self.vvc_mock.get_restricted_view_on_items.called)
+
+    def test_should_raise_when_inventory_path_is_no_scope_container(self):
+        self.vvc_mock.get_service.return_value.FindByInventoryPath.return_value = vim.VirtualMachine("vm-1")
+
+        self.assertRaises(NotFound, VVC.find_scope_containers, self.vvc_mock, ["dc-1/vm/vm-1"])
+
+    def test_should_raise_when_scope_container_name_is_unknown_or_ambiguous(self):
+        self.mock_scope_containers(["dc-1", "folder-1", "folder-1"])
+
+        self.assertRaises(NotFound, VVC.find_scope_containers, self.vvc_mock, ["dc-2"])
+        self.assertRaises(NotFound, VVC.find_scope_containers, self.vvc_mock, ["folder-1"])
+
+    @staticmethod
+    def item_with_parent(moref, parent):
+        item = Mock(moref=moref)
+        item.parent = parent
+        return item
+
+    def test_should_drop_scope_containers_below_other_scope_containers(self):
+        datacenter, host_folder = vim.Datacenter("datacenter-1"), vim.Folder("group-h1")
+        cluster, other_cluster = vim.ClusterComputeResource("domain-c1"), vim.ClusterComputeResource("domain-c2")
+        self.vvc_mock.find_scope_containers.return_value = [cluster, datacenter, other_cluster, datacenter]
+        self.vvc_mock.get_restricted_view_on_items.return_value = [
+            self.item_with_parent(cluster, host_folder),
+            self.item_with_parent(host_folder, datacenter),
+            self.item_with_parent(datacenter, None),
+            self.item_with_parent(other_cluster, vim.Folder("group-h2"))]
+        self.vvc_mock.find_outermost_containers.side_effect = lambda containers: VVC.find_outermost_containers(
+            self.vvc_mock, containers)
+
+        VVC.set_scope(self.vvc_mock, ["cluster-1", "datacenter-1", "cluster-2", "datacenter-1"])
+
+        self.assertEqual(self.vvc_mock.scope, [datacenter, other_cluster])
+        self.vvc_mock.get_restricted_view_on_items.assert_called_once_with(
+            ["parent"], [vim.Datacenter, vim.ClusterComputeResource, vim.Folder])
+
+    def test_should_not_retrieve_parents_of_single_scope_container(self):
+        self.assertEqual(VVC.find_outermost_containers(self.vvc_mock, ["dc-1-moref", "dc-1-moref"]), ["dc-1-moref"])
+
+        self.assertFalse(self.vvc_mock.get_restricted_view_on_items.called)
+
+    def test_should_create_one_view_per_scope_container(self):
+        self.vvc_mock.scope = ["dc-1-moref", "cluster-1-moref"]
+
+        views = VVC.views_for(self.vvc_mock, ["any-type"])
+
+        self.assertEqual(views, [self.vvc_mock.view_for.return_value] * 2)
+        self.assertEqual(self.vvc_mock.view_for.call_args_list, [call(["any-type"], "dc-1-moref"),
+                                                                 call(["any-type"], "cluster-1-moref")])
+
+    def test_should_create_one_view_on_the_root_folder_without_scope(self):
+        self.vvc_mock.scope = None
+
+        VVC.views_for(self.vvc_mock, ["any-type"])
+
+        self.vvc_mock.view_for.assert_called_once_with(["any-type"], None)
+
+    def test_should_create_views_on_given_containers_instead_of_scope(self):
+        self.vvc_mock.scope = ["dc-1-moref"]
+
+        VVC.views_for(self.vvc_mock, ["any-type"], ["dc-2-moref"])
+
+        self.vvc_mock.view_for.assert_called_once_with(["any-type"], "dc-2-moref")
+
+    def test_should_partition_by_datacenters_below_root_folder_without_scope(self):
+        self.vvc_mock.scope = None
+        self.vvc_mock.service_instance_content = Mock()
+        self.vvc_mock.service_instance_content.rootFolder.childEntity = ["dc-1-moref", "dc-2-moref"]
+
+        self.assertEqual(VVC.get_partitions(self.vvc_mock), ["dc-1-moref", "dc-2-moref"])
+
+    def test_should_partition_by_scope_containers(self):
+        self.vvc_mock.scope = ["cluster-1-moref"]
+
+        self.assertEqual(VVC.get_partitions(self.vvc_mock), ["cluster-1-moref"])
+
+    @patch("isphere.interactive_wrapper.build_property_collector_specs")
+    def test_should_yield_items_of_overlapping_views_only_once(self, _):
+        self.vvc_mock.views_for.side_effect = lambda types, containers=None: [Mock(), Mock()]
+        self.vvc_mock.get_service.return_value.RetrievePropertiesEx.return_value = self.mock_retrieve_result(
+            ["vm-1", "vm-2", "vm-1"])
+
+        items = VVC.iterate_items_with_properties(self.vvc_mock, [], "any-type", VM)
+
+        self.assertEqual([item.name for item in items], ["vm-1", "vm-2"])
+
 
 class ItemContainerTests(TestCase):
 
@@ -344,3 +710,19 @@ class ItemContainerTests(TestCase):
 
         self.assertEqual(self.item.x.y.z, "any-value")
         self.assertEqual(self.item.x.y.d.m, "any-other-value")
+
+
+class BuildPropertyCollectorSpecsTests(TestCase):
+
+    @patch.object(vim.view.ContainerView, "type", ["VirtualMachine", "HostSystem"])
+    def test_should_collect_all_views_and_types_with_one_filter(self):
+        views = [vim.view.ContainerView("session[1]view-1"), vim.view.ContainerView("session[1]view-2")]
+
+        filter_specs = build_property_collector_specs(views, ["name"])
+
+        self.assertEqual(len(filter_specs), 1)
+        self.assertEqual([obj_spec.obj for obj_spec in filter_specs[0].objectSet], views)
+        self.assertEqual([property_spec.type for property_spec in filter_specs[0].propSet],
+                         [vim.VirtualMachine, vim.HostSystem])
+        self.assertEqual([list(property_spec.pathSet) for property_spec in filter_specs[0].propSet],
+                         [["name"], ["name"]])
@@ -0,0 +1,64 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+from unittest import TestCase
+
+from pyVmomi import vim
+
+from isphere.interactive_wrapper import NotFound
+from isphere.inventory import InventoryGraph
+
+
+class InventoryGraphTests(TestCase):
+
+    def setUp(self):
+        self.cluster = vim.ClusterComputeResource("domain-c1")
+        self.datastore = vim.Datastore("datastore-1")
+        self.esx_1, self.esx_2 = vim.HostSystem("host-1"), vim.HostSystem("host-2")
+        self.vm_1, self.vm_2 = vim.VirtualMachine("vm-1"), vim.VirtualMachine("vm-2")
+        self.graph = InventoryGraph()
+        self.graph.add(self.cluster, "cluster-1")
+        self.graph.add(self.datastore, "datastore-1")
+        self.graph.add(self.esx_1, "esx-1", [self.cluster])
+        self.graph.add(self.esx_2, "esx-2", [self.cluster])
+        self.graph.add(self.vm_1, "vm-1", [self.esx_1, self.datastore, None])
+        self.graph.add(self.vm_2, "vm-2", [self.esx_2, self.datastore])
+
+    def test_should_list_children_by_type(self):
+        self.assertEqual(self.graph.child_names(self.cluster, vim.HostSystem), ["esx-1", "esx-2"])
+        self.assertEqual(self.graph.child_names(self.datastore, vim.VirtualMachine), ["vm-1", "vm-2"])
+        self.assertEqual(self.graph.child_names(self.esx_1), ["vm-1"])
+
+    def test_should_list_parents_by_type(self):
+        self.assertEqual(self.graph.parent_names(self.vm_1, vim.HostSystem), ["esx-1"])
+        self.assertEqual(self.graph.parent_names(self.vm_1), ["datastore-1", "esx-1"])
+        self.assertEqual(self.graph.parents(self.cluster), [])
+
+    def test_should_find_items_by_name_and_type(self):
+        self.assertEqual(self.graph.find("cluster-1"), self.cluster)
+        self.assertEqual(self.graph.find("datastore-1", [vim.Datastore]), self.datastore)
+
+        self.assertRaises(NotFound, self.graph.find, "datastore-1", [vim.ComputeResource])
+        self.assertRaises(NotFound, self.graph.find, "unknown-name")
+
+    def test_should_not_find_ambiguous_names(self):
+        self.graph.add(vim.Network("network-1"), "cluster-1")
+
+        self.assertRaises(NotFound, self.graph.find, "cluster-1")
+        self.assertEqual(self.graph.find("cluster-1", [vim.ComputeResource]), self.cluster)
+
+    def test_should_add_items_only_once(self):
+        self.graph.add(self.esx_1, "esx-1", [self.cluster])
+
+        self.assertEqual(len(self.graph), 6)
+        self.assertEqual(self.graph.find("esx-1"), self.esx_1)
+        self.assertEqual(self.graph.child_names(self.cluster, vim.HostSystem), ["esx-1", "esx-2"])
+
+    def test_should_list_unnamed_parents(self):
+        resource_pool = vim.ResourcePool("resgroup-1")
+        self.graph.add(self.vm_1, "vm-1", [resource_pool])
+
+        self.assertEqual(self.graph.unnamed_items(), [resource_pool])
@@ -0,0 +1,308 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import Mock
+from pyVmomi import vim
+from pyVmomi.Iso8601 import ParseISO8601
+
+from isphere.maintenance import RollingMaintenance
+from isphere.watcher import FinishedTask
+
+FIRST_BOOT = ParseISO8601("2015-06-01T10:00:00Z")
+SECOND_BOOT = ParseISO8601("2015-06-02T10:00:00Z")
+
+
+class FakeTaskTracker(object):
+
+    """
+    Finishes all tracked tasks on the next poll.
+    """
+
+    def __init__(self):
+        self.tracked_tasks = []
+        self.failing_tasks = []
+
+    def track(self, task):
+        self.tracked_tasks.append(task)
+
+    def poll(self, max_wait_seconds=None):
+        finished_tasks = [FinishedTask(task, "error" if task in self.failing_tasks else "success", Mock(msg="any-fault"), None)
+                          for task in self.tracked_tasks]
+        self.tracked_tasks = []
+        return finished_tasks
+
+
+class FakeInventory(object):
+
+    def __init__(self):
+        self.host_snapshots = []
+        self.vm_snapshots = {}
+        self.boot_times = {}
+        self.connection_states = {}
+        self.task_count = 0
+
+    def add_host(self, name, cluster="cluster-1", vms=(), in_maintenance_mode=False):
+        host = Mock(spec=vim.HostSystem)
+        host._moId = name
+        for method_name in ("EnterMaintenanceMode", "ExitMaintenanceMode", "Reboot", "Shutdown"):
+            getattr(host, method_name).side_effect = lambda *_: self.create_task()
+        host.Reboot.side_effect = lambda *_: self.reboot(host)
+        host_snapshot = Mock(moref=host, vm=list(vms))
+        host_snapshot.parent = cluster
+        host_snapshot.runtime.inMaintenanceMode = in_maintenance_mode
+        host_snapshot.runtime.connectionState = "connected"
+        self.boot_times[host] = FIRST_BOOT
+        self.host_snapshots.append(host_snapshot)
+        return host
+
+    def add_vm(self, name, power_state="poweredOn"):
+        vm = Mock(spec=vim.VirtualMachine)
+        vm.Relocate.side_effect = lambda *_: self.create_task()
+        vm_snapshot = Mock(moref=vm)
+        vm_snapshot.name = name
+        vm_snapshot.runtime.powerState = power_state
+        self.vm_snapshots[vm] = vm_snapshot
+        return vm
+
+    def create_task(self):
+        self.task_count += 1
+        return vim.Task("task-{0}".format(self.task_count))
+
+    def reboot(self, host):
+        self.boot_times[host] = SECOND_BOOT
+        return self.create_task()
+
+    def connection_state(self, host):
+        """
+        Returns the next of the given connection states of a host, the last one stays.
+        """
+        states = self.connection_states.get(host, ["connected"])
+        return states.pop(0) if len(states) > 1 else states[0]
+
+    def get_restricted_view_on_managed_objects(self, managed_objects, properties):
+        snapshots = []
+        for managed_object in managed_objects:
+            if managed_object in self.vm_snapshots:
+                snapshots.append(self.vm_snapshots[managed_object])
+            else:
+                if self.boot_times[managed_object] is Ellipsis:  # not retrievable
+                    continue
+                host_snapshot = Mock(moref=managed_object)
+                if "runtime.connectionState" in properties:
+                    host_snapshot.runtime.connectionState = self.connection_state(managed_object)
+                host_snapshot.runtime.bootTime = self.boot_times[managed_object]
+                snapshots.append(host_snapshot)
+        return snapshots
+
+    def vvc(self):
+        vvc = Mock(hostname="any-vcenter")
+        vvc.get_restricted_view_on_host_systems.return_value = self.host_snapshots
+        vvc.get_restricted_view_on_managed_objects.side_effect = self.get_restricted_view_on_managed_objects
+        return vvc
+
+
+class RollingMaintenanceTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.state_path = os.path.join(self.directory, "state.json")
+        self.inventory = FakeInventory()
+        self.tracker = FakeTaskTracker()
+        self.progress = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_maintenance(self, hosts, **kwargs):
+        kwargs.setdefault("state_path", self.state_path)
+        maintenance = RollingMaintenance(self.inventory.vvc(), [(host._moId, host) for host in hosts], self.tracker, **kwargs)
+        return maintenance.run(on_progress=self.record_progress)
+
+    def record_progress(self, host_maintenance):
+        self.progress.append((host_maintenance.name, host_maintenance.stage))
+
+    def test_should_reboot_host_and_exit_maintenance_mode_once_reconnected(self):
+        host = self.inventory.add_host("esx-1")
+
+        maintenances = self.run_maintenance([host], action="reboot")
+
+        self.assertEqual([stage for _, stage in self.progress],
+                         ["entering", "rebooting", "reconnecting", "exiting", "done"])
+        self.assertEqual(maintenances[0].stage, "done")
+        host.EnterMaintenanceMode.assert_called_with(0)
+        host.Reboot.assert_called_with(False)
+        self.assertTrue(host.ExitMaintenanceMode.called)
+        self.assertFalse(os.path.exists(self.state_path))
+
+    def test_should_wait_for_disconnect_when_boot_time_is_unset(self):
+        host = self.inventory.add_host("esx-1")
+        self.inventory.boot_times[host] = None
+        host.Reboot.side_effect = lambda *_: self.inventory.create_task()
+        self.inventory.connection_states[host] = ["connected", "disconnected", "connected"]
+
+        maintenances = self.run_maintenance([host], action="reboot")
+
+        self.assertEqual(maintenances[0].stage, "done")
+        self.assertEqual(self.inventory.connection_states[host], ["connected"])
+        self.assertTrue(host.ExitMaintenanceMode.called)
+
+    def test_should_wait_for_disconnect_when_boot_time_could_not_be_read(self):
+        host = self.inventory.add_host("esx-1")
+        self.inventory.boot_times[host] = Ellipsis
+        host.Reboot.side_effect = lambda *_: self.inventory.reboot(host)
+        self.inventory.connection_states[host] = ["connected", "connected", "disconnected", "connected"]
+
+        maintenances = self.run_maintenance([host], action="reboot")
+
+        self.assertEqual(maintenances[0].stage, "done")
+        self.assertEqual(self.inventory.connection_states[host], ["connected"])
+
+    def test_should_not_exit_maintenance_mode_before_boot_time_changed(self):
+        host = self.inventory.add_host("esx-1")
+        host.Reboot.side_effect = lambda *_: self.inventory.create_task()
+        self.inventory.connection_states[host] = ["connected", "connected", "connected"]
+        maintenance = RollingMaintenance(self.inventory.vvc(), [("esx-1", host)], self.tracker, action="reboot")
+        poll, polls = self.tracker.poll, []
+
+        def interrupt_after_ten_polls(max_wait_seconds=None):
+            polls.append(max_wait_seconds)
+            if len(polls) > 10:
+                raise KeyboardInterrupt()
+            return poll(max_wait_seconds)
+        self.tracker.poll = interrupt_after_ten_polls
+
+        self.assertRaises(KeyboardInterrupt, maintenance.run)
+
+        self.assertEqual(maintenance.maintenances[0].stage, "reconnecting")
+        self.assertFalse(host.ExitMaintenanceMode.called)
+
+    def test_should_stay_in_maintenance_mode_when_entering(self):
+        host = self.inventory.add_host("esx-1")
+
+        self.run_maintenance([host], action="enter")
+
+        self.assertEqual([stage for _, stage in self.progress], ["entering", "done"])
+        self.assertFalse(host.ExitMaintenanceMode.called)
+
+    def test_should_skip_entering_when_already_in_maintenance_mode(self):
+        host = self.inventory.add_host("esx-1", in_maintenance_mode=True)
+
+        self.run_maintenance([host], action="shutdown")
+
+        self.assertEqual([stage for _, stage in self.progress], ["shutting_down", "done"])
+        self.assertFalse(host.EnterMaintenanceMode.called)
+        host.Shutdown.assert_called_with(False)
+
+    def test_should_evacuate_powered_on_vms_to_least_loaded_hosts_of_cluster(self):
+        vm_1, vm_2, vm_3 = self.inventory.add_vm("vm-1"), self.inventory.add_vm("vm-2"), self.inventory.add_vm("vm-3", "poweredOff")
+        host = self.inventory.add_host("esx-1", vms=[vm_1, vm_2, vm_3])
+        self.inventory.add_host("esx-2", vms=[Mock(), Mock()])
+        idle_host = self.inventory.add_host("esx-3")
+        self.inventory.add_host("esx-4", cluster="cluster-2")
+
+        maintenances = self.run_maintenance([host], action="enter")
+
+        moves = maintenances[0].moves
+        self.assertEqual([move.vm_name for move in moves], ["vm-1", "vm-2"])
+        self.assertEqual([move.target_host for move in moves], [idle_host, idle_host])
+        self.assertEqual([move.state for move in moves], ["success", "success"])
+        self.assertEqual(self.progress[0], ("esx-1", "evacuating"))
+
+    def test_should_not_evacuate_to_hosts_that_are_maintained_later_if_possible(self):
+        vm = self.inventory.add_vm("vm-1")
+        host_1 = self.inventory.add_host("esx-1", vms=[vm])
+        host_2 = self.inventory.add_host("esx-2")
+        host_3 = self.inventory.add_host("esx-3", vms=[Mock()])
+
+        maintenances = self.run_maintenance([host_1, host_2], action="enter")
+
+        self.assertEqual(maintenances[0].moves[0].target_host, host_3)
+
+    def test_should_fail_when_no_host_is_left_for_evacuation(self):
+        host = self.inventory.add_host("esx-1", vms=[self.inventory.add_vm("vm-1")])
+
+        maintenances = self.run_maintenance([host], action="enter")
+
+        self.assertEqual(maintenances[0].stage, "failed")
+        self.assertEqual(maintenances[0].error, "no host left to evacuate 1 VMs to")
+
+    def test_should_limit_hosts_in_progress_to_wave_size(self):
+        hosts = [self.inventory.add_host("esx-{0}".format(index)) for index in range(5)]
+        active, maximal_active = set(), [0]
+
+        def on_progress(host_maintenance):
+            (active.add if host_maintenance.active else active.discard)(host_maintenance.name)
+            maximal_active[0] = max(maximal_active[0], len(active))
+        maintenance = RollingMaintenance(self.inventory.vvc(), [(host._moId, host) for host in hosts], self.tracker,
+                                         action="reboot", wave_size=2)
+        maintenances = maintenance.run(on_progress)
+
+        self.assertEqual(maximal_active[0], 2)
+        self.assertEqual([host_maintenance.stage for host_maintenance in maintenances], ["done"] * 5)
+
+    def test_should_not_start_more_hosts_after_failure_and_keep_state(self):
+        host_1, host_2 = self.inventory.add_host("esx-1"), self.inventory.add_host("esx-2")
+        host_1.EnterMaintenanceMode.side_effect = lambda *_: self.failing_task()
+
+        maintenances = self.run_maintenance([host_1, host_2], action="enter")
+
+        self.assertEqual([host_maintenance.stage for host_maintenance in maintenances], ["failed", "pending"])
+        self.assertEqual(maintenances[0].error, "any-fault")
+        with open(self.state_path) as state_file:
+            state = json.load(state_file)
+        self.assertEqual(state["hosts"]["esx-1"]["stage"], "failed")
+
+    def failing_task(self):
+        task = self.inventory.create_task()
+        self.tracker.failing_tasks.append(task)
+        return task
+
+    def test_should_resume_from_state_file(self):
+        host_1, host_2 = self.inventory.add_host("esx-1"), self.inventory.add_host("esx-2")
+        with open(self.state_path, "w") as state_file:
+            json.dump({"action": "reboot",
+                       "vcenter": "any-vcenter",
+                       "hosts": {"esx-1": {"stage": "done"},
+                                 "esx-2": {"stage": "rebooting", "boot_time": "2015-06-01T10:00:00Z"}}},
+                      state_file)
+        self.inventory.boot_times[host_2] = SECOND_BOOT
+
+        self.run_maintenance([host_1, host_2], action="reboot")
+
+        self.assertEqual(self.progress, [("esx-2", "reconnecting"), ("esx-2", "exiting"), ("esx-2", "done")])
+        self.assertFalse(host_1.EnterMaintenanceMode.called)
+        self.assertFalse(host_2.Reboot.called)
+
+    def test_should_refuse_state_file_of_other_action(self):
+        host = self.inventory.add_host("esx-1")
+        with open(self.state_path, "w") as state_file:
+            json.dump({"action": "enter", "vcenter": "any-vcenter", "hosts": {"esx-1": {"stage": "done"}}}, state_file)
+
+        self.assertRaises(ValueError, self.run_maintenance, [host], action="reboot")
+
+    def test_should_refuse_state_file_of_other_vcenter(self):
+        host = self.inventory.add_host("esx-1")
+        with open(self.state_path, "w") as state_file:
+            json.dump({"action": "reboot", "vcenter": "other-vcenter", "hosts": {"esx-1": {"stage": "done"}}}, state_file)
+
+        self.assertRaises(ValueError, self.run_maintenance, [host], action="reboot")
+
+    def test_should_refuse_state_file_of_other_esxis(self):
+        host_1, host_2 = self.inventory.add_host("esx-1"), self.inventory.add_host("esx-2")
+        with open(self.state_path, "w") as state_file:
+            json.dump({"action": "reboot", "vcenter": "any-vcenter", "hosts": {"esx-1": {"stage": "done"}}}, state_file)
+
+        self.assertRaises(ValueError, self.run_maintenance, [host_1, host_2], action="reboot")
+        self.assertFalse(host_2.EnterMaintenanceMode.called)
+
+    def test_should_refuse_unknown_actions(self):
+        self.assertRaises(ValueError, RollingMaintenance, Mock(), [], self.tracker, action="patch")
@@ -0,0 +1,41 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+import sys
+from unittest import TestCase
+
+from isphere.memory import approximate_size
+from isphere.prefix_index import PrefixIndex
+
+
+class ApproximateSizeTests(TestCase):
+
+    def test_should_count_contents_of_containers(self):
+        name, uuid = "vm-1", "any-uuid"
+
+        self.assertEqual(approximate_size({name: [uuid]}, set()),
+                         sum(map(sys.getsizeof, ({name: [uuid]}, name, [uuid], uuid))))
+
+    def test_should_count_shared_objects_once(self):
+        names = ["vm-{0}".format(number) for number in range(10)]
+        seen = set()
+        approximate_size(names, seen)
+
+        self.assertEqual(approximate_size(dict.fromkeys(names), seen),
+                         sys.getsizeof(dict.fromkeys(names)) + sys.getsizeof(None))
+
+    def test_should_count_attributes_of_isphere_objects(self):
+        index = PrefixIndex(["vm-1"])
+
+        self.assertTrue(approximate_size(index, set()) > approximate_size(index.names, set()) + sys.getsizeof(index))
+
+    def test_should_not_follow_other_objects(self):
+        class Foreign(object):
+            def __init__(self):
+                self.names = ["vm-{0}".format(number) for number in range(10)]
+        foreign = Foreign()
+
+        self.assertEqual(approximate_size(foreign, set()), sys.getsizeof(foreign))
@@ -0,0 +1,108 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from pyVmomi import vim
+
+from isphere.metrics import MetricsExporter, SoapMetrics
+from isphere.soap import SoapCall, SoapObservers
+
+
+class SoapMetricsTests(TestCase):
+
+    def setUp(self):
+        self.metrics = SoapMetrics(buckets=(0.1, 1.0), labels={"vcenter": "any-vcenter"})
+
+    def test_should_record_cumulative_histogram_per_method(self):
+        self.metrics.on_call(SoapCall("RetrieveProperties", 0.05, 0.04, 100, None))
+        self.metrics.on_call(SoapCall("RetrieveProperties", 0.5, 0.4, 200, None))
+        self.metrics.on_call(SoapCall("RetrieveProperties", 5.0, 4.0, 300, None))
+        self.metrics.on_call(SoapCall("FindByUuid", 0.01, 0.01, 10, None))
+
+        snapshot = self.metrics.snapshot()
+
+        self.assertEqual(snapshot["RetrieveProperties"]["buckets"], [[0.1, 1], [1.0, 2], ["+Inf", 3]])
+        self.assertEqual(snapshot["RetrieveProperties"]["count"], 3)
+        self.assertEqual(snapshot["RetrieveProperties"]["bytes_received"], 600)
+        self.assertEqual(snapshot["FindByUuid"]["count"], 1)
+
+    def test_should_count_errors_by_fault_name(self):
+        self.metrics.on_call(SoapCall("PowerOnVM_Task", 0.05, 0.0, 0, vim.fault.InvalidState()))
+        self.metrics.on_call(SoapCall("PowerOnVM_Task", 0.05, 0.0, 0, vim.fault.InvalidState()))
+        self.metrics.on_call(SoapCall("PowerOnVM_Task", 0.05, 0.0, 0, ValueError()))
+
+        self.assertEqual(self.metrics.snapshot()["PowerOnVM_Task"]["errors"], {"InvalidState": 2, "ValueError": 1})
+
+    def test_should_export_prometheus_text(self):
+        self.metrics.on_call(SoapCall("FindByUuid", 0.5, 0.4, 10, vim.fault.InvalidState()))
+
+        text = self.metrics.to_prometheus_text()
+
+        self.assertIn("# TYPE isphere_soap_request_duration_seconds histogram", text)
+        self.assertIn('isphere_soap_request_duration_seconds_bucket{vcenter="any-vcenter",method="FindByUuid",le="0.1"} 0', text)
+        self.assertIn('isphere_soap_request_duration_seconds_bucket{vcenter="any-vcenter",method="FindByUuid",le="1"} 1', text)
+        self.assertIn('isphere_soap_request_duration_seconds_bucket{vcenter="any-vcenter",method="FindByUuid",le="+Inf"} 1', text)
+        self.assertIn('isphere_soap_request_duration_seconds_count{vcenter="any-vcenter",method="FindByUuid"} 1', text)
+        self.assertIn('isphere_soap_errors_total{vcenter="any-vcenter",method="FindByUuid",error="InvalidState"} 1', text)
+        self.assertIn('isphere_soap_received_bytes_total{vcenter="any-vcenter",method="FindByUuid"} 10', text)
+
+    def test_should_escape_label_values(self):
+        metrics = SoapMetrics(labels={"vcenter": 'any"vcenter'})
+        metrics.on_call(SoapCall("FindByUuid", 0.5, 0.4, 10, None))
+
+        self.assertIn('vcenter="any\\"vcenter"', metrics.to_prometheus_text())
+
+    def test_should_receive_calls_through_observers(self):
+        observers = SoapObservers([self.metrics])
+
+        observers.on_call(SoapCall("FindByUuid", 0.5, 0.4, 10, None))
+
+        self.assertEqual(self.metrics.snapshot()["FindByUuid"]["count"], 1)
+
+
+class MetricsExporterTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.metrics = SoapMetrics()
+        self.metrics.on_call(SoapCall("FindByUuid", 0.5, 0.4, 10, None))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_should_write_prometheus_textfile(self):
+        path = os.path.join(self.directory, "isphere.prom")
+
+        MetricsExporter(self.metrics, path).write()
+
+        with open(path) as metrics_file:
+            self.assertEqual(metrics_file.read(), self.metrics.to_prometheus_text())
+        self.assertEqual(os.listdir(self.directory), ["isphere.prom"])
+
+    def test_should_write_json_for_json_files(self):
+        path = os.path.join(self.directory, "isphere.json")
+
+        MetricsExporter(self.metrics, path).write()
+
+        with open(path) as metrics_file:
+            self.assertEqual(json.load(metrics_file)["methods"]["FindByUuid"]["count"], 1)
+
+    def test_should_write_when_stopped(self):
+        path = os.path.join(self.directory, "isphere.prom")
+        exporter = MetricsExporter(self.metrics, path, interval=60).start()
+
+        exporter.stop()
+
+        self.assertTrue(os.path.exists(path))
+        self.assertFalse(exporter._thread.is_alive())
+
+    def test_should_refuse_unknown_formats(self):
+        self.assertRaises(ValueError, MetricsExporter, self.metrics, "any-path", output_format="xml")
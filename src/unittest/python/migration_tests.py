@@ -0,0 +1,139 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+from unittest import TestCase
+
+from mock import Mock
+from pyVmomi import vim
+
+from isphere.migration import MigrationPlanner, MigrationProgress
+from isphere.watcher import FinishedTask
+
+
+class FakeTaskTracker(object):
+
+    """
+    Finishes the running tasks one poll after they were started.
+    """
+
+    def __init__(self, failing_vms=()):
+        self.failing_vms = failing_vms
+        self.tracked_tasks = []
+        self.maximal_concurrency = 0
+
+    def track(self, task):
+        self.tracked_tasks.append(task)
+        self.maximal_concurrency = max(self.maximal_concurrency, len(self.tracked_tasks))
+
+    def poll(self, max_wait_seconds=None):
+        finished_tasks = [FinishedTask(task, "error" if task.vm_name in self.failing_vms else "success", None, None)
+                          for task in self.tracked_tasks]
+        self.tracked_tasks = []
+        return finished_tasks
+
+
+def mock_vm(name):
+    vm = Mock()
+    vm.Relocate.return_value = vim.Task("task-" + name)
+    vm.Relocate.return_value.vm_name = name
+    return vm
+
+
+class MigrationPlannerTests(TestCase):
+
+    def setUp(self):
+        self.source_1, self.source_2 = vim.HostSystem("host-1"), vim.HostSystem("host-2")
+        self.target = vim.HostSystem("host-3")
+
+    def test_should_relocate_all_vms_to_target(self):
+        tracker = FakeTaskTracker()
+        planner = MigrationPlanner(tracker)
+        vm = mock_vm("vm-1")
+        planner.add("vm-1", vm, self.source_1, self.target)
+
+        moves = planner.run()
+
+        self.assertEqual([move.state for move in moves], ["success"])
+        self.assertEqual(vm.Relocate.call_args[0][0].host, self.target)
+
+    def test_should_limit_concurrent_migrations_per_source_host(self):
+        tracker = FakeTaskTracker()
+        planner = MigrationPlanner(tracker, max_per_source_host=2, max_per_target_host=None)
+        for index in range(5):
+            planner.add("vm-{0}".format(index), mock_vm("vm-{0}".format(index)), self.source_1, self.target)
+
+        planner.run()
+
+        self.assertEqual(tracker.maximal_concurrency, 2)
+
+    def test_should_limit_concurrent_migrations_per_target_host(self):
+        tracker = FakeTaskTracker()
+        planner = MigrationPlanner(tracker, max_per_source_host=2, max_per_target_host=3)
+        for index in range(6):
+            source = self.source_1 if index % 2 else self.source_2
+            planner.add("vm-{0}".format(index), mock_vm("vm-{0}".format(index)), source, self.target)
+
+        planner.run()
+
+        self.assertEqual(tracker.maximal_concurrency, 3)
+
+    def test_should_not_limit_when_limits_are_disabled(self):
+        tracker = FakeTaskTracker()
+        planner = MigrationPlanner(tracker, max_per_source_host=0, max_per_target_host=0)
+        for index in range(6):
+            planner.add("vm-{0}".format(index), mock_vm("vm-{0}".format(index)), self.source_1, self.target)
+
+        planner.run()
+
+        self.assertEqual(tracker.maximal_concurrency, 6)
+
+    def test_should_skip_vms_already_on_target(self):
+        vm = mock_vm("vm-1")
+        planner = MigrationPlanner(FakeTaskTracker())
+        planner.add("vm-1", vm, self.target, self.target)
+
+        moves = planner.run()
+
+        self.assertEqual(moves[0].state, "skipped")
+        self.assertFalse(vm.Relocate.called)
+
+    def test_should_record_failures_and_continue(self):
+        planner = MigrationPlanner(FakeTaskTracker(failing_vms=["vm-1"]), max_per_source_host=1)
+        unsubmittable_vm = mock_vm("vm-3")
+        unsubmittable_vm.Relocate.side_effect = vim.fault.InvalidState()
+        planner.add("vm-1", mock_vm("vm-1"), self.source_1, self.target)
+        planner.add("vm-2", mock_vm("vm-2"), self.source_1, self.target)
+        planner.add("vm-3", unsubmittable_vm, self.source_1, self.target)
+
+        moves = planner.run()
+
+        self.assertEqual([move.state for move in moves], ["error", "success", "error"])
+        self.assertTrue(isinstance(moves[2].error, vim.fault.InvalidState))
+
+    def test_should_report_progress(self):
+        on_progress = Mock()
+        planner = MigrationPlanner(FakeTaskTracker(), max_per_source_host=1)
+        planner.add("vm-1", mock_vm("vm-1"), self.source_1, self.target)
+        planner.add("vm-2", mock_vm("vm-2"), self.source_1, self.target)
+
+        planner.run(on_progress)
+
+        last_progress = on_progress.call_args[0][0]
+        self.assertEqual(last_progress.succeeded, 2)
+        self.assertEqual(last_progress.pending, 0)
+        self.assertEqual(on_progress.call_count, 3)
+
+
+class MigrationProgressTests(TestCase):
+
+    def test_should_compute_throughput(self):
+        moves = [Mock(state="success"), Mock(state="success"), Mock(state="running"), Mock(state="pending")]
+
+        progress = MigrationProgress(moves, 30.0)
+
+        self.assertEqual(progress.per_minute, 4.0)
+        self.assertEqual(str(progress),
+                         "2/4 done (2 succeeded, 0 failed, 0 skipped), 1 running, 1 pending, 4.0 vMotions/min")
@@ -0,0 +1,50 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+from unittest import TestCase
+
+from isphere.name_store import UuidStore, intern_name
+
+UUID_1 = "4231a8b2-7f3c-4e6d-9a1b-2c3d4e5f6a7b"
+UUID_2 = "4231a8b2-7f3c-4e6d-9a1b-2c3d4e5f6a7c"
+
+
+class UuidStoreTests(TestCase):
+
+    def setUp(self):
+        self.store = UuidStore([("vm-2", UUID_2), ("vm-1", UUID_1), (u"vm-\u00e9", UUID_1)])
+
+    def test_should_find_uuids_by_name(self):
+        self.assertEqual(self.store["vm-1"], UUID_1)
+        self.assertEqual(self.store["vm-2"], UUID_2)
+        self.assertEqual(self.store[u"vm-\u00e9"], UUID_1)
+
+    def test_should_not_find_unknown_names(self):
+        self.assertRaises(KeyError, lambda: self.store["vm-3"])
+        self.assertEqual(self.store.get("vm-0", "any-default"), "any-default")
+        self.assertFalse("vm-" in self.store)
+        self.assertTrue("vm-1" in self.store)
+
+    def test_should_list_names_sorted(self):
+        self.assertEqual(self.store.keys(), ["vm-1", "vm-2", u"vm-\u00e9"])
+        self.assertEqual(len(self.store), 3)
+
+    def test_should_keep_uuids_that_are_not_canonical_as_they_are(self):
+        store = UuidStore([("vm-1", UUID_1.upper()), ("vm-2", "not-a-uuid"), ("vm-3", None), ("vm-4", UUID_2)])
+
+        self.assertEqual(store.items(), [("vm-1", UUID_1.upper()), ("vm-2", "not-a-uuid"), ("vm-3", None),
+                                         ("vm-4", UUID_2)])
+
+    def test_should_keep_last_uuid_of_duplicate_names(self):
+        self.assertEqual(UuidStore([("vm-1", UUID_1), ("vm-1", UUID_2)]).items(), [("vm-1", UUID_2)])
+
+    def test_should_be_empty_by_default(self):
+        self.assertEqual(UuidStore().keys(), [])
+        self.assertEqual(UuidStore().get("vm-1"), None)
+
+    def test_should_intern_names(self):
+        self.assertTrue(intern_name("".join(["vm", "-1"])) is intern_name("vm-1"))
+        self.assertTrue(self.store.keys()[0] is intern_name("vm-1"))
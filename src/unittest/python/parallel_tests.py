@@ -0,0 +1,81 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+import threading
+import time
+from unittest import TestCase
+
+from isphere.parallel import map_bounded
+
+
+class MapBoundedTests(TestCase):
+
+    def test_should_yield_result_of_each_call(self):
+        results = list(map_bounded(lambda number: number * 2, range(10), max_concurrency=3))
+
+        self.assertEqual(sorted(results), [(number, number * 2, None) for number in range(10)])
+
+    def test_should_yield_errors_of_failed_calls(self):
+        error = ValueError("any-error")
+
+        def fail_on_odd_numbers(number):
+            if number % 2:
+                raise error
+            return number
+
+        results = sorted(map_bounded(fail_on_odd_numbers, range(4)), key=lambda result: result[0])
+
+        self.assertEqual(results, [(0, 0, None), (1, None, error), (2, 2, None), (3, None, error)])
+
+    def test_should_not_exceed_max_concurrency(self):
+        lock = threading.Lock()
+        running, maximal_running = [0], [0]
+
+        def call(_):
+            with lock:
+                running[0] += 1
+                maximal_running[0] = max(maximal_running[0], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+
+        list(map_bounded(call, range(20), max_concurrency=4))
+
+        self.assertEqual(maximal_running[0], 4)
+
+    def test_should_run_calls_concurrently(self):
+        barrier_count, all_started = [0], threading.Event()
+        lock = threading.Lock()
+
+        def call(_):
+            with lock:
+                barrier_count[0] += 1
+                if barrier_count[0] == 3:
+                    all_started.set()
+            return all_started.wait(5)
+
+        results = list(map_bounded(call, range(3), max_concurrency=3))
+
+        self.assertEqual([result for _, result, _ in results], [True, True, True])
+
+    def test_should_not_start_calls_once_consumer_stops(self):
+        called, proceed = [], threading.Event()
+
+        def call(number):
+            called.append(number)
+            if number:
+                proceed.wait(5)
+            return number
+
+        results = map_bounded(call, range(1000), max_concurrency=1)
+        next(results)
+        threading.Timer(0.05, proceed.set).start()
+        results.close()
+
+        self.assertEqual(called, [0, 1])
+
+    def test_should_yield_nothing_without_arguments(self):
+        self.assertEqual(list(map_bounded(lambda argument: argument, [])), [])
@@ -0,0 +1,103 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+from datetime import datetime
+from unittest import TestCase
+
+from mock import Mock
+from pyVmomi import vim, vmodl
+
+from isphere.interactive_wrapper import NotFound
+from isphere.performance import PerformanceCounters, query_performance
+
+
+def mock_counter_info(key, group, name, rollup, unit):
+    return Mock(key=key, groupInfo=Mock(key=group), nameInfo=Mock(key=name), rollupType=rollup, unitInfo=Mock(key=unit))
+
+
+def mock_entity_metric(entity, values_by_counter_id, instance=""):
+    sample_count = max(len(values) for values in values_by_counter_id.values())
+    return Mock(entity=entity,
+                sampleInfo=[Mock(timestamp=datetime(2015, 6, 1, 12, 0, 20 * sample)) for sample in range(sample_count)],
+                value=[Mock(id=Mock(counterId=counter_id, instance=instance), value=values)
+                       for counter_id, values in values_by_counter_id.items()])
+
+
+COUNTERS = PerformanceCounters([mock_counter_info(1, "cpu", "ready", "summation", "millisecond"),
+                                mock_counter_info(2, "cpu", "usage", "average", "percent")])
+VMS = [vim.VirtualMachine("vm-{0}".format(number)) for number in range(5)]
+
+
+class PerformanceCountersTests(TestCase):
+
+    def test_should_resolve_counter_names(self):
+        self.assertEqual(COUNTERS.resolve("cpu.ready.summation").key, 1)
+        self.assertEqual(COUNTERS.resolve("cpu.usage.average").unit, "percent")
+
+    def test_should_suggest_similar_counter_names_when_not_found(self):
+        self.assertRaisesRegexp(NotFound, "Did you mean cpu.ready.summation",
+                                lambda: COUNTERS.resolve("cpu.redy.summation"))
+
+
+class QueryPerformanceTests(TestCase):
+
+    def setUp(self):
+        self.perf_manager = Mock()
+
+        def query_perf(query_specs):
+            return [mock_entity_metric(query_spec.entity, {1: [10 * VMS.index(query_spec.entity), 0],
+                                                           2: [2500]})
+                    for query_spec in query_specs if query_spec.entity is not VMS[3]]
+        self.perf_manager.QueryPerf.side_effect = query_perf
+
+    def test_should_query_in_batches_with_all_counters_per_spec(self):
+        query_performance(self.perf_manager, COUNTERS, VMS, ["cpu.ready.summation", "cpu.usage.average"],
+                          samples=2, batch_size=2)
+
+        batches = [query_perf_call[0][0] for query_perf_call in self.perf_manager.QueryPerf.call_args_list]
+        self.assertEqual(sorted(len(batch) for batch in batches), [1, 2, 2])
+        query_spec = batches[0][0]
+        self.assertEqual([metric_id.counterId for metric_id in query_spec.metricId], [1, 2])
+        self.assertEqual(query_spec.maxSample, 2)
+        self.assertEqual(query_spec.intervalId, 20)
+
+    def test_should_align_averaged_and_scaled_values_with_entities(self):
+        result = query_performance(self.perf_manager, COUNTERS, VMS, ["cpu.ready.summation", "cpu.usage.average"])
+
+        self.assertEqual(list(result.values["cpu.ready.summation"][:3]), [0.0, 5.0, 10.0])
+        self.assertEqual(result.values["cpu.usage.average"][0], 25.0)
+        self.assertNotEqual(result.values["cpu.ready.summation"][3], result.values["cpu.ready.summation"][3])  # nan
+
+    def test_should_keep_samples_with_their_timestamps(self):
+        result = query_performance(self.perf_manager, COUNTERS, VMS, ["cpu.ready.summation"], samples=2)
+
+        self.assertEqual(result.samples["cpu.ready.summation"][1], [(1433160000.0, 10.0), (1433160020.0, 0.0)])
+        self.assertEqual(result.samples["cpu.ready.summation"][3], [])
+
+    def test_should_ignore_values_of_other_instances(self):
+        self.perf_manager.QueryPerf.side_effect = lambda query_specs: [mock_entity_metric(VMS[0], {1: [10]}, "0")]
+
+        result = query_performance(self.perf_manager, COUNTERS, VMS[:1], ["cpu.ready.summation"])
+
+        self.assertEqual(result.top("cpu.ready.summation"), [])
+
+    def test_should_return_top_entities_with_values_highest_first(self):
+        result = query_performance(self.perf_manager, COUNTERS, VMS, ["cpu.ready.summation"])
+
+        self.assertEqual(result.top("cpu.ready.summation", 2), [(VMS[4], 20.0), (VMS[2], 10.0)])
+        self.assertEqual([entity for entity, _ in result.top("cpu.ready.summation", None)],
+                         [VMS[4], VMS[2], VMS[1], VMS[0]])
+
+    def test_should_not_query_unknown_counters(self):
+        self.assertRaises(NotFound, lambda: query_performance(self.perf_manager, COUNTERS, VMS, ["any-counter"]))
+
+        self.assertFalse(self.perf_manager.QueryPerf.called)
+
+    def test_should_raise_query_errors(self):
+        self.perf_manager.QueryPerf.side_effect = vmodl.fault.NotSupported(msg="not supported")
+
+        self.assertRaises(vmodl.fault.NotSupported,
+                          lambda: query_performance(self.perf_manager, COUNTERS, VMS, ["cpu.ready.summation"]))
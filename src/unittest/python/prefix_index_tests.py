@@ -0,0 +1,44 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+from unittest import TestCase
+
+from isphere.prefix_index import PrefixIndex
+
+
+class PrefixIndexTests(TestCase):
+
+    def setUp(self):
+        self.index = PrefixIndex(["vm-{0:02d}".format(number) for number in range(20)] + ["esx-1"])
+
+    def test_should_complete_names_with_prefix_in_order(self):
+        self.assertEqual(self.index.complete("vm-1"), ["vm-{0}".format(number) for number in range(10, 20)])
+        self.assertEqual(self.index.complete("esx"), ["esx-1"])
+
+    def test_should_complete_all_names_with_empty_prefix(self):
+        self.assertEqual(len(self.index.complete("")), 21)
+
+    def test_should_not_complete_unknown_prefixes(self):
+        self.assertEqual(self.index.complete("vm-3"), [])
+        self.assertEqual(self.index.complete("zzz"), [])
+
+    def test_should_limit_completions(self):
+        self.assertEqual(self.index.complete("vm-", limit=2), ["vm-00", "vm-01"])
+
+    def test_should_update_few_changed_names_in_place(self):
+        names = self.index.names
+
+        self.index.update([name for name in names if name != "vm-05"] + ["vm-055"])
+
+        self.assertTrue(self.index.names is names)
+        self.assertEqual(self.index.complete("vm-05"), ["vm-055"])
+        self.assertEqual(len(self.index), 21)
+
+    def test_should_rebuild_when_most_names_changed(self):
+        self.index.update(["b", "a"])
+
+        self.assertEqual(self.index.names, ["a", "b"])
+        self.assertEqual(self.index.complete("vm"), [])
@@ -0,0 +1,182 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+from datetime import datetime
+from unittest import TestCase
+
+from mock import Mock, patch
+from pyVmomi import vim
+
+from isphere.reboot import READINESS_PROPERTIES, RollingReboot
+from isphere.watcher import PropertyUpdate
+
+
+def ready(vm, changes=None):
+    return PropertyUpdate(vm, "modify", dict(changes or {}, **{"guest.toolsRunningStatus": "guestToolsRunning",
+                                                               "guestHeartbeatStatus": "green"}))
+
+
+def down(vm):
+    return PropertyUpdate(vm, "modify", {"guest.toolsRunningStatus": "guestToolsNotRunning", "guestHeartbeatStatus": "gray"})
+
+
+class FakeWatcher(object):
+
+    """
+    Reports the guests of a wave as ready, then down and up again after `RebootGuest`.
+    """
+
+    def __init__(self, never_ready_vms=()):
+        self.never_ready_vms = never_ready_vms
+        self.watched_vms = []
+        self.waves = []
+        self.unwatched_filters = []
+        self.scripted_updates = []
+
+    def watch(self, vms, properties):
+        self.watched_vms = list(vms)
+        self.waves.append(self.watched_vms)
+        self.scripted_updates = [[ready(vm) for vm in vms]]
+        for vm in vms:
+            vm.RebootGuest.side_effect = lambda: None
+        self.scripted_updates.append([down(vm) for vm in vms])
+        self.scripted_updates.append([ready(vm) for vm in vms if vm not in self.never_ready_vms])
+        return "filter-{0}".format(len(self.waves))
+
+    def unwatch(self, property_filter):
+        self.unwatched_filters.append(property_filter)
+
+    def wait(self, max_wait_seconds=None):
+        if self.scripted_updates:
+            return self.scripted_updates.pop(0)
+        return []
+
+
+def mock_vm(name):
+    vm = Mock(spec=vim.VirtualMachine)
+    vm.name = name
+    return vm
+
+
+class RollingRebootTests(TestCase):
+
+    def setUp(self):
+        self.vms = [mock_vm("vm-{0}".format(index)) for index in range(5)]
+        self.progress = []
+
+    def record_progress(self, reboot):
+        self.progress.append((reboot.name, reboot.state))
+
+    def test_should_reboot_vms_in_waves_with_one_filter_per_wave(self):
+        watcher = FakeWatcher()
+
+        reboots = RollingReboot(watcher, [(vm.name, vm) for vm in self.vms], wave_size=2).run(self.record_progress)
+
+        self.assertEqual(watcher.waves, [self.vms[0:2], self.vms[2:4], self.vms[4:5]])
+        self.assertEqual(watcher.unwatched_filters, ["filter-1", "filter-2", "filter-3"])
+        self.assertEqual([reboot.state for reboot in reboots], ["ready"] * 5)
+        for vm in self.vms:
+            vm.RebootGuest.assert_called_once_with()
+
+    def test_should_start_next_wave_only_when_previous_wave_is_ready(self):
+        RollingReboot(FakeWatcher(), [(vm.name, vm) for vm in self.vms[:4]], wave_size=2).run(self.record_progress)
+
+        self.assertEqual(self.progress, [("vm-0", "rebooting"), ("vm-1", "rebooting"),
+                                         ("vm-0", "ready"), ("vm-1", "ready"),
+                                         ("vm-2", "rebooting"), ("vm-3", "rebooting"),
+                                         ("vm-2", "ready"), ("vm-3", "ready")])
+
+    def test_should_not_be_ready_before_guest_went_down(self):
+        watcher = FakeWatcher()
+        rolling_reboot = RollingReboot(watcher, [("vm-0", self.vms[0])])
+        original_watch = watcher.watch
+
+        def watch_with_stale_update(vms, properties):
+            property_filter = original_watch(vms, properties)
+            watcher.scripted_updates.insert(1, [ready(self.vms[0])])
+            return property_filter
+        watcher.watch = watch_with_stale_update
+
+        rolling_reboot.run(self.record_progress)
+
+        self.assertEqual(self.progress, [("vm-0", "rebooting"), ("vm-0", "ready")])
+        self.assertTrue(rolling_reboot.reboots[0].went_down)
+
+    def watch_without_down_update(self, watcher, changes_before, changes_after):
+        original_watch = watcher.watch
+
+        def watch(vms, properties):
+            property_filter = original_watch(vms, properties)
+            watcher.scripted_updates = [[ready(vm, changes_before) for vm in vms],
+                                        [ready(vm, changes_after) for vm in vms]]
+            return property_filter
+        watcher.watch = watch
+
+    def test_should_be_ready_when_uptime_was_reset_without_guest_reported_down(self):
+        watcher = FakeWatcher()
+        self.watch_without_down_update(watcher, {"summary.quickStats.uptimeSeconds": 86400},
+                                       {"summary.quickStats.uptimeSeconds": 30})
+
+        reboots = RollingReboot(watcher, [("vm-0", self.vms[0])]).run(self.record_progress)
+
+        self.assertEqual(self.progress, [("vm-0", "rebooting"), ("vm-0", "ready")])
+        self.assertFalse(reboots[0].went_down)
+
+    def test_should_be_ready_when_booted_again_without_guest_reported_down(self):
+        watcher = FakeWatcher()
+        self.watch_without_down_update(watcher, {"runtime.bootTime": datetime(2015, 1, 1)},
+                                       {"runtime.bootTime": datetime(2015, 1, 2)})
+
+        reboots = RollingReboot(watcher, [("vm-0", self.vms[0])]).run()
+
+        self.assertEqual(reboots[0].state, "ready")
+
+    @patch("isphere.reboot._timer")
+    def test_should_not_be_ready_when_uptime_only_grew(self, timer):
+        timer.side_effect = [0, 0, 600]
+        watcher = FakeWatcher()
+        self.watch_without_down_update(watcher, {"summary.quickStats.uptimeSeconds": 86400},
+                                       {"summary.quickStats.uptimeSeconds": 86420})
+
+        reboots = RollingReboot(watcher, [("vm-0", self.vms[0])]).run()
+
+        self.assertEqual(reboots[0].state, "failed")
+        self.assertEqual(reboots[0].uptime_seconds, 86420)
+
+    def test_should_watch_readiness_properties(self):
+        watcher = Mock()
+        watcher.wait.return_value = []
+
+        RollingReboot(watcher, [("vm-0", self.vms[0])], timeout_seconds=0).run()
+
+        watcher.watch.assert_called_with([self.vms[0]], READINESS_PROPERTIES)
+
+    def test_should_fail_and_stop_when_wave_is_not_ready_in_time(self):
+        watcher = FakeWatcher(never_ready_vms=[self.vms[1]])
+
+        reboots = RollingReboot(watcher, [(vm.name, vm) for vm in self.vms[:3]], wave_size=2,
+                                timeout_seconds=0).run()
+
+        self.assertEqual([reboot.state for reboot in reboots], ["failed", "failed", "pending"])
+        self.assertEqual(reboots[1].error, "not ready after 0 seconds")
+        self.assertEqual(len(watcher.waves), 1)
+        self.assertFalse(self.vms[2].RebootGuest.called)
+
+    def test_should_fail_and_stop_when_guest_cannot_be_rebooted(self):
+        watcher = FakeWatcher()
+        original_watch = watcher.watch
+
+        def watch_with_unavailable_tools(vms, properties):
+            property_filter = original_watch(vms, properties)
+            self.vms[0].RebootGuest.side_effect = vim.fault.ToolsUnavailable(msg="tools unavailable")
+            return property_filter
+        watcher.watch = watch_with_unavailable_tools
+
+        reboots = RollingReboot(watcher, [(vm.name, vm) for vm in self.vms[:3]], wave_size=2).run()
+
+        self.assertEqual([reboot.state for reboot in reboots], ["failed", "ready", "pending"])
+        self.assertEqual(reboots[0].error, "tools unavailable")
+        self.assertEqual(len(watcher.waves), 1)
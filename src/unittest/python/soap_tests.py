@@ -0,0 +1,234 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+from io import BytesIO
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import Mock
+from pyVmomi import vim
+from pyVmomi.SoapAdapter import SoapStubAdapter
+
+from isphere.soap import (CapturedResponse,
+                          hook_connections,
+                          instrument_stub,
+                          NotRecorded,
+                          ReplayStubAdapter,
+                          SoapRecorder,
+                          SoapStatistics,
+                          SoapTotals)
+
+CURRENT_TIME_RESPONSE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<soapenv:Envelope xmlns:soapenc="http://schemas.xmlsoap.org/soap/encoding/"
+ xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"
+ xmlns:xsd="http://www.w3.org/2001/XMLSchema"
+ xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+<soapenv:Body>
+<CurrentTimeResponse xmlns="urn:vim25"><returnval>2015-03-04T05:06:07Z</returnval></CurrentTimeResponse>
+</soapenv:Body>
+</soapenv:Envelope>"""
+
+
+def fake_http_connection(body, status=200):
+    connection = Mock()
+    connection.getresponse.return_value.status = status
+    connection.getresponse.return_value.reason = "OK"
+    headers = [("Content-Type", "text/xml"), ("Set-Cookie", "vmware_soap_session=secret")]
+    connection.getresponse.return_value.getheaders.return_value = headers
+    connection.getresponse.return_value.getheader.side_effect = lambda name, default=None: dict(headers).get(name, default)
+    connection.getresponse.side_effect = lambda: reset_body(connection.getresponse.return_value, body)
+    return connection
+
+
+def reset_body(response, body):
+    stream = BytesIO(body)
+    response.read.side_effect = lambda amount=-1: stream.read(amount)
+    return response
+
+
+class HookConnectionsTests(TestCase):
+
+    def setUp(self):
+        self.stub = Mock()
+        self.connection = fake_http_connection(b"any-response")
+        self.stub.GetConnection.return_value = self.connection
+        self.on_exchange = Mock()
+        self.return_connection = self.stub.ReturnConnection
+        hook_connections(self.stub, self.on_exchange)
+
+    def test_should_pass_exchange_to_callback(self):
+        connection = self.stub.GetConnection()
+        connection.request("POST", "/sdk", b"any-request", {})
+        response = connection.getresponse()
+
+        request_body, captured_response = self.on_exchange.call_args[0]
+        self.assertEqual(request_body, b"any-request")
+        self.assertEqual(captured_response, response)
+        self.assertEqual(response.read(), b"any-response")
+        self.assertEqual(response.status, 200)
+
+    def test_should_return_unwrapped_connection(self):
+        connection = self.stub.GetConnection()
+
+        self.stub.ReturnConnection(connection)
+
+        self.return_connection.assert_called_with(self.connection)
+
+    def test_should_leave_stubs_without_connections_alone(self):
+        stub = object()
+
+        hook_connections(stub, self.on_exchange)
+
+
+class StreamingHookConnectionsTests(TestCase):
+
+    def setUp(self):
+        self.stub = Mock()
+        self.connection = fake_http_connection(b"any-response")
+        self.raw_response = self.connection.getresponse.return_value
+        self.stub.GetConnection.return_value = self.connection
+        self.on_exchange = Mock()
+        hook_connections(self.stub, self.on_exchange, buffer_body=False)
+        connection = self.stub.GetConnection()
+        connection.request("POST", "/sdk", b"any-request", {})
+        self.response = connection.getresponse()
+
+    def test_should_not_read_response_before_it_is_consumed(self):
+        self.assertFalse(self.raw_response.read.called)
+        self.assertFalse(self.on_exchange.called)
+        self.assertEqual(self.response.status, 200)
+
+    def test_should_pass_exchange_to_callback_once_response_is_consumed(self):
+        self.assertEqual(self.response.read(4), b"any-")
+        self.assertEqual(self.response.read(1024), b"response")
+        self.assertFalse(self.on_exchange.called)
+        self.assertEqual(self.response.read(1024), b"")
+        self.response.close()
+
+        self.on_exchange.assert_called_once_with(b"any-request", self.response)
+        self.assertEqual(self.response.bytes_received, len(b"any-response"))
+
+    def test_should_pass_exchange_to_callback_when_response_is_closed(self):
+        self.response.close()
+
+        self.on_exchange.assert_called_once_with(b"any-request", self.response)
+        self.raw_response.close.assert_called_with()
+
+
+class CapturedResponseTests(TestCase):
+
+    def test_should_read_in_chunks(self):
+        response = CapturedResponse(200, "OK", [], b"0123456789")
+
+        self.assertEqual(response.read(4), b"0123")
+        self.assertEqual(response.read(), b"456789")
+
+    def test_should_find_headers_case_insensitively(self):
+        response = CapturedResponse(200, "OK", [("Content-Encoding", "gzip")], b"")
+
+        self.assertEqual(response.getheader("content-encoding"), "gzip")
+        self.assertEqual(response.getheader("any-other-header", "default"), "default")
+
+
+class RecordReplayTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.recording_path = os.path.join(self.directory, "recording.jsonl.gz")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def record_current_time(self):
+        stub = SoapStubAdapter(host="any-host")
+        stub.GetConnection = Mock(return_value=fake_http_connection(CURRENT_TIME_RESPONSE))
+        stub.ReturnConnection = Mock()
+        recorder = SoapRecorder.record(stub, self.recording_path)
+        current_time = vim.ServiceInstance("ServiceInstance", stub).CurrentTime()
+        recorder.close()
+        return current_time
+
+    def test_should_replay_recorded_session_through_deserializer(self):
+        recorded_time = self.record_current_time()
+
+        replayed_time = vim.ServiceInstance("ServiceInstance", ReplayStubAdapter(self.recording_path)).CurrentTime()
+
+        self.assertEqual(recorded_time, replayed_time)
+        self.assertEqual(replayed_time.year, 2015)
+
+    def test_should_replay_repeated_requests(self):
+        self.record_current_time()
+        service_instance = vim.ServiceInstance("ServiceInstance", ReplayStubAdapter(self.recording_path))
+
+        self.assertEqual(service_instance.CurrentTime(), service_instance.CurrentTime())
+
+    def test_should_raise_when_request_was_not_recorded(self):
+        self.record_current_time()
+        service_instance = vim.ServiceInstance("ServiceInstance", ReplayStubAdapter(self.recording_path))
+
+        self.assertRaises(NotRecorded, service_instance.RetrieveContent)
+
+    def test_should_not_record_cookies(self):
+        self.record_current_time()
+
+        stub = ReplayStubAdapter(self.recording_path)
+        for responses in stub._responses.values():
+            for exchange in responses:
+                self.assertNotIn("secret", str(exchange["headers"]))
+
+
+class InstrumentStubTests(TestCase):
+
+    def setUp(self):
+        stub = SoapStubAdapter(host="any-host")
+        stub.GetConnection = Mock(return_value=fake_http_connection(CURRENT_TIME_RESPONSE))
+        stub.ReturnConnection = Mock()
+        self.statistics = SoapStatistics()
+        instrument_stub(stub, self.statistics)
+        self.service_instance = vim.ServiceInstance("ServiceInstance", stub)
+
+    def test_should_count_calls_and_bytes_received(self):
+        self.service_instance.CurrentTime()
+        self.service_instance.CurrentTime()
+
+        totals = self.statistics.snapshot()
+        self.assertEqual(totals.calls, 2)
+        self.assertEqual(totals.errors, 0)
+        self.assertEqual(totals.bytes_received, 2 * len(CURRENT_TIME_RESPONSE))
+        self.assertTrue(totals.seconds >= totals.network_seconds)
+
+    def test_should_report_method_and_error_to_observer(self):
+        observer = Mock()
+        stub = Mock()
+        stub.InvokeMethod.side_effect = ValueError("any-error")
+        del stub.GetConnection
+        instrument_stub(stub, observer)
+        info = Mock()
+        info.wsdlName = "any-method"
+
+        self.assertRaises(ValueError, stub.InvokeMethod, "any-mo", info, ())
+
+        call = observer.on_call.call_args[0][0]
+        self.assertEqual(call.method, "any-method")
+        self.assertEqual(str(call.error), "any-error")
+
+    def test_should_count_accessors_once(self):
+        stub = Mock()
+        del stub.GetConnection
+        observer = Mock()
+        instrument_stub(stub, observer)
+        stub.InvokeAccessor.side_effect = lambda mo, info: stub.InvokeMethod(mo, info, ())
+
+        stub.InvokeAccessor("any-mo", Mock())
+
+        self.assertEqual(observer.on_call.call_count, 1)
+        self.assertEqual(observer.on_call.call_args[0][0].method, "Fetch")
+
+    def test_should_subtract_totals(self):
+        self.assertEqual(SoapTotals(3, 1, 2.0, 1.0, 100) - SoapTotals(1, 0, 0.5, 0.5, 40),
+                         SoapTotals(2, 1, 1.5, 0.5, 60))
@@ -0,0 +1,119 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+from io import BytesIO
+from unittest import TestCase
+
+from mock import Mock
+
+from isphere.timeseries import BYTES_PER_SAMPLE, Rollup, RingBuffer, TimeSeriesStore
+
+
+class RingBufferTests(TestCase):
+
+    def test_should_return_samples_oldest_first(self):
+        ring_buffer = RingBuffer(3)
+        ring_buffer.append(1.0, 10.0)
+        ring_buffer.append(2.0, 20.0)
+
+        self.assertEqual(ring_buffer.samples(), [(1.0, 10.0), (2.0, 20.0)])
+        self.assertEqual(ring_buffer.last_timestamp, 2.0)
+
+    def test_should_overwrite_oldest_samples_when_full(self):
+        ring_buffer = RingBuffer(3)
+        for timestamp in range(5):
+            ring_buffer.append(float(timestamp), timestamp * 10.0)
+
+        self.assertEqual(ring_buffer.samples(), [(2.0, 20.0), (3.0, 30.0), (4.0, 40.0)])
+        self.assertEqual(ring_buffer.samples(since=3.0), [(3.0, 30.0), (4.0, 40.0)])
+        self.assertEqual(ring_buffer.last_timestamp, 4.0)
+
+    def test_should_have_no_last_timestamp_when_empty(self):
+        self.assertEqual(RingBuffer(3).last_timestamp, None)
+
+
+class TimeSeriesStoreTests(TestCase):
+
+    def setUp(self):
+        self.store = TimeSeriesStore(memory_budget=2 * 100 * BYTES_PER_SAMPLE, capacity=100)
+
+    def test_should_roll_up_all_samples(self):
+        for value in range(1, 101):
+            self.store.record("any-vm", "cpu.ready.summation", float(value), float(value))
+
+        self.assertEqual(self.store.rollup("any-vm", "cpu.ready.summation"), Rollup(100, 1.0, 50.5, 100.0, 95.0))
+
+    def test_should_roll_up_samples_of_window(self):
+        for value in range(1, 11):
+            self.store.record("any-vm", "cpu.ready.summation", value * 20.0, float(value))
+
+        self.assertEqual(self.store.rollup("any-vm", "cpu.ready.summation", window_seconds=40),
+                         Rollup(3, 8.0, 9.0, 10.0, 10.0))
+        self.assertEqual(self.store.rollup("any-vm", "cpu.ready.summation", window_seconds=40, now=1000.0), None)
+
+    def test_should_not_roll_up_unknown_series(self):
+        self.assertEqual(self.store.rollup("any-vm", "cpu.ready.summation"), None)
+
+    def test_should_evict_least_recently_updated_series_to_stay_within_budget(self):
+        self.store.record("vm-1", "cpu.ready.summation", 2.0, 1.0)
+        self.store.record("vm-2", "cpu.ready.summation", 1.0, 1.0)
+        self.store.record("vm-3", "cpu.ready.summation", 3.0, 1.0)
+
+        self.assertEqual(sorted(self.store.series), [("vm-1", "cpu.ready.summation"), ("vm-3", "cpu.ready.summation")])
+        self.assertEqual(self.store.memory_usage(), 2 * 100 * BYTES_PER_SAMPLE)
+
+    def test_should_record_performance_results_with_values(self):
+        counter = Mock(unit="millisecond")
+        counter.name = "cpu.ready.summation"
+        result = Mock(entities=["vm-1-moref", "vm-2-moref"], counters=[counter],
+                      samples={"cpu.ready.summation": [[(20.0, 100.0), (40.0, 150.0)], []]})
+
+        self.store.record_performance(result, {"vm-1-moref": "vm-1", "vm-2-moref": "vm-2"})
+
+        self.assertEqual(list(self.store.series), [("vm-1", "cpu.ready.summation")])
+        self.assertEqual(self.store.series[("vm-1", "cpu.ready.summation")].samples(), [(20.0, 100.0), (40.0, 150.0)])
+
+    def test_should_skip_performance_samples_already_recorded(self):
+        counter = Mock(unit="millisecond")
+        counter.name = "cpu.ready.summation"
+        first_result = Mock(entities=["vm-1-moref"], counters=[counter],
+                            samples={"cpu.ready.summation": [[(20.0, 100.0), (40.0, 150.0)]]})
+        second_result = Mock(entities=["vm-1-moref"], counters=[counter],
+                             samples={"cpu.ready.summation": [[(40.0, 150.0), (60.0, 50.0)]]})
+
+        self.store.record_performance(first_result, {"vm-1-moref": "vm-1"})
+        self.store.record_performance(first_result, {"vm-1-moref": "vm-1"})
+        self.store.record_performance(second_result, {"vm-1-moref": "vm-1"})
+
+        self.assertEqual(self.store.series[("vm-1", "cpu.ready.summation")].samples(),
+                         [(20.0, 100.0), (40.0, 150.0), (60.0, 50.0)])
+
+    def test_should_load_dumped_series(self):
+        for timestamp in range(150):
+            self.store.record(u"vm-\u00e4", "cpu.ready.summation", float(timestamp), timestamp / 2.0)
+        self.store.record("vm-2", "cpu.usage.average", 1.0, 12.5)
+        binary_file = BytesIO()
+
+        self.store.dump(binary_file)
+        binary_file.seek(0)
+        loaded_store = TimeSeriesStore.load(binary_file)
+
+        self.assertEqual(loaded_store.capacity, 100)
+        self.assertEqual(loaded_store.series[(u"vm-\u00e4", "cpu.ready.summation")].samples(),
+                         self.store.series[(u"vm-\u00e4", "cpu.ready.summation")].samples())
+        self.assertEqual(loaded_store.series[("vm-2", "cpu.usage.average")].samples(), [(1.0, 12.5)])
+        names = [u"vm-\u00e4".encode("utf-8"), b"cpu.ready.summation", b"vm-2", b"cpu.usage.average"]
+        self.assertEqual(len(binary_file.getvalue()), 9 + 2 * 8 + sum(len(name) for name in names) + 101 * BYTES_PER_SAMPLE)
+
+    def test_should_not_load_other_files(self):
+        self.assertRaises(ValueError, lambda: TimeSeriesStore.load(BytesIO(b"not a dump at all")))
+
+    def test_should_not_load_truncated_dumps(self):
+        self.store.record("vm-1", "cpu.ready.summation", 1.0, 1.0)
+        binary_file = BytesIO()
+        self.store.dump(binary_file)
+
+        self.assertRaises(ValueError, lambda: TimeSeriesStore.load(BytesIO(binary_file.getvalue()[:-4])))
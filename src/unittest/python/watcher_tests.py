@@ -0,0 +1,118 @@
+#  Copyright (c) 2014-2015 Maximilien Riehl <max@riehl.io>
+#  This work is free. You can redistribute it and/or modify it under the
+#  terms of the Do What The Fuck You Want To Public License, Version 2,
+#  as published by Sam Hocevar. See the COPYING.wtfpl file for more details.
+#
+
+from unittest import TestCase
+
+from mock import Mock
+from pyVmomi import vim
+
+from isphere.watcher import PropertyWatcher, TaskTracker
+
+
+def update_set(version, object_updates, truncated=False):
+    update = Mock(version=version, truncated=truncated)
+    update.filterSet = [Mock(objectSet=object_updates)]
+    return update
+
+
+def named_object_update(obj, kind, changes):
+    change_set = []
+    for name, value in changes:
+        change = Mock(op="assign", val=value)
+        change.name = name
+        change_set.append(change)
+    return Mock(obj=obj, kind=kind, changeSet=change_set)
+
+
+class PropertyWatcherTests(TestCase):
+
+    def setUp(self):
+        self.property_collector = Mock()
+        self.watcher = PropertyWatcher(self.property_collector)
+
+    def test_should_create_one_filter_for_all_objects(self):
+        vm_1, vm_2 = vim.VirtualMachine("vm-1"), vim.VirtualMachine("vm-2")
+
+        property_filter = self.watcher.watch([vm_1, vm_2], ["runtime.powerState"])
+
+        self.assertEqual(property_filter, self.property_collector.CreateFilter.return_value)
+        filter_spec = self.property_collector.CreateFilter.call_args[0][0]
+        self.assertEqual([object_spec.obj for object_spec in filter_spec.objectSet], [vm_1, vm_2])
+        self.assertEqual(len(filter_spec.propSet), 1)
+        self.assertEqual(filter_spec.propSet[0].pathSet, ["runtime.powerState"])
+
+    def test_should_return_changes_and_remember_version(self):
+        vm = vim.VirtualMachine("vm-1")
+        self.property_collector.WaitForUpdatesEx.return_value = update_set(
+            "1", [named_object_update(vm, "modify", [("runtime.powerState", "poweredOn")])])
+
+        updates = self.watcher.wait(max_wait_seconds=10)
+
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(updates[0].obj, vm)
+        self.assertEqual(updates[0].kind, "modify")
+        self.assertEqual(updates[0].changes, {"runtime.powerState": "poweredOn"})
+        self.assertEqual(self.watcher.version, "1")
+        version, options = self.property_collector.WaitForUpdatesEx.call_args[0]
+        self.assertEqual(version, "")
+        self.assertEqual(options.maxWaitSeconds, 10)
+
+    def test_should_return_nothing_when_nothing_changed(self):
+        self.property_collector.WaitForUpdatesEx.return_value = None
+
+        self.assertEqual(self.watcher.wait(max_wait_seconds=0), [])
+        self.assertEqual(self.watcher.version, "")
+
+    def test_should_fetch_rest_of_truncated_updates_without_waiting(self):
+        vm_1, vm_2 = vim.VirtualMachine("vm-1"), vim.VirtualMachine("vm-2")
+        self.property_collector.WaitForUpdatesEx.side_effect = [
+            update_set("1", [named_object_update(vm_1, "enter", [("name", "vm-1")])], truncated=True),
+            update_set("2", [named_object_update(vm_2, "enter", [("name", "vm-2")])])]
+
+        updates = self.watcher.wait(max_wait_seconds=10)
+
+        self.assertEqual([update.obj for update in updates], [vm_1, vm_2])
+        self.assertEqual(self.property_collector.WaitForUpdatesEx.call_args[0][0], "1")
+        self.assertEqual(self.watcher.version, "2")
+
+    def test_should_destroy_collector_when_closed(self):
+        self.watcher.close()
+
+        self.property_collector.Destroy.assert_called_with()
+
+
+class TaskTrackerTests(TestCase):
+
+    def setUp(self):
+        self.watcher = Mock()
+        self.tracker = TaskTracker(self.watcher)
+        self.task_1, self.task_2 = vim.Task("task-1"), vim.Task("task-2")
+        self.tracker.track(self.task_1)
+        self.tracker.track(self.task_2)
+
+    def test_should_report_finished_tasks_only(self):
+        self.watcher.wait.return_value = [Mock(obj=self.task_1, changes={"info.state": "success", "info.result": "any-result"}),
+                                          Mock(obj=self.task_2, changes={"info.state": "running"})]
+
+        finished_tasks = self.tracker.poll()
+
+        self.assertEqual(len(finished_tasks), 1)
+        self.assertEqual(finished_tasks[0].task, self.task_1)
+        self.assertEqual(finished_tasks[0].state, "success")
+        self.assertEqual(finished_tasks[0].result, "any-result")
+        self.assertEqual(self.tracker.pending, 1)
+
+    def test_should_report_errors_and_stop_watching_finished_tasks(self):
+        fault = vim.fault.InvalidState()
+        self.watcher.wait.return_value = [Mock(obj=self.task_2, changes={"info.state": "error", "info.error": fault})]
+
+        finished_tasks = self.tracker.poll()
+
+        self.assertEqual(finished_tasks[0].error, fault)
+        self.watcher.unwatch.assert_called_with(self.watcher.watch.return_value)
+
+    def test_should_watch_task_state(self):
+        self.watcher.watch.assert_called_with([self.task_2], ["info.state", "info.error", "info.result"])